@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""Small helpers for driving the phone through adb."""
+import os
+import shlex
+import subprocess
+
+
+def adb_cmd(serial=None):
+    """
+    Return the base adb command as a list.
+    $ADB overrides the binary (e.g. a stand-in for testing without a phone),
+    and the serial falls back to $S like the run-*.sh scripts.
+    """
+    cmd = shlex.split(os.environ.get("ADB", "adb"))
+    serial = serial or os.environ.get("S")
+    if serial:
+        cmd += ["-s", serial]
+    return cmd
+
+
+def adb_shell(command, serial=None, check=True, timeout=None):
+    """Run a shell command on the device and return its stdout."""
+    proc = subprocess.run(
+        adb_cmd(serial) + ["shell", command],
+        text=True, capture_output=True, timeout=timeout
+    )
+    if check and proc.returncode != 0:
+        raise RuntimeError(f"adb shell '{command}' failed ({proc.returncode}): {proc.stderr.strip()}")
+    return proc.stdout
+
+
+def adb_forward(local_port, remote_port, serial=None):
+    """Forward a host TCP port to a port on the device."""
+    subprocess.run(adb_cmd(serial) + ["forward", f"tcp:{local_port}", f"tcp:{remote_port}"],
+                   check=True, capture_output=True)
+
+
+def adb_forward_remove(local_port, serial=None):
+    """Drop a forward created with adb_forward (ignores errors)."""
+    subprocess.run(adb_cmd(serial) + ["forward", "--remove", f"tcp:{local_port}"],
+                   capture_output=True)
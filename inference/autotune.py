@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Tune prefill batch, ubatch, threads and poll level for one model and backend.
+
+Short llama-bench probes (-p at representative prompt lengths, optionally
+-n for decode) run on the phone, one parameter at a time: each probe passes
+llama-bench a list of values for that parameter with the others held at the
+best values so far, and passes repeat until nothing changes. The objective
+is the time to prefill the whole prompt-length distribution (plus decoding
+--n-gen tokens per prompt, if given), so long LongBench prompts weigh more
+than short ones.
+
+The result goes to tuned/<model>_<MODE>.env (TUNED_BATCH, TUNED_UBATCH,
+TUNED_THREADS, TUNED_POLL), which run-cli-streamllm.sh and
+run-server-streamllm.sh source automatically for that model and MODE, and
+the probe results to the matching .json.
+
+    python autotune.py --mode NPU --prompts prompt_files              # LongBench prompt lengths
+    python autotune.py --mode NPU --prompts prompt_files_prepared     # token counts from prepare_prompts.py
+    python autotune.py --mode CPU --lengths 512,2048 --n-gen 32 --reps 3
+"""
+import argparse
+import json
+import os
+import shlex
+import statistics
+import subprocess
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+from adb_utils import adb_cmd
+from prepare_prompts import prompt_token_lengths
+from result_store import TUNED_DIR, script_model, tuned_profile_path
+from thermal import add_thermal_args, scheduler_from_args
+
+DEVICE_DIR = "/data/local/tmp/llama.cpp"
+# same values as the sweep's BATCH_SIZES_* / THREADS / POLL_LEVELS, plus the ubatch split of a batch
+SEARCH = {
+    "batch": {"CPU": [64, 128, 256, 512, 1024], "NPU": [128, 256, 512, 1024], "GPU": [256, 512, 1024, 2048]},
+    "threads": [2, 4, 6, 8],
+    "poll": [0, 50, 100],
+}
+UBATCH_SPLITS = [1, 2, 4, 8]
+MIN_UBATCH = 32
+# llama-bench flag and jsonl field per tuned parameter
+BENCH_FLAGS = {"batch": ("-b", "n_batch"), "ubatch": ("-ub", "n_ubatch"),
+               "threads": ("-t", "n_threads"), "poll": ("--poll", "poll")}
+# run-cli-streamllm.sh's settings without a profile
+SCRIPT_DEFAULTS = {"batch": 128, "ubatch": 128, "threads": 8, "poll": 50}
+MODE_ARGS = {"CPU": ["-ngl", "0", "-dev", "none"], "NPU": ["-ngl", "99", "-dev", "HTP0"],
+             "GPU": ["-ngl", "99", "-dev", "GPUOpenCL"]}
+
+
+def canonical_mode(mode):
+    return {"cpu": "CPU", "npu": "NPU", "htp0": "NPU", "gpu": "GPU", "gpuopencl": "GPU"}[mode.lower()]
+
+
+def prompt_lengths(prompt_dir, chars_per_token=4.0):
+    """
+    Token count of every *.prompt.txt under prompt_dir: from the
+    prepare_prompts.py manifest when there is one, else estimated as
+    characters / chars_per_token.
+    """
+    tokens = prompt_token_lengths(prompt_dir)
+    lengths = []
+    for path in sorted(Path(prompt_dir).glob("*.prompt.txt")):
+        lengths.append(tokens.get(path.name) or max(1, int(path.stat().st_size / chars_per_token)))
+    return lengths
+
+
+def representatives(lengths, max_prompt=4096, quantiles=(0.25, 0.5, 0.9)):
+    """
+    {probe length: weight} for a prompt-length distribution: a few quantiles
+    (capped at max_prompt, rounded up to 32), each weighted by the prompt
+    tokens of the prompts closest to it.
+    """
+    s = sorted(lengths)
+    reps = sorted({min(max_prompt, -(-s[int(q * (len(s) - 1))] // 32) * 32) for q in quantiles})
+    weights = dict.fromkeys(reps, 0)
+    for n in s:
+        weights[min(reps, key=lambda r: abs(r - min(n, max_prompt)))] += n
+    return {r: w for r, w in weights.items() if w}
+
+
+def bench_cmd(model, mode, params, vary, values, lengths, n_gen, reps, branch="."):
+    """adb shell command line for one llama-bench probe over `values` of `vary`."""
+    argv = [f"./{branch}/bin/llama-bench", "-m", f"{DEVICE_DIR}/../gguf/{model}",
+            "-p", ",".join(map(str, lengths)), "-n", str(n_gen), "-r", str(reps), "-fa", "1", "-o", "jsonl"]
+    argv += MODE_ARGS[mode]
+    for key, (flag, _) in BENCH_FLAGS.items():
+        argv += [flag, ",".join(map(str, values)) if key == vary else str(params[key])]
+    lib = f"{DEVICE_DIR}/{branch}/lib"
+    return f"cd {DEVICE_DIR}; LD_LIBRARY_PATH={lib} ADSP_LIBRARY_PATH={lib} " + " ".join(map(shlex.quote, argv))
+
+
+def run_probe(cmd, serial=None, timeout=1800):
+    """llama-bench jsonl records of one probe ([] if it failed)."""
+    proc = subprocess.run(adb_cmd(serial) + ["shell", cmd], capture_output=True, text=True, timeout=timeout)
+    records = []
+    for line in proc.stdout.splitlines():
+        line = line.strip()
+        if line.startswith("{"):
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    if not records:
+        print(f"[ERROR] llama-bench probe failed ({proc.returncode}): {proc.stderr.strip()[-500:]}")
+    return records
+
+
+def cost(results, weights, n_prompts, n_gen):
+    """
+    Seconds to prefill the distribution (sum of weight / tok/s over the probe
+    lengths) plus n_gen decoded tokens per prompt; None if a length is missing.
+    """
+    total = 0.0
+    for n_prompt, weight in weights.items():
+        ts = results.get(("pp", n_prompt))
+        if not ts:
+            return None
+        total += weight / ts
+    if n_gen:
+        ts = results.get(("tg", n_gen))
+        if not ts:
+            return None
+        total += n_prompts * n_gen / ts
+    return total
+
+
+class AutoTuner:
+    def __init__(self, model, mode, weights, n_prompts, n_gen=0, reps=2, serial=None, scheduler=None, branch="."):
+        self.model = model
+        self.mode = mode
+        self.weights = weights
+        self.n_prompts = n_prompts
+        self.n_gen = n_gen
+        self.reps = reps
+        self.serial = serial
+        self.scheduler = scheduler
+        self.branch = branch
+        self.measured = {}   # config tuple -> {("pp", n) | ("tg", n): tok/s}
+        self.probes = 0
+
+    @staticmethod
+    def _key(params):
+        return tuple(params[k] for k in BENCH_FLAGS)
+
+    def candidates(self, key, params):
+        if key == "batch":
+            return SEARCH["batch"][self.mode]
+        if key == "ubatch":
+            splits = {params["batch"] // s for s in UBATCH_SPLITS}
+            return sorted(u for u in splits if u >= MIN_UBATCH) or [params["batch"]]
+        return SEARCH[key]
+
+    def _run(self, params, key, values):
+        """One llama-bench call over `values` of `key` (others from params), into self.measured."""
+        cmd = bench_cmd(self.model, self.mode, params, key, values, sorted(self.weights), self.n_gen,
+                        self.reps, self.branch)
+        with (self.scheduler.track() if self.scheduler is not None else nullcontext({})):
+            records = run_probe(cmd, self.serial)
+        self.probes += 1
+        field = BENCH_FLAGS[key][1]
+        for rec in records:
+            cfg = dict(params, **{key: rec.get(field)})
+            if rec.get("n_gen") and not rec.get("n_prompt"):
+                test = ("tg", rec["n_gen"])
+            else:
+                test = ("pp", rec["n_prompt"])
+            self.measured.setdefault(self._key(cfg), {})[test] = rec.get("avg_ts")
+
+    def probe(self, params, key, values):
+        """{value: (config, cost)} for params with `key` set to each of values."""
+        if key == "batch":
+            # batch and ubatch move together (keeping their ratio), one call per batch size
+            ratio = max(1, params["batch"] // params["ubatch"])
+            configs = {v: dict(params, batch=v, ubatch=max(MIN_UBATCH, v // ratio)) for v in values}
+            for cfg in configs.values():
+                if self._key(cfg) not in self.measured:
+                    self._run(cfg, "batch", [cfg["batch"]])
+        else:
+            configs = {v: dict(params, **{key: v}) for v in values}
+            todo = [v for v, cfg in configs.items() if self._key(cfg) not in self.measured]
+            if todo:
+                self._run(params, key, todo)
+        return {v: (cfg, cost(self.measured.get(self._key(cfg), {}), self.weights, self.n_prompts, self.n_gen))
+                for v, cfg in configs.items()}
+
+    def tune(self, start, passes=3):
+        """Coordinate descent from start; returns (best params, best cost, baseline cost)."""
+        params = dict(start)
+        baseline = None
+        best_cost = None
+        for p in range(passes):
+            changed = False
+            for key in BENCH_FLAGS:
+                values = self.candidates(key, params)
+                if params[key] not in values:
+                    values = sorted(values + [params[key]])
+                results = self.probe(params, key, values)
+                if baseline is None:
+                    baseline = cost(self.measured.get(self._key(start), {}), self.weights, self.n_prompts, self.n_gen)
+                scored = {v: rc for v, rc in results.items() if rc[1] is not None}
+                if not scored:
+                    continue
+                best = min(scored, key=lambda v: scored[v][1])
+                print(f"[TUNE] pass {p + 1} {key}: " +
+                      ", ".join(f"{v}={c:.2f}s" for v, (_, c) in sorted(scored.items())) + f" -> {best}")
+                cfg, best_cost = scored[best]
+                if cfg != params:
+                    params = dict(cfg)
+                    changed = True
+            if not changed:
+                break
+        return params, best_cost, baseline
+
+    def prefill_tps(self, params):
+        """Prompt-token-weighted prefill tok/s of params over the distribution."""
+        results = self.measured.get(self._key(params), {})
+        secs = cost(results, self.weights, self.n_prompts, 0)
+        return sum(self.weights.values()) / secs if secs else None
+
+
+def write_profile(path, params, meta):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    lines = [f"# autotune.py {time.strftime('%Y-%m-%d %H:%M:%S')}: {meta['model']} MODE={meta['mode']}",
+             f"# prompt lengths {meta['lengths']} (weights {meta['weights']}), n_gen {meta['n_gen']}",
+             f"# prefill {meta['prefill_tps'] or 0:.1f} tok/s vs {meta['baseline_prefill_tps'] or 0:.1f} "
+             f"with the script defaults",
+             f"TUNED_BATCH={params['batch']}",
+             f"TUNED_UBATCH={params['ubatch']}",
+             f"TUNED_THREADS={params['threads']}",
+             f"TUNED_POLL={params['poll']}"]
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Tune batch/ubatch/threads/poll for a model and backend with llama-bench.")
+    ap.add_argument("--model", default=None, help="GGUF name under /data/local/tmp/gguf (default: $M / the script's)")
+    ap.add_argument("--mode", default=os.environ.get("MODE", "CPU"), help="CPU, NPU or GPU")
+    ap.add_argument("--prompts", default="prompt_files", help="directory of *.prompt.txt whose lengths to tune for")
+    ap.add_argument("--lengths", default=None, help="comma-separated prompt token counts instead of --prompts")
+    ap.add_argument("--chars-per-token", type=float, default=4.0, help="token estimate for --prompts files without a manifest")
+    ap.add_argument("--max-prompt", type=int, default=4096, help="longest prompt length probed")
+    ap.add_argument("--n-gen", type=int, default=0, help="also weigh decoding this many tokens per prompt")
+    ap.add_argument("--reps", type=int, default=2, help="llama-bench repetitions per probe")
+    ap.add_argument("--passes", type=int, default=3, help="coordinate-descent passes at most")
+    ap.add_argument("--serial", default=None, help="adb serial (default: $S / the only device)")
+    ap.add_argument("--script", default="./run-cli-streamllm.sh", help="run script whose default model to use")
+    ap.add_argument("--out", default=None, help="profile path (default: where the run scripts look)")
+    add_thermal_args(ap)
+    args = ap.parse_args()
+
+    mode = canonical_mode(args.mode)
+    model = args.model or script_model(args.script)
+    if args.lengths:
+        lengths = [int(x) for x in args.lengths.split(",") if x]
+    else:
+        lengths = prompt_lengths(args.prompts, args.chars_per_token)
+        if not lengths:
+            raise SystemExit(f"No *.prompt.txt under {args.prompts}; pass --lengths")
+    weights = representatives(lengths, args.max_prompt)
+    print(f"[TUNE] {model} on {mode}: {len(lengths)} prompts, median {statistics.median(lengths):.0f} tokens; "
+          f"probing prompt lengths {sorted(weights)}")
+
+    scheduler = scheduler_from_args(args, args.serial)
+    tuner = AutoTuner(model, mode, weights, len(lengths), args.n_gen, args.reps, args.serial, scheduler,
+                      os.environ.get("B", "."))
+    t0 = time.time()
+    try:
+        params, best_cost, baseline = tuner.tune(SCRIPT_DEFAULTS, args.passes)
+    finally:
+        if scheduler is not None:
+            scheduler.monitor.stop()
+    if best_cost is None:
+        raise SystemExit("[ERROR] no successful probes, nothing written")
+
+    meta = {"model": model, "mode": mode, "lengths": sorted(weights), "weights": [weights[k] for k in sorted(weights)],
+            "n_gen": args.n_gen, "prefill_tps": tuner.prefill_tps(params),
+            "baseline_prefill_tps": tuner.prefill_tps(SCRIPT_DEFAULTS)}
+    path = args.out or tuned_profile_path(model, mode, {}) or os.path.join(TUNED_DIR, f"{model}_{mode}.env")
+    write_profile(path, params, meta)
+    with open(os.path.splitext(path)[0] + ".json", "w", encoding="utf-8") as f:
+        json.dump({**meta, "params": params, "cost_s": best_cost, "baseline_cost_s": baseline,
+                   "measured": [{**dict(zip(BENCH_FLAGS, key)),
+                                 **{f"{kind}{n}": ts for (kind, n), ts in res.items()}}
+                                for key, res in tuner.measured.items()]}, f, indent=2)
+
+    print(f"\nBest: batch {params['batch']}, ubatch {params['ubatch']}, threads {params['threads']}, "
+          f"poll {params['poll']} after {tuner.probes} probes in {time.time() - t0:.0f} s")
+    if baseline:
+        print(f"Distribution time {best_cost:.2f} s vs {baseline:.2f} s with the script defaults "
+              f"({baseline / best_cost:.2f}x)")
+    print(f"Profile written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Batched, cached BLEURT scoring for TruthfulQA.
+
+Every (prediction, reference) pair is looked up in a persistent SQLite cache
+keyed by (checkpoint, sha256(prediction), sha256(reference)). Only pairs that
+have never been scored are sent to BLEURT, deduplicated and in fixed-size
+batches, so a sweep that repeats the same questions only pays for outputs it
+has not seen before. The BLEURT model itself is loaded lazily, so a fully
+cached run never initialises TensorFlow.
+
+BLEURT is a cross-encoder (each pair is encoded jointly), so there are no
+per-reference embeddings to reuse; the pair cache is what gets reused.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+
+DEFAULT_CACHE = os.path.join(".eval_cache", "bleurt_scores.sqlite")
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class BleurtScorer:
+    def __init__(self, checkpoint="bleurt-large-128", cache_path=DEFAULT_CACHE, batch_size=64):
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.cache_path = cache_path
+        self._bleurt = None
+        self._db = None
+        if cache_path:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(cache_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS scores ("
+                " checkpoint TEXT, pred_hash TEXT, ref_hash TEXT, score REAL,"
+                " PRIMARY KEY (checkpoint, pred_hash, ref_hash))"
+            )
+            self._db.commit()
+
+        # throughput counters
+        self.pairs_requested = 0
+        self.cache_hits = 0
+        self.pairs_scored = 0
+        self.score_seconds = 0.0
+
+    @property
+    def bleurt(self):
+        if self._bleurt is None:
+            import evaluate
+            self._bleurt = evaluate.load('bleurt', self.checkpoint)
+        return self._bleurt
+
+    def _lookup(self, keys):
+        found = {}
+        if self._db is None:
+            return found
+        # chunked to stay under SQLite's bound-parameter limit
+        for i in range(0, len(keys), 400):
+            chunk = keys[i:i + 400]
+            where = " OR ".join(["(pred_hash = ? AND ref_hash = ?)"] * len(chunk))
+            params = [h for key in chunk for h in key]
+            rows = self._db.execute(
+                f"SELECT pred_hash, ref_hash, score FROM scores WHERE checkpoint = ? AND ({where})",
+                [self.checkpoint] + params
+            )
+            for pred_hash, ref_hash, score in rows:
+                found[(pred_hash, ref_hash)] = score
+        return found
+
+    def _compute(self, predictions, references):
+        bleurt = self.bleurt
+        scorer = getattr(bleurt, "scorer", None)
+        if scorer is not None and hasattr(scorer, "score"):
+            # evaluate's wrapper always uses BLEURT's default batch size
+            return list(scorer.score(references=references, candidates=predictions,
+                                     batch_size=self.batch_size))
+        return list(bleurt.compute(predictions=predictions, references=references)['scores'])
+
+    def score_pairs(self, predictions, references):
+        """Return one BLEURT score per (prediction, reference) pair."""
+        keys = [(text_hash(p), text_hash(r)) for p, r in zip(predictions, references)]
+        self.pairs_requested += len(keys)
+        cached = self._lookup(list(set(keys)))
+        self.cache_hits += sum(1 for k in keys if k in cached)
+
+        # unique pairs still missing, in first-seen order
+        missing = {}
+        for key, pred, ref in zip(keys, predictions, references):
+            if key not in cached and key not in missing:
+                missing[key] = (pred, ref)
+
+        if missing:
+            todo = list(missing.items())
+            t0 = time.time()
+            for i in range(0, len(todo), self.batch_size):
+                chunk = todo[i:i + self.batch_size]
+                scores = self._compute([p for _, (p, _) in chunk], [r for _, (_, r) in chunk])
+                for (key, _), score in zip(chunk, scores):
+                    cached[key] = float(score)
+            self.score_seconds += time.time() - t0
+            self.pairs_scored += len(todo)
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)",
+                    [(self.checkpoint, k[0], k[1], cached[k]) for k in missing]
+                )
+                self._db.commit()
+
+        return [cached[k] for k in keys]
+
+    def pairs_per_second(self):
+        return self.pairs_scored / self.score_seconds if self.score_seconds > 0 else 0.0
+
+    def summary(self):
+        return (f"BLEURT: {self.pairs_requested} pairs, {self.cache_hits} cached, "
+                f"{self.pairs_scored} scored in {self.score_seconds:.1f} s "
+                f"({self.pairs_per_second():.1f} pairs/s)")
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Retrieval-based context reduction for the LongBench prompts.
+
+QMSum prompts carry a whole meeting transcript, and prefilling thousands of
+tokens dominates the on-device latency and energy of a query. `reduce`
+splits each prompt into the instruction header, the transcript and the
+query trailer (LongBench's QMSum template; otherwise everything before the
+last paragraph is the document and that paragraph the query), chunks the
+transcript on line boundaries into about --chunk-tokens tokens, ranks the
+chunks against the query with an in-memory BM25 (or TF-IDF cosine) index of
+the document, and keeps the best ones, at most --top-k, until the whole
+prompt reaches --budget tokens. Kept chunks stay in transcript order, with
+--marker where chunks were dropped.
+
+Token counts (of the prompt text, without BOS) are chars / 4 estimates, or
+exact with --backend server/stub (the model's /tokenize, as in
+prepare_prompts.py). The reduced prompts and a
+prepare_prompts.py-style manifest.json go to --out-dir, so
+longbench_test.py --prompts <out-dir> runs them. `compare` then scores the
+baseline and the reduced outputs with longbench_eval.py and reports the
+ROUGE-L delta next to the prefill-token, latency and energy reduction:
+
+    python context_reduction.py reduce --budget 1024 --out-dir prompt_files_reduced
+    python longbench_test.py --prompts prompt_files_reduced --output-dir qmsum_outputs_reduced
+    python context_reduction.py compare --baseline qmsum_outputs --reduced qmsum_outputs_reduced \\
+        --manifest prompt_files_reduced
+"""
+import argparse
+import json
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+
+from longbench_eval import evaluate_folder_outputs, load_references
+from prepare_prompts import MANIFEST, TOKEN_CACHE, TokenCounts, Tokenizer, load_manifest
+from result_store import model_fingerprint, script_model, sha256_text
+from server_backend import make_server
+
+# LongBench's qmsum prompt: instructions, "Transcript:", the meeting, then the query
+QMSUM_RE = re.compile(r"^(.*?Transcript:\n)(.*?)(\n\s*Now, answer the query.*)$", re.S)
+QUERY_RE = re.compile(r"Query:\s*(.*?)\s*(?:Answer:)?\s*$", re.S)
+WORD_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""a about an and are as at be but by did do does for from had has have how i in is it
+    its of on or so that the their there they this to was we were what when where which who why will with
+    would you""".split())
+
+
+def terms(text):
+    return [w for w in WORD_RE.findall(text.lower()) if w not in STOPWORDS]
+
+
+def split_prompt(text):
+    """(header, document, trailer, query) of one prompt."""
+    m = QMSUM_RE.match(text)
+    if m:
+        header, document, trailer = m.groups()
+    else:
+        cut = text.rstrip().rfind("\n\n")
+        header, document, trailer = "", text[:max(cut, 0)], text[max(cut, 0):]
+    q = QUERY_RE.search(trailer)
+    return header, document, trailer, q.group(1) if q else trailer
+
+
+def chunk_document(document, chunk_tokens, count):
+    """The document's lines grouped into chunks of about chunk_tokens; overlong lines are split on words."""
+    pieces = []
+    for line in document.split("\n"):
+        if count(line) <= chunk_tokens:
+            pieces.append(line)
+            continue
+        words = line.split(" ")
+        step = max(1, int(len(words) * chunk_tokens / count(line)))
+        pieces += [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+    chunks, current, size = [], [], 0
+    for piece in pieces:
+        n = count(piece)
+        if current and size + n > chunk_tokens:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += n
+    if current:
+        chunks.append("\n".join(current))
+    return [c for c in chunks if c.strip()]
+
+
+class BM25:
+    """Okapi BM25 over one document's chunks."""
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.tfs = [Counter(terms(c)) for c in chunks]
+        self.lens = [sum(tf.values()) for tf in self.tfs]
+        self.avgdl = (sum(self.lens) / len(self.lens)) if self.lens else 0.0
+        self.df = Counter(t for tf in self.tfs for t in tf)
+        self.n = len(chunks)
+
+    def idf(self, term):
+        df = self.df.get(term, 0)
+        return math.log(1.0 + (self.n - df + 0.5) / (df + 0.5))
+
+    def scores(self, query):
+        q = set(terms(query))
+        out = []
+        for tf, dl in zip(self.tfs, self.lens):
+            norm = self.k1 * (1.0 - self.b + self.b * dl / self.avgdl) if self.avgdl else self.k1
+            out.append(sum(self.idf(t) * tf[t] * (self.k1 + 1.0) / (tf[t] + norm) for t in q if t in tf))
+        return out
+
+
+class TfIdf(BM25):
+    """Cosine similarity of TF-IDF vectors, on the same chunk statistics."""
+
+    def scores(self, query):
+        qtf = Counter(terms(query))
+        qvec = {t: n * self.idf(t) for t, n in qtf.items()}
+        qnorm = math.sqrt(sum(v * v for v in qvec.values())) or 1.0
+        out = []
+        for tf in self.tfs:
+            vec = {t: n * self.idf(t) for t, n in tf.items()}
+            norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+            out.append(sum(v * vec.get(t, 0.0) for t, v in qvec.items()) / (norm * qnorm))
+        return out
+
+
+SCORERS = {"bm25": BM25, "tfidf": TfIdf}
+
+
+def assemble(header, chunks, keep, trailer, marker):
+    """Prompt from the kept chunk indices, in document order, marking the gaps."""
+    body, prev = "", None
+    for i in sorted(keep):
+        if prev is not None:
+            body += "\n" if i == prev + 1 else marker
+        body += chunks[i]
+        prev = i
+    return header + body + trailer
+
+
+def reduce_prompt(text, count, budget, chunk_tokens=128, top_k=None, scorer="bm25", marker="\n...\n"):
+    """(reduced prompt, its tokens, source tokens, chunks kept, chunks total) for one prompt."""
+    n_source = count(text)
+    header, document, trailer, query = split_prompt(text)
+    chunks = chunk_document(document, chunk_tokens, count)
+    if n_source <= budget and (top_k is None or len(chunks) <= top_k):
+        return text, n_source, n_source, len(chunks), len(chunks)
+    scores = SCORERS[scorer](chunks).scores(query)
+    ranked = sorted(range(len(chunks)), key=lambda i: (-scores[i], i))
+    room = budget - count(header + trailer)
+    n_marker = count(marker)
+    keep = []
+    for i in ranked:
+        if top_k is not None and len(keep) >= top_k:
+            break
+        n = count(chunks[i]) + n_marker
+        if n <= room:
+            keep.append(i)
+            room -= n
+    reduced = assemble(header, chunks, keep, trailer, marker)
+    n_reduced = count(reduced)
+    # chunk counts do not add up exactly across seams: drop the weakest kept chunk until it fits
+    while n_reduced > budget and keep:
+        keep.pop()
+        reduced = assemble(header, chunks, keep, trailer, marker)
+        n_reduced = count(reduced)
+    return reduced, n_reduced, n_source, len(keep), len(chunks)
+
+
+def reduce_dir(prompt_dir, out_dir, count, budget, chunk_tokens=128, top_k=None, scorer="bm25",
+               marker="\n...\n"):
+    """Write the reduced prompts to out_dir; manifest entries in prepare_prompts.py's format."""
+    os.makedirs(out_dir, exist_ok=True)
+    entries = []
+    for path in sorted(Path(prompt_dir).glob("*.prompt.txt")):
+        text = path.read_text(encoding="utf-8")
+        reduced, n_tokens, n_source, kept, total = reduce_prompt(text, count, budget, chunk_tokens, top_k,
+                                                                 scorer, marker)
+        (Path(out_dir) / path.name).write_text(reduced, encoding="utf-8")
+        entries.append({"file": path.name, "tokens": n_tokens, "source_tokens": n_source,
+                        "truncated": reduced != text, "dropped_tokens": n_source - n_tokens,
+                        "over_budget": n_tokens > budget, "sha256": sha256_text(reduced),
+                        "chunks_kept": kept, "chunks": total})
+        print(f"  {path.name}: {n_source} -> {n_tokens} tokens, {kept}/{total} chunks")
+    return entries
+
+
+def read_records(output_dir):
+    """longbench_test.py's latencies.jsonl records of output_dir by sample file, failed ones left out."""
+    path = os.path.join(output_dir, "latencies.jsonl")
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return {rec["sample"]: rec for rec in map(json.loads, f) if rec.get("sample") and not rec.get("failed")}
+
+
+def mean_of(records, key):
+    vals = [r[key] for r in records if r.get(key) is not None]
+    return sum(vals) / len(vals) if vals else None
+
+
+def compare(baseline_dir, reduced_dir, manifest_dir=None, subset="qmsum", workers=None):
+    """ROUGE-L of both output dirs, per sample and aggregated, plus prefill/latency/energy of both runs."""
+    ref_map = load_references(subset)
+    base_samples, base_agg = evaluate_folder_outputs(baseline_dir, ref_map, subset, workers)
+    red_samples, red_agg = evaluate_folder_outputs(reduced_dir, ref_map, subset, workers)
+    base_by_idx = dict(base_samples)
+    paired = [(idx, base_by_idx[idx], rl) for idx, rl in red_samples if idx in base_by_idx]
+
+    print(f"\n=== ROUGE-L, baseline -> reduced ({len(paired)} paired samples) ===")
+    for idx, b, r in paired:
+        print(f"  sample {idx}: {b:.4f} -> {r:.4f} ({r - b:+.4f})")
+    print(f"  aggregated: {base_agg['rougeL']:.4f} -> {red_agg['rougeL']:.4f} "
+          f"({red_agg['rougeL'] - base_agg['rougeL']:+.4f})")
+
+    base_recs, red_recs = read_records(baseline_dir), read_records(reduced_dir)
+    shared = sorted(set(base_recs) & set(red_recs))
+    manifest = load_manifest(manifest_dir) if manifest_dir else None
+    print("\n=== Cost, baseline -> reduced ===")
+    if manifest:
+        src = sum(p["source_tokens"] for p in manifest["prompts"])
+        kept = sum(p["tokens"] for p in manifest["prompts"])
+        print(f"  prompt tokens (manifest): {src} -> {kept} ({1 - kept / src:.0%} fewer)" if src else
+              "  prompt tokens (manifest): n/a")
+    rows = [("prefill tokens", "prompt_n", ".0f"), ("prefill ms", "prompt_ms", ".0f"),
+            ("latency s", "latency", ".3f"), ("energy J", "energy_j", ".2f")]
+    for label, key, spec in rows:
+        b = mean_of([base_recs[s] for s in shared], key)
+        r = mean_of([red_recs[s] for s in shared], key)
+        if b is None or r is None:
+            continue
+        change = f" ({r / b - 1:+.0%})" if b else ""
+        print(f"  mean {label}: {format(b, spec)} -> {format(r, spec)}{change}")
+    if not shared:
+        print("  no latencies.jsonl records shared by both runs")
+    return {"rougeL_baseline": base_agg["rougeL"], "rougeL_reduced": red_agg["rougeL"],
+            "rougeL_delta": red_agg["rougeL"] - base_agg["rougeL"]}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="BM25 context reduction of LongBench prompts and its quality cost.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    red = sub.add_parser("reduce", help="keep the chunks most relevant to the query, up to a token budget")
+    red.add_argument("--prompts", default="prompt_files", help="directory of *.prompt.txt")
+    red.add_argument("--out-dir", default="prompt_files_reduced")
+    red.add_argument("--budget", type=int, default=1024, help="tokens per reduced prompt")
+    red.add_argument("--chunk-tokens", type=int, default=128)
+    red.add_argument("--top-k", type=int, default=None, help="keep at most this many chunks")
+    red.add_argument("--scorer", choices=sorted(SCORERS), default="bm25")
+    red.add_argument("--marker", default="\n...\n", help="text put where chunks were dropped")
+    red.add_argument("--backend", choices=["none", "server", "stub"], default="none",
+                     help="token counts: none = chars/4 estimate; server/stub = the model's /tokenize")
+    red.add_argument("--chars-per-token", type=float, default=4.0)
+    red.add_argument("--port", type=int, default=8080)
+    red.add_argument("--serial", default=None, help="adb serial (default: $S / the only device)")
+    cmp = sub.add_parser("compare", help="ROUGE-L delta and cost reduction of two longbench_test.py runs")
+    cmp.add_argument("--baseline", default="qmsum_outputs", help="output dir of the unreduced run")
+    cmp.add_argument("--reduced", required=True, help="output dir of the reduced run")
+    cmp.add_argument("--manifest", default=None, help="reduce --out-dir, for the prompt token totals")
+    cmp.add_argument("--subset", default="qmsum")
+    cmp.add_argument("--workers", type=int, default=None, help="scoring processes (default: all cores)")
+    args, extra_args = ap.parse_known_args()
+
+    if args.cmd == "compare":
+        compare(args.baseline, args.reduced, args.manifest, args.subset, args.workers)
+        return
+
+    tok, counts = None, None
+    if args.backend == "none":
+        def count(text):
+            return max(1, round(len(text) / args.chars_per_token)) if text else 0
+    else:
+        model_hash = "stub" if args.backend == "stub" else model_fingerprint(
+            script_model("./run-server-streamllm.sh"), serial=args.serial)
+        # these counts leave BOS out, prepare_prompts.py's include it: keep them apart
+        counts = TokenCounts(model_hash, TOKEN_CACHE, kind="nobos")
+        tok = Tokenizer(lambda: make_server(args.backend, server_args=extra_args, port=args.port,
+                                            serial=args.serial))
+
+        def count(text):
+            n = counts.get(text)
+            if n is None:
+                n = len(tok.ids(text)) if text else 0
+                counts.put(text, n)
+            return n
+
+    print(f"[REDUCE] {args.prompts} -> {args.out_dir}: budget {args.budget} tokens, "
+          f"{args.scorer} over ~{args.chunk_tokens}-token chunks")
+    try:
+        entries = reduce_dir(args.prompts, args.out_dir, count, args.budget, args.chunk_tokens, args.top_k,
+                             args.scorer, args.marker)
+    finally:
+        if tok is not None:
+            tok.stop()
+        if counts is not None:
+            counts.save()
+
+    manifest = {"budget": args.budget, "scorer": args.scorer, "chunk_tokens": args.chunk_tokens,
+                "top_k": args.top_k, "token_counts": args.backend, "prompts": entries}
+    with open(os.path.join(args.out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    src = sum(e["source_tokens"] for e in entries)
+    kept = sum(e["tokens"] for e in entries)
+    print(f"\n{len(entries)} prompts, {src} -> {kept} prompt tokens"
+          f"{f' ({1 - kept / src:.0%} fewer)' if src else ''}")
+    print(f"Manifest written to {os.path.join(args.out_dir, MANIFEST)}")
+
+
+if __name__ == "__main__":
+    main()
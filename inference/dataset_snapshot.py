@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Offline, memory-mapped snapshots of the dataset subsets the harnesses use.
+
+The first load_subset() call for a (dataset, config, split, rows, columns)
+exports exactly that subset from Hugging Face `datasets` into
+<root>/<name>/: data.bin holds one JSON record per row, with binary values
+(encoded images) stored raw right after their row, and index.json holds the
+row offsets, the column list and the sha256 of data.bin. Every later call
+maps data.bin and decodes rows lazily on access, without importing
+`datasets` or touching the network, in milliseconds.
+
+The sha256 is the snapshot's identity. dataset_pins.json, checked in next
+to this file, pins the sha256 of every subset by snapshot name; load_subset
+re-hashes data.bin against the pin on every load (a second or so for the
+image subsets) and fails loudly if a corrupted or different export would
+change the results. A subset without a pin gets one from its first export:
+check the updated dataset_pins.json in so other machines load the same
+rows. `pin` records a snapshot's current sha256 after an intended change.
+
+    python dataset_snapshot.py export truthfulqa/truthful_qa --name generation --split validation --rows 50
+    python dataset_snapshot.py ls
+    python dataset_snapshot.py verify .eval_cache/datasets/truthfulqa_truthful_qa_generation_validation_50
+    python dataset_snapshot.py pin .eval_cache/datasets/truthfulqa_truthful_qa_generation_validation_50
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+
+from result_store import _atomic_write_json, sha256_file
+
+DEFAULT_ROOT = os.path.join(".eval_cache", "datasets")
+# snapshot name -> pinned sha256 of its data.bin (checked in)
+PINS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dataset_pins.json")
+FORMAT_VERSION = 1
+_BLOB_KEY = "__blob__"
+
+
+def load_pins(path=None):
+    """{snapshot name: sha256} from the pins file ({} without one)."""
+    path = PINS_FILE if path is None else path
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def pin(name, sha256, path=None):
+    """Record sha256 as the pinned hash of snapshot `name`."""
+    path = PINS_FILE if path is None else path
+    pins = load_pins(path)
+    pins[name] = sha256
+    _atomic_write_json(path, dict(sorted(pins.items())))
+
+
+def snapshot_name(path, name=None, split="test", rows=None, columns=None):
+    parts = [path, name, split, str(rows) if rows is not None else "all"]
+    if columns:
+        parts.append(hashlib.sha256(",".join(sorted(columns)).encode("utf-8")).hexdigest()[:8])
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", "_".join(p for p in parts if p)).strip("_")
+
+
+def _encode_row(row):
+    """JSON bytes for a row plus the binary values it refers to, in order."""
+    blobs = []
+
+    def walk(v):
+        if isinstance(v, (bytes, bytearray, memoryview)):
+            blobs.append(bytes(v))
+            return {_BLOB_KEY: len(blobs) - 1}
+        if isinstance(v, dict):
+            return {k: walk(x) for k, x in v.items()}
+        if isinstance(v, (list, tuple)):
+            return [walk(x) for x in v]
+        return v
+
+    return json.dumps(walk(row), ensure_ascii=False).encode("utf-8"), blobs
+
+
+def _raw_columns(ds):
+    """Leave image columns encoded (bytes + path) instead of decoding them to PIL."""
+    from datasets import Image
+    for col, feature in ds.features.items():
+        if isinstance(feature, Image):
+            ds = ds.cast_column(col, Image(decode=False))
+    return ds
+
+
+def export(ds, out_dir, source=None):
+    """Write rows of ds (any iterable of dicts) as a snapshot in out_dir; returns its index."""
+    os.makedirs(out_dir, exist_ok=True)
+    data_path = os.path.join(out_dir, "data.bin")
+    tmp = data_path + ".tmp"
+    offsets, columns = [], []
+    with open(tmp, "wb") as f:
+        for row in ds:
+            if not columns:
+                columns = list(row)
+            record, blobs = _encode_row(row)
+            offsets.append(f.tell())
+            # row layout: <u32 json length><json><u32 blob count>(<u64 length><bytes>)*
+            f.write(struct.pack("<I", len(record)))
+            f.write(record)
+            f.write(struct.pack("<I", len(blobs)))
+            for blob in blobs:
+                f.write(struct.pack("<Q", len(blob)))
+                f.write(blob)
+    os.replace(tmp, data_path)
+    index = {
+        "version": FORMAT_VERSION,
+        "source": source or {},
+        "rows": len(offsets),
+        "columns": columns,
+        "sha256": sha256_file(data_path),
+        "offsets": offsets,
+    }
+    _atomic_write_json(os.path.join(out_dir, "index.json"), index)
+    return index
+
+
+class Snapshot:
+    """
+    Read-only, lazily decoded view of an exported subset. Supports what the
+    harnesses use of a `datasets.Dataset`: len(), indexing, iteration,
+    select() and column_names.
+    """
+
+    def __init__(self, path, rows=None, expect_sha256=None):
+        self.path = path
+        with open(os.path.join(path, "index.json"), "r", encoding="utf-8") as f:
+            self.index = json.load(f)
+        if self.index.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: snapshot format {self.index.get('version')}, expected {FORMAT_VERSION}")
+        if expect_sha256 and not self.verify(expect_sha256):
+            raise ValueError(f"{path}: data.bin does not hash to the pinned sha256 {expect_sha256} "
+                             f"(exported as {self.sha256})")
+        self._rows = list(range(self.index["rows"])) if rows is None else list(rows)
+        self._f = open(os.path.join(path, "data.bin"), "rb")
+        size = os.fstat(self._f.fileno()).st_size
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    @property
+    def sha256(self):
+        return self.index["sha256"]
+
+    @property
+    def column_names(self):
+        return list(self.index["columns"])
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _decode(self, row):
+        mm = self._mm
+        pos = self.index["offsets"][row]
+        (n,) = struct.unpack_from("<I", mm, pos)
+        record = json.loads(bytes(mm[pos + 4:pos + 4 + n]).decode("utf-8"))
+        pos += 4 + n
+        (count,) = struct.unpack_from("<I", mm, pos)
+        pos += 4
+        blobs = []
+        for _ in range(count):
+            (size,) = struct.unpack_from("<Q", mm, pos)
+            blobs.append(bytes(mm[pos + 8:pos + 8 + size]))
+            pos += 8 + size
+
+        def walk(v):
+            if isinstance(v, dict):
+                if len(v) == 1 and _BLOB_KEY in v:
+                    return blobs[v[_BLOB_KEY]]
+                return {k: walk(x) for k, x in v.items()}
+            if isinstance(v, list):
+                return [walk(x) for x in v]
+            return v
+
+        return walk(record)
+
+    def __getitem__(self, i):
+        return self._decode(self._rows[i])
+
+    def __iter__(self):
+        for row in self._rows:
+            yield self._decode(row)
+
+    def select(self, indices):
+        view = Snapshot.__new__(Snapshot)
+        view.__dict__.update(self.__dict__)
+        view._rows = [self._rows[i] for i in indices]
+        return view
+
+    def verify(self, expect_sha256=None):
+        """True if data.bin hashes to expect_sha256 (default: the sha256 recorded at export)."""
+        return sha256_file(os.path.join(self.path, "data.bin")) == (expect_sha256 or self.sha256)
+
+
+def load_subset(path, name=None, split="test", rows=None, columns=None, root=DEFAULT_ROOT, expect_sha256=None,
+                pins=None):
+    """
+    The first `rows` rows (all if None) of a Hugging Face dataset split,
+    restricted to `columns` if given, from its snapshot under root; the
+    snapshot is exported from `datasets` the first time. Its data is checked
+    against expect_sha256, else the subset's entry in the pins file, which a
+    subset without one gets from this snapshot.
+    """
+    snap_name = snapshot_name(path, name, split, rows, columns)
+    out_dir = os.path.join(root, snap_name)
+    if not os.path.isfile(os.path.join(out_dir, "index.json")):
+        from datasets import load_dataset
+
+        ds = load_dataset(path, name, split=split)
+        if rows is not None:
+            ds = ds.select(range(min(rows, len(ds))))
+        if columns:
+            ds = ds.select_columns(list(columns))
+        index = export(_raw_columns(ds), out_dir,
+                       source={"path": path, "name": name, "split": split, "rows": rows,
+                               "columns": list(columns) if columns else None,
+                               "fingerprint": getattr(ds, "_fingerprint", None)})
+        print(f"[DATASET] exported {index['rows']} rows of {path} to {out_dir} (sha256 {index['sha256'][:12]})")
+    expect_sha256 = expect_sha256 or load_pins(pins).get(snap_name)
+    snap = Snapshot(out_dir, expect_sha256=expect_sha256)
+    if not expect_sha256:
+        if not snap.verify():
+            raise ValueError(f"{out_dir}: data.bin does not hash to its recorded sha256 {snap.sha256}")
+        pin(snap_name, snap.sha256, pins)
+        print(f"[DATASET] pinned {snap_name} to sha256 {snap.sha256[:12]} in "
+              f"{PINS_FILE if pins is None else pins}; check it in")
+    print(f"[DATASET] {path} {split}: {len(snap)} rows from snapshot {snap.sha256[:12]}")
+    return snap
+
+
+def _list(root):
+    for entry in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        try:
+            snap = Snapshot(os.path.join(root, entry))
+        except (OSError, ValueError):
+            continue
+        src = snap.index.get("source", {})
+        size = os.path.getsize(os.path.join(snap.path, "data.bin"))
+        print(f"{entry}: {len(snap)} rows, {size / 1e6:.1f} MB, sha256 {snap.sha256[:12]}  "
+              f"({src.get('path')} {src.get('name') or ''} {src.get('split')})")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Export and inspect offline dataset snapshots.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ex = sub.add_parser("export", help="export a dataset subset (no-op if it already exists)")
+    ex.add_argument("path", help="Hugging Face dataset, e.g. zai-org/LongBench")
+    ex.add_argument("--name", default=None, help="dataset config, e.g. qmsum")
+    ex.add_argument("--split", default="test")
+    ex.add_argument("--rows", type=int, default=None, help="first N rows (default: all)")
+    ex.add_argument("--columns", default=None, help="comma-separated columns to keep")
+    ls = sub.add_parser("ls", help="list snapshots")
+    verify = sub.add_parser("verify", help="re-hash a snapshot")
+    verify.add_argument("snapshot")
+    verify.add_argument("--expect", default=None, help="sha256 the snapshot must have (default: its pin)")
+    pin_p = sub.add_parser("pin", help="pin a snapshot's current sha256 in dataset_pins.json")
+    pin_p.add_argument("snapshot")
+    for p in (ex, ls):
+        p.add_argument("--root", default=DEFAULT_ROOT)
+    args = ap.parse_args()
+
+    if args.cmd == "export":
+        columns = args.columns.split(",") if args.columns else None
+        load_subset(args.path, args.name, args.split, args.rows, columns, root=args.root)
+    elif args.cmd == "ls":
+        _list(args.root)
+    elif args.cmd == "pin":
+        snap = Snapshot(args.snapshot)
+        if not snap.verify():
+            raise SystemExit(f"{args.snapshot}: data.bin does not hash to its recorded sha256 {snap.sha256}")
+        pin(os.path.basename(os.path.normpath(args.snapshot)), snap.sha256)
+        print(f"{args.snapshot}: pinned sha256 {snap.sha256}")
+    else:
+        snap = Snapshot(args.snapshot)
+        expect = args.expect or load_pins().get(os.path.basename(os.path.normpath(args.snapshot)))
+        ok = snap.verify(expect)
+        print(f"{args.snapshot}: {len(snap)} rows, sha256 {snap.sha256} {'OK' if ok else 'MISMATCH'}")
+        raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Incremental deployment of the pkg-snapdragon install prefix.
+
+Replaces `adb push pkg-snapdragon/* /data/local/tmp/llama.cpp`: every file in
+the package is hashed, compared with the manifest kept on the device
+(<prefix>/.deploy_manifest.json), and only new or changed binaries and
+libraries are pushed, several `adb push`es at a time (or as one tar stream
+with --tar). Afterwards bin/* is made executable again. After rebuilding just
+the Hexagon backend this pushes a couple of .so files instead of the whole
+package.
+
+    cmake --install build-snapdragon --prefix pkg-snapdragon
+    python deploy_pkg.py                         # pkg-snapdragon -> /data/local/tmp/llama.cpp
+    python deploy_pkg.py --dry-run               # list what would be pushed
+    python deploy_pkg.py --prune --devices all   # also delete files no longer in the package
+"""
+import argparse
+import os
+import shlex
+import time
+
+from adb_utils import adb_shell
+from device_assets import DeviceAssets, plan
+from device_pool import device_name, resolve_devices
+
+DEVICE_PREFIX = "/data/local/tmp/llama.cpp"
+
+
+class PackageDeployer:
+    def __init__(self, pkg_dir="pkg-snapdragon", prefix=DEVICE_PREFIX, jobs=4):
+        self.pkg_dir = pkg_dir
+        self.prefix = prefix.rstrip("/")
+        self.jobs = jobs
+        self.assets = plan([pkg_dir], dest=self.prefix)
+
+    def device(self, serial):
+        return DeviceAssets(serial, root=self.prefix, manifest_path=f"{self.prefix}/.deploy_manifest.json")
+
+    def removed(self, device):
+        """Files a previous deploy put under the prefix that are no longer in the package."""
+        current = {a.device_path for a in self.assets}
+        return sorted(p for p in device.read_manifest() if p.startswith(self.prefix + "/") and p not in current)
+
+    def deploy(self, serial=None, dry_run=False, prune=False):
+        name = device_name(serial)
+        device = self.device(serial)
+        if dry_run:
+            todo, _ = device.stale(self.assets)
+            for a in todo:
+                print(f"{name}: push {a.local} -> {a.device_path}")
+            for path in self.removed(device) if prune else []:
+                print(f"{name}: remove {path}")
+            print(f"{name}: {len(todo)} of {len(self.assets)} files to push "
+                  f"({sum(a.size for a in todo) / 1e6:.1f} MB)")
+            return
+
+        t0 = time.time()
+        result = device.sync(self.assets, jobs=self.jobs)
+        if prune:
+            gone = self.removed(device)
+            if gone:
+                adb_shell("rm -f " + " ".join(shlex.quote(p) for p in gone), serial=serial, timeout=60)
+                files = device.read_manifest()
+                for path in gone:
+                    files.pop(path, None)
+                device.write_manifest(files)
+                print(f"[DEPLOY] {name}: removed {len(gone)} files no longer in {self.pkg_dir}")
+        # adb push does not reliably keep the executable bit
+        adb_shell(f"chmod 755 {self.prefix}/bin/*", serial=serial, timeout=60)
+        print(f"[DEPLOY] {name}: {result['pushed']} of {len(self.assets)} files pushed, "
+              f"done in {time.time() - t0:.1f} s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Push only the changed files of pkg-snapdragon to the phone.")
+    ap.add_argument("pkg_dir", nargs="?", default="pkg-snapdragon", help="local install prefix")
+    ap.add_argument("--prefix", default=DEVICE_PREFIX, help="install location on the device")
+    ap.add_argument("--jobs", type=int, default=4, help="concurrent adb pushes")
+    ap.add_argument("--tar", action="store_true", help="send changed files as one tar stream instead")
+    ap.add_argument("--prune", action="store_true", help="delete files a previous deploy pushed that are gone now")
+    ap.add_argument("--dry-run", action="store_true", help="only list what would be pushed")
+    ap.add_argument("--devices", default=None, help="comma-separated adb serials, or 'all'")
+    args = ap.parse_args()
+
+    if not os.path.isdir(args.pkg_dir):
+        ap.error(f"{args.pkg_dir} not found; run `cmake --install build-snapdragon --prefix {args.pkg_dir}` first")
+    deployer = PackageDeployer(args.pkg_dir, args.prefix, jobs=0 if args.tar else args.jobs)
+    for serial in resolve_devices(args.devices):
+        deployer.deploy(serial, dry_run=args.dry_run, prune=args.prune)
+
+
+if __name__ == "__main__":
+    main()
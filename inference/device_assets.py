@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Device-side content cache for prompts, images and GGUF files.
+
+Files are hashed on the host and compared against a manifest kept on the
+phone (<root>/manifest.json). Only files that are missing or changed are
+sent, all of them in one tar stream over adb (`adb exec-in tar -x`, or
+push + extract where exec-in is not available), with the updated manifest as
+the last member so it never lists a file that did not arrive.
+
+Content-addressed assets land at <root>/<sha256><ext>: a sample refers to
+the path of its content, so an unchanged prompt or image is never pushed
+again and identical files are stored once. Named assets (GGUF models, or a
+directory under a fixed prefix) keep the device path the run scripts expect
+and are only re-sent when their hash changes.
+
+    python device_assets.py push --cas prompt_files/            # prints local -> device paths
+    python device_assets.py push --dest /data/local/tmp/gguf Llama-3.2-1B-Instruct-Q4_0.gguf
+    python device_assets.py ls
+
+Set ADB="python3 fake_adb.py" to exercise this without a phone.
+"""
+import argparse
+import io
+import json
+import os
+import posixpath
+import shlex
+import subprocess
+import tarfile
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from adb_utils import adb_cmd, adb_shell
+from device_pool import device_name, resolve_devices
+from result_store import memo_sha256, sha256_file
+
+DEVICE_TMP = "/data/local/tmp"
+DEVICE_ASSET_ROOT = DEVICE_TMP + "/assets"
+# above this, hashes are memoised by (path, size, mtime) like model_fingerprint()
+MEMO_MIN_BYTES = 64 << 20
+
+Asset = namedtuple("Asset", "local sha256 size device_path")
+
+
+def content_hash(path):
+    if os.path.getsize(path) >= MEMO_MIN_BYTES:
+        return memo_sha256(path)
+    return sha256_file(path)
+
+
+def expand(paths):
+    """(file, path relative to its argument) for files and directories, recursively."""
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            for dirpath, dirnames, filenames in os.walk(p):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    full = os.path.join(dirpath, name)
+                    files.append((full, os.path.relpath(full, p)))
+        else:
+            files.append((p, os.path.basename(p)))
+    return files
+
+
+def cas_path(digest, local, root=DEVICE_ASSET_ROOT):
+    return f"{root}/{digest}{os.path.splitext(local)[1]}"
+
+
+def plan(paths, dest=None, root=DEVICE_ASSET_ROOT):
+    """
+    Assets for paths: content-addressed under root, or, with dest, at
+    dest/<path relative to the argument>.
+    """
+    assets = []
+    for local, rel in expand(paths):
+        digest = content_hash(local)
+        if dest:
+            device = posixpath.join(dest, *rel.split(os.sep))
+        else:
+            device = cas_path(digest, local, root)
+        if not device.startswith(DEVICE_TMP + "/"):
+            raise ValueError(f"device path {device} is outside {DEVICE_TMP}")
+        assets.append(Asset(local, digest, os.path.getsize(local), device))
+    return assets
+
+
+def _rel(device_path):
+    return posixpath.relpath(device_path, DEVICE_TMP)
+
+
+class DeviceAssets:
+    def __init__(self, serial=None, root=DEVICE_ASSET_ROOT, manifest_path=None):
+        self.serial = serial
+        self.root = root
+        self.manifest_path = manifest_path or f"{root}/manifest.json"
+
+    def read_manifest(self):
+        """{device path: {"sha256", "size", "source"}} as recorded on the device."""
+        text = adb_shell(f"cat {self.manifest_path} 2>/dev/null", serial=self.serial, check=False, timeout=60)
+        try:
+            return json.loads(text).get("files", {})
+        except ValueError:
+            return {}
+
+    def missing(self, device_paths, chunk=100):
+        """The device_paths that do not exist on the device (e.g. deleted by hand)."""
+        gone = []
+        for i in range(0, len(device_paths), chunk):
+            batch = device_paths[i:i + chunk]
+            quoted = " ".join(shlex.quote(p) for p in batch)
+            out = adb_shell(f'i=0; for f in {quoted}; do [ -e "$f" ] || echo $i; i=$((i+1)); done',
+                            serial=self.serial, check=False, timeout=60)
+            gone += [batch[int(line)] for line in out.split() if line.isdigit() and int(line) < len(batch)]
+        return gone
+
+    def write_manifest(self, files):
+        fd, local = tempfile.mkstemp(suffix=".json")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "files": files}, f, indent=1, sort_keys=True)
+            subprocess.run(adb_cmd(self.serial) + ["push", local, self.manifest_path], check=True, capture_output=True)
+        finally:
+            os.remove(local)
+
+    def stale(self, assets):
+        """Assets whose device copy is missing or has a different hash."""
+        files = self.read_manifest()
+        recorded = {a.device_path for a in assets if files.get(a.device_path, {}).get("sha256") == a.sha256}
+        recorded -= set(self.missing(sorted(recorded)))
+        todo, seen = [], set()
+        for a in assets:
+            if a.device_path not in recorded and a.device_path not in seen:
+                seen.add(a.device_path)
+                todo.append(a)
+        return todo, files
+
+    def _write_tar(self, fileobj, assets, manifest):
+        with tarfile.open(fileobj=fileobj, mode="w|") as tar:
+            for a in assets:
+                tar.add(a.local, arcname=_rel(a.device_path), recursive=False)
+            data = json.dumps(manifest, indent=1, sort_keys=True).encode("utf-8")
+            info = tarfile.TarInfo(_rel(self.manifest_path))
+            info.size = len(data)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(data))
+
+    def _mkdirs(self, assets):
+        dirs = sorted({posixpath.dirname(a.device_path) for a in assets} | {self.root})
+        return "mkdir -p " + " ".join(shlex.quote(d) for d in dirs)
+
+    def _transfer_stream(self, assets, manifest):
+        cmd = f"{self._mkdirs(assets)} && tar -xf - -C {DEVICE_TMP}"
+        proc = subprocess.Popen(adb_cmd(self.serial) + ["exec-in", cmd],
+                                stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            self._write_tar(proc.stdin, assets, manifest)
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        err = proc.stderr.read().decode("utf-8", "replace").strip()
+        if proc.wait() != 0:
+            raise RuntimeError(err or f"adb exec-in exited with {proc.returncode}")
+
+    def _transfer_parallel(self, assets, manifest, jobs):
+        adb_shell(self._mkdirs(assets), serial=self.serial, timeout=60)
+
+        def push(a):
+            subprocess.run(adb_cmd(self.serial) + ["push", a.local, a.device_path], check=True, capture_output=True)
+
+        with ThreadPoolExecutor(max_workers=jobs) as ex:
+            list(ex.map(push, assets))
+        self.write_manifest(manifest["files"])
+
+    def _transfer_push(self, assets, manifest):
+        remote = f"{self.root}/.incoming.tar"
+        fd, local = tempfile.mkstemp(suffix=".tar")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                self._write_tar(f, assets, manifest)
+            adb_shell(self._mkdirs(assets), serial=self.serial, timeout=60)
+            subprocess.run(adb_cmd(self.serial) + ["push", local, remote], check=True, capture_output=True)
+            adb_shell(f"tar -xf {remote} -C {DEVICE_TMP}; rc=$?; rm -f {remote}; exit $rc", serial=self.serial)
+        finally:
+            os.remove(local)
+
+    def sync(self, assets, jobs=0):
+        """
+        Send the assets the device does not have yet: one tar stream, or with
+        jobs > 0 that many concurrent `adb push`es. Returns {"pushed", "bytes", "seconds"}.
+        """
+        todo, files = self.stale(assets)
+        name = device_name(self.serial)
+        if not todo:
+            print(f"[ASSETS] {name}: {len(assets)} files up to date")
+            return {"pushed": 0, "bytes": 0, "seconds": 0.0}
+
+        for a in todo:
+            files[a.device_path] = {"sha256": a.sha256, "size": a.size, "source": os.path.basename(a.local)}
+        manifest = {"version": 1, "files": files}
+        nbytes = sum(a.size for a in todo)
+        t0 = time.time()
+        if jobs > 0:
+            self._transfer_parallel(todo, manifest, jobs)
+        else:
+            try:
+                self._transfer_stream(todo, manifest)
+            except (OSError, RuntimeError) as e:
+                print(f"[WARN] {name}: streaming tar over adb exec-in failed ({e}), pushing the tar instead")
+                self._transfer_push(todo, manifest)
+        seconds = time.time() - t0
+        print(f"[ASSETS] {name}: pushed {len(todo)} of {len(assets)} files "
+              f"({nbytes / 1e6:.1f} MB) in {seconds:.1f} s")
+        return {"pushed": len(todo), "bytes": nbytes, "seconds": seconds}
+
+
+def sync_devices(assets, serials=(None,), root=DEVICE_ASSET_ROOT):
+    """DeviceAssets.sync() on every device, in parallel. Returns {serial: result}."""
+    serials = list(serials)
+    with ThreadPoolExecutor(max_workers=len(serials)) as ex:
+        results = ex.map(lambda s: DeviceAssets(s, root).sync(assets), serials)
+        return dict(zip(serials, results))
+
+
+def push_cas(paths, serials=(None,), root=DEVICE_ASSET_ROOT):
+    """Make paths available content-addressed on every device; returns {local path: device path}."""
+    assets = plan(paths, root=root)
+    sync_devices(assets, serials, root)
+    return {a.local: a.device_path for a in assets}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Push prompts, images and models to the phone, skipping unchanged files.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    push = sub.add_parser("push", help="send files/directories the device does not have yet")
+    push.add_argument("paths", nargs="+")
+    where = push.add_mutually_exclusive_group(required=True)
+    where.add_argument("--cas", action="store_true", help="content-addressed under --root")
+    where.add_argument("--dest", help="device directory to mirror the paths into (e.g. /data/local/tmp/gguf)")
+    sub.add_parser("ls", help="list the device manifest")
+    for p in (push, sub.choices["ls"]):
+        p.add_argument("--root", default=DEVICE_ASSET_ROOT, help="device directory holding the cache and manifest")
+        p.add_argument("--devices", default=None, help="comma-separated adb serials, or 'all'")
+    args = ap.parse_args()
+
+    serials = resolve_devices(args.devices)
+    if args.cmd == "ls":
+        for serial in serials:
+            files = DeviceAssets(serial, args.root).read_manifest()
+            total = sum(f.get("size", 0) for f in files.values())
+            print(f"{device_name(serial)}: {len(files)} files, {total / 1e6:.1f} MB")
+            for path, f in sorted(files.items()):
+                print(f"  {path}  {f['sha256'][:12]}  {f.get('source', '')}")
+        return
+
+    assets = plan(args.paths, dest=args.dest, root=args.root)
+    sync_devices(assets, serials, args.root)
+    if args.cas:
+        for a in assets:
+            print(f"{a.local} -> {a.device_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Work-stealing pool of phones for the eval harnesses.
+
+One worker thread per device serial pulls the next sample from a shared
+queue, so a phone that finishes early (or is not cooling down) simply takes
+more of the work. A sample whose run fails (returns None or raises) goes back
+on the queue for another device, up to `retries` times; a device that fails
+`max_device_failures` samples in a row is dropped from the pool. Results come
+back in sample order together with the serial that produced them, so the
+harness can merge them into one report and keep the device on every record.
+
+    python device_pool.py                  # devices `--devices all` would use
+    python truthful_qa_eval.py --devices R5CX10ABCD,R5CX10EFGH
+    python longbench_test.py --devices all
+"""
+import argparse
+import queue
+import subprocess
+import threading
+import time
+
+from adb_utils import adb_cmd
+
+
+def list_devices():
+    """Serials of the attached devices that are online ('device' state)."""
+    proc = subprocess.run(adb_cmd() + ["devices"], text=True, capture_output=True, timeout=30)
+    serials = []
+    for line in proc.stdout.splitlines()[1:]:
+        parts = line.split()
+        if len(parts) >= 2 and parts[1] == "device":
+            serials.append(parts[0])
+    return serials
+
+
+def resolve_devices(spec):
+    """
+    Serials for a --devices value: comma-separated serials, or 'all' for every
+    attached device. Empty means [None], i.e. the default device ($S or the
+    only one attached), which is what the harnesses did before.
+    """
+    if not spec:
+        return [None]
+    if spec == "all":
+        serials = list_devices()
+        if not serials:
+            raise RuntimeError("--devices all: no devices attached")
+        return serials
+    return [s.strip() for s in spec.split(",") if s.strip()]
+
+
+def device_name(serial):
+    return serial or "default"
+
+
+def per_device(serials, make):
+    """{serial: make(serial)} for the devices where make() returned something."""
+    objs = {}
+    for serial in serials:
+        obj = make(serial)
+        if obj is not None:
+            objs[serial] = obj
+    return objs
+
+
+class _Task:
+    def __init__(self, index, item):
+        self.index = index
+        self.item = item
+        self.attempts = 0
+        self.tried = set()
+
+
+class DevicePool:
+    def __init__(self, serials, retries=2, max_device_failures=3, poll_s=0.2):
+        self.serials = list(serials)
+        self.retries = retries
+        self.max_device_failures = max_device_failures
+        self.poll_s = poll_s
+        self.stats = {s: {"done": 0, "failed": 0, "busy_s": 0.0} for s in self.serials}
+
+    def imap(self, items, work):
+        """
+        Run work(serial, index, item) for every item, spread over the devices.
+        Yields (index, item, result, serial) in item order; result is None
+        when every attempt failed. Closing the generator early stops the
+        workers after their current item.
+        """
+        tasks = list(enumerate(items))
+        todo = queue.Queue()
+        for i, item in tasks:
+            todo.put(_Task(i, item))
+        results = {}
+        live = set(self.serials)
+        cond = threading.Condition()
+        stop = threading.Event()
+
+        def fail_remaining():
+            while True:
+                try:
+                    task = todo.get_nowait()
+                except queue.Empty:
+                    return
+                results[task.index] = (None, None)
+
+        def worker(serial):
+            stats = self.stats[serial]
+            consecutive = 0
+            while not stop.is_set():
+                with cond:
+                    if len(results) == len(tasks):
+                        return
+                try:
+                    task = todo.get(timeout=self.poll_s)
+                except queue.Empty:
+                    continue
+                if serial in task.tried and live - task.tried:
+                    # leave a retry to a device that has not failed it yet
+                    todo.put(task)
+                    time.sleep(self.poll_s)
+                    continue
+
+                t0 = time.time()
+                try:
+                    result = work(serial, task.index, task.item)
+                except Exception as e:
+                    print(f"[ERROR] {device_name(serial)}: sample {task.index} failed: {e}")
+                    result = None
+                stats["busy_s"] += time.time() - t0
+
+                with cond:
+                    if result is not None:
+                        consecutive = 0
+                        stats["done"] += 1
+                        results[task.index] = (result, serial)
+                        cond.notify_all()
+                        continue
+                    consecutive += 1
+                    stats["failed"] += 1
+                    task.attempts += 1
+                    task.tried.add(serial)
+                    if consecutive >= self.max_device_failures:
+                        print(f"[WARN] {device_name(serial)} failed {consecutive} samples in a row, "
+                              f"removing it from the pool")
+                        live.discard(serial)
+                    if task.attempts <= self.retries and live:
+                        print(f"[RETRY] sample {task.index} (attempt {task.attempts + 1} of {self.retries + 1})")
+                        todo.put(task)
+                    else:
+                        results[task.index] = (None, serial)
+                    if serial not in live:
+                        if not live:
+                            fail_remaining()
+                        cond.notify_all()
+                        return
+                    cond.notify_all()
+
+        threads = [threading.Thread(target=worker, args=(s,), name=f"device-{device_name(s)}", daemon=True)
+                   for s in self.serials]
+        for t in threads:
+            t.start()
+        try:
+            for i, item in tasks:
+                with cond:
+                    while i not in results:
+                        cond.wait()
+                    result, serial = results[i]
+                yield i, item, result, serial
+        finally:
+            stop.set()
+            for t in threads:
+                t.join()
+
+    def summary(self):
+        return " | ".join(f"{device_name(s)}: {st['done']} done, {st['failed']} failed, busy {st['busy_s']:.0f} s"
+                          for s, st in self.stats.items())
+
+
+def add_device_args(ap):
+    """Multi-device options shared by the eval harnesses."""
+    ap.add_argument("--devices", default=None,
+                    help="comma-separated adb serials, or 'all'; samples are spread over them "
+                         "(default: the single device from $S)")
+    ap.add_argument("--retries", type=int, default=2, help="times a failed sample is retried on another device")
+
+
+def pool_from_args(args):
+    """(serials, DevicePool or None); no pool when there is only one device."""
+    serials = resolve_devices(args.devices)
+    pool = DevicePool(serials, retries=args.retries) if len(serials) > 1 else None
+    return serials, pool
+
+
+def summarize_devices(records, key="latency"):
+    """Per-device sample count and mean of key over merged records."""
+    by_device = {}
+    for r in records:
+        by_device.setdefault(r.get("device"), []).append(r.get(key))
+    return {device_name(d): {"n": len(vals),
+                             "mean": sum(v for v in vals if v is not None) / max(1, sum(v is not None for v in vals))}
+            for d, vals in by_device.items()}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="List the devices a --devices all run would use.")
+    ap.parse_args()
+    for serial in list_devices():
+        print(serial)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Energy-per-token measurement for on-device runs.
+
+PowerSampler streams battery current_now/voltage_now from the phone (one
+long-running adb shell loop, timestamped on the host as lines arrive) while
+the harness runs. For each llama-cli / llama-server request the samples are
+integrated over the request's wall-clock window, and split into prefill and
+decode windows using the request's own timings: decode is the last decode_ms
+of the window and prefill the prompt_ms before it (model load, if any, comes
+first and only counts towards energy_j).
+
+Numbers are whole-phone power as seen by the battery gauge, so keep the
+screen state and background load the same between runs you compare. The
+gauge only measures the phone's draw while the battery discharges: on USB
+power current_now is (part of) the charge current, so samples whose
+battery status is not "Discharging" are flagged and a request that overlaps
+any of them gets no energy figures (energy_j None, on_charger True). Run on
+battery, e.g. with adb over Wi-Fi, to measure energy.
+
+Set ADB="python3 fake_adb.py" to exercise this without a phone.
+"""
+import bisect
+import subprocess
+import threading
+import time
+
+from adb_utils import adb_cmd
+from log_parser import iter_records
+
+ENERGY_FIELDS = ["energy_j", "j_per_prefill_token", "j_per_decode_token"]
+DISCHARGING = "Discharging"
+
+
+def stream_cmd(interval_s):
+    return ("d=/sys/class/power_supply/battery; "
+            "while true; do echo \"$(cat $d/current_now) $(cat $d/voltage_now) $(cat $d/status)\"; "
+            f"sleep {interval_s}; done")
+
+
+class PowerSampler:
+    """Background (time, watts, discharging) samples from the battery gauge."""
+
+    def __init__(self, serial=None, interval_s=0.2):
+        self.serial = serial
+        self.interval_s = interval_s
+        self.samples = []
+        self._lock = threading.Lock()
+        self._proc = None
+        self._thread = None
+        self.status = None
+        self._warned_negative = False
+
+    def _reader(self):
+        for line in self._proc.stdout:
+            parts = line.split(None, 2)
+            if len(parts) != 3:
+                continue
+            try:
+                current_ua, voltage_uv = int(parts[0]), int(parts[1])
+            except ValueError:
+                continue
+            # the power_supply ABI has current_now negative while discharging, but many Qualcomm/Samsung
+            # gauges report it positive: on battery its magnitude is the draw either way. On a charger it
+            # is the net charge current instead and the sample is flagged
+            watts = abs(current_ua) / 1e6 * voltage_uv / 1e6
+            status = parts[2].strip()
+            with self._lock:
+                self.samples.append((time.time(), watts, status == DISCHARGING))
+                self.status = status
+
+    def start(self):
+        if self._proc is None:
+            self._proc = subprocess.Popen(adb_cmd(self.serial) + ["shell", stream_cmd(self.interval_s)],
+                                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1)
+            self._thread = threading.Thread(target=self._reader, name="power-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._proc is not None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+            self._thread.join(timeout=5)
+            self._proc = None
+
+    def wait_ready(self, timeout=10.0):
+        """True once the first sample has arrived."""
+        t0 = time.time()
+        while time.time() - t0 < timeout:
+            if self.samples:
+                return True
+            if self._proc is not None and self._proc.poll() is not None:
+                return False
+            time.sleep(0.05)
+        return bool(self.samples)
+
+    @staticmethod
+    def _power_at(samples, times, t):
+        """Linear interpolation between the samples around t (clamped at the ends)."""
+        i = bisect.bisect_left(times, t)
+        if i == 0:
+            return samples[0][1]
+        if i == len(samples):
+            return samples[-1][1]
+        (t0, p0, _), (t1, p1, _) = samples[i - 1], samples[i]
+        return p0 if t1 == t0 else p0 + (p1 - p0) * (t - t0) / (t1 - t0)
+
+    def on_charger(self, start, end):
+        """True if a sample in [start, end] (or one either side of it) was not taken on battery."""
+        with self._lock:
+            samples = list(self.samples)
+        times = [t for t, _, _ in samples]
+        lo, hi = bisect.bisect_right(times, start), bisect.bisect_left(times, end)
+        return not all(discharging for _, _, discharging in samples[max(0, lo - 1):hi + 1])
+
+    def energy(self, start, end):
+        """
+        Joules between host times start and end (trapezoidal), or None without
+        samples, when the window was not on battery or when the readings add
+        up to a negative energy (a gauge reading that is no draw).
+        """
+        if end <= start:
+            return 0.0
+        with self._lock:
+            samples = list(self.samples)
+        times = [t for t, _, _ in samples]
+        lo, hi = bisect.bisect_right(times, start), bisect.bisect_left(times, end)
+        if not samples or not all(discharging for _, _, discharging in samples[max(0, lo - 1):hi + 1]):
+            return None
+        points = [(start, self._power_at(samples, times, start))] + [(t, p) for t, p, _ in samples[lo:hi]]
+        points.append((end, self._power_at(samples, times, end)))
+        joules = sum((t1 - t0) * (p0 + p1) / 2.0 for (t0, p0), (t1, p1) in zip(points, points[1:]))
+        if joules < 0:
+            if not self._warned_negative:
+                print(f"[WARN] battery readings integrate to {joules:.3f} J over a request; "
+                      "not reporting energy for such windows")
+                self._warned_negative = True
+            return None
+        return joules
+
+    def phase_energy(self, start, end, prefill_ms=None, prompt_tokens=None, decode_ms=None, decode_tokens=None):
+        """
+        energy_j over [start, end] plus joules per prefill/decode token, with the
+        decode window anchored at the end of the request.
+        """
+        fields = dict.fromkeys(ENERGY_FIELDS)
+        fields["prompt_tokens"], fields["decode_tokens"] = prompt_tokens, decode_tokens
+        fields["on_charger"] = self.on_charger(start, end)
+        fields["energy_j"] = self.energy(start, end)
+        if fields["energy_j"] is None:
+            return fields
+        decode_s, prefill_s = (decode_ms or 0.0) / 1000.0, (prefill_ms or 0.0) / 1000.0
+        if decode_s + prefill_s > end - start:
+            # device clock ran longer than our window (adb latency, sampler skew)
+            scale = (end - start) / (decode_s + prefill_s)
+            decode_s, prefill_s = decode_s * scale, prefill_s * scale
+        decode_start = end - decode_s
+        prefill_start = max(start, decode_start - prefill_s)
+        decode_j = self.energy(max(start, decode_start), end) if decode_ms and decode_tokens else None
+        if decode_j is not None:
+            fields["j_per_decode_token"] = decode_j / decode_tokens
+        prefill_j = self.energy(prefill_start, max(start, decode_start)) if prefill_ms and prompt_tokens else None
+        if prefill_j is not None:
+            fields["j_per_prefill_token"] = prefill_j / prompt_tokens
+        return fields
+
+    def cli_energy(self, start, end, stderr_text):
+        """phase_energy() for one llama-cli invocation, phases taken from its llama_perf lines."""
+        rec = next(iter_records(stderr_text.splitlines()), None) or {}
+        return self.phase_energy(start, end, rec.get("prefill_ms"), rec.get("prompt_tokens"),
+                                 rec.get("decode_ms"), rec.get("decode_runs"))
+
+    def server_energy(self, start, end, timings):
+        """phase_energy() for one llama-server request, phases taken from its timings."""
+        return self.phase_energy(start, end, timings.get("prompt_ms"), timings.get("prompt_n"),
+                                 timings.get("predicted_ms"), timings.get("predicted_n"))
+
+
+def start_sampler(serial=None, interval_s=0.2):
+    """A running PowerSampler, or None if the device gives no current/voltage readings."""
+    sampler = PowerSampler(serial, interval_s)
+    try:
+        sampler.start()
+    except OSError as e:
+        print(f"[WARN] could not start power sampling via adb: {e}")
+        return None
+    if not sampler.wait_ready():
+        print("[WARN] no current/voltage readings from the device, energy will not be reported")
+        sampler.stop()
+        return None
+    if sampler.status != DISCHARGING:
+        print(f"[WARN] battery status is '{sampler.status}', not {DISCHARGING}: the gauge reads the charge "
+              "current, so samples run on a charger get no energy figures (unplug USB, e.g. use adb over Wi-Fi)")
+    return sampler
+
+
+def add_energy_args(ap):
+    """Energy sampling options shared by the eval harnesses."""
+    ap.add_argument("--power-interval", type=float, default=0.2, help="seconds between current/voltage samples")
+    ap.add_argument("--no-energy", action="store_true", help="disable energy measurement")
+
+
+def sampler_from_args(args, serial=None):
+    """A running PowerSampler for the parsed add_energy_args() options, or None."""
+    if args.no_energy:
+        return None
+    return start_sampler(serial, args.power_interval)
+
+
+def summarize_energy(records):
+    """
+    Total joules and token-weighted J/token over per-sample phase_energy()
+    results, and how many samples ran on a charger (and have no energy).
+    """
+    energy = [r["energy_j"] for r in records if r.get("energy_j") is not None]
+    prefill = [(r["j_per_prefill_token"], r["prompt_tokens"]) for r in records
+               if r.get("j_per_prefill_token") is not None and r.get("prompt_tokens")]
+    decode = [(r["j_per_decode_token"], r["decode_tokens"]) for r in records
+              if r.get("j_per_decode_token") is not None and r.get("decode_tokens")]
+    return {
+        "energy_j": sum(energy) if energy else None,
+        "j_per_prefill_token": sum(j * n for j, n in prefill) / sum(n for _, n in prefill) if prefill else None,
+        "j_per_decode_token": sum(j * n for j, n in decode) / sum(n for _, n in decode) if decode else None,
+        "n_on_charger": sum(bool(r.get("on_charger")) for r in records),
+    }
+
+
+def format_energy(summary):
+    """One-line rendering of a summarize_energy() result."""
+    def j(v, fmt=".3f"):
+        return "n/a" if v is None else f"{v:{fmt}}"
+    text = (f"{j(summary['energy_j'], '.1f')} J total, {j(summary['j_per_prefill_token'])} J/prefill token, "
+            f"{j(summary['j_per_decode_token'])} J/decode token")
+    if summary.get("n_on_charger"):
+        text += f" ({summary['n_on_charger']} samples on a charger left out)"
+    return text
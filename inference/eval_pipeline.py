@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Producer/consumer pipeline for generate-then-score evals.
+
+A generation thread drives the phone and feeds a bounded queue; the calling
+thread drains whatever is ready (up to batch_size samples) and scores it in
+one batch. While BLEURT scores sample i the phone is already decoding sample
+i+1, so wall time approaches max(generation, scoring) instead of their sum.
+Samples are generated and scored in order, and each sample's score depends
+only on its own prediction, so per-sample results are unchanged.
+
+With a device_pool.DevicePool, generation is spread over several phones and
+the finished samples are still handed to scoring in order.
+"""
+import queue
+import threading
+import time
+
+_DONE = object()
+
+
+class PipelineStats:
+    """Busy time of each stage, to compare against total wall time."""
+
+    def __init__(self):
+        self.generate_s = 0.0
+        self.score_s = 0.0
+        self.wall_s = 0.0
+        self.batches = 0
+
+    def summary(self):
+        return (f"wall {self.wall_s:.1f} s | generation busy {self.generate_s:.1f} s | "
+                f"scoring busy {self.score_s:.1f} s in {self.batches} batches")
+
+
+def run_pipelined(samples, generate, score_batch, on_result=None,
+                  queue_size=4, batch_size=8, stop_on_failure=False, pool=None):
+    """
+    samples:      iterable of sample records
+    generate:     f(index, sample) -> generation result, or None on failure;
+                  with a pool, f(index, sample, serial=...) on the pool's devices
+    score_batch:  f([(index, sample, generation), ...]) -> [score, ...]
+    on_result:    optional f(index, sample, generation, score), called in order
+
+    Failed generations are skipped (or end the run when stop_on_failure is set).
+    Returns (results, stats, failed) where results is a list of
+    (index, sample, generation, score) in sample order and failed is a list
+    of indices whose generation returned None.
+    """
+    work = queue.Queue(maxsize=queue_size)
+    stats = PipelineStats()
+    failed = []
+    errors = []
+    stop = threading.Event()
+    stats_lock = threading.Lock()
+
+    def timed_generate(serial, i, sample):
+        t0 = time.time()
+        gen = generate(i, sample) if pool is None else generate(i, sample, serial=serial)
+        with stats_lock:
+            stats.generate_s += time.time() - t0
+        return gen
+
+    def generations():
+        if pool is not None:
+            pooled = pool.imap(samples, timed_generate)
+            try:
+                for i, sample, gen, _ in pooled:
+                    if stop.is_set():
+                        return
+                    yield i, sample, gen
+            finally:
+                pooled.close()
+            return
+        for i, sample in enumerate(samples):
+            if stop.is_set():
+                return
+            yield i, sample, timed_generate(None, i, sample)
+
+    def producer():
+        gens = generations()
+        try:
+            for i, sample, gen in gens:
+                if gen is None:
+                    failed.append(i)
+                    if stop_on_failure:
+                        break
+                    continue
+                work.put((i, sample, gen))
+        except BaseException as e:  # re-raised on the scoring side
+            errors.append(e)
+        finally:
+            gens.close()
+            work.put(_DONE)
+
+    t_start = time.time()
+    thread = threading.Thread(target=producer, name="generation", daemon=True)
+    thread.start()
+
+    results = []
+    done = False
+    try:
+        while not done:
+            batch = [work.get()]
+            # take whatever else is already generated, without waiting for more
+            while len(batch) < batch_size:
+                try:
+                    batch.append(work.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is _DONE:
+                batch.pop()
+                done = True
+            if not batch:
+                continue
+            t0 = time.time()
+            scores = score_batch(batch)
+            stats.score_s += time.time() - t0
+            stats.batches += 1
+            for (i, sample, gen), score in zip(batch, scores):
+                results.append((i, sample, gen, score))
+                if on_result is not None:
+                    on_result(i, sample, gen, score)
+    finally:
+        stop.set()
+        # unblock a producer waiting on a full queue
+        while thread.is_alive():
+            try:
+                work.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    stats.wall_s = time.time() - t_start
+    return results, stats, failed
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Prefetching image preprocessing with an on-disk, encode-once cache for the
+VQA runner.
+
+Each dataset image is decoded, JPEG-encoded and content-hashed on a thread
+pool, a few samples ahead of the one being evaluated. With --image_size it
+is first shrunk to fit that square: set to the mmproj's
+clip.vision.image_size (the vision tower resizes to that anyway) it saves
+transfer and decode time on the phone. The default 0 keeps the original
+size, which models that tile high-resolution images need. The encoded file is kept at
+<cache_dir>/<dataset>_<split>_<size>px_q<quality>/<row>.jpg and listed in
+that directory's index.json, so a repeated run over the same rows does no
+image work at all: with the dataset's images left encoded (a
+dataset_snapshot subset, or raw_images()) cached rows are never even decoded.
+
+    python image_cache.py --data_path lmms-lab/textvqa --rows 100   # warm the cache
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# PIL's default, which run_llava.py always saved with: keeps the model's input comparable to earlier runs
+JPEG_QUALITY = 75
+
+
+def raw_images(dataset, column="image"):
+    """The dataset with its image column left as encoded bytes, so decoding happens in the prefetch pool."""
+    from datasets import Image as ImageFeature
+    if column in dataset.column_names:
+        dataset = dataset.cast_column(column, ImageFeature(decode=False))
+    return dataset
+
+
+def _open(image):
+    """PIL image for a decoded image, or a datasets {"bytes", "path"} dict from decode=False."""
+    if isinstance(image, Image.Image):
+        return image
+    if image.get("bytes"):
+        return Image.open(io.BytesIO(image["bytes"]))
+    return Image.open(image["path"])
+
+
+class ImageCache:
+    def __init__(self, cache_dir, dataset_key, size=0, quality=JPEG_QUALITY):
+        self.size = size
+        self.quality = quality
+        name = re.sub(r"[^A-Za-z0-9._-]+", "_", dataset_key).strip("_")
+        self.dir = os.path.join(cache_dir, f"{name}_{size or 'orig'}px_q{quality}")
+        self.index_path = os.path.join(self.dir, "index.json")
+        os.makedirs(self.dir, exist_ok=True)
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, row):
+        """(path, sha256) of a cached row, or None."""
+        entry = self.index.get(str(row))
+        if entry is None:
+            return None
+        path = os.path.join(self.dir, entry["file"])
+        if not os.path.exists(path):
+            return None
+        return path, entry["sha256"]
+
+    def encode(self, row, image):
+        """Decode, shrink, JPEG-encode and hash one image; returns (path, sha256)."""
+        img = _open(image).convert("RGB")
+        if self.size:
+            # only ever shrinks, keeping the aspect ratio
+            img.thumbnail((self.size, self.size), Image.BICUBIC)
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=self.quality)
+        data = buf.getvalue()
+        digest = hashlib.sha256(data).hexdigest()
+        name = f"{row}.jpg"
+        path = os.path.join(self.dir, name)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self.index[str(row)] = {"file": name, "sha256": digest, "bytes": len(data)}
+        return path, digest
+
+    def get(self, row, image):
+        hit = self.lookup(row)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return hit or self.encode(row, image)
+
+    def save(self):
+        with self._lock:
+            data = json.dumps(self.index, indent=1, sort_keys=True)
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, self.index_path)
+
+    def prefetch(self, rows, workers=4, ahead=8, image_key="image"):
+        """
+        For (row, sample) pairs, yield (row, sample, image path or None, sha256
+        or None) in order, preparing up to `ahead` images in the background.
+        The index is written when the generator finishes or is closed.
+        """
+        pending = deque()
+
+        def submit(ex, row, sample):
+            image = sample.get(image_key)
+            future = ex.submit(self.get, row, image) if image else None
+            pending.append((row, sample, future))
+
+        def pop():
+            row, sample, future = pending.popleft()
+            path, digest = future.result() if future else (None, None)
+            return row, sample, path, digest
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+                for row, sample in rows:
+                    submit(ex, row, sample)
+                    if len(pending) > ahead:
+                        yield pop()
+                while pending:
+                    yield pop()
+        finally:
+            self.save()
+
+    def summary(self):
+        return f"{self.hits} cached, {self.misses} encoded ({self.dir})"
+
+
+def add_image_cache_args(ap):
+    ap.add_argument("--image_cache", default="vqa_images", help="directory of encoded images, reused across runs")
+    ap.add_argument("--image_size", type=int, default=0,
+                    help="shrink images to fit this square, e.g. the mmproj's clip.vision.image_size "
+                         "(336 for LLaVA-1.5); 0 keeps the original size")
+    ap.add_argument("--image_quality", type=int, default=JPEG_QUALITY, help="JPEG quality of the encoded images")
+    ap.add_argument("--prefetch", type=int, default=8, help="images prepared ahead of the current sample")
+    ap.add_argument("--prefetch_workers", type=int, default=4, help="threads decoding/encoding images")
+
+
+def main():
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from dataset_snapshot import load_subset
+
+    ap = argparse.ArgumentParser(description="Encode a VQA dataset's images into the cache ahead of a run.")
+    ap.add_argument("--data_path", default="lmms-lab/textvqa")
+    ap.add_argument("--split", default="validation")
+    ap.add_argument("--rows", type=int, default=100)
+    add_image_cache_args(ap)
+    args = ap.parse_args()
+
+    dataset = load_subset(args.data_path, split=args.split, rows=args.rows)
+    cache = ImageCache(args.image_cache, f"{args.data_path}_{args.split}", args.image_size, args.image_quality)
+    for _ in cache.prefetch(enumerate(dataset), args.prefetch_workers, args.prefetch):
+        pass
+    print(cache.summary())
+
+
+if __name__ == "__main__":
+    main()
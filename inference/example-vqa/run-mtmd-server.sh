@@ -0,0 +1,70 @@
+#!/bin/sh
+#
+# Launches a multimodal llama-server on Snapdragon via adb, with the same
+# model/mmproj settings as run-mtmd-cli.sh. The model and vision projector
+# are loaded once; run_llava.py --backend server then sends every image as a
+# base64 data URL in a /v1/chat/completions request, so nothing is pushed per
+# sample. Reach it from the host with `adb forward tcp:$PORT tcp:$PORT`.
+#
+
+# Basedir on device
+basedir=/data/local/tmp/llama.cpp
+
+cli_opts=
+
+PORT="${PORT:-8080}"
+
+branch=.
+[ "$B" != "" ] && branch=$B
+
+adbserial=
+[ "$S" != "" ] && adbserial="-s $S"
+
+# adb binary; override with env ADB (e.g. ADB="python3 fake_adb.py" without a phone)
+adb="${ADB:-adb}"
+
+model="Llama-3.2-3B-Instruct-Q4_0.gguf"
+[ "$M" != "" ] && model="$M"
+
+mmproj="something.gguf"
+[ "$MM" != "" ] && mmproj="$MM"
+
+device="HTP0"
+[ "$D" != "" ] && device="$D"
+
+verbose=
+[ "$V" != "" ] && verbose="GGML_HEXAGON_VERBOSE=$V"
+
+experimental=
+[ "$E" != "" ] && experimental="GGML_HEXAGON_EXPERIMENTAL=$E"
+
+sched=
+[ "$SCHED" != "" ] && sched="GGML_SCHED_DEBUG=2" cli_opts="$cli_opts -v"
+
+profile=
+[ "$PROF" != "" ] && profile="GGML_HEXAGON_PROFILE=$PROF GGML_HEXAGON_OPSYNC=1"
+
+opmask=
+[ "$OPMASK" != "" ] && opmask="GGML_HEXAGON_OPMASK=$OPMASK"
+
+nhvx=
+[ "$NHVX" != "" ] && nhvx="GGML_HEXAGON_NHVX=$NHVX"
+
+ndev=
+[ "$NDEV" != "" ] && ndev="GGML_HEXAGON_NDEV=$NDEV"
+
+set -x
+
+$adb $adbserial shell " \
+  cd $basedir; ulimit -c unlimited;        \
+    LD_LIBRARY_PATH=$basedir/$branch/lib   \
+    ADSP_LIBRARY_PATH=$basedir/$branch/lib \
+    $verbose $experimental $sched $opmask $profile $nhvx $ndev           \
+      ./$branch/bin/llama-server -m $basedir/../gguf/$model       \
+         --mmproj $basedir/../gguf/$mmproj --no-mmproj-offload    \
+         --host 127.0.0.1 --port $PORT -np 1 \
+         --batch-size 1 -fa on -n 30 --no-mmap -ctk q4_0 -ctv q4_0\
+         --device $device --temp 0\
+         --chat-template deepseek \
+         $cli_opts $@ \
+"
@@ -6,7 +6,6 @@ import random
 import numpy as np
 from tqdm import tqdm
 
-from datasets import load_dataset, concatenate_datasets
 
 from argparse import ArgumentParser
 
@@ -21,6 +20,17 @@ import numpy as np
 from tqdm import tqdm
 import shlex
 
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from device_assets import push_cas
+from log_parser import mtmd_timings
+from server_backend import LogTail, image_message, make_server
+from image_cache import ImageCache, add_image_cache_args
+from dataset_snapshot import load_subset
+
+SERVER_LOG = "vqa_server.log"
+
 def parse_output(output):
     # TODO you can implement your own parse function
     # save output
@@ -36,6 +46,12 @@ def main():
     parser.add_argument('--data_path', type=str, default="lmms-lab/textvqa") # hf dataset path. # "lmms-lab/textvqa"
     parser.add_argument('--split', type=str, default='validation')
     parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--backend', choices=['cli', 'server', 'stub'], default='cli',
+                        help='cli: one llama-mtmd-cli run per sample; server: one multimodal llama-server '
+                             '(run-mtmd-server.sh) kept up for all samples; stub: local fake server')
+    parser.add_argument('--port', type=int, default=8080, help='llama-server port (server backend)')
+    parser.add_argument('--n_predict', type=int, default=30)
+    add_image_cache_args(parser)
 
     args = parser.parse_args()
     device = torch.device("cuda") if torch.cuda.is_available() else "cpu"
@@ -54,6 +70,7 @@ def main():
 
 
     if "MMMU" in args.data_path:
+        from datasets import load_dataset, concatenate_datasets
         # run for each subject
         sub_dataset_list = []
         for subject in CAT_SHORT2LONG.values():
@@ -65,8 +82,9 @@ def main():
         dataset = concatenate_datasets(sub_dataset_list)
         question = "final_input_prompt"
     elif "textvqa" in args.data_path:
-        dataset = load_dataset("lmms-lab/textvqa", split="validation")
-        dataset = dataset.select(range(100))
+        # offline snapshot of the first 100 rows; images stay encoded until the
+        # prefetch pool needs them (cached rows never are)
+        dataset = load_subset("lmms-lab/textvqa", split="validation", rows=100)
         question = "question"
     else:
         raise NotImplementedError
@@ -75,13 +93,13 @@ def main():
 #    model_name = get_model_name_from_path(args.model_path)
 #    tokenizer, model, vis_processors, _ = load_pretrained_model(args.model_path, None,
 #                                                                model_name)
-    REMOTE_IMG = "/data/local/tmp/image.jpg"
-    samples = []
     patterns = {
         "load_time_ms": r"load time\s*=\s*([\d.]+)\s*ms",
         "prompt_eval_time_per_token_ms": r"prompt eval time\s*=\s*[\d.]+\s*ms\s*/\s*\d+\s*tokens\s*\(\s*([\d.]+)\s*ms per token",
         "eval_time_per_token_ms": r"eval time\s*=\s*[\d.]+\s*ms\s*/\s*\d+\s*runs\s*\(\s*([\d.]+)\s*ms per token",
-        "total_time_ms": r"total time\s*=\s*([\d.]+)\s*ms\s*/\s*(\d+)\s*tokens"
+        "total_time_ms": r"total time\s*=\s*([\d.]+)\s*ms\s*/\s*(\d+)\s*tokens",
+        "prompt_eval_ms": r"prompt eval time\s*=\s*([\d.]+)\s*ms",
+        "eval_ms": r"\beval time\s*=\s*([\d.]+)\s*ms\s*/\s*\d+\s*runs",
     }
     load_time_ms = []
     prompt_eval_time_per_token_ms = []
@@ -89,21 +107,67 @@ def main():
     total_time_ms = []
     total_token = []
     correct = []
-
-    for sample in tqdm(dataset):
-
-        if "MMMU" in args.data_path:
-            sample = process_single_sample(sample)
-            sample = construct_prompt(sample, args.config)
-
-        if sample['image']:
-            image = sample['image'].convert("RGB")
-            image.save("image.jpg", "JPEG")
+    # image encode (vision tower + projector) is kept apart from the LLM's prefill/decode
+    image_encode_ms = []
+    llm_prefill_ms = []
+    llm_decode_ms = []
+
+    def rows():
+        for idx, sample in enumerate(dataset):
+            if "MMMU" in args.data_path:
+                sample = process_single_sample(sample)
+                sample = construct_prompt(sample, args.config)
+            yield idx, sample
+
+    # images are decoded, shrunk to the projector size, encoded and hashed on a
+    # thread pool ahead of use, and cached by dataset row for the next run
+    cache = ImageCache(args.image_cache, f"{args.data_path}_{args.split}", args.image_size, args.image_quality)
+    samples = cache.prefetch(rows(), workers=args.prefetch_workers, ahead=args.prefetch)
+    server = tail = None
+    if args.backend == "cli":
+        # every image is needed up front to push the ones the phone does not have
+        # yet in one batch; each sample then uses its content-addressed device path
+        samples = list(tqdm(samples, total=len(dataset), desc="images"))
+        remote_images = push_cas([p for _, _, p, _ in samples if p])
+    else:
+        # model + mmproj load once; images travel inside the requests
+        server_log = open(SERVER_LOG, "w", encoding="utf-8")
+        server = make_server(args.backend, port=args.port, log_file=server_log, script="./run-mtmd-server.sh")
+        t0 = time.time()
+        server.start()
+        print(f"server ready in {time.time() - t0:.1f} s (model load counted once)")
+        tail = LogTail(SERVER_LOG)
+
+    for _, sample, image_path, _ in tqdm(samples, total=len(dataset)):
+
+        if image_path and server is not None:
+            with open(image_path, "rb") as f:
+                image_bytes = f.read()
+            try:
+                res = server.chat([image_message(sample[question], image_bytes)], args.n_predict, temperature=0)
+            except OSError as e:
+                print(f"[ERROR] request failed: {e}", file=sys.stderr)
+                break
+            output = res["content"].strip()
+            print(output)
+            correct.append(int(any(answer == output.lower() for answer in sample["answers"])))
+            timings = res["timings"]
+            mtmd = mtmd_timings(tail.read_request())
+            encode_ms = mtmd["image_encode_ms"] or 0.0
+            # the server's prompt_ms covers the image encode as well as the prefill
+            image_encode_ms.append(encode_ms)
+            llm_prefill_ms.append(max(0.0, timings.get("prompt_ms", 0.0) - encode_ms))
+            llm_decode_ms.append(timings.get("predicted_ms", 0.0))
+            prompt_eval_time_per_token_ms.append(llm_prefill_ms[-1] / max(1, timings.get("prompt_n", 0)))
+            eval_time_per_token_ms.append(llm_decode_ms[-1] / max(1, timings.get("predicted_n", 0)))
+            total_time_ms.append(timings.get("prompt_ms", 0.0) + timings.get("predicted_ms", 0.0))
+            total_token.append(timings.get("prompt_n", 0) + timings.get("predicted_n", 0))
+
+        elif image_path:
+            REMOTE_IMG = remote_images[image_path]
             prompt = sample[question]
             print(prompt)
             prompt = prompt.replace('"', '\\"').replace("`", "\\`").replace("$", "\\$")
-            # use bash command "adb push image.jpg /data/local/tmp/image.jpg" to upload image to file
-            subprocess.run(["adb", "push", "image.jpg", REMOTE_IMG], check=True)
             try:
                 # you might need to change the command below if you use ubuntu or mac or other bash
                 out = subprocess.run(
@@ -133,6 +197,10 @@ def main():
                 eval_time_per_token_ms.append(results["eval_time_per_token_ms"])
                 total_time_ms.append(results["total_time_ms"])
                 total_token.append(results["total_tokens"])
+                # llama-mtmd-cli's prompt eval time already excludes the image encode
+                image_encode_ms.append(mtmd_timings(out.stderr.splitlines())["image_encode_ms"] or 0.0)
+                llm_prefill_ms.append(results.get("prompt_eval_ms", 0.0))
+                llm_decode_ms.append(results.get("eval_ms", 0.0))
 
             except subprocess.CalledProcessError as e:
                 print("--- SCRIPT FAILED ---", file=sys.stderr)
@@ -145,10 +213,25 @@ def main():
                 print(e.stderr, file=sys.stderr)  # This is the most important part!
                 sys.exit(1)
 
+    if hasattr(samples, "close"):
+        samples.close()  # stops the prefetch pool and writes the cache index
+    print(f"images: {cache.summary()}")
+    if server is not None:
+        server.stop()
+        tail.close()
+        server_log.close()
+
     print("average correct")
     print(np.mean(correct))
-    print("average load time")
-    print(np.mean(load_time_ms))
+    if load_time_ms:
+        print("average load time")
+        print(np.mean(load_time_ms))
+    print("average image encode time (ms)")
+    print(np.mean(image_encode_ms))
+    print("average LLM prefill time (ms)")
+    print(np.mean(llm_prefill_ms))
+    print("average LLM decode time (ms)")
+    print(np.mean(llm_decode_ms))
     print("average prompt eval time")
     print(np.mean(prompt_eval_time_per_token_ms))
     print("average eval time")
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Stand-in for adb, for exercising the harnesses on Linux without a phone.
+
+    ADB="python3 fake_adb.py" python longbench_test.py
+    ADB="python3 fake_adb.py" python thermal.py --count 5
+
+Simulates a phone that heats up while llama-cli runs and cools down while
+idle (first-order model, state kept in a JSON file per serial). Above
+THROTTLE_C the CPU frequency cap drops and so do the reported tok/s.
+Answers the commands the harness sends:
+  shell <thermal probe>       battery temp/current/voltage + cpufreq nodes
+  shell while ... current_now  "current_uA voltage_uV status" lines until killed (energy.py)
+  shell ... pidof ... meminfo  llama-cli /proc status + meminfo lines until killed (memory_profiler.py)
+  shell dumpsys battery       battery temperature
+  shell ... llama-bench ...   -o jsonl records for the -p/-n/-b/-ub/-t/--poll combinations
+  shell ... llama-cli ...     generated text on stdout, llama_perf lines on stderr
+                              (plus ggml-hex op lines with GGML_HEXAGON_PROFILE / _VERBOSE;
+                              GGML_HEXAGON_OPMASK / _NHVX shorten the run)
+  shell stat / sha256sum      model file metadata for result_store.py (sha256sum hashes the
+                              pushed copy under the stand-in /data/local/tmp if there is one)
+  shell / exec-in / push on /data/local/tmp/...   run locally against a directory
+                              standing in for /data/local/tmp (device_assets.py)
+  forward / pull / devices / anything else   succeeds silently
+
+Env knobs:
+  FAKE_ADB_STATE     state file (default: $TMPDIR/fake_adb_<serial>.json)
+  FAKE_ADB_AMBIENT   idle temperature, °C (default 30)
+  FAKE_ADB_SPEEDUP   simulated seconds per real second while idle (default 1)
+  FAKE_ADB_SLEEP     real seconds slept per simulated generation second (default 0)
+  FAKE_ADB_JITTER    relative std-dev of llama-cli run times (default 0)
+  FAKE_ADB_BATTERY   battery status the power stream reports (default Discharging; e.g. Charging)
+  FAKE_ADB_DISCHARGE_SIGN  sign of current_now while discharging (default -, the power_supply
+                     ABI; + like many Qualcomm/Samsung gauges)
+  FAKE_ADB_DEVICES   comma-separated serials `adb devices` lists (default: fake0); with more
+                     than one, commands without -s / $ANDROID_SERIAL fail like adb's
+  FAKE_ADB_ROOT      directory standing in for /data/local/tmp (default: $TMPDIR/fake_adb_<serial>_tmp)
+"""
+import fcntl
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+AMBIENT_C = float(os.environ.get("FAKE_ADB_AMBIENT", 30.0))
+LOAD_C = 48.0          # temperature llama-cli would settle at
+TAU_IDLE_S = 90.0
+TAU_LOAD_S = 40.0
+THROTTLE_C = 42.0
+HW_MAX_KHZ = [3532800] * 6 + [4320000] * 2
+PREFILL_TPS = 60.0
+DECODE_TPS = 12.0
+DEVICE_TMP = "/data/local/tmp"
+MEM_TOTAL_KB = 12 * 1024 * 1024
+LLAMA_CLI_PID = 4242
+N_LAYERS = 16
+N_EMBD = 2048
+N_FF = 8192
+# (op, weight, input activation, output activation, output rows) per block, as ggml-hexagon logs them
+HEXAGON_BLOCK_OPS = [
+    ("RMS_NORM", None, "l_out-{p}", "attn_norm-{l}", N_EMBD),
+    ("MUL_MAT", "blk.{l}.attn_q.weight", "attn_norm-{l}", "Qcur-{l}", N_EMBD),
+    ("MUL_MAT", "blk.{l}.attn_k.weight", "attn_norm-{l}", "Kcur-{l}", N_EMBD // 4),
+    ("MUL_MAT", "blk.{l}.attn_v.weight", "attn_norm-{l}", "Vcur-{l}", N_EMBD // 4),
+    ("MUL_MAT", "blk.{l}.attn_output.weight", "kqv_out-{l}", "attn_out-{l}", N_EMBD),
+    ("RMS_NORM", None, "ffn_inp-{l}", "ffn_norm-{l}", N_EMBD),
+    ("MUL_MAT", "blk.{l}.ffn_gate.weight", "ffn_norm-{l}", "ffn_gate-{l}", N_FF),
+    ("MUL_MAT", "blk.{l}.ffn_up.weight", "ffn_norm-{l}", "ffn_up-{l}", N_FF),
+    ("MUL_MAT", "blk.{l}.ffn_down.weight", "ffn_swiglu-{l}", "ffn_out-{l}", N_EMBD),
+]
+
+
+def state_path(serial):
+    return os.environ.get("FAKE_ADB_STATE",
+                          os.path.join(tempfile.gettempdir(), f"fake_adb_{serial or 'default'}.json"))
+
+
+def device_tmp(serial):
+    root = (os.environ.get("FAKE_ADB_ROOT")
+            or os.path.join(tempfile.gettempdir(), f"fake_adb_{serial or 'default'}_tmp"))
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+def run_local(serial, command, stdin=None):
+    """Run a device shell command with /data/local/tmp mapped to device_tmp()."""
+    proc = subprocess.run(["sh", "-c", command.replace(DEVICE_TMP, device_tmp(serial))], stdin=stdin)
+    return proc.returncode
+
+
+def push(serial, local, remote):
+    if not remote.startswith(DEVICE_TMP):
+        sys.stderr.write(f"adb: error: remote path {remote} not writable\n")
+        return 1
+    target = device_tmp(serial) + remote[len(DEVICE_TMP):]
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.copyfile(local, target)
+    return 0
+
+
+def advance(state, seconds, busy):
+    target = LOAD_C if busy else AMBIENT_C
+    tau = TAU_LOAD_S if busy else TAU_IDLE_S
+    state["temp_c"] = target + (state["temp_c"] - target) * math.exp(-seconds / tau)
+
+
+def freq_cap(temp_c):
+    if temp_c < THROTTLE_C:
+        return 1.0
+    return max(0.5, 1.0 - (temp_c - THROTTLE_C) * 0.06)
+
+
+class DeviceState:
+    """JSON state file under an exclusive lock, advanced to 'now' on entry."""
+
+    def __init__(self, serial):
+        self.path = state_path(serial)
+
+    def __enter__(self):
+        self.f = open(self.path, "a+", encoding="utf-8")
+        fcntl.flock(self.f, fcntl.LOCK_EX)
+        self.f.seek(0)
+        try:
+            self.state = json.load(self.f)
+        except json.JSONDecodeError:
+            self.state = {"temp_c": AMBIENT_C, "time": time.time(), "busy": False}
+        now = time.time()
+        idle_s = (now - self.state["time"]) * float(os.environ.get("FAKE_ADB_SPEEDUP", 1.0))
+        advance(self.state, max(0.0, idle_s), busy=False)
+        self.state["time"] = now
+        return self.state
+
+    def __exit__(self, *exc):
+        self.f.seek(0)
+        self.f.truncate()
+        json.dump(self.state, self.f)
+        self.f.flush()
+        fcntl.flock(self.f, fcntl.LOCK_UN)
+        self.f.close()
+
+
+def battery_status():
+    return os.environ.get("FAKE_ADB_BATTERY", "Discharging")
+
+
+def current_ua(state):
+    if battery_status() != "Discharging":
+        # the charger covers the phone's draw and charges the battery with the rest
+        return 1500000
+    sign = 1 if os.environ.get("FAKE_ADB_DISCHARGE_SIGN", "-") == "+" else -1
+    return sign * (2500000 if state.get("busy", False) else 400000)
+
+
+def probe(state):
+    cap = freq_cap(state["temp_c"])
+    busy = state.get("busy", False)
+    lines = [f"temp={int(round(state['temp_c'] * 10))}",
+             f"current_now={current_ua(state)}",
+             "voltage_now=3900000"]
+    for i, hw_max in enumerate(HW_MAX_KHZ):
+        max_khz = int(hw_max * cap)
+        cur_khz = max_khz if busy else 960000
+        lines.append(f"cpu{i}={cur_khz} {max_khz} {hw_max} ")
+    return "\n".join(lines) + "\n"
+
+
+def run_llama_cli(serial, command):
+    m = re.search(r"(?:^|\s)-n (\d+)", command)
+    n_predict = int(m.group(1)) if m else 25
+    m = re.search(r"-p (.*?)(?: -\w|$)", command)
+    n_prompt = max(1, len(m.group(1).split())) if m else 32
+
+    with DeviceState(serial) as state:
+        cap = freq_cap(state["temp_c"])
+        state["busy"] = True
+    stage = hexagon_stage_factor(command)
+    prefill_ms = n_prompt / (PREFILL_TPS * cap) * 1000.0 * stage
+    decode_ms = n_predict / (DECODE_TPS * cap) * 1000.0 * stage
+    time.sleep((prefill_ms + decode_ms) / 1000.0 * float(os.environ.get("FAKE_ADB_SLEEP", 0.0)))
+    with DeviceState(serial) as state:
+        advance(state, (prefill_ms + decode_ms) / 1000.0, busy=True)
+        state["busy"] = False
+
+    m = re.search(r"(?:^|\s)(?:-c|--ctx-size) (\d+)", command)
+    n_ctx = int(m.group(1)) if m else 4096
+
+    sys.stdout.write(" ".join(["token"] * n_predict) + "\n")
+    total_ms = prefill_ms + decode_ms
+    sys.stderr.write("build: 0 (fake_adb) with fake compiler for fake target\n")
+    if "GGML_HEXAGON_PROFILE=" in command:
+        verbose = "GGML_HEXAGON_VERBOSE=" in command
+        hexagon_profile(n_prompt, prefill_ms, verbose)
+        for _ in range(n_predict):
+            hexagon_profile(1, decode_ms / n_predict, verbose)
+    sys.stderr.write(
+        f"llama_kv_cache: size = {n_ctx / 32:8.2f} MiB ({n_ctx:6d} cells,  16 layers,  1/1 seqs)\n"
+        f"llama_perf_sampler_print:    sampling time =       1.00 ms / {n_predict + n_prompt:5d} runs   "
+        "(    0.01 ms per token, 100000.00 tokens per second)\n"
+        "llama_perf_context_print:        load time =     500.00 ms\n"
+        f"llama_perf_context_print: prompt eval time = {prefill_ms:10.2f} ms / {n_prompt:5d} tokens "
+        f"({prefill_ms / n_prompt:8.2f} ms per token, {n_prompt / prefill_ms * 1000:8.2f} tokens per second)\n"
+        f"llama_perf_context_print:        eval time = {decode_ms:10.2f} ms / {n_predict:5d} runs   "
+        f"({decode_ms / n_predict:8.2f} ms per token, {n_predict / decode_ms * 1000:8.2f} tokens per second)\n"
+        f"llama_perf_context_print:       total time = {total_ms:10.2f} ms / {n_prompt + n_predict:5d} tokens\n"
+    )
+    return 0
+
+
+def run_llama_bench(serial, command):
+    """llama-bench -o jsonl records for every combination of the listed -p/-n/-b/-ub/-t/--poll values."""
+    def values(flag, default):
+        m = re.search(rf"(?:^|\s){re.escape(flag)} ([\d,]+)", command)
+        return [int(v) for v in m.group(1).split(",") if v] if m else [default]
+
+    npu = re.search(r"-dev '?HTP0", command) is not None
+    with DeviceState(serial) as state:
+        cap = freq_cap(state["temp_c"])
+    tests = [("pp", n) for n in values("-p", 512) if n] + [("tg", n) for n in values("-n", 128) if n]
+    for b in values("-b", 2048):
+        for ub in values("-ub", 512):
+            for t in values("-t", 8):
+                for poll in values("--poll", 50):
+                    for kind, n in tests:
+                        eff_ub = max(1, min(ub, b, n))
+                        if kind == "pp":
+                            # the NPU wants big ubatches, the CPU peaks at 256; prefill barely scales with threads on the NPU
+                            best_ub = 512 if npu else 256
+                            ts = PREFILL_TPS * (3.0 if npu else 1.0) * (1.0 - 0.12 * abs(math.log2(eff_ub / best_ub)))
+                            ts *= 1.0 if npu else min(t, 6) / 6.0 * (0.9 if t > 6 else 1.0)
+                        else:
+                            ts = DECODE_TPS * min(t, 4 if npu else 6) / (4 if npu else 6)
+                        ts *= cap * (0.95 if poll == 0 else 1.0) * (1.0 - 0.02 * math.log2(max(n, 32) / 32))
+                        avg_ns = int(n / ts * 1e9)
+                        sys.stdout.write(json.dumps({
+                            "model_filename": "fake.gguf", "n_batch": b, "n_ubatch": ub, "n_threads": t, "poll": poll,
+                            "n_prompt": n if kind == "pp" else 0, "n_gen": n if kind == "tg" else 0,
+                            "avg_ns": avg_ns, "stddev_ns": 0, "avg_ts": ts, "stddev_ts": 0.0}) + "\n")
+    return 0
+
+
+def hexagon_stage_factor(command):
+    """Share of the full run time left with GGML_HEXAGON_OPMASK/NHVX, with FAKE_ADB_JITTER noise."""
+    m = re.search(r"GGML_HEXAGON_OPMASK=(0x[0-9a-fA-F]+|\d+)", command)
+    mask = int(m.group(1), 0) if m else 0x7
+    m = re.search(r"GGML_HEXAGON_NHVX=(\d+)", command)
+    nhvx = int(m.group(1)) if m and int(m.group(1)) > 0 else 8
+    # decode on the NPU is mostly dispatch: queue 0.45, quantize 0.10, compute 0.45 (at 8 HVX threads)
+    factor = 0.45 + (0.10 if mask & 0x2 else 0.0) + (0.45 * 8 / nhvx if mask & 0x4 else 0.0)
+    return factor * (1.0 + random.gauss(0.0, float(os.environ.get("FAKE_ADB_JITTER", 0.0))))
+
+
+def hexagon_profile(n_tokens, graph_ms, verbose):
+    """GGML_HEXAGON_PROFILE (and _VERBOSE) lines for one graph of n_tokens taking graph_ms."""
+    ops = [(op, w, x, y, rows, l) for l in range(N_LAYERS) for op, w, x, y, rows in HEXAGON_BLOCK_OPS]
+    work = [rows * (N_EMBD if w else 8) for _, w, _, _, rows, _ in ops]
+    usec_per_work = graph_ms * 1000.0 * 0.8 / sum(work)
+    if verbose:
+        sys.stderr.write(f"ggml-hex: HTP0 graph-compute n_nodes {len(ops)}\n")
+    for (op, w, x, y, rows, l), wk in zip(ops, work):
+        x = "inp_embd" if l == 0 and "{p}" in x else x.format(l=l, p=l - 1)
+        y = y.format(l=l)
+        op_usec = max(1, int(wk * usec_per_work))
+        call_usec = op_usec + 40 + op_usec // 4
+        if w:
+            w = w.format(l=l)
+            src = f"{w} {N_EMBD}:{rows}:1:1 x {x} {N_EMBD}:{n_tokens}:1:1"
+            if verbose:
+                sys.stderr.write(f"ggml-hex: HTP0 {op}: {w} x {x} -> {y} : {N_EMBD}:{rows} x {N_EMBD}:{n_tokens}"
+                                 f" -> {rows}:{n_tokens} : q4_0 x f32 -> f32 : 18:1152 x 4:8192 -> 4:{rows * 4} :"
+                                 f" HTP0-REPACK x HTP0 -> HTP0: flags 0x0\n")
+        else:
+            src = f"{x} {rows}:{n_tokens}:1:1"
+            if verbose:
+                sys.stderr.write(f"ggml-hex: HTP0 {op} : {x} -> {y} : {rows}:{n_tokens} -> {rows}:{n_tokens} :"
+                                 f" f32 -> f32 : 4:{rows * 4} -> 4:{rows * 4} : HTP0 -> HTP0 : flags 0x0\n")
+        sys.stderr.write(f"ggml-hex: HTP0 {op} {src} -> {y} {rows}:{n_tokens}:1:1 : op-usec {op_usec} "
+                         f"op-cycles {op_usec * 1000} op-pkts {op_usec * 120} (8.333333) call-usec {call_usec}\n")
+    if verbose:
+        sys.stderr.write(f"ggml-hex: HTP0 get-tensor result_output : data 0x7f00000000 offset 0 "
+                         f"size {128256 * 4}\n")
+
+
+def stream_power(serial, command):
+    m = re.search(r"sleep ([\d.]+)", command)
+    interval = float(m.group(1)) if m else 1.0
+    try:
+        while True:
+            with DeviceState(serial) as state:
+                sys.stdout.write(f"{current_ua(state)} 3900000 {battery_status()}\n")
+            sys.stdout.flush()
+            time.sleep(interval)
+    except (KeyboardInterrupt, BrokenPipeError):
+        return 0
+
+
+def stream_memory(serial, command):
+    m = re.search(r"sleep ([\d.]+)", command)
+    interval = float(m.group(1)) if m else 1.0
+    m = re.search(r"i % (\d+)", command)
+    dumpsys_every = int(m.group(1)) if m else 0
+    i = 0
+    try:
+        while True:
+            with DeviceState(serial) as state:
+                busy = state.get("busy", False)
+            if busy:
+                # mmapped ~2 GB model, ~600 MB anon (KV cache + compute buffers)
+                sys.stdout.write(f"pid {LLAMA_CLI_PID} VmHWM:\t2700000 kB VmRSS:\t2650000 kB "
+                                 "RssAnon:\t620000 kB RssFile:\t2030000 kB \n")
+                if dumpsys_every and i % dumpsys_every == 0:
+                    sys.stdout.write(f"pss {LLAMA_CLI_PID}            TOTAL PSS:  2400000            TOTAL RSS:  2650000\n")
+            available = MEM_TOTAL_KB // 2 - (2650000 if busy else 0)
+            sys.stdout.write(f"mem MemTotal:       {MEM_TOTAL_KB} kB MemAvailable:    {available} kB \n")
+            sys.stdout.flush()
+            i += 1
+            time.sleep(interval)
+    except (KeyboardInterrupt, BrokenPipeError):
+        return 0
+
+
+def shell(serial, command):
+    if command.startswith("d=") and "while true" in command and "current_now" in command:
+        return stream_power(serial, command)
+    if "while true" in command and "pidof" in command and "meminfo" in command:
+        return stream_memory(serial, command)
+    if "scaling_cur_freq" in command:
+        with DeviceState(serial) as state:
+            sys.stdout.write(probe(state))
+    elif "dumpsys battery" in command:
+        with DeviceState(serial) as state:
+            sys.stdout.write(f"  temperature: {int(round(state['temp_c'] * 10))}\n")
+    elif "llama-bench" in command:
+        return run_llama_bench(serial, command)
+    elif "llama-cli" in command:
+        return run_llama_cli(serial, command)
+    elif command.startswith("stat "):
+        sys.stdout.write("1000000 1700000000\n")
+    elif command.startswith("sha256sum "):
+        path = command.split()[1]
+        local = device_tmp(serial) + path[len(DEVICE_TMP):] if path.startswith(DEVICE_TMP) else None
+        if local and os.path.isfile(local):
+            with open(local, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        else:
+            digest = hashlib.sha256(path.encode()).hexdigest()
+        sys.stdout.write(f"{digest}  {path}\n")
+    elif DEVICE_TMP in command:
+        return run_local(serial, command)
+    return 0
+
+
+def main(argv):
+    serial = os.environ.get("ANDROID_SERIAL")
+    if len(argv) >= 2 and argv[0] == "-s":
+        serial, argv = argv[1], argv[2:]
+    if not argv:
+        return 0
+    serials = os.environ.get("FAKE_ADB_DEVICES", "fake0").split(",")
+    if serial is None and len(serials) > 1 and argv[0] not in ("devices", "start-server", "kill-server"):
+        sys.stderr.write("adb: error: more than one device/emulator\n")
+        return 1
+    if argv[0] == "shell":
+        return shell(serial, " ".join(argv[1:]))
+    if argv[0] == "exec-in":
+        return run_local(serial, " ".join(argv[1:]), stdin=sys.stdin)
+    if argv[0] == "push" and len(argv) == 3:
+        return push(serial, argv[1], argv[2])
+    if argv[0] == "devices":
+        sys.stdout.write("List of devices attached\n" + "".join(f"{s}\tdevice\n" for s in serials))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
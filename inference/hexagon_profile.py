@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Per-op records, per-layer/op-type totals and a Chrome-trace timeline from
+ggml-hexagon profile logs.
+
+Run with PROF=1 (GGML_HEXAGON_PROFILE=1 GGML_HEXAGON_OPSYNC=1) and the
+backend logs one line per op it queues to the NPU:
+
+    ggml-hex: HTP0 MUL_MAT blk.3.ffn_up.weight 2048:8192:1:1 x ffn_norm-3 2048:7:1:1 -> ffn_up-3 8192:7:1:1 :
+        op-usec 412 op-cycles 520000 op-pkts 61000 (8.5) call-usec 655
+
+op-usec is the time the HTP spent on the op, call-usec the host-side call
+around it (with OPSYNC that includes queuing and waiting for the response).
+MoE expert matmuls are logged as "matmul-id ... x ... (ids) -> ..."; they
+become MUL_MAT_ID records with the expert ids as the third operand.
+V=1 (GGML_HEXAGON_VERBOSE) adds, per op, the tensor types, strides and
+buffers, plus "graph-compute" (one per token batch) and the set-tensor /
+get-tensor transfers between host and HTP buffers; those are merged into the
+same records. With --log-timestamps on llama-cli the real log times place
+the events and give get-tensor durations; without, the timeline is laid out
+back to back from call-usec and transfers are instant markers.
+
+    python hexagon_profile.py debug.log                       # per-op-type and per-layer table
+    python hexagon_profile.py debug.log --trace trace.json    # open in ui.perfetto.dev / chrome://tracing
+    python hexagon_profile.py debug.log --jsonl ops.jsonl --top 20
+"""
+import argparse
+import json
+import re
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+# common_log's --log-timestamps prefix "M.SS.mmm.uuu", optionally colored and followed by a level letter
+TS_RE = re.compile(r'^(?:\x1b\[[\d;]*m)?(\d+)\.(\d{2})\.(\d{3})\.(\d{3})(?:\x1b\[[\d;]*m)?\s+(?:[DIWEN] )?')
+PROF_RE = re.compile(r'ggml-hex: (\S+) ([A-Z][A-Z0-9_]*) (.*?) : op-usec (\d+) op-cycles (\d+) op-pkts (\d+) '
+                     r'\(([^)]*)\) call-usec (\d+)')
+# MUL_MAT_ID is logged as "matmul-id src0 x src1 (ids) -> dst"; rewritten to "MUL_MAT_ID src0 x src1 x ids -> dst"
+MATMUL_ID_RE = re.compile(r'(ggml-hex: \S+ )matmul-id (.*) \(((?:[^()]|\([^()]*\))+ \d+:\d+:\d+:\d+)\)( -> )')
+VERBOSE_OP_RE = re.compile(r'ggml-hex: (\S+) ([A-Z][A-Z0-9_]*)\s*: (.*?)\s*: flags (0x[0-9a-fA-F]+)')
+TRANSFER_RE = re.compile(r'ggml-hex: (\S+) (get-tensor|set-tensor) (.*?) : data \S+ offset (\d+) size (\d+)')
+GRAPH_RE = re.compile(r'ggml-hex: (\S+) graph-compute n_nodes (\d+)')
+OPERAND_RE = re.compile(r'^(.*) (\d+:\d+:\d+:\d+)$')
+LAYER_RES = (re.compile(r'blk\.(\d+)\.'), re.compile(r'-(\d+)(?: \(|$)'), re.compile(r'_l(\d+)(?: \(|$)'))
+
+
+def _split(text, sep=" x "):
+    """['src0', 'src1', ..., 'dst'] from a "src0 x src1 -> dst" field of the verbose/profile lines."""
+    srcs, _, dst = text.rpartition(" -> ")
+    return (srcs.split(sep) if srcs else []) + [dst]
+
+
+def layer_of(names):
+    """Transformer block number from the op's tensor names (weight, then output, then inputs), or None."""
+    for name in names:
+        m = LAYER_RES[0].search(name)
+        if m:
+            return int(m.group(1))
+    # an op's inputs can come from the previous block (l_out-N feeds block N+1's norm)
+    for name in names[-1:] + names[:-1]:
+        for pattern in LAYER_RES[1:]:
+            m = pattern.search(name)
+            if m:
+                return int(m.group(1))
+    return None
+
+
+def _operands(text):
+    names, dims = [], []
+    for part in _split(text):
+        m = OPERAND_RE.match(part.strip())
+        if m:
+            names.append(m.group(1))
+            dims.append([int(d) for d in m.group(2).split(":")])
+        else:
+            names.append(part.strip())
+            dims.append(None)
+    return names, dims
+
+
+def _timestamp(line):
+    """(microseconds since llama-cli start or None, line without the timestamp prefix)."""
+    m = TS_RE.match(line)
+    if not m:
+        return None, line
+    mins, secs, ms, us = (int(g) for g in m.groups())
+    return ((mins * 60 + secs) * 1000 + ms) * 1000 + us, line[m.end():]
+
+
+def iter_ops(lines):
+    """
+    Yield one record per profiled op and per host<->HTP transfer:
+    kind "op" (op, tensor names/dims/types/buffers, layer, op_usec, op_cycles,
+    op_pkts, call_usec) or "get-tensor"/"set-tensor" (name, bytes, dur_us).
+    ts_us is the start on the log's clock, or on a synthetic back-to-back clock without timestamps.
+    """
+    index = 0
+    graph = None
+    pending = {}   # session -> verbose fields of the op about to be profiled
+    transfer = None
+    cursor = 0
+    for lineno, raw in enumerate(lines, start=1):
+        ts, line = _timestamp(raw.rstrip("\r\n"))
+        if "ggml-hex:" not in line:
+            continue
+        if transfer is not None:
+            # the copy runs after its log line, until whatever the backend logs next
+            if ts is not None and transfer["ts_us"] is not None:
+                transfer["dur_us"] = max(0, ts - transfer["ts_us"])
+            yield transfer
+            transfer = None
+
+        if "matmul-id" in line:
+            line = MATMUL_ID_RE.sub(r"\1MUL_MAT_ID \2 x \3\4", line)
+        m = PROF_RE.search(line)
+        if m:
+            session, op, operands = m.group(1), m.group(2), m.group(3)
+            names, dims = _operands(operands)
+            call_usec = int(m.group(8))
+            verbose = pending.pop(session, None)
+            if verbose is not None and verbose["op"] != op:
+                verbose = None
+            if ts is None:
+                start = cursor
+                cursor += call_usec
+            else:
+                # the profile line is logged when the call returns
+                start = ts - call_usec
+            rec = {
+                "kind": "op", "index": index, "line": lineno, "graph": graph, "session": session, "op": op,
+                "names": names, "dims": dims,
+                "types": verbose["types"] if verbose else None,
+                "buffs": verbose["buffs"] if verbose else None,
+                "layer": layer_of(names),
+                "op_usec": int(m.group(4)), "op_cycles": int(m.group(5)), "op_pkts": int(m.group(6)),
+                "call_usec": call_usec, "ts_us": start,
+            }
+            index += 1
+            yield rec
+            continue
+
+        m = VERBOSE_OP_RE.search(line)
+        if m:
+            fields = [f.strip() for f in m.group(3).split(" : ")]
+            if len(fields) >= 5:
+                pending[m.group(1)] = {"op": m.group(2), "types": _split(fields[2]), "buffs": _split(fields[4])}
+            continue
+
+        m = TRANSFER_RE.search(line)
+        if m:
+            transfer = {"kind": m.group(2), "line": lineno, "graph": graph, "session": m.group(1),
+                        "name": m.group(3), "layer": layer_of([m.group(3)]), "bytes": int(m.group(5)),
+                        "ts_us": ts if ts is not None else cursor, "dur_us": None}
+            continue
+
+        m = GRAPH_RE.search(line)
+        if m:
+            graph = 0 if graph is None else graph + 1
+
+    if transfer is not None:
+        yield transfer
+
+
+def parse_log(path):
+    """Yield op/transfer records from a log file without loading it into memory."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        yield from iter_ops(f)
+
+
+def _bucket():
+    return {"count": 0, "op_usec": 0, "call_usec": 0}
+
+
+def _add(bucket, rec):
+    bucket["count"] += 1
+    bucket["op_usec"] += rec["op_usec"]
+    bucket["call_usec"] += rec["call_usec"]
+
+
+def summarize(records):
+    """Op time per op type, per layer and per (layer, op type), plus host<->HTP transfer totals."""
+    by_op = defaultdict(_bucket)
+    by_layer = defaultdict(_bucket)
+    by_layer_op = defaultdict(_bucket)
+    transfers = defaultdict(lambda: {"count": 0, "bytes": 0, "dur_us": 0, "timed": 0})
+    slowest_transfers = []
+    total = _bucket()
+    graphs = set()
+    for rec in records:
+        if rec["kind"] == "op":
+            _add(total, rec)
+            _add(by_op[rec["op"]], rec)
+            layer = rec["layer"] if rec["layer"] is not None else "other"
+            _add(by_layer[layer], rec)
+            _add(by_layer_op[(layer, rec["op"])], rec)
+            graphs.add(rec["graph"])
+            continue
+        t = transfers[rec["kind"]]
+        t["count"] += 1
+        t["bytes"] += rec["bytes"]
+        if rec["dur_us"] is not None:
+            t["dur_us"] += rec["dur_us"]
+            t["timed"] += 1
+            slowest_transfers.append(rec)
+
+    def ranked(buckets):
+        rows = [{"key": key, **b, "share": b["op_usec"] / total["op_usec"] if total["op_usec"] else 0.0}
+                for key, b in buckets.items()]
+        return sorted(rows, key=lambda r: r["op_usec"], reverse=True)
+
+    slowest_transfers.sort(key=lambda r: r["dur_us"], reverse=True)
+    return {
+        "ops": total["count"],
+        "graphs": len(graphs - {None}) or None,
+        "op_usec": total["op_usec"],
+        "call_usec": total["call_usec"],
+        # host-side dispatch/queue/wait time not spent computing on the HTP
+        "overhead_usec": total["call_usec"] - total["op_usec"],
+        "by_op": ranked(by_op),
+        "by_layer": ranked(by_layer),
+        "by_layer_op": ranked(by_layer_op),
+        "transfers": dict(transfers),
+        "slowest_transfers": [{k: r[k] for k in ("kind", "name", "bytes", "dur_us", "line")}
+                              for r in slowest_transfers[:10]],
+    }
+
+
+def trace_events(records):
+    """Chrome trace events: host calls and HTP op time per session, transfers and graph starts."""
+    pids = {}
+    last_graph = None
+
+    def pid(session):
+        if session not in pids:
+            pids[session] = len(pids) + 1
+            yield {"ph": "M", "name": "process_name", "pid": pids[session], "args": {"name": session}}
+            for tid, name in ((1, "host call"), (2, "HTP op"), (3, "transfers")):
+                yield {"ph": "M", "name": "thread_name", "pid": pids[session], "tid": tid, "args": {"name": name}}
+
+    for rec in records:
+        yield from pid(rec["session"])
+        p = pids[rec["session"]]
+        if rec["graph"] != last_graph and rec["graph"] is not None:
+            last_graph = rec["graph"]
+            yield {"ph": "i", "s": "p", "name": f"graph {rec['graph']}", "pid": p, "tid": 1, "ts": rec["ts_us"]}
+        if rec["kind"] != "op":
+            args = {"bytes": rec["bytes"], "layer": rec["layer"]}
+            if rec["dur_us"] is None:
+                yield {"ph": "i", "s": "t", "name": f"{rec['kind']} {rec['name']}", "cat": "transfer",
+                       "pid": p, "tid": 3, "ts": rec["ts_us"], "args": args}
+            else:
+                yield {"ph": "X", "name": f"{rec['kind']} {rec['name']}", "cat": "transfer",
+                       "pid": p, "tid": 3, "ts": rec["ts_us"], "dur": rec["dur_us"], "args": args}
+            continue
+        name = rec["op"] if rec["layer"] is None else f"{rec['op']} L{rec['layer']}"
+        args = {k: rec[k] for k in ("names", "dims", "types", "buffs", "layer", "op_usec", "op_cycles",
+                                    "op_pkts", "call_usec", "graph")}
+        yield {"ph": "X", "name": name, "cat": rec["op"], "pid": p, "tid": 1,
+               "ts": rec["ts_us"], "dur": rec["call_usec"], "args": args}
+        # HTP time sits at the end of the (synchronous) call
+        yield {"ph": "X", "name": name, "cat": rec["op"], "pid": p, "tid": 2,
+               "ts": rec["ts_us"] + max(0, rec["call_usec"] - rec["op_usec"]), "dur": rec["op_usec"],
+               "args": {"names": rec["names"], "op_cycles": rec["op_cycles"], "op_pkts": rec["op_pkts"]}}
+
+
+def write_trace(records, path):
+    """Chrome-trace JSON (ui.perfetto.dev, chrome://tracing), one event per line."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"displayTimeUnit": "ms", "traceEvents": [\n')
+        for i, event in enumerate(trace_events(records)):
+            f.write((",\n" if i else "") + json.dumps(event))
+        f.write("\n]}\n")
+
+
+def write_jsonl(records, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+
+
+def print_summary(summary, top=10, out=sys.stdout):
+    if not summary["ops"]:
+        out.write("No ggml-hex profile lines found (run with PROF=1)\n")
+        return
+    graphs = f" over {summary['graphs']} graphs" if summary["graphs"] else ""
+    out.write(f"Ops: {summary['ops']}{graphs}, HTP {summary['op_usec'] / 1000:.1f} ms, "
+              f"host calls {summary['call_usec'] / 1000:.1f} ms "
+              f"(dispatch/queue overhead {summary['overhead_usec'] / 1000:.1f} ms)\n")
+
+    def table(title, rows):
+        out.write(f"\n{title}\n")
+        out.write(f"  {'':24} {'count':>7} {'HTP ms':>10} {'share':>7} {'call ms':>10}\n")
+        for r in rows[:top]:
+            key = " ".join(map(str, r["key"])) if isinstance(r["key"], tuple) else str(r["key"])
+            out.write(f"  {key:24} {r['count']:7d} {r['op_usec'] / 1000:10.2f} {r['share'] * 100:6.1f}% "
+                      f"{r['call_usec'] / 1000:10.2f}\n")
+
+    table("By op type", summary["by_op"])
+    table("By layer", summary["by_layer"])
+    table("By layer and op type", summary["by_layer_op"])
+
+    if summary["transfers"]:
+        out.write("\nHost<->HTP transfers\n")
+        for kind, t in sorted(summary["transfers"].items()):
+            timed = f", {t['dur_us'] / 1000:.2f} ms" if t["timed"] else ""
+            out.write(f"  {kind}: {t['count']} x, {t['bytes'] / 1e6:.2f} MB{timed}\n")
+        for r in summary["slowest_transfers"][:top]:
+            out.write(f"    {r['kind']} {r['name']}: {r['bytes']} B in {r['dur_us'] / 1000:.2f} ms (line {r['line']})\n")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Parse ggml-hexagon PROF/V logs into per-op records and a timeline.")
+    ap.add_argument("logfile", type=Path, help="llama-cli stderr captured with PROF=1 (and optionally V=1)")
+    ap.add_argument("--trace", type=Path, help="write a Chrome-trace / Perfetto JSON timeline")
+    ap.add_argument("--jsonl", type=Path, help="write one JSON record per op / transfer")
+    ap.add_argument("--json-summary", action="store_true", help="print the summary as JSON")
+    ap.add_argument("--top", type=int, default=10, help="rows per table")
+    args = ap.parse_args()
+
+    if not args.logfile.is_file():
+        raise SystemExit(f"File not found: {args.logfile}")
+
+    records = list(parse_log(args.logfile))
+    if args.jsonl:
+        write_jsonl(records, args.jsonl)
+    if args.trace:
+        write_trace(records, args.trace)
+        print(f"Trace written to {args.trace}")
+
+    summary = summarize(records)
+    if args.json_summary:
+        print(json.dumps(summary, indent=2, default=str))
+    else:
+        print_summary(summary, args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Multi-fidelity TruthfulQA hyperparameter search (successive halving / Hyperband).
+
+Samples configs from the same space as hyperparameter_search.sh, evaluates
+many of them on a few questions, and promotes the best 1/eta of each rung to
+more questions until the survivors get the full pass. Configs are ranked by a
+joint objective of BLEURT accuracy and decode speed:
+
+    objective = accuracy + speed_weight * avg_decode_speed / speed_ref
+
+Samples a promoted config already ran are served from the result store, so a
+promotion only costs the new questions.
+
+Output (same layout as hyperparameter_search.sh, readable by check_progress.sh):
+    hyperparam_search_<timestamp>/results.csv      full-fidelity runs, results.csv columns
+    hyperparam_search_<timestamp>/rungs.csv        every evaluation, incl. partial ones
+    hyperparam_search_<timestamp>/BEST_RESULTS.txt
+    hyperparam_search_<timestamp>/run_<id>/debug.log
+
+    python hyperband_search.py                       # Hyperband, 25 questions max
+    python hyperband_search.py --algo sha --n-configs 27 --min-samples 3
+"""
+import argparse
+import csv
+import math
+import os
+import random
+from datetime import datetime
+
+from device_pool import add_device_args, per_device, pool_from_args
+from energy import add_energy_args, sampler_from_args
+from memory_profiler import add_memory_args, memory_sampler_from_args
+from sweep_common import (CONFIG_COLUMNS, RESULTS_COLUMNS, ResultsCSV, TruthfulQAEvaluator,
+                          config_key, sample_config)
+
+RUNG_COLUMNS = RESULTS_COLUMNS + ["bracket", "rung", "n_samples", "objective"]
+
+
+def fidelity_levels(min_samples, max_samples, eta):
+    """Question counts per rung: min_samples * eta^k, capped by (and ending at) max_samples."""
+    levels = []
+    r = min_samples
+    while r < max_samples:
+        levels.append(int(r))
+        r *= eta
+    levels.append(max_samples)
+    return levels
+
+
+def hyperband_brackets(min_samples, max_samples, eta):
+    """(n_configs, rung question counts) per Hyperband bracket, most exploratory first."""
+    levels = fidelity_levels(min_samples, max_samples, eta)
+    s_max = len(levels) - 1
+    brackets = []
+    for s in range(s_max, -1, -1):
+        n = int(math.ceil((s_max + 1) / (s + 1) * eta ** s))
+        brackets.append((n, levels[s_max - s:]))
+    return brackets
+
+
+def objective(metrics, speed_weight, speed_ref):
+    """Joint score; runs without an accuracy (failed) rank last."""
+    if metrics.get("accuracy") is None:
+        return float("-inf")
+    decode = metrics.get("avg_decode_speed") or 0.0
+    return metrics["accuracy"] + speed_weight * decode / speed_ref
+
+
+class HyperbandSearch:
+    def __init__(self, evaluator, output_dir, eta=3, speed_weight=0.5, speed_ref=20.0, seed=None):
+        self.evaluator = evaluator
+        self.output_dir = output_dir
+        self.eta = eta
+        self.speed_weight = speed_weight
+        self.speed_ref = speed_ref
+        self.rng = random.Random(seed)
+        self.results = ResultsCSV(os.path.join(output_dir, "results.csv"))
+        self.rungs_path = os.path.join(output_dir, "rungs.csv")
+        with open(self.rungs_path, "w", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerow(RUNG_COLUMNS)
+        self.run_id = 0
+        self.seen = set()
+        self.finished = []  # full-fidelity rows with objective
+
+    def new_configs(self, n):
+        configs = []
+        attempts = 0
+        while len(configs) < n and attempts < n * 100:
+            attempts += 1
+            cfg = sample_config(self.rng)
+            if config_key(cfg) not in self.seen:
+                self.seen.add(config_key(cfg))
+                configs.append(cfg)
+        return configs
+
+    def _evaluate(self, cfg, n_samples, bracket, rung, runtime_before):
+        self.run_id += 1
+        print("=" * 40)
+        print(f"RUN #{self.run_id} - bracket {bracket} rung {rung}: {n_samples} questions - {datetime.now()}")
+        print(" | ".join(f"{k}: {cfg[k]}" for k in CONFIG_COLUMNS))
+        metrics = self.evaluator.evaluate(cfg, os.path.join(self.output_dir, f"run_{self.run_id}"), n_samples)
+        # runtime of the config across all its rungs, comparable to a full run
+        metrics["runtime_seconds"] += runtime_before
+        score = objective(metrics, self.speed_weight, self.speed_ref)
+        row = {"run_id": self.run_id, **cfg, **metrics, "bracket": bracket, "rung": rung,
+               "n_samples": n_samples, "objective": score}
+        print(f"Accuracy: {metrics['accuracy']} | BLEURT: {metrics['bleurt_score']} | "
+              f"Decode: {metrics['avg_decode_speed']} tok/s | objective: {score:.4f}")
+        with open(self.rungs_path, "a", encoding="utf-8", newline="") as f:
+            csv.DictWriter(f, fieldnames=RUNG_COLUMNS, extrasaction="ignore").writerow(row)
+        return row
+
+    def successive_halving(self, configs, levels, bracket=0):
+        """Evaluate configs at levels[0], keep the top 1/eta for each next level."""
+        runtimes = {config_key(c): 0 for c in configs}
+        rows = []
+        for rung, n_samples in enumerate(levels):
+            rows = []
+            for cfg in configs:
+                row = self._evaluate(cfg, n_samples, bracket, rung, runtimes[config_key(cfg)])
+                runtimes[config_key(cfg)] = row["runtime_seconds"]
+                rows.append(row)
+            rows.sort(key=lambda r: r["objective"], reverse=True)
+            if rung < len(levels) - 1:
+                keep = max(1, len(rows) // self.eta)
+                configs = [{k: r[k] for k in CONFIG_COLUMNS} for r in rows[:keep]
+                           if r["objective"] != float("-inf")]
+                print(f"Rung {rung} done: promoting {len(configs)} of {len(rows)} configs to {levels[rung + 1]} questions")
+                if not configs:
+                    return []
+        for row in rows:
+            self.results.append(row)
+            self.finished.append(row)
+        self.write_best()
+        return rows
+
+    def hyperband(self, min_samples, max_samples, rounds=1):
+        for _ in range(rounds):
+            for bracket, (n, levels) in enumerate(hyperband_brackets(min_samples, max_samples, self.eta)):
+                print(f"Bracket {bracket}: {n} configs, rungs {levels}")
+                self.successive_halving(self.new_configs(n), levels, bracket)
+
+    def write_best(self, top=5):
+        ranked = sorted(self.finished, key=lambda r: r["objective"], reverse=True)
+        path = os.path.join(self.output_dir, "BEST_RESULTS.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("=" * 80 + "\n")
+            f.write("HYPERBAND SEARCH - BEST RESULTS\n")
+            f.write(f"Updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            f.write(f"objective = accuracy + {self.speed_weight} * decode tok/s / {self.speed_ref}\n")
+            f.write("=" * 80 + "\n\n")
+            f.write(f"Evaluations: {self.run_id} | Full-fidelity runs: {len(ranked)}\n\n")
+            for row in ranked[:top]:
+                f.write(f"Run: {row['run_id']} | objective: {row['objective']:.4f} | "
+                        f"Accuracy: {row['accuracy']} | BLEURT: {row['bleurt_score']}\n")
+                f.write(f"Model: {row['model']} | Mode: {row['mode']} | Temp: {row['temperature']} | "
+                        f"Top-p: {row['top_p']} | Top-k: {row['top_k']} | Repeat Penalty: {row['repeat_penalty']}\n")
+                f.write(f"Context: {row['ctx_size']} | Batch: {row['batch_size']} | Threads: {row['threads']} | "
+                        f"Flash Attn: {row['flash_attn']} | KV: {row['ctk']}/{row['ctv']} | "
+                        f"Poll: {row['poll_level']} | MMap: {row['use_mmap']}\n")
+                f.write(f"Prefill: {row['avg_prefill_speed']} tok/s | Decode: {row['avg_decode_speed']} tok/s | "
+                        f"Total: {row['avg_total_speed']} tok/s\n")
+                f.write(f"Energy: {row.get('energy_j')} J | J/prefill token: {row.get('j_per_prefill_token')} | "
+                        f"J/decode token: {row.get('j_per_decode_token')}\n")
+                f.write(f"Memory: peak RSS {row.get('peak_rss_mb')} MB | KV cache {row.get('kv_cache_mib')} MiB | "
+                        f"mmap resident {row.get('mmap_resident_mb')} MB\n\n")
+            f.write(f"Full results: {os.path.abspath(self.results.path)}\n")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Successive halving / Hyperband TruthfulQA sweep.")
+    ap.add_argument("--algo", choices=["hyperband", "sha"], default="hyperband")
+    ap.add_argument("--max-samples", type=int, default=25, help="questions in a full-fidelity run")
+    ap.add_argument("--min-samples", type=int, default=3, help="questions in the lowest rung")
+    ap.add_argument("--eta", type=int, default=3, help="keep the top 1/eta configs per rung")
+    ap.add_argument("--n-configs", type=int, default=27, help="configs in the first rung (--algo sha)")
+    ap.add_argument("--rounds", type=int, default=1, help="Hyperband iterations (--algo hyperband)")
+    ap.add_argument("--speed-weight", type=float, default=0.5,
+                    help="weight of decode speed vs accuracy in the objective")
+    ap.add_argument("--speed-ref", type=float, default=20.0,
+                    help="decode tok/s that counts as speed_weight accuracy points")
+    ap.add_argument("--seed", type=int, default=None, help="seed for config sampling")
+    ap.add_argument("--output-dir", default=None)
+    add_energy_args(ap)
+    add_memory_args(ap)
+    add_device_args(ap)
+    args = ap.parse_args()
+
+    output_dir = args.output_dir or f"hyperparam_search_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Output directory: {output_dir}")
+
+    serials, pool = pool_from_args(args)
+    power = per_device(serials, lambda s: sampler_from_args(args, s))
+    memory = per_device(serials, lambda s: memory_sampler_from_args(args, s))
+    evaluator = TruthfulQAEvaluator(max_samples=args.max_samples, power=power, memory=memory, pool=pool)
+    search = HyperbandSearch(evaluator, output_dir, eta=args.eta, speed_weight=args.speed_weight,
+                             speed_ref=args.speed_ref, seed=args.seed)
+    try:
+        if args.algo == "sha":
+            levels = fidelity_levels(args.min_samples, args.max_samples, args.eta)
+            search.successive_halving(search.new_configs(args.n_configs), levels)
+        else:
+            search.hyperband(args.min_samples, args.max_samples, rounds=args.rounds)
+    finally:
+        for sampler in list(power.values()) + list(memory.values()):
+            sampler.stop()
+
+    if pool is not None:
+        print(f"Devices: {pool.summary()}")
+    print(evaluator.scorer.summary())
+    if evaluator.store is not None:
+        print(evaluator.store.summary())
+    print(f"Search complete! Results: {os.path.join(output_dir, 'BEST_RESULTS.txt')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,8 @@ mkdir -p "$OUTPUT_DIR"
 LOG_FILE="$OUTPUT_DIR/search_log.txt"
 RESULTS_CSV="$OUTPUT_DIR/results.csv"
 BEST_CONFIG_FILE="$OUTPUT_DIR/BEST_RESULTS.txt"
+QUEUE_FILE="$OUTPUT_DIR/configs.jsonl"
+RUNNER_LOG="$OUTPUT_DIR/runner_output.txt"
 
 # Get absolute paths
 RESULTS_CSV_ABS="$(pwd)/$RESULTS_CSV"
@@ -24,7 +26,7 @@ echo "Output directory: $OUTPUT_DIR" | tee -a "$LOG_FILE"
 echo "" | tee -a "$LOG_FILE"
 
 # CSV header - Added avg_prefill_speed, avg_decode_speed, avg_total_speed
-echo "run_id,model,mode,temperature,repeat_penalty,top_p,top_k,ctx_size,keep,batch_size,ubatch_size,threads,ngl,ctk,ctv,flash_attn,context_shift,poll_level,use_mmap,split_mode,system_prompt,bleurt_score,accuracy,avg_prefill_speed,avg_decode_speed,avg_total_speed,runtime_seconds" > "$RESULTS_CSV"
+echo "run_id,model,mode,temperature,repeat_penalty,top_p,top_k,ctx_size,keep,batch_size,ubatch_size,threads,ngl,ctk,ctv,flash_attn,context_shift,poll_level,use_mmap,split_mode,system_prompt,bleurt_score,accuracy,avg_prefill_speed,avg_decode_speed,avg_total_speed,runtime_seconds,energy_j,j_per_prefill_token,j_per_decode_token,peak_rss_mb,kv_cache_mib,mmap_resident_mb" > "$RESULTS_CSV"
 
 ################################################################################
 # HYPERPARAMETER SPACES
@@ -161,6 +163,15 @@ try:
                 f.write(f"Prefill Speed: {valid_speeds['avg_prefill_speed'].min():.2f} - {valid_speeds['avg_prefill_speed'].max():.2f} tok/s (avg: {valid_speeds['avg_prefill_speed'].mean():.2f})\n")
                 f.write(f"Decode Speed: {valid_speeds['avg_decode_speed'].min():.2f} - {valid_speeds['avg_decode_speed'].max():.2f} tok/s (avg: {valid_speeds['avg_decode_speed'].mean():.2f})\n")
                 f.write(f"Total Speed: {valid_speeds['avg_total_speed'].min():.2f} - {valid_speeds['avg_total_speed'].max():.2f} tok/s (avg: {valid_speeds['avg_total_speed'].mean():.2f})\n")
+        if 'j_per_decode_token' in df_valid and pd.to_numeric(df_valid['j_per_decode_token'], errors='coerce').notna().any():
+            j_decode = pd.to_numeric(df_valid['j_per_decode_token'], errors='coerce').dropna()
+            j_prefill = pd.to_numeric(df_valid['j_per_prefill_token'], errors='coerce').dropna()
+            f.write(f"J/decode token: {j_decode.min():.3f} - {j_decode.max():.3f} (avg: {j_decode.mean():.3f})\n")
+            if len(j_prefill) > 0:
+                f.write(f"J/prefill token: {j_prefill.min():.3f} - {j_prefill.max():.3f} (avg: {j_prefill.mean():.3f})\n")
+        if 'peak_rss_mb' in df_valid and pd.to_numeric(df_valid['peak_rss_mb'], errors='coerce').notna().any():
+            rss = pd.to_numeric(df_valid['peak_rss_mb'], errors='coerce').dropna()
+            f.write(f"Peak RSS: {rss.min():.0f} - {rss.max():.0f} MB (avg: {rss.mean():.0f})\n")
         f.write("\n")
 
         # Best by BLEURT score
@@ -207,109 +218,6 @@ except Exception as e:
 PYPYTHON
 }
 
-parse_speeds() {
-    local debug_log="$1"
-    
-    python3 << PYPYTHON
-import re
-import sys
-from pathlib import Path
-
-debug_log = Path("$debug_log")
-
-if not debug_log.is_file():
-    print("0.00 0.00 0.00")
-    sys.exit(0)
-
-# Match the context print line
-CONTEXT_RE = re.compile(r'llama_perf_context_print:')
-
-# Match floats or ints
-NUM_RE = re.compile(r'[+-]?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?')
-
-def parse_line_numbers(line):
-    """Return (floats:list[float], ints:list[int]) parsed from the line."""
-    floats, ints = [], []
-    for m in NUM_RE.finditer(line):
-        s = m.group(0)
-        if ('.' in s) or ('e' in s.lower()):
-            try:
-                floats.append(float(s))
-            except ValueError:
-                pass
-        else:
-            try:
-                ints.append(int(s))
-            except ValueError:
-                pass
-    return floats, ints
-
-prefill_records = []
-decode_records = []
-total_records = []
-
-try:
-    with debug_log.open("r", encoding="utf-8", errors="replace") as f:
-        for line in f:
-            if "prompt eval time" in line and CONTEXT_RE.match(line):
-                floats, ints = parse_line_numbers(line)
-                if len(floats) > 0 and len(ints) > 0:
-                    prefill_records.append({
-                        "time_ms": floats[0],
-                        "tokens": ints[0],
-                    })
-            elif "eval time" in line and CONTEXT_RE.match(line) and "prompt eval" not in line:
-                floats, ints = parse_line_numbers(line)
-                if len(floats) > 0 and len(ints) > 0:
-                    decode_records.append({
-                        "time_ms": floats[0],
-                        "tokens": ints[0],
-                    })
-            elif "total time" in line and CONTEXT_RE.match(line):
-                floats, ints = parse_line_numbers(line)
-                if len(floats) > 0 and len(ints) > 0:
-                    total_records.append({
-                        "time_ms": floats[0],
-                        "tokens": ints[0],
-                    })
-except Exception as e:
-    print("0.00 0.00 0.00")
-    sys.exit(0)
-
-# Calculate average prefill speed with zero-division protection
-avg_prefill_speed = 0.0
-if prefill_records:
-    for rec in prefill_records:
-        if rec['time_ms'] > 0:  # ✅ ADDED: Zero-division protection
-            token_per_second = rec['tokens'] / rec['time_ms'] * 1000
-            avg_prefill_speed += token_per_second
-    if len([r for r in prefill_records if r['time_ms'] > 0]) > 0:  # ✅ ADDED: Check valid records
-        avg_prefill_speed /= len([r for r in prefill_records if r['time_ms'] > 0])
-
-# Calculate average decode speed with zero-division protection
-avg_decode_speed = 0.0
-if decode_records:
-    for rec in decode_records:
-        if rec['time_ms'] > 0:  # ✅ ADDED: Zero-division protection
-            token_per_second = rec['tokens'] / rec['time_ms'] * 1000
-            avg_decode_speed += token_per_second
-    if len([r for r in decode_records if r['time_ms'] > 0]) > 0:  # ✅ ADDED: Check valid records
-        avg_decode_speed /= len([r for r in decode_records if r['time_ms'] > 0])
-
-# Calculate average total speed with zero-division protection
-avg_total_speed = 0.0
-if total_records:
-    for rec in total_records:
-        if rec['time_ms'] > 0:  # ✅ ADDED: Zero-division protection
-            token_per_second = rec['tokens'] / rec['time_ms'] * 1000
-            avg_total_speed += token_per_second
-    if len([r for r in total_records if r['time_ms'] > 0]) > 0:  # ✅ ADDED: Check valid records
-        avg_total_speed /= len([r for r in total_records if r['time_ms'] > 0])
-
-print(f"{avg_prefill_speed:.2f} {avg_decode_speed:.2f} {avg_total_speed:.2f}")
-PYPYTHON
-}
-
 run_configuration() {
     local run_id=$1
     local model=$2
@@ -347,214 +255,23 @@ run_configuration() {
     echo "System Prompt: ${system_prompt:-'(none)'}" | tee -a "$LOG_FILE"
     echo "" | tee -a "$LOG_FILE"
 
-    # Build context shift flag
-    local context_shift_flag=""
-    if [ "$context_shift" -eq 1 ]; then
-        context_shift_flag="--context-shift"
-    else
-        context_shift_flag="--no-context-shift"
-    fi
-
-    # Build mmap flag
-    local mmap_flag=""
-    [ "$use_mmap" -eq 0 ] && mmap_flag="--no-mmap"
-
-    # Create a temporary Python script that matches truthful_qa_eval.py exactly
-    cat > "$run_dir/run_eval.py" << 'PYPYTHON'
-#!/usr/bin/env python3
-import os
-import sys
-
-# FIX: Disable TensorFlow before importing evaluate
-os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
-os.environ['TRANSFORMERS_NO_TF'] = '1'
-
-from datasets import load_dataset
-import evaluate
-import subprocess
-import time
-import numpy as np
-
-# Configuration from bash - INJECTED BY HEREDOC BELOW
-
-PYPYTHON
-
-    # Inject configuration variables
-    cat >> "$run_dir/run_eval.py" << PYPYTHON
-MODEL = "$model"
-MODE = "$mode"
-TEMP = $temp
-REPEAT_PENALTY = $repeat_penalty
-TOP_P = $top_p
-TOP_K = $top_k
-CTX_SIZE = $ctx_size
-KEEP = $keep
-BATCH_SIZE = $batch_size
-UBATCH_SIZE = $batch_size
-THREADS = $threads
-NGL = $ngl
-CTK = "$ctk"
-CTV = "$ctv"
-FLASH_ATTN = "$flash_attn"
-CONTEXT_SHIFT_FLAG = "$context_shift_flag"
-POLL_LEVEL = $poll_level
-MMAP_FLAG = "$mmap_flag"
-SYSTEM_PROMPT = "$system_prompt"
-RUN_DIR = "$run_dir"
-PYPYTHON
-
-    # Append the rest of the Python script
-    cat >> "$run_dir/run_eval.py" << 'PYPYTHON'
-
-# Load dataset - exactly like truthful_qa_eval.py
-ds = load_dataset("truthfulqa/truthful_qa", "generation", split="validation")
-ds = ds.select(range(25))
-n = len(ds)
-print(f"Loaded {n} test samples for Truthful QA")
-
-# initiate BLEURT evaluator model - exactly like truthful_qa_eval.py
-bleurt = evaluate.load('bleurt', 'bleurt-large-128')
-
-# debug log
-stderr_file = open(os.path.join(RUN_DIR, 'debug.log'), 'w', encoding='utf-8')
-max_score_arr = []
-acc_score_arr = []
-
-for i, rec in enumerate(ds):
-    print(f"-------- sample {i} --------")
-    question = rec['question']
-    best_answer = rec['best_answer']
-    correct_answers = rec['correct_answers']
-    incorrect_answers = rec['incorrect_answers']
-
-    # Clean question - exactly like truthful_qa_eval.py
-    question = question.replace("'", " ")
-    question = question.replace('"', ' ')
-
-    # Build command - matching run-cli-streamllm.sh pattern
-    cmd = [
-        "bash", "./run-cli-streamllm.sh",
-        "-no-cnv",
-    ]
-    
-    # Add system prompt if provided
-    # if SYSTEM_PROMPT:
-    #    cmd.extend(["-sys", SYSTEM_PROMPT])
-    
-    # Add the rest of arguments
-    cmd.extend([
-        "-p", f"\"\'{question} \'\"",
-        "-n", "250",
-        # Pass extra args to override defaults
-        "-t", str(THREADS),
-        "-c", str(CTX_SIZE),
-        "-b", str(BATCH_SIZE),
-        "-ub", str(BATCH_SIZE),
-        "-ctk", CTK,
-        "-ctv", CTV,
-        "--temp", str(TEMP),
-        "--repeat-penalty", str(REPEAT_PENALTY),
-        "--top-p", str(TOP_P),
-        "--top-k", str(TOP_K),
-        "--keep", str(KEEP),
-        "-fa", FLASH_ATTN,
-        CONTEXT_SHIFT_FLAG,
-        "--poll", str(POLL_LEVEL),
-    ])
-    
-    if MMAP_FLAG:
-        cmd.append(MMAP_FLAG)
-
-    start = time.time()
-    with open(os.path.join(RUN_DIR, f"tmp_output_{i}.txt"), "w", encoding="utf-8") as fout:
-        print("CMD:", " ".join(cmd))
-        proc = subprocess.run(cmd, stdout=fout, stderr=stderr_file, text=True)
-    end = time.time()
-
-    latency = end - start
-    if proc.returncode != 0:
-        print(f"[ERROR] CLI failed for prompt {question}:")
-        continue
-
-    # start evaluate - exactly like truthful_qa_eval.py
-    with open(os.path.join(RUN_DIR, f"tmp_output_{i}.txt"), "r", encoding='utf-8') as fin:
-        pred = fin.read().strip()
-        
-        if not pred:
-            print(f"[WARNING] Empty prediction for sample {i}")
-            continue
-            
-        predictions = [pred] * len(correct_answers)
-        score_true = bleurt.compute(predictions=predictions, references=correct_answers)['scores']
-        predictions = [pred] * len(incorrect_answers)
-        score_false = bleurt.compute(predictions=predictions, references=incorrect_answers)['scores']
-
-        max_score = max(score_true)
-        acc_score = int(max(score_true) > max(score_false))
-
-        print(f'    latency: {latency:.3f} s.')
-        print(f'    max_score: {max_score:.3f}')
-        print(f'    acc: {acc_score}')
-
-        max_score_arr.append(max_score)
-        acc_score_arr.append(acc_score)
-
-stderr_file.close()
-
-# Calculate final metrics - exactly like truthful_qa_eval.py
-print('=======================================')
-print('')
-if max_score_arr:
-    accuracy = sum(acc_score_arr) / len(acc_score_arr)
-    avg_bleurt = np.mean(np.array(max_score_arr))
-else:
-    accuracy = 0.0
-    avg_bleurt = 0.0
-    
-print(f'avg max score: {avg_bleurt}')
-print(f'avg accuracy: {accuracy:.3f}')
-
-# Output in parseable format
-print(f"BLEURT_AVG={avg_bleurt}")
-print(f"ACCURACY={accuracy}")
-PYPYTHON
-
-    chmod +x "$run_dir/run_eval.py"
+    # Queue the config for the sweep runner, which keeps TruthfulQA and BLEURT
+    # loaded across runs and appends the run's row to results.csv
+    python3 -c 'import json, sys; print(json.dumps(dict(zip(sys.argv[1].split(","), sys.argv[2:]))))' \
+        "run_id,model,mode,temperature,repeat_penalty,top_p,top_k,ctx_size,keep,batch_size,ubatch_size,threads,ngl,ctk,ctv,flash_attn,context_shift,poll_level,use_mmap,split_mode,system_prompt" \
+        "$run_id" "$model" "$mode" "$temp" "$repeat_penalty" "$top_p" "$top_k" "$ctx_size" "$keep" "$batch_size" "$ubatch_size" "$threads" "$ngl" "$ctk" "$ctv" "$flash_attn" "$context_shift" "$poll_level" "$use_mmap" "$split_mode" "$system_prompt" \
+        >> "$QUEUE_FILE"
 
     echo "Running TruthfulQA test (25 samples)..." | tee -a "$LOG_FILE"
-    local start_time=$(date +%s)
-
-    # Run the Python evaluation script and save output
-    python3 "$run_dir/run_eval.py" 2>&1 | tee "$run_dir/eval_output.txt" | tee -a "$LOG_FILE"
-    
-    local end_time=$(date +%s)
-    local runtime=$((end_time - start_time))
-
-    # Parse BLEURT_AVG and ACCURACY from Python output
-    local bleurt_score="N/A"
-    local accuracy="N/A"
-    if [ -f "$run_dir/eval_output.txt" ]; then
-        bleurt_score=$(grep "BLEURT_AVG=" "$run_dir/eval_output.txt" | tail -1 | sed 's/.*=//')
-        accuracy=$(grep "ACCURACY=" "$run_dir/eval_output.txt" | tail -1 | sed 's/.*=//')
-    fi
-
-    # Parse speed metrics from debug.log using EXACT SAME logic as parse_log.py
-    local speeds=$(parse_speeds "$run_dir/debug.log")
-    local avg_prefill_speed=$(echo "$speeds" | awk '{print $1}')
-    local avg_decode_speed=$(echo "$speeds" | awk '{print $2}')
-    local avg_total_speed=$(echo "$speeds" | awk '{print $3}')
 
-    # Default to empty if parsing failed
-    [ -z "$avg_prefill_speed" ] && avg_prefill_speed=""
-    [ -z "$avg_decode_speed" ] && avg_decode_speed=""
-    [ -z "$avg_total_speed" ] && avg_total_speed=""
-
-    echo "BLEURT: $bleurt_score | Accuracy: $accuracy | Runtime: ${runtime}s" | tee -a "$LOG_FILE"
-    echo "Prefill: $avg_prefill_speed tok/s | Decode: $avg_decode_speed tok/s | Total: $avg_total_speed tok/s" | tee -a "$LOG_FILE"
-
-    # Append to CSV with ALL speed metrics - escape system_prompt for CSV
-    local escaped_prompt=$(echo "$system_prompt" | sed 's/"/""/g')
-    echo "${run_id},${model},${mode},${temp},${repeat_penalty},${top_p},${top_k},${ctx_size},${keep},${batch_size},${ubatch_size},${threads},${ngl},${ctk},${ctv},${flash_attn},${context_shift},${poll_level},${use_mmap},${split_mode},\"${escaped_prompt}\",${bleurt_score},${accuracy},${avg_prefill_speed},${avg_decode_speed},${avg_total_speed},${runtime}" >> "$RESULTS_CSV"
+    # Wait for the runner to record this run
+    until awk -F, -v id="$run_id" 'NR > 1 && $1 == id { found = 1 } END { exit !found }' "$RESULTS_CSV"; do
+        if ! kill -0 "$RUNNER_PID" 2>/dev/null; then
+            echo "[ERROR] sweep runner exited, see $RUNNER_LOG" | tee -a "$LOG_FILE"
+            exit 1
+        fi
+        sleep 5
+    done
 
     update_best_results
     echo "" | tee -a "$LOG_FILE"
@@ -571,6 +288,16 @@ echo "Running $NUM_TRIALS trials with expanded hyperparameters..." | tee -a "$LO
 echo "Progress: $BEST_CONFIG_FILE" | tee -a "$LOG_FILE"
 echo "" | tee -a "$LOG_FILE"
 
+# One long-lived runner executes every queued config (see sweep_runner.py).
+# DEVICES="serial1,serial2" (or "all") spreads each config's questions over several phones.
+touch "$QUEUE_FILE"
+python3 -u sweep_runner.py --queue "$QUEUE_FILE" --follow --results "$RESULTS_CSV" --output-dir "$OUTPUT_DIR" \
+    ${DEVICES:+--devices "$DEVICES"} 2>&1 \
+    | tee -a "$LOG_FILE" > "$RUNNER_LOG" &
+RUNNER_PID=$!
+# Let the runner finish its current run and exit if the search is interrupted
+trap 'echo "{\"stop\": true}" >> "$QUEUE_FILE"' EXIT
+
 for run_id in $(seq 1 $NUM_TRIALS); do
     model=$(get_random "${MODELS[@]}")
     mode=$(get_random "${MODES[@]}")
@@ -617,5 +344,8 @@ for run_id in $(seq 1 $NUM_TRIALS); do
     sleep 1
 done
 
+echo '{"stop": true}' >> "$QUEUE_FILE"
+wait "$RUNNER_PID"
+
 echo "Search complete! Results: $BEST_CONFIG_FILE" | tee -a "$LOG_FILE"
 
@@ -194,104 +194,10 @@ PYPYTHON
 parse_speeds() {
     local debug_log="$1"
 
-    python3 << PYPYTHON
-import re
-import sys
-from pathlib import Path
-
-debug_log = Path("$debug_log")
-
-if not debug_log.is_file():
-    print("0.00 0.00 0.00")
-    sys.exit(0)
-
-# Match the context print line
-CONTEXT_RE = re.compile(r'llama_perf_context_print:')
-
-# Match floats or ints
-NUM_RE = re.compile(r'[+-]?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?')
-
-def parse_line_numbers(line):
-    """Return (floats:list[float], ints:list[int]) parsed from the line."""
-    floats, ints = [], []
-    for m in NUM_RE.finditer(line):
-        s = m.group(0)
-        if ('.' in s) or ('e' in s.lower()):
-            try:
-                floats.append(float(s))
-            except ValueError:
-                pass
-        else:
-            try:
-                ints.append(int(s))
-            except ValueError:
-                pass
-    return floats, ints
-
-prefill_records = []
-decode_records = []
-total_records = []
-
-try:
-    with debug_log.open("r", encoding="utf-8", errors="replace") as f:
-        for line in f:
-            if "prompt eval time" in line and CONTEXT_RE.match(line):
-                floats, ints = parse_line_numbers(line)
-                if len(floats) > 0 and len(ints) > 0:
-                    prefill_records.append({
-                        "time_ms": floats[0],
-                        "tokens": ints[0],
-                    })
-            elif "eval time" in line and CONTEXT_RE.match(line) and "prompt eval" not in line:
-                floats, ints = parse_line_numbers(line)
-                if len(floats) > 0 and len(ints) > 0:
-                    decode_records.append({
-                        "time_ms": floats[0],
-                        "tokens": ints[0],
-                    })
-            elif "total time" in line and CONTEXT_RE.match(line):
-                floats, ints = parse_line_numbers(line)
-                if len(floats) > 0 and len(ints) > 0:
-                    total_records.append({
-                        "time_ms": floats[0],
-                        "tokens": ints[0],
-                    })
-except Exception as e:
-    print("0.00 0.00 0.00")
-    sys.exit(0)
-
-# Calculate average prefill speed with zero-division protection
-avg_prefill_speed = 0.0
-if prefill_records:
-    for rec in prefill_records:
-        if rec['time_ms'] > 0:
-            token_per_second = rec['tokens'] / rec['time_ms'] * 1000
-            avg_prefill_speed += token_per_second
-    if len([r for r in prefill_records if r['time_ms'] > 0]) > 0:
-        avg_prefill_speed /= len([r for r in prefill_records if r['time_ms'] > 0])
-
-# Calculate average decode speed with zero-division protection
-avg_decode_speed = 0.0
-if decode_records:
-    for rec in decode_records:
-        if rec['time_ms'] > 0:
-            token_per_second = rec['tokens'] / rec['time_ms'] * 1000
-            avg_decode_speed += token_per_second
-    if len([r for r in decode_records if r['time_ms'] > 0]) > 0:
-        avg_decode_speed /= len([r for r in decode_records if r['time_ms'] > 0])
-
-# Calculate average total speed with zero-division protection
-avg_total_speed = 0.0
-if total_records:
-    for rec in total_records:
-        if rec['time_ms'] > 0:
-            token_per_second = rec['tokens'] / rec['time_ms'] * 1000
-            avg_total_speed += token_per_second
-    if len([r for r in total_records if r['time_ms'] > 0]) > 0:
-        avg_total_speed /= len([r for r in total_records if r['time_ms'] > 0])
-
-print(f"{avg_prefill_speed:.2f} {avg_decode_speed:.2f} {avg_total_speed:.2f}")
-PYPYTHON
+    # mean of per-run tokens/s (the results.csv columns); per-invocation
+    # records go next to the log for later analysis
+    python3 log_parser.py "$debug_log" --speeds --jsonl "$(dirname "$debug_log")/perf.jsonl" 2>/dev/null \
+        || echo "0.00 0.00 0.00"
 }
 
 run_configuration() {
@@ -352,7 +258,6 @@ import time
 import subprocess
 import re
 from pathlib import Path
-from datasets import load_dataset
 import evaluate
 
 # Configuration from bash - INJECTED BY HEREDOC BELOW
@@ -429,17 +334,10 @@ def run_one_prompt(cli_path, prompt_device_path, output_path, stderr_file):
     return latency
 
 def load_references():
-    """Load qmsum test split and return reference map."""
-    ds = load_dataset("zai-org/LongBench", "qmsum", split="test")
-    ref_map = {}
-    for i, rec in enumerate(ds):
-        ans = rec["answers"]
-        if isinstance(ans, list) and len(ans) > 0:
-            ref = ans[0]
-        else:
-            ref = ans
-        ref_map[i] = ref.strip()
-    return ref_map
+    """Load qmsum test split (from its offline snapshot) and return reference map."""
+    sys.path.insert(0, os.getcwd())
+    from longbench_eval import load_references as load_subset_references
+    return load_subset_references("qmsum")
 
 def main():
     print(f"Loading references from LongBench qmsum test split...")
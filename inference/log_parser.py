@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Streaming parser for llama-cli stderr logs (debug.log).
+
+Reads the log line by line (so arbitrarily large logs are fine) and yields one
+structured record per llama-cli invocation: load time, prompt tokens, prefill
+ms, decode runs, decode ms, sampling time, graph splits, KV cache size, etc.
+summarize() turns the records into token-weighted speeds, p50/p90/p99 and
+per-sample outliers instead of a plain mean of per-run tokens/s.
+
+    python log_parser.py debug.log                      # summary
+    python log_parser.py debug.log --jsonl perf.jsonl --csv perf.csv
+    python log_parser.py debug.log --speeds             # "prefill decode total"
+"""
+import argparse
+import csv
+import json
+import re
+import statistics
+import sys
+from pathlib import Path
+
+NUM = r'([+-]?(?:\d+\.\d*|\.\d+|\d+))'
+
+PERF_PATTERNS = {
+    "load_ms": re.compile(r'^llama_perf_context_print:\s+load time =\s*' + NUM + r' ms'),
+    "prefill": re.compile(r'^llama_perf_context_print:\s+prompt eval time =\s*' + NUM + r' ms /\s*(\d+) tokens'),
+    "decode": re.compile(r'^llama_perf_context_print:\s+eval time =\s*' + NUM + r' ms /\s*(\d+) runs'),
+    "total": re.compile(r'^llama_perf_context_print:\s+total time =\s*' + NUM + r' ms /\s*(\d+) tokens'),
+    "graphs_reused": re.compile(r'^llama_perf_context_print:\s+graphs reused =\s*(\d+)'),
+    "sampling": re.compile(r'^llama_perf_sampler_print:\s+sampling time =\s*' + NUM + r' ms /\s*(\d+) runs'),
+}
+GRAPH_SPLITS_RE = re.compile(r'^llama_context: graph splits = (\d+)')
+KV_CACHE_RE = re.compile(r'^llama_kv_cache: size =\s*' + NUM + r' MiB')
+CTX_SHIFT_RE = re.compile(r'^main: prompt \((\d+) tokens\) exceeds context')
+# lines that open a new llama-cli invocation
+START_RE = re.compile(r'^(\+ adb |build: \d+)')
+# mtmd helper lines (llama-mtmd-cli and multimodal llama-server), one pair per image slice
+MTMD_ENCODE_RE = re.compile(r'image slice encoded in (\d+) ms')
+MTMD_DECODE_RE = re.compile(r'image decoded \(batch \d+/\d+\) in (\d+) ms')
+
+FIELDS = ["index", "line", "cmd", "load_ms", "prompt_tokens", "prefill_ms", "decode_runs", "decode_ms",
+          "sampling_ms", "sampling_runs", "total_ms", "total_tokens", "graph_splits", "graphs_reused",
+          "kv_cache_mib", "prompt_exceeds_ctx", "prefill_tps", "decode_tps", "total_tps"]
+
+
+def _rate(tokens, ms):
+    if tokens is None or not ms:
+        return None
+    return tokens / ms * 1000.0
+
+
+def _new_record(index, lineno):
+    rec = dict.fromkeys(FIELDS)
+    rec["index"] = index
+    rec["line"] = lineno
+    return rec
+
+
+def _finish(rec):
+    rec["prefill_tps"] = _rate(rec["prompt_tokens"], rec["prefill_ms"])
+    rec["decode_tps"] = _rate(rec["decode_runs"], rec["decode_ms"])
+    rec["total_tps"] = _rate(rec["total_tokens"], rec["total_ms"])
+    return rec
+
+
+def iter_records(lines):
+    """Yield one record per llama-cli invocation found in the log lines."""
+    index = 0
+    rec = None
+    has_perf = False
+    for lineno, line in enumerate(lines, start=1):
+        if START_RE.match(line):
+            # '+ adb' and 'build:' both open the same run; only split after perf output
+            if rec is not None and has_perf:
+                yield _finish(rec)
+                index += 1
+                rec = None
+                has_perf = False
+            if rec is None:
+                rec = _new_record(index, lineno)
+            if line.startswith("+ adb "):
+                rec["cmd"] = line[2:].strip()
+            continue
+
+        if not line.startswith(("llama_", "main: prompt")):
+            continue
+        if rec is None:
+            rec = _new_record(index, lineno)
+
+        m = GRAPH_SPLITS_RE.match(line)
+        if m:
+            rec["graph_splits"] = int(m.group(1))
+            continue
+        m = KV_CACHE_RE.match(line)
+        if m:
+            rec["kv_cache_mib"] = float(m.group(1))
+            continue
+        m = CTX_SHIFT_RE.match(line)
+        if m:
+            rec["prompt_exceeds_ctx"] = int(m.group(1))
+            continue
+
+        for key, pattern in PERF_PATTERNS.items():
+            m = pattern.match(line)
+            if not m:
+                continue
+            if key in ("sampling", "load_ms") and rec["total_ms"] is not None:
+                # next perf block without a start marker in between
+                yield _finish(rec)
+                index += 1
+                rec = _new_record(index, lineno)
+            has_perf = True
+            if key == "load_ms":
+                rec["load_ms"] = float(m.group(1))
+            elif key == "prefill":
+                rec["prefill_ms"], rec["prompt_tokens"] = float(m.group(1)), int(m.group(2))
+            elif key == "decode":
+                rec["decode_ms"], rec["decode_runs"] = float(m.group(1)), int(m.group(2))
+            elif key == "total":
+                rec["total_ms"], rec["total_tokens"] = float(m.group(1)), int(m.group(2))
+            elif key == "graphs_reused":
+                rec["graphs_reused"] = int(m.group(1))
+            elif key == "sampling":
+                rec["sampling_ms"], rec["sampling_runs"] = float(m.group(1)), int(m.group(2))
+            break
+
+    if rec is not None and has_perf:
+        yield _finish(rec)
+
+
+def parse_log(path):
+    """Yield records from a log file without loading it into memory."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        yield from iter_records(f)
+
+
+def mtmd_timings(lines):
+    """
+    Image encode (vision tower + projector) and image-embedding decode ms,
+    summed over the mtmd lines of one llama-mtmd-cli run or server request.
+    """
+    encode = [int(m.group(1)) for m in map(MTMD_ENCODE_RE.search, lines) if m]
+    decode = [int(m.group(1)) for m in map(MTMD_DECODE_RE.search, lines) if m]
+    return {
+        "image_slices": len(encode),
+        "image_encode_ms": float(sum(encode)) if encode else None,
+        "image_decode_ms": float(sum(decode)) if decode else None,
+    }
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile, q in [0, 100]."""
+    if not values:
+        return None
+    s = sorted(values)
+    pos = (len(s) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (pos - lo)
+
+
+def _phase_stats(records, tok_key, ms_key, outlier_z):
+    rows = [r for r in records if r[tok_key] is not None and r[ms_key]]
+    if not rows:
+        return None
+    rates = [r[tok_key] / r[ms_key] * 1000.0 for r in rows]
+    total_tokens = sum(r[tok_key] for r in rows)
+    total_ms = sum(r[ms_key] for r in rows)
+
+    # robust z-score against the median; flags throttled / cold / broken runs
+    med = statistics.median(rates)
+    mad = statistics.median([abs(x - med) for x in rates])
+    outliers = []
+    if mad > 0:
+        for r, x in zip(rows, rates):
+            z = 0.6745 * (x - med) / mad
+            if abs(z) > outlier_z:
+                outliers.append({"index": r["index"], "tps": x, "z": z})
+
+    return {
+        "runs": len(rows),
+        "tokens": total_tokens,
+        "ms": total_ms,
+        "weighted_tps": total_tokens / total_ms * 1000.0,
+        "mean_tps": sum(rates) / len(rates),
+        "p50_tps": percentile(rates, 50),
+        "p90_tps": percentile(rates, 90),
+        "p99_tps": percentile(rates, 99),
+        "p50_ms_per_token": percentile([1000.0 / x for x in rates if x > 0], 50),
+        "p90_ms_per_token": percentile([1000.0 / x for x in rates if x > 0], 90),
+        "p99_ms_per_token": percentile([1000.0 / x for x in rates if x > 0], 99),
+        "outliers": outliers,
+    }
+
+
+def summarize(records, outlier_z=3.5):
+    """Token-weighted speeds, percentiles and outliers per phase."""
+    records = list(records)
+    return {
+        "invocations": len(records),
+        "prefill": _phase_stats(records, "prompt_tokens", "prefill_ms", outlier_z),
+        "decode": _phase_stats(records, "decode_runs", "decode_ms", outlier_z),
+        "total": _phase_stats(records, "total_tokens", "total_ms", outlier_z),
+        "load_ms_p50": percentile([r["load_ms"] for r in records if r["load_ms"] is not None], 50),
+    }
+
+
+def write_jsonl(records, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+
+
+def write_csv(records, path):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for rec in records:
+            writer.writerow(rec)
+
+
+def print_summary(summary, out=sys.stdout):
+    labels = {"prefill": "Prefill", "decode": "Decode", "total": "Total (prefill + decode)"}
+    out.write(f"Invocations: {summary['invocations']}\n")
+    for phase, label in labels.items():
+        st = summary[phase]
+        if st is None:
+            out.write(f"No {phase} records found\n")
+            continue
+        out.write(f"{label}: {st['weighted_tps']:.2f} tokens/s token-weighted "
+                  f"({st['tokens']} tokens over {st['runs']} runs), mean of runs {st['mean_tps']:.2f}\n")
+        out.write(f"    p50 {st['p50_tps']:.2f} | p90 {st['p90_tps']:.2f} | p99 {st['p99_tps']:.2f} tokens/s"
+                  f" | p50/p90/p99 latency {st['p50_ms_per_token']:.2f}/{st['p90_ms_per_token']:.2f}/"
+                  f"{st['p99_ms_per_token']:.2f} ms/token\n")
+        for o in st["outliers"]:
+            out.write(f"    outlier: run {o['index']} at {o['tps']:.2f} tokens/s (z={o['z']:.1f})\n")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Parse llama.cpp logs into per-invocation records.")
+    ap.add_argument("logfile", type=Path, help="Path to the log file to parse")
+    ap.add_argument("--jsonl", type=Path, help="write one JSON record per invocation")
+    ap.add_argument("--csv", type=Path, help="write one CSV row per invocation")
+    ap.add_argument("--json-summary", action="store_true", help="print the summary as JSON")
+    ap.add_argument("--speeds", action="store_true",
+                    help="print 'prefill decode total' mean tokens/s (results.csv columns)")
+    ap.add_argument("--outlier-z", type=float, default=3.5)
+    args = ap.parse_args()
+
+    if not args.logfile.is_file():
+        if args.speeds:
+            print("0.00 0.00 0.00")
+            return
+        raise SystemExit(f"File not found: {args.logfile}")
+
+    records = list(parse_log(args.logfile))
+    if args.jsonl:
+        write_jsonl(records, args.jsonl)
+    if args.csv:
+        write_csv(records, args.csv)
+
+    summary = summarize(records, args.outlier_z)
+    if args.speeds:
+        # mean of per-run rates, which is what results.csv has always recorded
+        print(" ".join(f"{summary[p]['mean_tps'] if summary[p] else 0.0:.2f}" for p in ("prefill", "decode", "total")))
+    elif args.json_summary:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
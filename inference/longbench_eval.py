@@ -1,16 +1,38 @@
 #!/usr/bin/env python3
-
+"""
+ROUGE scoring of LongBench outputs (<subset>_test_<id>.txt) against the
+dataset references.
+
+Each prediction/reference pair is scored for ROUGE-1/2/L/Lsum by
+rouge_score's RougeScorer (one per worker process) on a process pool; files
+are read and scored in bounded chunks, so thousands of outputs across
+several subsets never sit in memory at once. The aggregate is the mean of the per-sample F1 scores over the
+samples with ROUGE-L > 0 (evaluate's rouge reports the bootstrap median of
+the same mean, so the two agree to within resampling noise).
+
+    python longbench_eval.py                                   # qmsum_outputs/, qmsum
+    python longbench_eval.py --output_dir outputs --subsets qmsum,gov_report --workers 8
+"""
+import argparse
 import os
 import re
-from datasets import load_dataset
-import evaluate
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+
+from dataset_snapshot import load_subset
+
+ROUGE_TYPES = ["rouge1", "rouge2", "rougeL", "rougeLsum"]
+OUTPUT_RE = re.compile(r"(\w+?)_test_(\d+)\.txt$")
 
-def load_references():
+_scorer = None
+
+
+def load_references(subset="qmsum"):
     """
-    Load the qmsum test split and return a dict mapping sample index -> reference summary.
+    Load the test split of a LongBench subset and return a dict mapping sample index -> reference summary.
     You must adapt this to the correct field name in the dataset.
     """
-    ds = load_dataset("zai-org/LongBench", "qmsum", split="test")
+    ds = load_subset("zai-org/LongBench", subset, split="test", columns=["answers"])
     ref_map = {}
     for i, rec in enumerate(ds):
         ans = rec["answers"]
@@ -21,89 +43,120 @@ def load_references():
         ref_map[i] = ref.strip()
     return ref_map
 
-def evaluate_folder_outputs(output_dir: str, ref_map: dict):
-    """
-    Traverse output files (qmsum_test_{id}.txt) in output_dir,
-    collect predictions and references, compute rouge via evaluate.
-    Return results list and overall metrics.
-    """
-    rouge = evaluate.load("rouge")
-    pattern = re.compile(r"qmsum_test_(\d+)\.txt")
-    predictions = []
-    references = []
-    sample_ids = []
 
+def score_pair(prediction, reference):
+    """{rouge type: F1} for one sample."""
+    global _scorer
+    if _scorer is None:
+        from rouge_score import rouge_scorer
+        _scorer = rouge_scorer.RougeScorer(ROUGE_TYPES, use_stemmer=True)
+    scores = _scorer.score(reference, prediction)
+    return {t: scores[t].fmeasure for t in ROUGE_TYPES}
+
+
+def _score_chunk(chunk):
+    """[(key, scores)] for [(key, prediction path, reference)]; runs in a worker process."""
+    scored = []
+    for key, path, ref in chunk:
+        with open(path, "r", encoding="utf-8") as f:
+            pred = f.read().strip()
+        scored.append((key, score_pair(pred, ref)))
+    return scored
+
+
+def iter_outputs(output_dir, ref_maps):
+    """((subset, idx), path, reference) for every output file with a reference, in file-name order."""
     for fname in sorted(os.listdir(output_dir)):
-        m = pattern.match(fname)
+        m = OUTPUT_RE.match(fname)
         if not m:
             print(f"Skipping unrecognized file name: {fname}")
             continue
-        idx = int(m.group(1))
-        outpath = os.path.join(output_dir, fname)
-        with open(outpath, "r", encoding="utf-8") as f:
-            pred = f.read().strip()
-
-        if idx not in ref_map:
-            print(f"Warning: no reference for sample {idx}, skipping")
+        subset, idx = m.group(1), int(m.group(2))
+        if subset not in ref_maps:
+            continue
+        if idx not in ref_maps[subset]:
+            print(f"Warning: no reference for {subset} sample {idx}, skipping")
             continue
+        yield (subset, idx), os.path.join(output_dir, fname), ref_maps[subset][idx]
+
+
+def score_outputs(items, workers=None, chunk_size=32):
+    """
+    Yield ((subset, idx), scores) for (key, path, reference) items, scoring
+    chunks of them on a process pool with a bounded number in flight.
+    """
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        pending = deque()
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) == chunk_size:
+                pending.append(ex.submit(_score_chunk, chunk))
+                chunk = []
+                if len(pending) >= 2 * workers:
+                    yield from pending.popleft().result()
+        if chunk:
+            pending.append(ex.submit(_score_chunk, chunk))
+        while pending:
+            yield from pending.popleft().result()
+
+
+def aggregate(scores):
+    """Mean F1 per ROUGE type over the samples with ROUGE-L > 0 (zeros if there are none)."""
+    kept = [s for s in scores if s["rougeL"] > 0.0]
+    if not kept:
+        return {t: 0.0 for t in ROUGE_TYPES}
+    return {t: sum(s[t] for s in kept) / len(kept) for t in ROUGE_TYPES}
+
+
+def evaluate_subsets(output_dir, ref_maps, workers=None):
+    """{subset: (per-sample [(idx, rougeL)], aggregated scores)} for the subsets in ref_maps."""
+    per_subset = {subset: [] for subset in ref_maps}
+    for (subset, idx), scores in score_outputs(iter_outputs(output_dir, ref_maps), workers):
+        per_subset[subset].append((idx, scores))
+    results = {}
+    for subset, scored in per_subset.items():
+        scored.sort()
+        results[subset] = ([(idx, s["rougeL"]) for idx, s in scored], aggregate([s for _, s in scored]))
+    return results
+
+
+def evaluate_folder_outputs(output_dir: str, ref_map: dict, subset="qmsum", workers=None):
+    """
+    Score the <subset>_test_{id}.txt files in output_dir.
+    Return per-sample (idx, rougeL) results and aggregated metrics.
+    """
+    return evaluate_subsets(output_dir, {subset: ref_map}, workers)[subset]
 
-        ref = ref_map[idx]
-        sample_ids.append(idx)
-        predictions.append(pred)
-        references.append(ref)
-
-    # Compute per-sample scores
-    per_sample = rouge.compute(
-        predictions=predictions,
-        references=references,
-        use_stemmer=True,
-        use_aggregator=False
-    )
-
-    # Build per-sample result list (idx, rougeL)
-    results = []
-    for i, idx in enumerate(sample_ids):
-        rl = per_sample["rougeL"][i]
-        results.append((idx, rl))
-
-    # === Filter out samples with ROUGE-L == 0.0 for aggregated score ===
-    filtered_predictions = []
-    filtered_references = []
-    for i, rl in enumerate(per_sample["rougeL"]):
-        if rl > 0.0:
-            filtered_predictions.append(predictions[i])
-            filtered_references.append(references[i])
-
-    if filtered_predictions:
-        result = rouge.compute(
-            predictions=filtered_predictions,
-            references=filtered_references,
-            use_stemmer=True
-        )
-    else:
-        # Fallback: no non-zero samples, return zeros
-        result = {"rouge1": 0.0, "rouge2": 0.0, "rougeL": 0.0, "rougeLsum": 0.0}
-
-    return results, result
 
 def main():
-    output_dir = "qmsum_outputs"
+    ap = argparse.ArgumentParser(description="ROUGE of LongBench outputs against the references.")
+    ap.add_argument("--output_dir", default="qmsum_outputs")
+    ap.add_argument("--subsets", default="qmsum", help="comma-separated LongBench subsets to score")
+    ap.add_argument("--workers", type=int, default=None, help="scoring processes (default: all cores)")
+    ap.add_argument("--quiet", action="store_true", help="do not print per-sample scores")
+    args = ap.parse_args()
+
     print("Loading references …")
-    ref_map = load_references()
-    print(f"Loaded {len(ref_map)} references.")
+    ref_maps = {s: load_references(s) for s in args.subsets.split(",") if s}
+    for subset, ref_map in ref_maps.items():
+        print(f"Loaded {len(ref_map)} {subset} references.")
+
+    print("Evaluating predictions in", args.output_dir)
+    results = evaluate_subsets(args.output_dir, ref_maps, args.workers)
 
-    print("Evaluating predictions in", output_dir)
-    per_sample_scores, aggregated = evaluate_folder_outputs(output_dir, ref_map)
+    for subset, (per_sample_scores, aggregated) in results.items():
+        if not args.quiet:
+            print(f"\n=== {subset}: ROUGE-L per sample ===")
+            for idx, rl in per_sample_scores:
+                print(f"Sample {idx}: ROUGE-L = {rl:.4f}")
 
-    print("\n=== ROUGE-L per sample ===")
-    for idx, rl in per_sample_scores:
-        print(f"Sample {idx}: ROUGE-L = {rl:.4f}")
+        print(f"\n=== {subset}: Aggregated ROUGE ({len(per_sample_scores)} samples) ===")
+        print(f"ROUGE-L (F1): {aggregated['rougeL']:.4f}")
+        print(f"ROUGE-1: {aggregated['rouge1']:.4f}, ROUGE-2: {aggregated['rouge2']:.4f}, "
+              f"ROUGE-Lsum: {aggregated['rougeLsum']:.4f}")
 
-    print("\n=== Aggregated ROUGE ===")
-    # Print only rougeL, or print all metrics
-    print(f"ROUGE-L (F1): {aggregated['rougeL']:.4f}")
-    print(f"ROUGE-1: {aggregated['rouge1']:.4f}, ROUGE-2: {aggregated['rouge2']:.4f}, ROUGE-Lsum: {aggregated['rougeLsum']:.4f}")
 
 if __name__ == "__main__":
     main()
-
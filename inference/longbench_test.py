@@ -1,37 +1,30 @@
 #!/usr/bin/env python3
 import os
+import json
 import time
+import argparse
 import subprocess
+import threading
+from contextlib import nullcontext
 from pathlib import Path
 
+from server_backend import make_server
+from thermal import add_thermal_args, scheduler_from_args, summarize_thermal
+from energy import add_energy_args, format_energy, sampler_from_args, summarize_energy
+from memory_profiler import add_memory_args, format_memory, memory_sampler_from_args, summarize_memory
+from device_pool import add_device_args, device_name, per_device, pool_from_args, summarize_devices
+from device_assets import push_cas
+from prepare_prompts import prompt_token_lengths
+
 def ensure_dir(p):
     os.makedirs(p, exist_ok=True)
 
-def get_phone_temperature():
-    """
-    Query the phone temperature via adb.
-    Returns temperature in °C as float, or None if unavailable.
-    """
-    try:
-        out = subprocess.check_output(
-            ["adb", "shell", "dumpsys", "battery"],
-            text=True
-        )
-        for line in out.splitlines():
-            if "temperature" in line.lower():
-                parts = line.split(":")
-                if len(parts) == 2:
-                    val = parts[1].strip()
-                    temp_tenths = int(val)
-                    return temp_tenths / 10.0
-    except Exception as e:
-        print(f"[WARN] Failed to read phone temperature via adb: {e}")
-    return None
-
-def run_one(cli_path: str, prompt_device_path: str, output_path: str, extra_args=None, stderr_file=None):
+def run_one(cli_path: str, prompt_device_path: str, output_path: str, extra_args=None, stderr_file=None,
+            serial=None, log_lock=None):
     """
-    Run CLI with -no-cnv -f prompt_device_path, capture stdout → file, stderr → stderr_file.
-    Returns the latency (in seconds).
+    Run CLI with -no-cnv -f prompt_device_path (on device serial, if given),
+    capture stdout → file, stderr → stderr_file.
+    Returns (latency in seconds, stderr text, success).
     """
     if extra_args is None:
         extra_args = []
@@ -40,29 +33,83 @@ def run_one(cli_path: str, prompt_device_path: str, output_path: str, extra_args
     if cli_path.endswith(".sh"):
         cmd = ["bash"] + cmd
 
+    env = dict(os.environ, S=serial) if serial else None
     start = time.time()
     with open(output_path, "w", encoding="utf-8") as fout:
-        proc = subprocess.run(cmd, stdout=fout, stderr=stderr_file, text=True)
+        proc = subprocess.run(cmd, stdout=fout, stderr=subprocess.PIPE, text=True, env=env)
     end = time.time()
+    if stderr_file is not None:
+        with log_lock or nullcontext():
+            stderr_file.write(proc.stderr)
+            stderr_file.flush()
 
     latency = end - start
     if proc.returncode != 0:
         print(f"[ERROR] CLI failed for prompt {prompt_device_path}")
-    return latency
+    return latency, proc.stderr, proc.returncode == 0
+
+def run_one_server(server, prompt_local_path: str, output_path: str):
+    """
+    Send the prompt file's contents to the persistent llama-server, write the
+    completion to output_path. Returns (latency in seconds, server timings),
+    or None if the request failed.
+    """
+    with open(prompt_local_path, "r", encoding="utf-8") as f:
+        prompt = f.read()
+    try:
+        res = server.complete(prompt, n_predict=int(os.environ.get("N_PRED", 250)), seed=42)
+    except OSError as e:
+        print(f"[ERROR] server request failed for prompt {prompt_local_path}: {e}")
+        return None
+    with open(output_path, "w", encoding="utf-8") as fout:
+        fout.write(res["content"])
+    return res["latency"], res["timings"]
+
+def order_prompts(prompt_files, prompt_dir, order="name"):
+    """
+    prompt_files in run order: by name, or by length ("longest" first, which
+    keeps a device pool busy to the end, or "shortest" first), using the
+    token counts of prepare_prompts.py's manifest and file size otherwise.
+    """
+    if order == "name":
+        return prompt_files
+    tokens = prompt_token_lengths(prompt_dir)
+    return sorted(prompt_files, key=lambda pf: tokens.get(pf.name, pf.stat().st_size / 4.0),
+                  reverse=order == "longest")
 
 def run_all(local_prompt_dir: str, device_prompt_prefix: str, output_dir: str,
-            cli_path: str, extra_args=None):
+            cli_path: str, extra_args=None, servers=None, thermal=None, power=None,
+            memory=None, serials=(None,), pool=None, device_paths=None, order="name"):
+    """
+    servers, thermal, power and memory map device serial -> server /
+    ThermalScheduler / PowerSampler / MemorySampler. With a DevicePool the prompts are spread over pool.serials;
+    records come back in prompt order with the device they ran on.
+    device_paths maps a prompt file name to its (content-addressed) path on
+    the device; prompts not in it are expected under device_prompt_prefix.
+    A sample that fails is retried on another device of the pool; without a
+    pool (or once the retries are used up on the last device) its record
+    carries failed=True and is left out of the averages.
+    """
     ensure_dir(output_dir)
     local = Path(local_prompt_dir)
-    prompt_files = sorted(local.glob("*.prompt.txt"))
+    prompt_files = order_prompts(sorted(local.glob("*.prompt.txt")), local_prompt_dir, order)
+    servers = servers or {}
+    thermal = thermal or {}
+    power = power or {}
+    memory = memory or {}
+    serials = list(pool.serials) if pool is not None else list(serials)
 
     latencies = []
     stderr_file = open('debug.log', 'w', encoding='utf-8')
+    log_lock = threading.Lock()
+    # one record per sample, tagged with the thermal state it ran in
+    records_file = open(os.path.join(output_dir, 'latencies.jsonl'), 'w', encoding='utf-8')
+    timings_file = None
     t0 = time.time()
 
-    for idx, pf in enumerate(prompt_files):
+    def run_sample(serial, idx, pf):
         fname = pf.name  # e.g. "qmsum_test_0.prompt.txt"
-        prompt_dev_path = os.path.join(device_prompt_prefix, fname)
+        prompt_dev_path = (device_paths or {}).get(fname) or os.path.join(device_prompt_prefix, fname)
 
         # derive output filename, strip ".prompt.txt"
         base = fname
@@ -71,46 +118,166 @@ def run_all(local_prompt_dir: str, device_prompt_prefix: str, output_dir: str,
         out_fname = base + ".txt"
         out_path = os.path.join(output_dir, out_fname)
 
-        print(f"Running prompt {fname} → output {out_fname}")
-        latency = run_one(cli_path, prompt_dev_path, out_path, extra_args, stderr_file)
+        print(f"Running prompt {fname} → output {out_fname}"
+              f"{'' if len(serials) == 1 else ' on ' + device_name(serial)}")
+        record = {"sample": fname, "device": serial or os.environ.get("S")}
+        server = servers.get(serial)
+        scheduler = thermal.get(serial)
+        sampler = power.get(serial)
+        mem = memory.get(serial)
+        with (scheduler.track() if scheduler is not None else nullcontext({})) as thermal_tags:
+            t_start = time.time()
+            if server is None:
+                latency, cli_stderr, ok = run_one(cli_path, prompt_dev_path, out_path, extra_args, stderr_file,
+                                                  serial, log_lock)
+            else:
+                res = run_one_server(server, str(pf), out_path)
+                latency, timings = res if res is not None else (time.time() - t_start, {})
+                record.update(timings)
+                ok = res is not None
+            t_end = time.time()
+        if not ok and pool is not None:
+            # hand the prompt to another device
+            return None
+        record["latency"] = latency
+        record.update(thermal_tags)
+        if not ok:
+            record["failed"] = True
+            print(f"  failed after {latency:.3f} s")
+            return record
         print(f"  latency: {latency:.3f} s")
 
-        # Read and print phone temperature
-        temp = get_phone_temperature()
-        if temp is not None:
-            print(f"phone temperature: {temp:.1f} °C")
+        if sampler is not None:
+            if server is None:
+                energy = sampler.cli_energy(t_start, t_end, cli_stderr)
+            else:
+                energy = sampler.server_energy(t_start, t_end, timings)
+            record.update(energy)
+            if energy["energy_j"] is not None:
+                print(f"  energy: {energy['energy_j']:.2f} J, "
+                      f"{energy['j_per_decode_token'] or 0:.3f} J/decode token")
+            elif energy["on_charger"]:
+                print("  energy: n/a (on a charger)")
+
+        if mem is not None:
+            record.update(mem.cli_memory(t_start, t_end, cli_stderr) if server is None
+                          else mem.window(t_start, t_end))
+            if record["peak_rss_mb"] is not None:
+                print(f"  memory: peak RSS {record['peak_rss_mb']:.0f} MB, "
+                      f"mmap resident {record['mmap_resident_mb'] or 0:.0f} MB")
+
+        if thermal_tags.get("temp_end_c") is not None:
+            print(f"phone temperature: {thermal_tags['temp_end_c']:.1f} °C"
+                  f"{' (throttled)' if thermal_tags['throttled'] else ''}")
         else:
             print("phone temperature: unavailable")
+        return record
 
-        latencies.append((fname, latency))
-
-        # Wait one minute after each sample, except after the last one
-        # if idx < len(prompt_files) - 1:
-        #     print("waiting 60 seconds before next run...\n")
-        #     time.sleep(60)
+    try:
+        if servers:
+            for server in servers.values():
+                server.log_file = stderr_file
+                server.start()
+            timings_file = open(os.path.join(output_dir, 'server_timings.jsonl'), 'w', encoding='utf-8')
+        if pool is None:
+            records = (run_sample(serials[0], idx, pf) for idx, pf in enumerate(prompt_files))
+        else:
+            records = (rec for _, pf, rec, _ in pool.imap(prompt_files, run_sample) if rec is not None)
+        for record in records:
+            if timings_file is not None:
+                timings_file.write(json.dumps(record) + "\n")
+                timings_file.flush()
+            records_file.write(json.dumps(record) + "\n")
+            records_file.flush()
+            latencies.append(record)
+    finally:
+        for server in servers.values():
+            server.stop()
+        if timings_file is not None:
+            timings_file.close()
+        for scheduler in thermal.values():
+            scheduler.monitor.stop()
+        for sampler in list(power.values()) + list(memory.values()):
+            sampler.stop()
+        records_file.close()
+        stderr_file.close()
 
-    t1 = time.time()
-    total = t1 - t0
+    total = time.time() - t0
     return latencies, total
 
 def main():
-    local_prompt_dir = "./prompt_files"
-    device_prompt_prefix = "/data/local/tmp/prompt_files"
-    output_dir = "./qmsum_outputs"
+    ap = argparse.ArgumentParser(description="LongBench (QMSum) generation on the phone.")
+    ap.add_argument("--backend", choices=["cli", "server", "stub"], default="cli",
+                    help="cli: one llama-cli per prompt; server: persistent llama-server "
+                         "via adb forward; stub: local stand-in server (no phone)")
+    ap.add_argument("--port", type=int, default=8080, help="llama-server port (server backend)")
+    ap.add_argument("--prompts", default="./prompt_files",
+                    help="directory of *.prompt.txt, e.g. prepare_prompts.py's --out-dir")
+    ap.add_argument("--output-dir", default="./qmsum_outputs", help="where the outputs and latencies.jsonl go")
+    ap.add_argument("--order", choices=["name", "longest", "shortest"], default="name",
+                    help="run order of the prompts (lengths from the prepare_prompts.py manifest)")
+    add_thermal_args(ap)
+    add_energy_args(ap)
+    add_memory_args(ap)
+    add_device_args(ap)
+    ap.add_argument("--no-sync", action="store_true",
+                    help="don't push the prompts; use the copies already under /data/local/tmp/<prompts dir>")
+    args, extra_args = ap.parse_known_args()  # e.g. model settings, etc.
+
+    local_prompt_dir = args.prompts
+    device_prompt_prefix = "/data/local/tmp/" + os.path.basename(os.path.normpath(local_prompt_dir))
+    output_dir = args.output_dir
     cli_path = "./run-cli-streamllm.sh"  # or path to llama-cli or wrapper
-    extra_args = []  # e.g. model settings, etc.
+
+    serials, pool = pool_from_args(args)
+    device_paths = None
+    if args.backend == "cli" and not args.no_sync:
+        # one batched transfer of the prompts each device does not have yet
+        prompt_files = sorted(Path(local_prompt_dir).glob("*.prompt.txt"))
+        device_paths = {os.path.basename(local): remote
+                        for local, remote in push_cas([str(p) for p in prompt_files], serials).items()}
+    servers = {}
+    if args.backend != "cli":
+        # one server per device, on consecutive host ports
+        servers = {serial: make_server(args.backend, server_args=extra_args, port=args.port + k, serial=serial)
+                   for k, serial in enumerate(serials)}
 
     latencies, total_time = run_all(
-        local_prompt_dir, device_prompt_prefix, output_dir, cli_path, extra_args
+        local_prompt_dir, device_prompt_prefix, output_dir, cli_path, extra_args, servers,
+        thermal=per_device(serials, lambda s: scheduler_from_args(args, s)),
+        power=per_device(serials, lambda s: sampler_from_args(args, s)),
+        memory=per_device(serials, lambda s: memory_sampler_from_args(
+            args, s, "llama-cli" if args.backend == "cli" else "llama-server")),
+        serials=serials, pool=pool, device_paths=device_paths, order=args.order
     )
 
     print("\n=== Benchmark Summary ===")
-    for fname, lat in latencies:
-        print(f"{fname}: {lat:.3f} s")
+    for rec in latencies:
+        print(f"{rec['sample']}: {rec['latency']:.3f} s{' (throttled)' if rec.get('throttled') else ''}"
+              f"{' (failed)' if rec.get('failed') else ''}")
     print(f"Total time for {len(latencies)} samples: {total_time:.3f} s")
+    failed = [rec for rec in latencies if rec.get("failed")]
+    if failed:
+        print(f"Failed samples: {len(failed)} / {len(latencies)}, left out of the averages below")
+    latencies = [rec for rec in latencies if not rec.get("failed")]
     if latencies:
-        avg = sum(lat for _, lat in latencies) / len(latencies)
+        avg = sum(rec["latency"] for rec in latencies) / len(latencies)
         print(f"Average latency: {avg:.3f} s")
+        th = summarize_thermal(latencies)
+        if th["n_throttled"]:
+            unthrottled = f"{th['mean_unthrottled']:.3f} s" if th["mean_unthrottled"] is not None else "n/a"
+            print(f"Throttled samples: {th['n_throttled']} / {th['n']}, "
+                  f"average latency without them: {unthrottled}")
+        en = summarize_energy(latencies)
+        if en["energy_j"] is not None or en["n_on_charger"]:
+            print(f"Energy: {format_energy(en)}")
+        mem = summarize_memory(latencies)
+        if mem["peak_rss_mb"] is not None:
+            print(f"Memory: {format_memory(mem)}")
+    if pool is not None:
+        print(f"Devices: {pool.summary()}")
+        for name, dev in summarize_devices(latencies).items():
+            print(f"  {name}: {dev['n']} samples, average latency {dev['mean']:.3f} s")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Memory-footprint sampling for on-device llama-cli runs.
+
+MemorySampler keeps one adb shell loop running (like energy.PowerSampler)
+that, every interval, finds the llama-cli process and prints its
+/proc/<pid>/status VmRSS/VmHWM/RssAnon/RssFile, the device's
+/proc/meminfo MemTotal/MemAvailable and, every few samples, the TOTAL PSS
+line of `dumpsys meminfo <pid>`. dumpsys walks the whole process and costs
+the phone real CPU, so the eval harnesses only run it with --dumpsys-every
+N (off by default) and their timed samples stay undisturbed. For each
+llama-cli invocation the samples in its wall-clock window give:
+
+  peak_rss_mb        highest VmHWM/VmRSS seen for the process
+  mmap_resident_mb   highest RssFile, i.e. resident pages of the mmapped GGUF
+                     (close to 0 with --no-mmap, where the weights are anon)
+  anon_rss_mb        highest RssAnon (weights without mmap, KV cache, buffers)
+  pss_mb             highest dumpsys TOTAL PSS, when dumpsys ran in the window
+  min_available_mb   lowest MemAvailable, how close the phone came to LMK
+  kv_cache_mib       from llama-cli's own "llama_kv_cache: size" line
+
+With local=True the same loop runs on the host (`sh -c`) against the host's
+/proc (or proc_root), e.g. to profile a CPU build of llama-cli or a
+stand-in /proc tree in tests. Set ADB="python3 fake_adb.py" to exercise the
+adb path without a phone.
+
+    python memory_profiler.py --count 10                  # print device readings
+    python memory_profiler.py --local --process python3   # host /proc
+"""
+import argparse
+import re
+import subprocess
+import threading
+import time
+
+from adb_utils import adb_cmd
+from log_parser import iter_records
+
+MEMORY_FIELDS = ["peak_rss_mb", "kv_cache_mib", "mmap_resident_mb"]
+STATUS_KEYS = ("VmRSS", "VmHWM", "RssAnon", "RssFile")
+KV_RE = re.compile(r"(\w+):\s*(\d+)\s*kB")
+PSS_RE = re.compile(r"TOTAL PSS:\s*(\d+)|TOTAL\s+(\d+)")
+
+
+def stream_cmd(interval_s, process="llama-cli", proc_root="/proc", dumpsys_every=10):
+    """Shell loop printing 'pid <pid> <status fields>', 'mem <meminfo fields>' and 'pss <line>' lines."""
+    keys = "|".join(STATUS_KEYS)
+    dumpsys = ""
+    if dumpsys_every:
+        dumpsys = (f"[ -n \"$pid\" ] && [ $((i % {dumpsys_every})) -eq 0 ] && "
+                   "echo \"pss $pid $(dumpsys meminfo $pid 2>/dev/null | grep -m1 TOTAL)\"; ")
+    return (f"P={proc_root}; i=0; while true; do "
+            f"pid=$(pidof {process} 2>/dev/null | cut -d' ' -f1); "
+            f"[ -n \"$pid\" ] && echo \"pid $pid $(grep -E '^({keys}):' $P/$pid/status 2>/dev/null | tr '\\n' ' ')\"; "
+            f"echo \"mem $(grep -E '^(MemTotal|MemAvailable):' $P/meminfo | tr '\\n' ' ')\"; "
+            f"{dumpsys}i=$((i+1)); sleep {interval_s}; done")
+
+
+def parse_line(line):
+    """(kind, pid, {field: MB}) for one stream_cmd() line, or None."""
+    parts = line.split(None, 2)
+    if len(parts) < 2:
+        return None
+    kind = parts[0]
+    if kind == "mem":
+        return "mem", None, {k: int(v) / 1024.0 for k, v in KV_RE.findall(line)}
+    if kind not in ("pid", "pss") or not parts[1].isdigit():
+        return None
+    rest = parts[2] if len(parts) > 2 else ""
+    if kind == "pid":
+        return "pid", int(parts[1]), {k: int(v) / 1024.0 for k, v in KV_RE.findall(rest)}
+    m = PSS_RE.search(rest)
+    if not m:
+        return None
+    return "pss", int(parts[1]), {"pss": int(m.group(1) or m.group(2)) / 1024.0}
+
+
+class MemorySampler:
+    """Background (time, kind, pid, values) samples of llama-cli's and the device's memory."""
+
+    def __init__(self, serial=None, interval_s=0.5, process="llama-cli", dumpsys_every=10,
+                 local=False, proc_root="/proc"):
+        self.serial = serial
+        self.interval_s = interval_s
+        self.process = process
+        self.dumpsys_every = 0 if local else dumpsys_every
+        self.local = local
+        self.proc_root = proc_root
+        self.samples = []
+        self._lock = threading.Lock()
+        self._proc = None
+        self._thread = None
+
+    def _reader(self):
+        for line in self._proc.stdout:
+            parsed = parse_line(line)
+            if parsed is not None:
+                with self._lock:
+                    self.samples.append((time.time(),) + parsed)
+
+    def start(self):
+        if self._proc is None:
+            cmd = stream_cmd(self.interval_s, self.process, self.proc_root, self.dumpsys_every)
+            argv = ["sh", "-c", cmd] if self.local else adb_cmd(self.serial) + ["shell", cmd]
+            self._proc = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                          text=True, bufsize=1)
+            self._thread = threading.Thread(target=self._reader, name="memory-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._proc is not None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+            self._thread.join(timeout=5)
+            self._proc = None
+
+    def wait_ready(self, timeout=10.0):
+        """True once the first meminfo line has arrived."""
+        t0 = time.time()
+        while time.time() - t0 < timeout:
+            if self.samples:
+                return True
+            if self._proc is not None and self._proc.poll() is not None:
+                return False
+            time.sleep(0.05)
+        return bool(self.samples)
+
+    def window(self, start, end):
+        """Peak/min memory figures over host times [start, end] (None where nothing was seen)."""
+        # one interval of slack: the last sample before exit can land just after `end`
+        end += self.interval_s
+        with self._lock:
+            samples = [s for s in self.samples if start <= s[0] <= end]
+
+        def peak(kind, *keys):
+            vals = [v[k] for _, kd, _, v in samples if kd == kind for k in keys if k in v]
+            return max(vals) if vals else None
+
+        avail = [v["MemAvailable"] for _, kd, _, v in samples if kd == "mem" and "MemAvailable" in v]
+        return {
+            "peak_rss_mb": peak("pid", "VmHWM", "VmRSS"),
+            "mmap_resident_mb": peak("pid", "RssFile"),
+            "anon_rss_mb": peak("pid", "RssAnon"),
+            "pss_mb": peak("pss", "pss"),
+            "min_available_mb": min(avail) if avail else None,
+        }
+
+    def cli_memory(self, start, end, stderr_text):
+        """window() for one llama-cli invocation plus the KV cache size from its log."""
+        rec = next(iter_records(stderr_text.splitlines()), None) or {}
+        fields = self.window(start, end)
+        fields["kv_cache_mib"] = rec.get("kv_cache_mib")
+        return fields
+
+
+def start_memory_sampler(serial=None, interval_s=0.5, dumpsys_every=0, process="llama-cli"):
+    """A running MemorySampler, or None if the device gives no /proc/meminfo readings."""
+    sampler = MemorySampler(serial, interval_s, process, dumpsys_every=dumpsys_every)
+    try:
+        sampler.start()
+    except OSError as e:
+        print(f"[WARN] could not start memory sampling via adb: {e}")
+        return None
+    if not sampler.wait_ready():
+        print("[WARN] no /proc/meminfo readings from the device, memory will not be reported")
+        sampler.stop()
+        return None
+    return sampler
+
+
+def add_memory_args(ap):
+    """Memory sampling options shared by the eval harnesses."""
+    ap.add_argument("--mem-interval", type=float, default=0.5, help="seconds between /proc memory samples")
+    ap.add_argument("--dumpsys-every", type=int, default=0,
+                    help="also read dumpsys meminfo (PSS) every N samples (perturbs the timings); 0 disables")
+    ap.add_argument("--no-memory", action="store_true", help="disable memory sampling")
+
+
+def memory_sampler_from_args(args, serial=None, process="llama-cli"):
+    """A running MemorySampler for the parsed add_memory_args() options, or None."""
+    if args.no_memory:
+        return None
+    return start_memory_sampler(serial, args.mem_interval, args.dumpsys_every, process)
+
+
+def summarize_memory(records):
+    """Largest peak RSS, KV cache and mmap-resident size over per-sample cli_memory() results."""
+    def largest(key):
+        vals = [r[key] for r in records if r.get(key) is not None]
+        return max(vals) if vals else None
+    return {key: largest(key) for key in MEMORY_FIELDS}
+
+
+def format_memory(summary):
+    """One-line rendering of a summarize_memory() result."""
+    def mb(v):
+        return "n/a" if v is None else f"{v:.0f} MB"
+    return (f"peak RSS {mb(summary['peak_rss_mb'])}, KV cache {mb(summary['kv_cache_mib'])}, "
+            f"mmap resident {mb(summary['mmap_resident_mb'])}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Print memory readings for the llama-cli process and the device.")
+    ap.add_argument("--count", type=int, default=10)
+    ap.add_argument("--interval", type=float, default=1.0)
+    ap.add_argument("--process", default="llama-cli")
+    ap.add_argument("--local", action="store_true", help="read the host's /proc instead of the device's")
+    ap.add_argument("--proc-root", default="/proc", help="directory standing in for /proc")
+    ap.add_argument("--serial", default=None)
+    args = ap.parse_args()
+
+    sampler = MemorySampler(args.serial, args.interval, args.process, local=args.local,
+                            proc_root=args.proc_root).start()
+    seen = 0
+    try:
+        while seen < args.count:
+            time.sleep(0.1)
+            with sampler._lock:
+                new, seen = sampler.samples[seen:], len(sampler.samples)
+            for t, kind, pid, values in new:
+                fields = " ".join(f"{k}={v:.1f}MB" for k, v in values.items())
+                print(f"{time.strftime('%H:%M:%S', time.localtime(t))} {kind} {pid or ''} {fields}")
+            if sampler._proc.poll() is not None:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sampler.stop()
+
+
+if __name__ == "__main__":
+    main()
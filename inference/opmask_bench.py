@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Attribute Hexagon NPU time to op queuing, dynamic quantization and compute
+with GGML_HEXAGON_OPMASK.
+
+The same prompt runs through run-cli-streamllm.sh (MODE=NPU) under each mask
+
+  0x1  ops are queued to the NPU, NPU-side processing is stubbed out
+  0x3  the NPU also quantizes the activations, then skips the op
+  0x7  full processing (default)
+
+for every NHVX/NDEV combination asked for. Configs run round-robin (so
+thermal drift hits all of them alike) until the 95% confidence interval of
+mean ms/token is within --rel-ci of the mean for both prefill and decode,
+or --max-runs is reached. Per (NHVX, NDEV) the differences of the masks give
+
+  queue     t(0x1)            host graph work + queuing/dispatch to the NPU
+  quantize  t(0x3) - t(0x1)   dynamic quantization on the NPU
+  compute   t(0x7) - t(0x3)   the ops themselves
+
+in ms/token for prefill and decode; a path whose compute share is under half
+of t(0x7) is dispatch-bound rather than compute-bound.
+
+    python opmask_bench.py --prompt "What is the capital of France?"
+    python opmask_bench.py --nhvx 2,4,8 --ndev 1,2 --rel-ci 0.02 --out opmask.json -- -ub 128
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import statistics
+import subprocess
+import time
+from contextlib import nullcontext
+
+from log_parser import iter_records
+from thermal import add_thermal_args, scheduler_from_args
+
+MASKS = ["0x1", "0x3", "0x7"]
+STAGES = [("queue", None, "0x1"), ("quantize", "0x1", "0x3"), ("compute", "0x3", "0x7")]
+PHASES = [("prefill", "prompt_tokens", "prefill_ms"), ("decode", "decode_runs", "decode_ms")]
+# two-sided 95% Student t quantiles for 1..30 degrees of freedom
+T95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+       2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+       2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+
+def t95(df):
+    return T95[df - 1] if 1 <= df <= len(T95) else 1.96
+
+
+def mean_ci(values):
+    """(mean, half-width of the 95% CI, standard error); CI/SE are None below two values."""
+    if not values:
+        return None, None, None
+    mean = statistics.fmean(values)
+    if len(values) < 2:
+        return mean, None, None
+    se = statistics.stdev(values) / math.sqrt(len(values))
+    return mean, t95(len(values) - 1) * se, se
+
+
+def config_name(cfg):
+    return " ".join(f"{k}={v}" for k, v in cfg.items() if v is not None)
+
+
+def run_once(cfg, prompt, n_predict, extra_args, script, serial=None, log_file=None):
+    """One llama-cli run under cfg's env knobs; {"prefill": ms/token, "decode": ms/token} or None."""
+    env = dict(os.environ, MODE=os.environ.get("MODE", "NPU"), N_PRED=str(n_predict), OPMASK=cfg["OPMASK"])
+    for key in ("NHVX", "NDEV"):
+        if cfg.get(key) is not None:
+            env[key] = str(cfg[key])
+    if serial:
+        env["S"] = serial
+    cmd = ["bash", script, "-no-cnv", "-p", f"\"'{prompt}'\""] + extra_args
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, env=env)
+    if log_file is not None:
+        log_file.write(proc.stderr)
+        log_file.flush()
+    rec = next(iter_records(proc.stderr.splitlines()), None)
+    if proc.returncode != 0 or rec is None:
+        print(f"[ERROR] run failed for {config_name(cfg)} (exit {proc.returncode})")
+        return None
+    return {phase: rec[ms] / rec[tokens] if rec[tokens] and rec[ms] is not None else None
+            for phase, tokens, ms in PHASES}
+
+
+def converged(samples, rel_ci, min_runs):
+    """True once every phase has min_runs values and a CI half-width within rel_ci of its mean."""
+    for phase, _, _ in PHASES:
+        values = [s[phase] for s in samples if s[phase] is not None]
+        if len(values) < min_runs:
+            return False
+        mean, ci, _ = mean_ci(values)
+        if ci is None or (mean and ci / mean > rel_ci):
+            return False
+    return True
+
+
+def attribute(stats):
+    """
+    Per (NHVX, NDEV) group and phase: queue/quantize/compute ms/token with
+    95% CIs (differences of independent means) and the compute share of t(0x7).
+    """
+    groups = {}
+    for (mask, nhvx, ndev), per_phase in stats.items():
+        groups.setdefault((nhvx, ndev), {})[mask] = per_phase
+    result = []
+    for (nhvx, ndev), by_mask in sorted(groups.items(), key=lambda kv: str(kv[0])):
+        if not all(m in by_mask for m in MASKS):
+            continue
+        row = {"NHVX": nhvx, "NDEV": ndev}
+        for phase, _, _ in PHASES:
+            stages = {}
+            for stage, lo, hi in STAGES:
+                m_hi, _, se_hi = by_mask[hi][phase]
+                m_lo, _, se_lo = by_mask[lo][phase] if lo else (0.0, None, 0.0)
+                if m_hi is None or m_lo is None:
+                    stages[stage] = {"ms_per_token": None, "ci": None}
+                    continue
+                ci = None
+                if se_hi is not None and se_lo is not None:
+                    n = min(by_mask[hi]["n"], by_mask[lo]["n"] if lo else by_mask[hi]["n"])
+                    ci = t95(max(1, n - 1)) * math.sqrt(se_hi ** 2 + se_lo ** 2)
+                stages[stage] = {"ms_per_token": m_hi - m_lo, "ci": ci}
+            full = by_mask["0x7"][phase][0]
+            compute = stages["compute"]["ms_per_token"]
+            share = compute / full if full and compute is not None else None
+            stages["total_ms_per_token"] = full
+            stages["compute_share"] = share
+            stages["bound"] = None if share is None else ("compute" if share >= 0.5 else "dispatch")
+            row[phase] = stages
+        result.append(row)
+    return result
+
+
+def benchmark(configs, prompt, n_predict, extra_args, script, rel_ci, min_runs, max_runs,
+              serial=None, scheduler=None, log_file=None):
+    """{config key: [per-run samples]}, running unconverged configs round-robin."""
+    samples = {key: [] for key in configs}
+    active = list(configs)
+    rounds = 0
+    while active and rounds < max_runs:
+        rounds += 1
+        for key in list(active):
+            cfg = configs[key]
+            with (scheduler.track() if scheduler is not None else nullcontext({})) as thermal_tags:
+                sample = run_once(cfg, prompt, n_predict, extra_args, script, serial, log_file)
+            if sample is not None:
+                sample.update(thermal_tags)
+                samples[key].append(sample)
+            if converged(samples[key], rel_ci, min_runs):
+                active.remove(key)
+        print(f"[OPMASK] round {rounds}: {len(configs) - len(active)}/{len(configs)} configs converged")
+    for key in active:
+        print(f"[WARN] {config_name(configs[key])} did not reach ±{rel_ci:.0%} in {max_runs} runs")
+    return samples
+
+
+def print_report(stats, attribution, out_configs):
+    print("\n=== ms/token per config (mean ± 95% CI, runs) ===")
+    for key, per_phase in stats.items():
+        cells = []
+        for phase, _, _ in PHASES:
+            mean, ci, _ = per_phase[phase]
+            cells.append(f"{phase} {mean:.2f}" + (f" ± {ci:.2f}" if ci is not None else "") if mean is not None
+                         else f"{phase} n/a")
+        print(f"  {config_name(out_configs[key]):28} {' | '.join(cells)}  ({per_phase['n']} runs)")
+
+    print("\n=== Stage attribution, ms/token ===")
+    for row in attribution:
+        label = config_name({"NHVX": row["NHVX"], "NDEV": row["NDEV"]}) or "default NHVX/NDEV"
+        print(f"  {label}")
+        for phase, _, _ in PHASES:
+            st = row[phase]
+            if st["total_ms_per_token"] is None:
+                print(f"    {phase:8} n/a")
+                continue
+
+            def cell(stage):
+                v = st[stage]
+                if v["ms_per_token"] is None:
+                    return f"{stage} n/a"
+                return f"{stage} {v['ms_per_token']:.2f}" + (f" ± {v['ci']:.2f}" if v["ci"] is not None else "")
+
+            share = f"{st['compute_share']:.0%}" if st["compute_share"] is not None else "n/a"
+            print(f"    {phase:8} {' | '.join(cell(s) for s, _, _ in STAGES)} "
+                  f"of {st['total_ms_per_token']:.2f} -> compute {share}, {st['bound'] or 'n/a'}-bound")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Queue/quantize/compute attribution of NPU time via GGML_HEXAGON_OPMASK.")
+    ap.add_argument("--prompt", default="What is the capital of France?")
+    ap.add_argument("--n_predict", type=int, default=64, help="tokens to decode per run")
+    ap.add_argument("--masks", default=",".join(MASKS), help="comma-separated OPMASK values")
+    ap.add_argument("--nhvx", default=None, help="comma-separated NHVX values (default: backend default)")
+    ap.add_argument("--ndev", default=None, help="comma-separated NDEV values (default: backend default)")
+    ap.add_argument("--rel-ci", type=float, default=0.03,
+                    help="stop once the 95%% CI half-width is within this fraction of the mean")
+    ap.add_argument("--min-runs", type=int, default=3)
+    ap.add_argument("--max-runs", type=int, default=20)
+    ap.add_argument("--script", default="./run-cli-streamllm.sh")
+    ap.add_argument("--serial", default=None, help="adb serial (default: $S / the only device)")
+    ap.add_argument("--log", default="opmask_bench.log", help="llama-cli stderr of all runs")
+    ap.add_argument("--out", default=None, help="write per-run samples and the attribution as JSON")
+    add_thermal_args(ap)
+    args, extra_args = ap.parse_known_args()
+    if extra_args[:1] == ["--"]:
+        extra_args = extra_args[1:]
+
+    def values(text):
+        return [v for v in text.split(",") if v] if text else [None]
+
+    configs = {}
+    for mask, nhvx, ndev in itertools.product(values(args.masks), values(args.nhvx), values(args.ndev)):
+        configs[(mask, nhvx, ndev)] = {"OPMASK": mask, "NHVX": nhvx, "NDEV": ndev}
+    print(f"[OPMASK] {len(configs)} configs, {args.min_runs}-{args.max_runs} runs each, target ±{args.rel_ci:.0%}")
+
+    scheduler = scheduler_from_args(args, args.serial)
+    t0 = time.time()
+    try:
+        with open(args.log, "w", encoding="utf-8") as log_file:
+            samples = benchmark(configs, args.prompt, args.n_predict, extra_args, args.script, args.rel_ci,
+                                args.min_runs, args.max_runs, args.serial, scheduler, log_file)
+    finally:
+        if scheduler is not None:
+            scheduler.monitor.stop()
+
+    stats = {}
+    for key, runs in samples.items():
+        stats[key] = {"n": len(runs)}
+        for phase, _, _ in PHASES:
+            stats[key][phase] = mean_ci([s[phase] for s in runs if s[phase] is not None])
+    attribution = attribute(stats)
+    print_report(stats, attribution, configs)
+    print(f"\nTotal time: {time.time() - t0:.1f} s")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({
+                "prompt": args.prompt, "n_predict": args.n_predict, "extra_args": extra_args,
+                "runs": [{**configs[key], **s} for key, runs in samples.items() for s in runs],
+                "attribution": attribution,
+            }, f, indent=2)
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Token-budget-aware preparation of the LongBench prompt files.
+
+longbench_test.py hands every *.prompt.txt to llama-cli as is, so a QMSum
+transcript longer than CTX_SIZE - N_PRED overflows the context or is shifted
+in the middle of prefill. This stage tokenizes each prompt once with the
+target model's own vocab (llama-server's /tokenize, started through
+run-server-streamllm.sh; --backend stub for a dry run), caches the counts by
+(model hash, prompt hash) in .eval_cache/token_counts.json and cuts the
+prompts that do not fit to the budget on token boundaries:
+
+  head        keep the first tokens
+  tail        keep the last tokens (the question at the end survives)
+  head+tail   keep --head-tokens from the start (the instructions) and fill
+              the rest of the budget from the end
+  middle      drop the middle, keeping equal halves
+  none        copy the prompts unchanged and only report the overflow
+
+A cut prompt is tokenized again and trimmed further until it fits, so the
+prepared prompt plus n_predict is never more than the context. The prepared
+files go to --out-dir with manifest.json, which records the token length of
+every prompt before and after; longbench_test.py --prompts <out-dir> runs
+them, --order longest/shortest schedules them by that length, and
+autotune.py --prompts <out-dir> tunes for the real lengths. The server is
+only started when a count is not cached yet or a prompt has to be cut.
+
+    python prepare_prompts.py --ctx-size 4096 --n-predict 250
+    python prepare_prompts.py --policy middle --out-dir prompt_files_4k
+    python prepare_prompts.py --backend stub --ctx-size 512 --policy head+tail --head-tokens 64
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from result_store import model_fingerprint, script_model, sha256_text
+from server_backend import make_server
+
+POLICIES = ["head+tail", "middle", "head", "tail", "none"]
+MANIFEST = "manifest.json"
+TOKEN_CACHE = os.path.join(".eval_cache", "token_counts.json")
+# re-tokenizing a cut prompt can merge tokens across the seam; trim and retry this often
+MAX_FIT_ROUNDS = 8
+
+
+def load_manifest(prompt_dir):
+    """The manifest.json written into prompt_dir, or None."""
+    path = os.path.join(prompt_dir, MANIFEST)
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def prompt_token_lengths(prompt_dir):
+    """{file name: prepared token count} from prompt_dir's manifest ({} without one)."""
+    manifest = load_manifest(prompt_dir) or {"prompts": []}
+    return {p["file"]: p["tokens"] for p in manifest["prompts"]}
+
+
+class TokenCounts:
+    """Prompt token counts per (model hash, text sha256), kept in one JSON file.
+
+    Counts are BOS included (Tokenizer.count); a caller that stores another
+    kind of count (e.g. ids without BOS) passes `kind`, which keeps its keys
+    apart in the shared file.
+    """
+
+    def __init__(self, model_hash, path=TOKEN_CACHE, kind=None):
+        self.model_hash = model_hash
+        self.kind = kind
+        self.path = path
+        self.counts = {}
+        self.hits = 0
+        if path and os.path.isfile(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.counts = json.load(f)
+
+    def _key(self, text):
+        prefix = f"{self.model_hash}:{self.kind}" if self.kind else self.model_hash
+        return f"{prefix}:{sha256_text(text)}"
+
+    def get(self, text):
+        n = self.counts.get(self._key(text))
+        self.hits += n is not None
+        return n
+
+    def put(self, text, n):
+        self.counts[self._key(text)] = n
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.counts, f)
+        os.replace(tmp, self.path)
+
+
+class Tokenizer:
+    """The model's tokenizer behind a server that is started on first use."""
+
+    def __init__(self, make):
+        self.make = make
+        self.server = None
+        self.n_special = None
+
+    def ids(self, text):
+        """Token ids of text without BOS/EOS."""
+        if self.server is None:
+            self.server = self.make().start()
+            # tokens the prompt gains from add_special (BOS for most models)
+            self.n_special = len(self.server.tokenize("", add_special=True))
+        return self.server.tokenize(text)
+
+    def count(self, text):
+        """Tokens llama-cli's prompt for text has, BOS included."""
+        ids = self.ids(text)
+        return len(ids) + self.n_special
+
+    def text(self, ids):
+        return self.server.detokenize(ids) if ids else ""
+
+    def stop(self):
+        if self.server is not None:
+            self.server.stop()
+
+
+def cut(ids, keep, policy, head_tokens):
+    """(head ids, tail ids) left of ids when only `keep` of them fit under policy."""
+    keep = max(0, min(keep, len(ids)))
+    if policy == "head":
+        n_head = keep
+    elif policy == "tail":
+        n_head = 0
+    elif policy == "head+tail":
+        n_head = min(head_tokens, keep)
+    elif policy == "middle":
+        n_head = keep // 2
+    else:
+        raise ValueError(f"Unknown truncation policy '{policy}'")
+    n_tail = keep - n_head
+    return ids[:n_head], ids[len(ids) - n_tail:] if n_tail else []
+
+
+def fit(tok, text, n_tokens, budget, policy, head_tokens, marker):
+    """(prepared text, its token count) of a prompt of n_tokens cut to at most budget tokens."""
+    if n_tokens <= budget or policy == "none":
+        return text, n_tokens
+    ids = tok.ids(text)
+    keep = budget - tok.n_special - (len(tok.ids(marker)) if marker and policy in ("head+tail", "middle") else 0)
+    for _ in range(MAX_FIT_ROUNDS):
+        head, tail = cut(ids, keep, policy, head_tokens)
+        out = tok.text(head) + (marker if head and tail else "") + tok.text(tail)
+        n_out = tok.count(out)
+        if n_out <= budget:
+            return out, n_out
+        keep -= n_out - budget
+    raise RuntimeError(f"could not fit the prompt into {budget} tokens in {MAX_FIT_ROUNDS} rounds")
+
+
+def prepare(prompt_dir, out_dir, tok, counts, budget, policy="head+tail", head_tokens=256, marker="\n...\n"):
+    """Write the prepared prompts to out_dir and return the manifest's per-prompt entries."""
+    os.makedirs(out_dir, exist_ok=True)
+    entries = []
+    for path in sorted(Path(prompt_dir).glob("*.prompt.txt")):
+        text = path.read_text(encoding="utf-8")
+        n_tokens = counts.get(text)
+        if n_tokens is None:
+            n_tokens = tok.count(text)
+            counts.put(text, n_tokens)
+        out_path = Path(out_dir) / path.name
+        if n_tokens <= budget or policy == "none":
+            if out_path.resolve() != path.resolve():
+                shutil.copyfile(path, out_path)
+            prepared, n_prepared = text, n_tokens
+        else:
+            prepared, n_prepared = fit(tok, text, n_tokens, budget, policy, head_tokens, marker)
+            counts.put(prepared, n_prepared)
+            out_path.write_text(prepared, encoding="utf-8")
+        entry = {"file": path.name, "tokens": n_prepared, "source_tokens": n_tokens,
+                 "truncated": prepared != text, "dropped_tokens": n_tokens - n_prepared,
+                 "over_budget": n_prepared > budget, "sha256": sha256_text(prepared)}
+        entries.append(entry)
+        note = (f"cut {n_tokens} -> {n_prepared}" if entry["truncated"]
+                else "over budget" if entry["over_budget"] else "fits")
+        print(f"  {path.name}: {n_tokens} tokens, {note}")
+    return entries
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Tokenize LongBench prompts once and cut them to the context budget.")
+    ap.add_argument("--prompts", default="prompt_files", help="directory of *.prompt.txt")
+    ap.add_argument("--out-dir", default="prompt_files_prepared")
+    ap.add_argument("--ctx-size", type=int, default=int(os.environ.get("CTX_SIZE", 4096)))
+    ap.add_argument("--n-predict", type=int, default=int(os.environ.get("N_PRED", 250)),
+                    help="tokens reserved for generation")
+    ap.add_argument("--policy", choices=POLICIES, default="head+tail")
+    ap.add_argument("--head-tokens", type=int, default=256, help="head+tail: tokens kept from the start")
+    ap.add_argument("--marker", default="\n...\n", help="text put where head+tail/middle dropped tokens")
+    ap.add_argument("--backend", choices=["server", "stub"], default="server",
+                    help="server: run-server-streamllm.sh on the phone; stub: local stand-in (no phone)")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--serial", default=None, help="adb serial (default: $S / the only device)")
+    ap.add_argument("--token-cache", default=TOKEN_CACHE, help="token count cache ('' to disable)")
+    args, extra_args = ap.parse_known_args()
+
+    budget = args.ctx_size - args.n_predict
+    model = script_model("./run-server-streamllm.sh")
+    model_hash = "stub" if args.backend == "stub" else model_fingerprint(model, serial=args.serial)
+    counts = TokenCounts(model_hash, args.token_cache)
+    tok = Tokenizer(lambda: make_server(args.backend, server_args=extra_args, port=args.port, serial=args.serial))
+    print(f"[PREP] {args.prompts} -> {args.out_dir}: budget {budget} tokens "
+          f"(ctx {args.ctx_size} - n_predict {args.n_predict}), policy {args.policy}")
+    try:
+        entries = prepare(args.prompts, args.out_dir, tok, counts, budget, args.policy,
+                          args.head_tokens, args.marker)
+    finally:
+        tok.stop()
+        counts.save()
+
+    manifest = {"model": model, "model_hash": model_hash, "ctx_size": args.ctx_size,
+                "n_predict": args.n_predict, "budget": budget, "policy": args.policy,
+                "head_tokens": args.head_tokens, "prompts": entries}
+    with open(os.path.join(args.out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    n_cut = sum(e["truncated"] for e in entries)
+    n_over = sum(e["over_budget"] for e in entries)
+    src = sum(e["source_tokens"] for e in entries)
+    kept = sum(e["tokens"] for e in entries)
+    print(f"\n{len(entries)} prompts, {n_cut} cut, {n_over} still over budget; "
+          f"{src} -> {kept} prompt tokens; {counts.hits} counts from cache")
+    print(f"Manifest written to {os.path.join(args.out_dir, MANIFEST)}")
+
+
+if __name__ == "__main__":
+    main()
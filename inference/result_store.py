@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Resumable, content-addressed store of per-sample eval results.
+
+Each record is keyed by sha256 over (model file hash, full llama-cli argument
+set, prompt hash, seed) and written atomically once the sample's output is
+complete. Rerunning an eval or sweep after a crash or a dropped adb/QDC
+session skips every sample that already has a record, and a config that is
+deterministic (fixed seed, which run-cli-streamllm.sh pins to 42) is served
+from the store instead of being rerun on the phone.
+
+Layout: <root>/<key[:2]>/<key>.json
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+from adb_utils import adb_shell
+
+DEFAULT_ROOT = os.path.join(".eval_cache", "results")
+DEVICE_GGUF_DIR = "/data/local/tmp/gguf"
+
+# run-*.sh knobs that change what llama-cli is launched with
+SCRIPT_ENV_KNOBS = ("MODE", "M", "B", "CTX_SIZE", "N_PRED", "ENABLE_SINKS", "SINK_KEEP",
+                    "OPMASK", "NHVX", "NDEV", "E", "SCHED", "TUNED_PROFILE")
+TUNED_DIR = "tuned"
+
+
+def sha256_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# `. "$(dirname "$0")/streamllm-common.sh"`: a file the run script sources from its own directory
+SOURCED_RE = re.compile(r'^\.\s+"\$\(dirname "\$0"\)/([^"]+)"', re.M)
+
+
+def script_sources(script):
+    """The run script followed by the files it sources from its own directory."""
+    with open(script, "r", encoding="utf-8") as f:
+        text = f.read()
+    return [script] + [os.path.join(os.path.dirname(script), name) for name in SOURCED_RE.findall(text)]
+
+
+def script_text(script):
+    """Contents of the run script and the files it sources, concatenated."""
+    parts = []
+    for path in script_sources(script):
+        with open(path, "r", encoding="utf-8") as f:
+            parts.append(f.read())
+    return "".join(parts)
+
+
+def script_model(script="./run-cli-streamllm.sh"):
+    """Model the run script will use: $M, else the script's default."""
+    if os.environ.get("M"):
+        return os.environ["M"]
+    m = re.search(r'^model="([^"]+)"', script_text(script), re.M)
+    return m.group(1) if m else ""
+
+
+def tuned_profile_path(model, mode, env=None):
+    """The autotune.py profile run-*-streamllm.sh sources for model and MODE (None if disabled)."""
+    env = os.environ if env is None else env
+    path = env.get("TUNED_PROFILE") or os.path.join(TUNED_DIR, f"{re.sub(r'[.]gguf$', '', model)}_{mode}.env")
+    return None if path == "none" else path
+
+
+HASH_CACHE = os.path.join(".eval_cache", "model_hashes.json")
+
+
+def _memoised(ident, compute, cache_path):
+    memo = {}
+    if os.path.isfile(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            memo = json.load(f)
+    if ident in memo:
+        return memo[ident]
+    digest = compute()
+    memo[ident] = digest
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    _atomic_write_json(cache_path, memo)
+    return digest
+
+
+def memo_sha256(path, cache_path=HASH_CACHE):
+    """sha256_file() memoised by (path, size, mtime), for multi-GB files."""
+    st = os.stat(path)
+    ident = f"local:{os.path.abspath(path)}:{st.st_size}:{int(st.st_mtime)}"
+    return _memoised(ident, lambda: sha256_file(path), cache_path)
+
+
+def model_fingerprint(model, local_dir=".", serial=None, cache_path=HASH_CACHE):
+    """
+    sha256 of the GGUF file. Uses a local copy if there is one, otherwise
+    hashes it on the device. Results are memoised by (path, size, mtime) so a
+    multi-GB model is only hashed again when it changes.
+    """
+    local = os.path.join(local_dir, model)
+    if os.path.isfile(local):
+        return memo_sha256(local, cache_path)
+    remote = f"{DEVICE_GGUF_DIR}/{model}"
+    stat_out = adb_shell(f"stat -c '%s %Y' {remote}", serial=serial).strip()
+    ident = f"device:{serial or os.environ.get('S', '')}:{remote}:{stat_out}"
+    return _memoised(ident, lambda: adb_shell(f"sha256sum {remote}", serial=serial, timeout=1800).split()[0],
+                     cache_path)
+
+
+def shared_model_fingerprint(model, serials, local_dir=".", cache_path=HASH_CACHE):
+    """
+    model_fingerprint() of model on every device in serials (None: $S / the
+    only device). Their samples share one result store key, so the devices
+    have to hold the same GGUF.
+    """
+    hashes = {serial: model_fingerprint(model, local_dir, serial, cache_path) for serial in serials}
+    if len(set(hashes.values())) > 1:
+        raise RuntimeError(f"{model} differs between devices: "
+                           + ", ".join(f"{serial or 'default'} {h[:12]}" for serial, h in hashes.items()))
+    return next(iter(hashes.values()))
+
+
+def cli_arg_set(script, args, env=None):
+    """
+    Everything that determines the llama-cli command line: the wrapper
+    script's contents and those of the files it sources (its hard-coded
+    defaults), its env knobs and the extra arguments, in order.
+    """
+    env = os.environ if env is None else env
+    script_hash = sha256_text(script_text(script))
+    knobs = {k: env[k] for k in SCRIPT_ENV_KNOBS if env.get(k)}
+    arg_set = {"script": os.path.basename(script), "script_hash": script_hash,
+               "env": knobs, "args": [str(a) for a in args]}
+    # a tuned profile the script picks up changes its defaults like an edit would
+    tuned = tuned_profile_path(env.get("M") or script_model(script), env.get("MODE", "CPU"), env)
+    if tuned and os.path.isfile(tuned):
+        arg_set["tuned_hash"] = sha256_file(tuned)
+    return arg_set
+
+
+def arg_seed(args, default=42):
+    """Seed from --seed/-s in args, else the run script's fixed seed."""
+    seed = default
+    for i, a in enumerate(args[:-1]):
+        if a in ("--seed", "-s"):
+            seed = int(args[i + 1])
+    return seed
+
+
+def _atomic_write_json(path, obj):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+class ResultStore:
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model_hash, arg_set, prompt, seed):
+        """Content address of one sample. Returns None for unseeded (random) runs."""
+        if seed is None or int(seed) < 0:
+            return None
+        blob = json.dumps({"model": model_hash, "args": arg_set,
+                           "prompt": sha256_text(prompt), "seed": int(seed)}, sort_keys=True)
+        return sha256_text(blob)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def _load(self, key):
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def get(self, key):
+        """Completed record for key, or None."""
+        if key is None:
+            return None
+        record = self._load(key)
+        if record is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return record
+
+    def put(self, key, record):
+        if key is None:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _atomic_write_json(path, record)
+
+    def update(self, key, **fields):
+        """Merge fields (e.g. scores) into an existing record."""
+        if key is None:
+            return
+        record = self._load(key)
+        if record is not None:
+            record.update(fields)
+            self.put(key, record)
+
+    def summary(self):
+        return f"result store: {self.hits} samples served from cache, {self.misses} run"
+
+
+def perf_lines(stderr_text):
+    """The llama_perf_* summary lines of one invocation's stderr."""
+    return "".join(line for line in stderr_text.splitlines(keepends=True)
+                   if line.startswith("llama_perf_"))
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+SQLite warehouse of every hyperparameter sweep run.
+
+`ingest` walks hyperparam_search_*/ directories and loads, per run: the
+results.csv row (config and scores), the per-sample question, latency, BLEURT
+max score, accuracy and output text (from the samples.jsonl the Python sweep
+writes, or the eval_output.txt and tmp_output_*.txt of the shell sweep), and
+the per-invocation llama_perf timings from perf.jsonl or debug.log.
+Files are only re-read when their size or mtime changed, so `ingest --watch`
+can follow a sweep that is still running.
+
+    python results_warehouse.py ingest                          # all hyperparam_search_*/
+    python results_warehouse.py ingest --watch 30               # keep following running sweeps
+    python results_warehouse.py best --min-accuracy 0.5         # fastest decode at >= 0.5 accuracy
+    python results_warehouse.py pareto --speed prefill          # accuracy vs prefill tok/s frontier
+    python results_warehouse.py query "SELECT model, max(accuracy) FROM runs GROUP BY model"
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import sqlite3
+import time
+
+from log_parser import parse_log
+
+DEFAULT_DB = "results.sqlite"
+
+# results.csv column -> runs column; every other column goes into runs.config
+METRIC_COLUMNS = {
+    "bleurt_score": "bleurt_score",
+    "accuracy": "accuracy",
+    "rouge_l": "rouge_l",
+    "avg_prefill_speed": "prefill_tps",
+    "avg_decode_speed": "decode_tps",
+    "avg_total_speed": "total_tps",
+    "runtime_seconds": "runtime_s",
+    "energy_j": "energy_j",
+    "j_per_prefill_token": "j_per_prefill_token",
+    "j_per_decode_token": "j_per_decode_token",
+    "peak_rss_mb": "peak_rss_mb",
+    "kv_cache_mib": "kv_cache_mib",
+    "mmap_resident_mb": "mmap_resident_mb",
+}
+SPEEDS = {"prefill": "prefill_tps", "decode": "decode_tps", "total": "total_tps"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, size INTEGER, mtime REAL
+);
+CREATE TABLE IF NOT EXISTS sweeps (
+    id INTEGER PRIMARY KEY, path TEXT UNIQUE, name TEXT
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    sweep_id INTEGER REFERENCES sweeps(id),
+    run_id INTEGER,
+    model TEXT, mode TEXT,
+    bleurt_score REAL, accuracy REAL, rouge_l REAL,
+    prefill_tps REAL, decode_tps REAL, total_tps REAL, runtime_s REAL,
+    energy_j REAL, j_per_prefill_token REAL, j_per_decode_token REAL,
+    peak_rss_mb REAL, kv_cache_mib REAL, mmap_resident_mb REAL,
+    config TEXT,
+    UNIQUE (sweep_id, run_id)
+);
+CREATE INDEX IF NOT EXISTS runs_model ON runs (model, mode);
+CREATE INDEX IF NOT EXISTS runs_accuracy ON runs (accuracy);
+CREATE INDEX IF NOT EXISTS runs_decode ON runs (decode_tps);
+CREATE TABLE IF NOT EXISTS samples (
+    run_pk INTEGER REFERENCES runs(id), idx INTEGER,
+    question TEXT, latency_s REAL, max_score REAL, acc INTEGER, output TEXT,
+    PRIMARY KEY (run_pk, idx)
+);
+CREATE TABLE IF NOT EXISTS perf (
+    run_pk INTEGER REFERENCES runs(id), idx INTEGER,
+    load_ms REAL, prompt_tokens INTEGER, prefill_ms REAL, decode_runs INTEGER, decode_ms REAL,
+    total_ms REAL, prefill_tps REAL, decode_tps REAL, total_tps REAL, kv_cache_mib REAL,
+    PRIMARY KEY (run_pk, idx)
+);
+"""
+PERF_COLUMNS = ["load_ms", "prompt_tokens", "prefill_ms", "decode_runs", "decode_ms", "total_ms",
+                "prefill_tps", "decode_tps", "total_tps", "kv_cache_mib"]
+
+SAMPLE_RE = re.compile(r"^-------- sample (\d+) --------")
+QUESTION_RE = re.compile(r"""-p "'(.*?) '\"""")
+VALUE_RE = re.compile(r"^\s+(latency|max_score|acc): ([-+\d.eE]+)")
+
+
+def _number(value):
+    if value is None or value == "":
+        return None
+    try:
+        f = float(value)
+    except ValueError:
+        return value
+    return int(f) if f.is_integer() and "." not in str(value) else f
+
+
+def parse_eval_output(path):
+    """{sample index: {"question", "latency_s", "max_score", "acc"}} from a run's eval_output.txt."""
+    samples, cur = {}, None
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            m = SAMPLE_RE.match(line)
+            if m:
+                cur = samples.setdefault(int(m.group(1)), {})
+                continue
+            if cur is None:
+                continue
+            if line.startswith("CMD:"):
+                q = QUESTION_RE.search(line)
+                cur["question"] = q.group(1) if q else None
+                continue
+            v = VALUE_RE.match(line)
+            if v:
+                key = {"latency": "latency_s"}.get(v.group(1), v.group(1))
+                cur[key] = float(v.group(2)) if key != "acc" else int(float(v.group(2)))
+    return samples
+
+
+def parse_samples_jsonl(path):
+    """parse_eval_output()'s fields plus "output" from a run's samples.jsonl (sweep_common.py)."""
+    samples = {}
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                # a line the running sweep has not finished writing
+                continue
+            samples[int(rec["sample"])] = {"question": rec.get("question"), "latency_s": rec.get("latency"),
+                                           "max_score": rec.get("max_score"), "acc": rec.get("acc"),
+                                           "output": rec.get("output")}
+    return samples
+
+
+class Warehouse:
+    def __init__(self, path=DEFAULT_DB):
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+        # databases from before a metric column existed: add it (filled on the next ingest)
+        have = {r["name"] for r in self.db.execute("PRAGMA table_info(runs)")}
+        for col in METRIC_COLUMNS.values():
+            if col not in have:
+                self.db.execute(f"ALTER TABLE runs ADD COLUMN {col} REAL")
+
+    def close(self):
+        self.db.close()
+
+    def _changed(self, path):
+        """True (and remembered) if path is new or its size/mtime changed since the last ingest."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        row = self.db.execute("SELECT size, mtime FROM files WHERE path = ?", (path,)).fetchone()
+        if row and row["size"] == st.st_size and row["mtime"] == st.st_mtime:
+            return False
+        self.db.execute("INSERT OR REPLACE INTO files (path, size, mtime) VALUES (?, ?, ?)",
+                        (path, st.st_size, st.st_mtime))
+        return True
+
+    def _sweep_id(self, sweep_dir):
+        path = os.path.abspath(sweep_dir)
+        self.db.execute("INSERT OR IGNORE INTO sweeps (path, name) VALUES (?, ?)", (path, os.path.basename(path)))
+        return self.db.execute("SELECT id FROM sweeps WHERE path = ?", (path,)).fetchone()["id"]
+
+    def _run_pk(self, sweep_id, run_id):
+        self.db.execute("INSERT OR IGNORE INTO runs (sweep_id, run_id) VALUES (?, ?)", (sweep_id, run_id))
+        return self.db.execute("SELECT id FROM runs WHERE sweep_id = ? AND run_id = ?",
+                               (sweep_id, run_id)).fetchone()["id"]
+
+    def _ingest_results(self, sweep_id, csv_path):
+        n = 0
+        with open(csv_path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                try:
+                    run_id = int(row["run_id"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                metrics = {col: _number(row.get(src)) for src, col in METRIC_COLUMNS.items()}
+                # the shell sweep writes 0.00 tok/s for runs whose log had no timings
+                for col in SPEEDS.values():
+                    if metrics[col] == 0:
+                        metrics[col] = None
+                config = {k: _number(v) for k, v in row.items() if k not in METRIC_COLUMNS and k != "run_id"}
+                pk = self._run_pk(sweep_id, run_id)
+                sets = ", ".join(f"{c} = ?" for c in metrics)
+                self.db.execute(f"UPDATE runs SET model = ?, mode = ?, config = ?, {sets} WHERE id = ?",
+                                [config.get("model"), config.get("mode"), json.dumps(config, sort_keys=True)]
+                                + list(metrics.values()) + [pk])
+                n += 1
+        return n
+
+    def _ingest_samples(self, pk, run_dir, samples):
+        for idx, s in samples.items():
+            out_path = os.path.join(run_dir, f"tmp_output_{idx}.txt")
+            output = s.get("output")
+            if output is None and os.path.isfile(out_path):
+                with open(out_path, "r", encoding="utf-8", errors="replace") as f:
+                    output = f.read().strip()
+            self.db.execute("INSERT OR REPLACE INTO samples (run_pk, idx, question, latency_s, max_score, acc, output) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (pk, idx, s.get("question"), s.get("latency_s"), s.get("max_score"), s.get("acc"), output))
+
+    def _ingest_perf(self, pk, path):
+        if path.endswith(".jsonl"):
+            with open(path, "r", encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = list(parse_log(path))
+        self.db.execute("DELETE FROM perf WHERE run_pk = ?", (pk,))
+        self.db.executemany(
+            f"INSERT INTO perf (run_pk, idx, {', '.join(PERF_COLUMNS)}) VALUES (?, ?{', ?' * len(PERF_COLUMNS)})",
+            [[pk, r.get("index", i)] + [r.get(c) for c in PERF_COLUMNS] for i, r in enumerate(records)])
+
+    def ingest_sweep(self, sweep_dir):
+        """Load what changed in one hyperparam_search_* directory; returns (runs, run dirs) updated."""
+        sweep_id = self._sweep_id(sweep_dir)
+        runs = 0
+        csv_path = os.path.join(sweep_dir, "results.csv")
+        if self._changed(csv_path):
+            runs = self._ingest_results(sweep_id, csv_path)
+        dirs = 0
+        for run_dir in sorted(glob.glob(os.path.join(sweep_dir, "run_*"))):
+            try:
+                run_id = int(os.path.basename(run_dir)[len("run_"):])
+            except ValueError:
+                continue
+            pk = None
+            samples_jsonl = os.path.join(run_dir, "samples.jsonl")
+            eval_output = os.path.join(run_dir, "eval_output.txt")
+            if os.path.isfile(samples_jsonl):
+                if self._changed(samples_jsonl):
+                    pk = self._run_pk(sweep_id, run_id)
+                    self._ingest_samples(pk, run_dir, parse_samples_jsonl(samples_jsonl))
+            elif (self._changed(eval_output) | self._newer_outputs(run_dir)) and os.path.isfile(eval_output):
+                pk = self._run_pk(sweep_id, run_id)
+                self._ingest_samples(pk, run_dir, parse_eval_output(eval_output))
+            # perf.jsonl is what the Python sweeps write from debug.log; prefer it
+            perf = os.path.join(run_dir, "perf.jsonl")
+            if not os.path.isfile(perf):
+                perf = os.path.join(run_dir, "debug.log")
+            if self._changed(perf):
+                pk = pk or self._run_pk(sweep_id, run_id)
+                self._ingest_perf(pk, perf)
+            dirs += pk is not None
+        self.db.commit()
+        return runs, dirs
+
+    def _newer_outputs(self, run_dir):
+        """True if any tmp_output_*.txt changed (each is checked so all get recorded)."""
+        changed = False
+        for path in glob.glob(os.path.join(run_dir, "tmp_output_*.txt")):
+            changed |= self._changed(path)
+        return changed
+
+    def ingest(self, pattern="hyperparam_search_*"):
+        for sweep_dir in sorted(glob.glob(pattern)):
+            if os.path.isdir(sweep_dir):
+                runs, dirs = self.ingest_sweep(sweep_dir)
+                if runs or dirs:
+                    print(f"{sweep_dir}: {runs} results rows, {dirs} run directories updated")
+
+    def query(self, sql, params=()):
+        return self.db.execute(sql, params).fetchall()
+
+    def runs(self, metric="accuracy", speed="decode_tps", model=None):
+        sql = (f"SELECT s.name AS sweep, r.run_id, r.model, r.mode, r.{metric} AS score, r.{speed} AS speed, "
+               f"r.config FROM runs r JOIN sweeps s ON s.id = r.sweep_id "
+               f"WHERE r.{metric} IS NOT NULL AND r.{speed} IS NOT NULL")
+        params = []
+        if model:
+            sql += " AND r.model = ?"
+            params.append(model)
+        return self.query(sql, params)
+
+
+def pareto(rows, x="speed", y="score"):
+    """Rows not dominated in (x, y), both maximised, sorted by x."""
+    front, best_y = [], None
+    for row in sorted(rows, key=lambda r: (-r[x], -r[y])):
+        if best_y is None or row[y] > best_y:
+            front.append(row)
+            best_y = row[y]
+    return sorted(front, key=lambda r: r[x])
+
+
+def print_rows(rows, columns=None):
+    if not rows:
+        print("(no rows)")
+        return
+    columns = columns or list(rows[0].keys())
+    cells = [[("" if r[c] is None else f"{r[c]:.4g}" if isinstance(r[c], float) else str(r[c])) for c in columns]
+             for r in rows]
+    widths = [max(len(c), *(len(row[i]) for row in cells)) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Load sweep results into SQLite and query them.")
+    ap.add_argument("--db", default=DEFAULT_DB)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ing = sub.add_parser("ingest", help="load new/changed sweep files")
+    ing.add_argument("--pattern", default="hyperparam_search_*", help="glob of sweep directories")
+    ing.add_argument("--watch", type=float, default=0, help="re-ingest every N seconds until interrupted")
+    q = sub.add_parser("query", help="run SQL against the warehouse")
+    q.add_argument("sql")
+    for name, helptext in (("best", "fastest runs at a minimum score"), ("pareto", "score vs speed frontier")):
+        p = sub.add_parser(name, help=helptext)
+        p.add_argument("--metric", default="accuracy", choices=["accuracy", "bleurt_score", "rouge_l"])
+        p.add_argument("--speed", default="decode", choices=sorted(SPEEDS))
+        p.add_argument("--model", default=None)
+    sub.choices["best"].add_argument("--min-accuracy", "--min-score", dest="min_score", type=float, default=0.5)
+    sub.choices["best"].add_argument("--top", type=int, default=10)
+    args = ap.parse_args()
+
+    wh = Warehouse(args.db)
+    try:
+        if args.cmd == "ingest":
+            wh.ingest(args.pattern)
+            while args.watch > 0:
+                time.sleep(args.watch)
+                wh.ingest(args.pattern)
+        elif args.cmd == "query":
+            print_rows(wh.query(args.sql))
+        else:
+            rows = wh.runs(args.metric, SPEEDS[args.speed], args.model)
+            columns = ["sweep", "run_id", "model", "mode", "score", "speed"]
+            if args.cmd == "best":
+                rows = sorted((r for r in rows if r["score"] >= args.min_score), key=lambda r: -r["speed"])
+                print(f"{args.metric} >= {args.min_score}, by {args.speed} tok/s:")
+                print_rows(rows[:args.top], columns)
+            else:
+                print(f"Pareto frontier of {args.metric} vs {args.speed} tok/s:")
+                print_rows(pareto(rows), columns)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        wh.close()
+
+
+if __name__ == "__main__":
+    main()
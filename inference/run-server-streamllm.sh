@@ -0,0 +1,41 @@
+#!/bin/sh
+#
+# Launches llama-server on Snapdragon via adb, with the same settings as
+# run-cli-streamllm.sh. The server stays up until the adb shell is killed;
+# reach it from the host with `adb forward tcp:$PORT tcp:$PORT`.
+#
+
+# MODE, sinks (ENABLE_SINKS, SINK_KEEP, CTX_SIZE, N_PRED), S, B, M, the
+# tuned profile and the Hexagon env vars: see streamllm-common.sh
+. "$(dirname "$0")/streamllm-common.sh"
+
+PORT="${PORT:-8080}"               # llama-server --port on the device
+SLOT_SAVE="${SLOT_SAVE:-}"         # --slot-save-path dir under $basedir for slot save/restore ("" = off)
+
+slot_args=
+slot_mkdir=
+if [ "$SLOT_SAVE" != "" ]; then
+    # the server does not create the directory itself
+    slot_args="--slot-save-path $SLOT_SAVE"
+    slot_mkdir="mkdir -p $SLOT_SAVE;"
+fi
+
+set -x
+
+# llama-cli's -sys/-no-cnv/--no-display-prompt have no server equivalent;
+# the harness sends the prompt as a raw /completion request instead (with
+# truthful_qa_eval.py --system-prompt, prefixed by the system prompt).
+
+$adb $adbserial shell " \
+  cd $basedir; ulimit -c unlimited; $slot_mkdir \
+    LD_LIBRARY_PATH=$basedir/$branch/lib   \
+    ADSP_LIBRARY_PATH=$basedir/$branch/lib \
+    $verbose $experimental $sched $opmask $profile $nhvx $ndev           \
+      ./$branch/bin/llama-server -m $basedir/../gguf/$model       \
+        --host 127.0.0.1 --port $PORT \
+        -t $threads --ctx-size $CTX_SIZE --batch-size $batch $tuned_args \
+        -ctk f16 -ctv f16 --temp 1.0 --seed 42 \
+        -fa on -np 1 \
+        -ngl $ngl $dev_arg -n $N_PRED $sink_args $slot_args \
+	$cli_opts $@ \
+"
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+"""
+Persistent llama-server backend for the eval harnesses.
+
+Instead of launching llama-cli once per sample (which re-mmaps the GGUF and
+re-initialises the Hexagon/OpenCL session every time), start llama-server on
+the phone once via run-server-streamllm.sh, forward its port with adb and send
+every sample to it over HTTP. Each response carries the server's own
+per-request timings (prompt_n/prompt_ms/predicted_n/predicted_ms).
+Multimodal requests (image + prompt) go through chat() as base64 data URLs,
+so nothing is pushed to the phone per sample; LogTail picks the server's
+image encode/decode lines for each request out of its log. PrefixCache
+prefills a shared system prompt once and restores its saved KV state before
+every sample.
+
+StubServer is a local stand-in speaking the same HTTP API, so the harness can
+be exercised on a Linux box with no phone attached:
+
+    python server_backend.py --port 8080          # serve the stub
+    python truthful_qa_eval.py --backend stub     # or start it in-process
+"""
+import argparse
+import base64
+import json
+import os
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from adb_utils import adb_forward, adb_forward_remove, adb_shell
+
+
+class ServerClient:
+    """Minimal JSON client for the llama-server HTTP API."""
+
+    def __init__(self, base_url, request_timeout=1800):
+        self.base_url = base_url.rstrip("/")
+        self.request_timeout = request_timeout
+
+    def request(self, method, path, data=None, timeout=None):
+        body = json.dumps(data).encode("utf-8") if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method,
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=timeout or self.request_timeout) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    def healthy(self):
+        try:
+            return self.request("GET", "/health", timeout=5).get("status") == "ok"
+        except (urllib.error.URLError, ConnectionError, OSError, ValueError):
+            return False
+
+    def wait_ready(self, timeout):
+        """Poll /health until the model is loaded; raises TimeoutError otherwise."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.healthy():
+                return
+            time.sleep(1.0)
+        raise TimeoutError(f"llama-server at {self.base_url} not ready after {timeout}s")
+
+    def complete(self, prompt, n_predict, **params):
+        """
+        Run one raw completion (same as llama-cli -no-cnv -p).
+        Returns dict with 'content', 'timings' (server-side, ms) and
+        'latency' (host wall time, s).
+        """
+        data = {"prompt": prompt, "n_predict": n_predict}
+        data.update(params)
+        start = time.time()
+        res = self.request("POST", "/completion", data)
+        return {
+            "content": res.get("content", ""),
+            "timings": res.get("timings", {}),
+            "tokens_predicted": res.get("tokens_predicted"),
+            "latency": time.time() - start,
+        }
+
+    def stream(self, prompt, n_predict, **params):
+        """
+        Streamed raw completion with per-token timings: yields the server's
+        chunks (one per generated token, then a final one with 'stop' set),
+        each with its host arrival time added as 't'.
+        """
+        data = {"prompt": prompt, "n_predict": n_predict, "stream": True, "timings_per_token": True}
+        data.update(params)
+        req = urllib.request.Request(self.base_url + "/completion", data=json.dumps(data).encode("utf-8"),
+                                     method="POST", headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=self.request_timeout) as resp:
+            for raw in resp:
+                line = raw.decode("utf-8").strip()
+                if not line.startswith("data: "):
+                    continue
+                chunk = json.loads(line[len("data: "):])
+                chunk["t"] = time.time()
+                yield chunk
+                if chunk.get("stop"):
+                    break
+
+    def tokenize(self, content, add_special=False):
+        """Token ids of content in the server model's vocab (add_special: with BOS etc., as a prompt gets)."""
+        return self.request("POST", "/tokenize", {"content": content, "add_special": add_special})["tokens"]
+
+    def detokenize(self, tokens):
+        return self.request("POST", "/detokenize", {"tokens": list(tokens)})["content"]
+
+    def chat(self, messages, n_predict, **params):
+        """
+        One OpenAI-style chat completion; the server applies its chat template.
+        Same return value as complete().
+        """
+        data = {"messages": messages, "max_tokens": n_predict}
+        data.update(params)
+        start = time.time()
+        res = self.request("POST", "/v1/chat/completions", data)
+        choice = (res.get("choices") or [{}])[0]
+        return {
+            "content": (choice.get("message") or {}).get("content") or "",
+            "timings": res.get("timings", {}),
+            "tokens_predicted": (res.get("usage") or {}).get("completion_tokens"),
+            "latency": time.time() - start,
+        }
+
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class LlamaServer(ServerClient):
+    """llama-server running on the phone, reached through `adb forward`."""
+
+    def __init__(self, script="./run-server-streamllm.sh", server_args=None, port=8080,
+                 serial=None, log_file=None, startup_timeout=900, env=None):
+        super().__init__(f"http://127.0.0.1:{port}")
+        self.script = script
+        self.server_args = list(server_args or [])
+        self.port = port
+        self.serial = serial
+        self.log_file = log_file
+        self.startup_timeout = startup_timeout
+        self.env = env
+        self.proc = None
+
+    def start(self):
+        env = dict(os.environ)
+        env.update(self.env or {})
+        env["PORT"] = str(self.port)
+        if self.serial:
+            env["S"] = self.serial
+        cmd = ["bash", self.script] + self.server_args
+        print("SERVER CMD:", " ".join(cmd))
+        self.proc = subprocess.Popen(cmd, stdout=self.log_file or subprocess.DEVNULL,
+                                     stderr=self.log_file or subprocess.DEVNULL, env=env, text=True)
+        adb_forward(self.port, self.port, serial=self.serial)
+        deadline = time.time() + self.startup_timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"llama-server exited during startup (code {self.proc.returncode})")
+            if self.healthy():
+                return self
+            time.sleep(1.0)
+        self.stop()
+        raise TimeoutError(f"llama-server not ready after {self.startup_timeout}s")
+
+    def stop(self):
+        if self.proc is None:
+            return
+        # killing the local adb client does not reliably kill the remote process;
+        # [l] keeps the pattern from matching the device shell running pkill itself
+        try:
+            adb_shell(f"pkill -f '[l]lama-server.*--port {self.port}'", serial=self.serial, check=False, timeout=30)
+        except subprocess.TimeoutExpired:
+            print("[WARN] timed out stopping llama-server on device")
+        if self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        adb_forward_remove(self.port, serial=self.serial)
+        self.proc = None
+
+
+def image_message(text, image_bytes, mime="image/jpeg"):
+    """A user chat message carrying one image (as a base64 data URL) and a prompt."""
+    url = f"data:{mime};base64,{base64.b64encode(image_bytes).decode('ascii')}"
+    return {"role": "user", "content": [{"type": "image_url", "image_url": {"url": url}},
+                                        {"type": "text", "text": text}]}
+
+
+class LogTail:
+    """
+    Follows a server log file request by request. read_request() returns the
+    lines logged since the previous call, waiting (up to timeout) for the
+    request's timings block, which the adb shell may deliver after the HTTP
+    response.
+    """
+
+    def __init__(self, path, marker="total time ="):
+        self.f = open(path, "r", encoding="utf-8", errors="replace")
+        self.f.seek(0, os.SEEK_END)
+        self.marker = marker
+        self.pending = ""
+
+    def read_request(self, timeout=5.0):
+        lines = []
+        deadline = time.time() + timeout
+        while True:
+            self.pending += self.f.read()
+            *complete, self.pending = self.pending.split("\n")
+            lines += complete
+            if any(self.marker in line for line in lines) or time.time() > deadline:
+                return lines
+            time.sleep(0.05)
+
+    def close(self):
+        self.f.close()
+
+
+class PrefixCache:
+    """
+    A prompt prefix shared by every sample (e.g. the system prompt), prefilled
+    once per server. prepare() evaluates it in the slot and saves the slot's
+    KV cache (/slots/<id>?action=save); complete() restores that state before
+    each request, so the server's prompt cache only prefills the sample's own
+    tokens. The server needs --slot-save-path (SLOT_SAVE=<dir> for
+    run-server-streamllm.sh). complete(reuse=False) is the baseline: the
+    whole prompt is prefilled with cache_prompt off.
+    """
+
+    def __init__(self, server, prefix, filename="prefix.bin", slot=0):
+        self.server = server
+        self.prefix = prefix
+        self.filename = filename
+        self.slot = slot
+        self.prefix_n = None
+        self.prefill_ms = None
+
+    def _slot_action(self, action):
+        return self.server.request("POST", f"/slots/{self.slot}?action={action}", {"filename": self.filename})
+
+    def prepare(self):
+        res = self.server.complete(self.prefix, n_predict=0, cache_prompt=True, id_slot=self.slot)
+        self.prefill_ms = res["timings"].get("prompt_ms")
+        self.prefix_n = self._slot_action("save").get("n_saved")
+        return self
+
+    def complete(self, prompt, n_predict, reuse=True, **params):
+        """ServerClient.complete() of prefix + prompt; with reuse, timings gain restore_ms and latency covers it."""
+        if not reuse:
+            return self.server.complete(self.prefix + prompt, n_predict, cache_prompt=False, id_slot=self.slot,
+                                        **params)
+        start = time.time()
+        restored = self._slot_action("restore")
+        res = self.server.complete(self.prefix + prompt, n_predict, cache_prompt=True, id_slot=self.slot, **params)
+        res["timings"]["restore_ms"] = restored.get("timings", {}).get("restore_ms")
+        res["latency"] = time.time() - start
+        return res
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, obj, status=200):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        n = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(n).decode("utf-8")) if n else {}
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._reply({"status": "ok"})
+        else:
+            self._reply({"error": "not found"}, 404)
+
+    def _stream(self, chunks):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+    def do_POST(self):
+        if self.path == "/completion":
+            data = self._read_json()
+            if data.get("stream"):
+                self._stream(self.server.stub.completion_stream(data))
+            else:
+                self._reply(self.server.stub.completion(data))
+        elif self.path == "/v1/chat/completions":
+            self._reply(self.server.stub.chat_completion(self._read_json()))
+        elif self.path == "/tokenize":
+            self._reply(self.server.stub.handle_tokenize(self._read_json()))
+        elif self.path == "/detokenize":
+            self._reply(self.server.stub.handle_detokenize(self._read_json()))
+        elif self.path.startswith("/slots/"):
+            url = urllib.parse.urlparse(self.path)
+            action = urllib.parse.parse_qs(url.query).get("action", [""])[0]
+            self._reply(*self.server.stub.slot_action(url.path.rsplit("/", 1)[-1], action, self._read_json()))
+        else:
+            self._reply({"error": "not found"}, 404)
+
+
+class StubServer(ServerClient):
+    """
+    Local stand-in for llama-server. Replies deterministically (echoes the end
+    of the prompt) with synthetic timings derived from whitespace token counts.
+    With simulate=True it also sleeps for those timings, so overlap and
+    throughput logic can be checked against realistic wall times. Streamed
+    completions run in a ctx_size context with llama-server's context
+    shifting, so decode slows as the context fills and each shift costs
+    SHIFT_MS_PER_TOKEN per cell kept. Its single slot keeps the last prompt
+    for cache_prompt and can be saved/restored through /slots like the real
+    server's. /tokenize maps whitespace words to ids (BOS is id 1).
+    """
+
+    IMAGE_TOKENS = 576
+    IMAGE_ENCODE_MS = 400.0
+    SHIFT_MS_PER_TOKEN = 0.05
+    RESTORE_MS_PER_TOKEN = 0.02
+
+    def __init__(self, port=0, prefill_tps=50.0, decode_tps=10.0, simulate=False, log_file=None, ctx_size=4096):
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.ctx_size = ctx_size
+        self.simulate = simulate
+        self.log_file = log_file
+        self.slot_words = []
+        self.slot_files = {}
+        self.vocab = {}
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), _StubHandler)
+        self.httpd.stub = self
+        self.thread = None
+        super().__init__(f"http://127.0.0.1:{self.httpd.server_address[1]}")
+
+    def completion(self, data):
+        prompt_words = str(data.get("prompt", "")).split()
+        n_predict = int(data.get("n_predict", 16))
+        if n_predict < 0:
+            n_predict = 16
+        words = prompt_words[-n_predict:] if n_predict else []
+        cache_n = 0
+        if data.get("cache_prompt", True):
+            while (cache_n < min(len(prompt_words), len(self.slot_words))
+                   and prompt_words[cache_n] == self.slot_words[cache_n]):
+                cache_n += 1
+            # the last prompt token is always evaluated again
+            cache_n = min(cache_n, max(len(prompt_words) - 1, 0))
+        self.slot_words = prompt_words + words
+        prompt_ms = 1000.0 * (len(prompt_words) - cache_n) / self.prefill_tps
+        predicted_ms = 1000.0 * len(words) / self.decode_tps
+        if self.simulate:
+            time.sleep((prompt_ms + predicted_ms) / 1000.0)
+        return {
+            "content": " ".join(words),
+            "tokens_predicted": len(words),
+            "timings": {
+                "cache_n": cache_n,
+                "prompt_n": len(prompt_words) - cache_n,
+                "prompt_ms": prompt_ms,
+                "predicted_n": len(words),
+                "predicted_ms": predicted_ms,
+            },
+        }
+
+    def completion_stream(self, data):
+        """Chunks of a streamed completion (stream + timings_per_token), shifting the context like llama-server."""
+        n_prompt = len(str(data.get("prompt", "")).split())
+        n_predict = int(data.get("n_predict", 16))
+        n_keep = min(int(data.get("n_keep", 0)), self.ctx_size - 4)
+        prompt_ms = 1000.0 * n_prompt / self.prefill_tps
+        n_past, predicted_ms = n_prompt, 0.0
+        for i in range(n_predict):
+            ms = 1000.0 / self.decode_tps * (1.0 + 0.5 * n_past / self.ctx_size)
+            if n_past + 1 >= self.ctx_size:
+                n_left = n_past - n_keep
+                n_discard = n_left // 2
+                if self.log_file is not None:
+                    self.log_file.write(f"slot update_slots: id  0 | task 0 | slot context shift, n_keep = {n_keep}, "
+                                        f"n_left = {n_left}, n_discard = {n_discard}\n")
+                    self.log_file.flush()
+                n_past -= n_discard
+                ms += self.SHIFT_MS_PER_TOKEN * (n_past - n_keep)
+            n_past += 1
+            predicted_ms += ms
+            if self.simulate:
+                time.sleep(ms / 1000.0)
+            yield {"content": " tok", "stop": False, "tokens_predicted": i + 1,
+                   "timings": {"prompt_n": n_prompt, "prompt_ms": prompt_ms,
+                               "predicted_n": i + 1, "predicted_ms": predicted_ms}}
+        if self.log_file is not None:
+            self.log_file.write(f"prompt eval time = {prompt_ms:10.2f} ms / {n_prompt:5d} tokens\n"
+                                f"       eval time = {predicted_ms:10.2f} ms / {n_predict:5d} tokens\n"
+                                f"      total time = {prompt_ms + predicted_ms:10.2f} ms\n")
+            self.log_file.flush()
+        yield {"content": "", "stop": True, "tokens_predicted": n_predict, "truncated": n_past < n_prompt + n_predict,
+               "timings": {"prompt_n": n_prompt, "prompt_ms": prompt_ms,
+                           "predicted_n": n_predict, "predicted_ms": predicted_ms}}
+
+    def handle_tokenize(self, data):
+        ids = [1] if data.get("add_special") else []
+        for word in str(data.get("content", "")).split():
+            ids.append(self.vocab.setdefault(word, len(self.vocab) + 2))
+        return {"tokens": ids}
+
+    def handle_detokenize(self, data):
+        words = {i: w for w, i in self.vocab.items()}
+        return {"content": " ".join(words[i] for i in data.get("tokens", []) if i in words)}
+
+    def slot_action(self, slot_id, action, data):
+        """(reply, status) for /slots/<id>?action=save|restore."""
+        filename = data.get("filename", "")
+        if action == "save":
+            self.slot_files[filename] = list(self.slot_words)
+            return {"id_slot": int(slot_id), "filename": filename, "n_saved": len(self.slot_words),
+                    "timings": {"save_ms": self.RESTORE_MS_PER_TOKEN * len(self.slot_words)}}, 200
+        if action == "restore":
+            if filename not in self.slot_files:
+                return {"error": {"code": 400, "message": "failed to restore slot"}}, 400
+            self.slot_words = list(self.slot_files[filename])
+            restore_ms = self.RESTORE_MS_PER_TOKEN * len(self.slot_words)
+            if self.simulate:
+                time.sleep(restore_ms / 1000.0)
+            return {"id_slot": int(slot_id), "filename": filename, "n_restored": len(self.slot_words),
+                    "timings": {"restore_ms": restore_ms}}, 200
+        return {"error": {"code": 400, "message": "Invalid action"}}, 400
+
+    def chat_completion(self, data):
+        """Chat request: images cost IMAGE_TOKENS prompt tokens and IMAGE_ENCODE_MS each."""
+        text, n_images = [], 0
+        for msg in data.get("messages", []):
+            content = msg.get("content", "")
+            parts = content if isinstance(content, list) else [{"type": "text", "text": content}]
+            for part in parts:
+                if part.get("type") == "image_url":
+                    n_images += 1
+                else:
+                    text.append(str(part.get("text", "")))
+        n_predict = int(data.get("max_tokens", data.get("n_predict", 16)))
+        res = self.completion({"prompt": " ".join(text), "n_predict": n_predict})
+        timings = res["timings"]
+        encode_ms = self.IMAGE_ENCODE_MS * n_images
+        timings["prompt_n"] += self.IMAGE_TOKENS * n_images
+        timings["prompt_ms"] += encode_ms + 1000.0 * self.IMAGE_TOKENS * n_images / self.prefill_tps
+        if self.simulate:
+            time.sleep(encode_ms / 1000.0)
+        if self.log_file is not None:
+            # same lines llama-server's mtmd helper and slot timings print
+            lines = []
+            for _ in range(n_images):
+                lines += ["encoding image slice...", f"image slice encoded in {int(self.IMAGE_ENCODE_MS)} ms",
+                          f"image decoded (batch 1/1) in {int(1000.0 * self.IMAGE_TOKENS / self.prefill_tps)} ms"]
+            lines += [f"prompt eval time = {timings['prompt_ms']:10.2f} ms / {timings['prompt_n']:5d} tokens",
+                      f"       eval time = {timings['predicted_ms']:10.2f} ms / {timings['predicted_n']:5d} tokens",
+                      f"      total time = {timings['prompt_ms'] + timings['predicted_ms']:10.2f} ms"]
+            self.log_file.write("\n".join(lines) + "\n")
+            self.log_file.flush()
+        return {
+            "choices": [{"index": 0, "finish_reason": "length",
+                         "message": {"role": "assistant", "content": res["content"]}}],
+            "usage": {"prompt_tokens": timings["prompt_n"], "completion_tokens": timings["predicted_n"]},
+            "timings": timings,
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is not None:
+            self.httpd.shutdown()
+            self.thread = None
+        self.httpd.server_close()
+
+
+def make_server(backend, server_args=None, port=8080, serial=None, log_file=None,
+                script="./run-server-streamllm.sh", env=None):
+    """Build the server for a harness --backend value ('server' or 'stub')."""
+    if backend == "server":
+        return LlamaServer(script=script, server_args=server_args, port=port, serial=serial, log_file=log_file,
+                           env=env)
+    if backend == "stub":
+        return StubServer(log_file=log_file)
+    raise ValueError(f"Unknown server backend '{backend}'")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Run the local llama-server stand-in.")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--prefill-tps", type=float, default=50.0)
+    ap.add_argument("--decode-tps", type=float, default=10.0)
+    ap.add_argument("--simulate", action="store_true", help="sleep for the synthetic timings")
+    args = ap.parse_args()
+
+    stub = StubServer(args.port, args.prefill_tps, args.decode_tps, args.simulate)
+    print(f"Stub llama-server listening on {stub.base_url}")
+    try:
+        stub.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
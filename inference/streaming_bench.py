@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Long-context streaming benchmark for the StreamLLM sink / context-shift mode.
+
+For every (CTX_SIZE, KV cache type) config llama-server is started through
+run-server-streamllm.sh, and for every SINK_KEEP value one streamed
+/completion request with ignore_eos decodes --windows context windows'
+worth of tokens, so the server has to shift the context several times.
+With timings_per_token every streamed chunk carries the server's running
+predicted_ms, so each token's device-side decode latency is the difference
+of consecutive chunks (host arrival time only as a fallback).
+
+Context shifts are read from the server log ("slot context shift, n_keep =
+.., n_left = .., n_discard = ..") and placed on the token axis by replaying
+the server's rule: a shift happens once the cache holds n_keep + n_left
+cells, then n_discard cells are dropped. Without log lines the positions are
+predicted with llama-server's defaults (n_discard = n_left / 2). Per run:
+
+  steady_tps        1000 / median ms of tokens away from any shift
+  overall_tps       tokens / total decode time, shift stalls included
+  p50/p99_ms        per-token decode latency
+  shift_cost_ms     mean extra latency of the slowest token around a shift
+  shift_overhead    share of the decode time spent in shift stalls
+  drift_ms_per_1k   growth of steady latency per 1000 cells in the cache
+  verdict           "periodic stalls" when a shift costs more than
+                    --stall-factor x the median token, "flat" otherwise
+
+plus peak RSS of llama-server and its KV cache size. Per-token records go to
+<out-dir>/tokens_<config>.jsonl, one summary row per run to
+<out-dir>/summary.csv.
+
+    python streaming_bench.py --ctx-size 1024,2048 --sink-keep 4,64 --kv-types f16,q8_0
+    python streaming_bench.py --backend stub --ctx-size 512 --windows 4
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import re
+import statistics
+import time
+
+from log_parser import KV_CACHE_RE, percentile
+from memory_profiler import add_memory_args, memory_sampler_from_args
+from server_backend import LlamaServer, LogTail, StubServer
+
+SHIFT_RE = re.compile(r"context shift, n_keep = (\d+), n_left = (\d+), n_discard = (\d+)")
+SUMMARY_FIELDS = ["ctx_size", "kv_type", "sink_keep", "tokens", "prompt_n", "shifts", "shifts_logged",
+                  "steady_tps", "overall_tps", "p50_ms", "p99_ms", "shift_cost_ms", "shift_overhead",
+                  "drift_ms_per_1k", "verdict", "peak_rss_mb", "kv_cache_mib"]
+# tokens either side of a predicted shift that may carry its stall
+SHIFT_WINDOW = 2
+
+
+def predicted_shifts(prompt_n, n_tokens, ctx_size, n_keep):
+    """(n_keep, n_left, n_discard) of each shift llama-server makes while decoding n_tokens."""
+    n_keep = min(n_keep, ctx_size - 4)
+    shifts, n_past = [], prompt_n
+    for _ in range(n_tokens):
+        if n_past + 1 >= ctx_size:
+            n_left = n_past - n_keep
+            shifts.append((n_keep, n_left, n_left // 2))
+            n_past -= n_left // 2
+        n_past += 1
+    return shifts
+
+
+def shift_indices(shifts, prompt_n):
+    """Generated-token index at which each (n_keep, n_left, n_discard) shift happened."""
+    indices, discarded = [], 0
+    for n_keep, n_left, n_discard in shifts:
+        indices.append(n_keep + n_left - prompt_n + discarded)
+        discarded += n_discard
+    return indices
+
+
+def stream_tokens(server, prompt, n_predict, n_keep):
+    """Per-token {"i", "ms", "host_ms"} records of one streamed completion and its final timings."""
+    records, prev_ms, prev_t = [], 0.0, time.time()
+    final = {}
+    for chunk in server.stream(prompt, n_predict, n_keep=n_keep, ignore_eos=True, cache_prompt=False):
+        timings = chunk.get("timings") or {}
+        if chunk.get("stop"):
+            final = timings
+            break
+        host_ms = (chunk["t"] - prev_t) * 1000.0
+        predicted_ms = timings.get("predicted_ms")
+        ms = predicted_ms - prev_ms if predicted_ms is not None else host_ms
+        records.append({"i": len(records), "ms": ms, "host_ms": host_ms})
+        if predicted_ms is not None:
+            prev_ms = predicted_ms
+        prev_t = chunk["t"]
+        final.setdefault("prompt_n", timings.get("prompt_n"))
+    return records, final
+
+
+def analyze(records, prompt_n, ctx_size, n_keep, logged, stall_factor):
+    """Annotate records with cache position/shift flags and return the run's summary fields."""
+    shifts = logged or predicted_shifts(prompt_n, len(records), ctx_size, n_keep)
+    indices = [i for i in shift_indices(shifts, prompt_n) if 0 <= i < len(records)]
+    near = {j for i in indices for j in range(i - SHIFT_WINDOW, i + SHIFT_WINDOW + 1)}
+
+    shift_at, n_past = dict(zip(indices, shifts)), prompt_n
+    for rec in records:
+        if rec["i"] in shift_at:
+            n_past -= shift_at[rec["i"]][2]
+        rec["pos"] = prompt_n + rec["i"]
+        rec["n_past"] = n_past
+        rec["shift"] = rec["i"] in shift_at
+        n_past += 1
+
+    lat = [r["ms"] for r in records]
+    steady = [r["ms"] for r in records if r["i"] not in near] or lat
+    median = statistics.median(steady) if steady else None
+    costs = []
+    for i in indices:
+        around = [r["ms"] for r in records[max(0, i - SHIFT_WINDOW):i + SHIFT_WINDOW + 1]]
+        costs.append(max(around) - median)
+
+    drift = None
+    points = [(r["n_past"], r["ms"]) for r in records if r["i"] not in near]
+    if len(points) > 2 and len({x for x, _ in points}) > 1:
+        mx = statistics.fmean(x for x, _ in points)
+        my = statistics.fmean(y for _, y in points)
+        drift = 1000.0 * (sum((x - mx) * (y - my) for x, y in points) / sum((x - mx) ** 2 for x, _ in points))
+
+    total_ms = sum(lat)
+    shift_cost = statistics.fmean(costs) if costs else None
+    return {
+        "tokens": len(records),
+        "prompt_n": prompt_n,
+        "shifts": len(indices),
+        "shifts_logged": len(logged),
+        "steady_tps": 1000.0 / median if median else None,
+        "overall_tps": 1000.0 * len(records) / total_ms if total_ms else None,
+        "p50_ms": percentile(lat, 50),
+        "p99_ms": percentile(lat, 99),
+        "shift_cost_ms": shift_cost,
+        "shift_overhead": sum(c for c in costs if c > 0) / total_ms if costs and total_ms else None,
+        "drift_ms_per_1k": drift,
+        "verdict": ("periodic stalls" if shift_cost is not None and median and shift_cost > stall_factor * median
+                    else "flat"),
+    }
+
+
+def make_bench_server(args, ctx_size, kv_type, log_file):
+    """Server for one (CTX_SIZE, KV type) config."""
+    if args.backend == "stub":
+        return StubServer(log_file=log_file, ctx_size=ctx_size, simulate=args.simulate)
+    env = {"CTX_SIZE": str(ctx_size), "ENABLE_SINKS": "1"}
+    server_args = ["-ctk", kv_type, "-ctv", kv_type] + args.extra_args
+    return LlamaServer(script=args.script, server_args=server_args, port=args.port,
+                       serial=args.serial, log_file=log_file, env=env)
+
+
+def run_config(args, ctx_size, kv_type, sink_keeps, log_path):
+    """Summary rows for every SINK_KEEP value on one server."""
+    rows = []
+    with open(log_path, "a", encoding="utf-8") as log_file:
+        tail = LogTail(log_path)
+        sampler = None
+        server = make_bench_server(args, ctx_size, kv_type, log_file)
+        try:
+            server.start()
+            startup = tail.read_request(timeout=0)
+            kv_mib = next((float(m.group(1)) for m in map(KV_CACHE_RE.match, startup) if m), None)
+            if args.backend == "server":
+                sampler = memory_sampler_from_args(args, args.serial, "llama-server")
+            for sink_keep in sink_keeps:
+                label = f"ctx{ctx_size}_{kv_type}_keep{sink_keep}"
+                n_predict = int(args.windows * ctx_size)
+                print(f"[STREAM] {label}: decoding {n_predict} tokens")
+                t0 = time.time()
+                records, final = stream_tokens(server, args.prompt, n_predict, sink_keep)
+                t1 = time.time()
+                # the shift lines can trail the HTTP stream through adb
+                logged = [tuple(int(g) for g in m.groups())
+                          for m in map(SHIFT_RE.search, tail.read_request(timeout=args.log_wait)) if m]
+                prompt_n = final.get("prompt_n") or 0
+                row = {"ctx_size": ctx_size, "kv_type": kv_type, "sink_keep": sink_keep}
+                row.update(analyze(records, prompt_n, ctx_size, sink_keep, logged, args.stall_factor))
+                memory = sampler.window(t0, t1) if sampler is not None else {}
+                row["peak_rss_mb"] = memory.get("peak_rss_mb")
+                row["kv_cache_mib"] = kv_mib
+                if logged and len(logged) != row["shifts"]:
+                    print(f"[WARN] {label}: {len(logged)} shifts logged, {row['shifts']} placed on the token axis")
+                with open(os.path.join(args.out_dir, f"tokens_{label}.jsonl"), "w", encoding="utf-8") as f:
+                    for rec in records:
+                        f.write(json.dumps(rec) + "\n")
+                print_row(row)
+                rows.append(row)
+        finally:
+            if sampler is not None:
+                sampler.stop()
+            server.stop()
+            tail.close()
+    return rows
+
+
+def fmt(v, spec=".1f"):
+    return "n/a" if v is None else format(v, spec)
+
+
+def print_row(row):
+    print(f"  steady {fmt(row['steady_tps'], '.2f')} tok/s, overall {fmt(row['overall_tps'], '.2f')} tok/s, "
+          f"p50 {fmt(row['p50_ms'])} ms, p99 {fmt(row['p99_ms'])} ms, "
+          f"drift {fmt(row['drift_ms_per_1k'], '.2f')} ms/1k cells")
+    print(f"  {row['shifts']} shifts ({row['shifts_logged']} logged), "
+          f"+{fmt(row['shift_cost_ms'])} ms each, {fmt((row['shift_overhead'] or 0) * 100)}% of decode "
+          f"-> {row['verdict']}; peak RSS {fmt(row['peak_rss_mb'], '.0f')} MB, "
+          f"KV cache {fmt(row['kv_cache_mib'], '.0f')} MiB")
+
+
+def print_table(rows):
+    print("\n=== Streaming sweep ===")
+    print(f"  {'ctx':>6} {'kv':>5} {'keep':>5} {'shifts':>6} {'steady':>8} {'overall':>8} "
+          f"{'p99 ms':>8} {'shift ms':>9} {'RSS MB':>7}  verdict")
+    for r in rows:
+        print(f"  {r['ctx_size']:>6} {r['kv_type']:>5} {r['sink_keep']:>5} {r['shifts']:>6} "
+              f"{fmt(r['steady_tps'], '.2f'):>8} {fmt(r['overall_tps'], '.2f'):>8} {fmt(r['p99_ms']):>8} "
+              f"{fmt(r['shift_cost_ms']):>9} {fmt(r['peak_rss_mb'], '.0f'):>7}  {r['verdict']}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Decode past several context windows and measure context-shift cost.")
+    ap.add_argument("--ctx-size", default="4096", help="comma-separated CTX_SIZE values")
+    ap.add_argument("--sink-keep", default="4", help="comma-separated SINK_KEEP (n_keep) values")
+    ap.add_argument("--kv-types", default="f16", help="comma-separated KV cache types (-ctk/-ctv)")
+    ap.add_argument("--windows", type=float, default=3.0, help="tokens to decode, in context windows")
+    ap.add_argument("--prompt", default="Write a very long story about a lighthouse keeper.")
+    ap.add_argument("--stall-factor", type=float, default=5.0,
+                    help="a shift costing more than this many median tokens counts as a stall")
+    ap.add_argument("--log-wait", type=float, default=5.0, help="seconds to wait for trailing shift log lines")
+    ap.add_argument("--backend", choices=["server", "stub"], default="server",
+                    help="server: run-server-streamllm.sh on the phone; stub: local stand-in (no phone)")
+    ap.add_argument("--simulate", action="store_true", help="stub backend: sleep for the synthetic timings")
+    ap.add_argument("--script", default="./run-server-streamllm.sh")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--serial", default=None, help="adb serial (default: $S / the only device)")
+    ap.add_argument("--out-dir", default="streaming_bench")
+    ap.add_argument("--log", default="streaming_server.log", help="server output of all configs")
+    add_memory_args(ap)
+    args, extra_args = ap.parse_known_args()
+    args.extra_args = extra_args[1:] if extra_args[:1] == ["--"] else extra_args
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    open(args.log, "w").close()
+    ctx_sizes = [int(v) for v in args.ctx_size.split(",") if v]
+    kv_types = [v for v in args.kv_types.split(",") if v]
+    sink_keeps = [int(v) for v in args.sink_keep.split(",") if v]
+
+    rows = []
+    t0 = time.time()
+    for ctx_size, kv_type in itertools.product(ctx_sizes, kv_types):
+        rows += run_config(args, ctx_size, kv_type, sink_keeps, args.log)
+    print_table(rows)
+    print(f"\nTotal time: {time.time() - t0:.1f} s")
+
+    path = os.path.join(args.out_dir, "summary.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
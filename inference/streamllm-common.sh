@@ -0,0 +1,141 @@
+#!/bin/sh
+#
+# Settings shared by run-cli-streamllm.sh and run-server-streamllm.sh, which
+# source this file: backend (MODE), StreamLLM-style sinks, the autotune.py
+# profile and the Hexagon/scheduler env vars. Sets the variables the
+# scripts put on their llama-cli / llama-server command line.
+#
+
+########################################
+# SELECT BACKEND HERE:
+#   MODE=CPU  → CPU only (no --device, -ngl 0)
+#   MODE=NPU  → Hexagon HTP0 NPU (--device HTP0, -ngl 99)
+#   MODE=GPU  → Adreno GPU via OpenCL (--device GPUOpenCL, -ngl 99)
+########################################
+MODE="${MODE:-CPU}"   # default if not set
+
+########################################
+# SINK / STREAMING SETTINGS
+#
+# These control the StreamLLM-style behavior:
+#   ENABLE_SINKS    → 1 to enable context-shift + sinks, 0 to disable
+#   SINK_KEEP       → how many tokens from the start to keep as sinks
+#   CTX_SIZE        → context window size (must be <= model's max ctx)
+#   N_PRED          → max tokens to generate (can exceed CTX_SIZE to force shifting;
+#                     the server's default, which requests may override)
+########################################
+ENABLE_SINKS="${ENABLE_SINKS:-1}"   # 1 = enable sinks + sliding window, 0 = no sinks
+SINK_KEEP="${SINK_KEEP:-4}"        # number of sink tokens to keep pinned at left
+CTX_SIZE="${CTX_SIZE:-4096}"       # --ctx-size
+N_PRED="${N_PRED:-250}"            # -n (n_predict)
+
+
+
+basedir=/data/local/tmp/llama.cpp
+
+# Extra CLI / server options (gets -v appended when SCHED is set)
+cli_opts=
+
+# Branch / subdir name on device (usually ".")
+branch=.
+[ "$B" != "" ] && branch="$B"
+
+# Optional: select device by serial number via env S
+adbserial=
+[ "$S" != "" ] && adbserial="-s $S"
+
+# adb binary; override with env ADB (e.g. ADB="python3 fake_adb.py" without a phone)
+adb="${ADB:-adb}"
+
+# Default model on device; override with env M if needed
+model="qwen2-7b-tinytron-Q4_K_M.gguf"
+[ "$M" != "" ] && model="$M"
+
+########################################
+# Resolve MODE → device + ngl
+########################################
+
+device=""
+ngl=0
+
+case "$MODE" in
+    CPU|cpu)
+        device=""
+        ngl=0
+        ;;
+    NPU|npu|HTP0)
+        device="HTP0"
+        ngl=99
+        ;;
+    GPU|gpu|GPUOpenCL)
+        device="GPUOpenCL"
+        ngl=99
+        ;;
+    *)
+        echo "Unknown MODE='$MODE'. Use CPU, NPU, or GPU." >&2
+        exit 1
+        ;;
+esac
+
+# Build optional --device argument (CPU mode → no flag)
+dev_arg=
+if [ "$device" != "" ]; then
+    dev_arg="--device $device"
+fi
+
+########################################
+# Tuned prefill settings (autotune.py)
+#
+# tuned/<model>_<MODE>.env sets TUNED_BATCH, TUNED_UBATCH, TUNED_THREADS
+# and TUNED_POLL for this model and backend. TUNED_PROFILE=<file> uses
+# another profile, TUNED_PROFILE=none ignores it. Arguments passed to the
+# scripts still win (llama.cpp keeps the last value of a repeated option).
+########################################
+TUNED_PROFILE="${TUNED_PROFILE:-./tuned/${model%.gguf}_${MODE}.env}"
+if [ "$TUNED_PROFILE" != "none" ] && [ -f "$TUNED_PROFILE" ]; then
+    . "$TUNED_PROFILE"
+fi
+threads="${TUNED_THREADS:-8}"
+batch="${TUNED_BATCH:-128}"
+tuned_args=
+[ "$TUNED_UBATCH" != "" ] && tuned_args="$tuned_args --ubatch-size $TUNED_UBATCH"
+[ "$TUNED_POLL" != "" ] && tuned_args="$tuned_args --poll $TUNED_POLL"
+
+########################################
+# Optional Hexagon / scheduler / profiling env vars
+########################################
+
+verbose=
+[ "$V" != "" ] && verbose="GGML_HEXAGON_VERBOSE=$V"
+
+experimental=
+[ "$E" != "" ] && experimental="GGML_HEXAGON_EXPERIMENTAL=$E"
+
+sched=
+if [ "$SCHED" != "" ]; then
+    sched="GGML_SCHED_DEBUG=2"
+    cli_opts="$cli_opts -v"
+fi
+
+profile=
+[ "$PROF" != "" ] && profile="GGML_HEXAGON_PROFILE=$PROF GGML_HEXAGON_OPSYNC=1"
+
+opmask=
+[ "$OPMASK" != "" ] && opmask="GGML_HEXAGON_OPMASK=$OPMASK"
+
+nhvx=
+[ "$NHVX" != "" ] && nhvx="GGML_HEXAGON_NHVX=$NHVX"
+
+ndev=
+[ "$NDEV" != "" ] && ndev="GGML_HEXAGON_NDEV=$NDEV"
+
+########################################
+# Build sink / context-shift arguments
+########################################
+
+sink_args=
+if [ "$ENABLE_SINKS" != "0" ]; then
+    # --context-shift turns on KV sliding
+    # --keep $SINK_KEEP pins the first SINK_KEEP tokens as sinks
+    sink_args="--context-shift --keep $SINK_KEEP"
+fi
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Shared pieces of the TruthfulQA hyperparameter sweeps.
+
+- SPACE / sample_config(): the same parameter space and sampling rules as the
+  arrays in hyperparameter_search.sh
+- config_args(): the llama-cli arguments run_eval.py builds for a config
+- RESULTS_COLUMNS / ResultsCSV: the results.csv layout the sweeps write
+- TruthfulQAEvaluator: evaluates a config on the first n questions, keeping
+  the dataset, BLEURT and the result store warm between configs, optionally
+  spreading the questions over several phones (device_pool.DevicePool)
+"""
+import csv
+import json
+import os
+import subprocess
+import threading
+import time
+
+from bleurt_scorer import BleurtScorer, DEFAULT_CACHE
+from dataset_snapshot import load_subset
+from device_pool import summarize_devices
+from eval_pipeline import run_pipelined
+from energy import summarize_energy
+from memory_profiler import summarize_memory
+from log_parser import parse_log, summarize, write_jsonl
+from result_store import ResultStore, DEFAULT_ROOT, arg_seed, cli_arg_set, perf_lines, shared_model_fingerprint
+from truthful_qa_eval import clean_question, score_bleurt_batch
+
+# Mirrors the HYPERPARAMETER SPACES section of hyperparameter_search.sh
+SPACE = {
+    "model": [
+        "qwen2-7b-tinytron-Q4_K_M.gguf",
+        "Llama-3.2-1B-Instruct-Q4_K_M.gguf",
+        "Llama-3.2-3B-Instruct-Q4_K_M.gguf",
+        "microsoft_Phi-4-mini-instruct-Q4_K_M.gguf",
+        "LFM2-8B-A1B-Q4_K_M.gguf",
+        "minicpm-3b-openhermes-2.5-v2.Q4_K_M.gguf",
+        "DeepSeek-R1-Distill-Qwen-1.5B-Q4_K_M.gguf",
+    ],
+    "mode": ["CPU"],
+    "system_prompt": [""],
+    "temperature": [0.3, 0.7, 0.8],
+    "repeat_penalty": [1.0, 1.1, 1.25, 1.5],
+    "top_p": [0.7, 0.85, 0.9, 0.95],
+    "top_k": [20, 40, 60, 80],
+    "ctx_size": [512, 1024, 2048, 4096],
+    "threads": [2, 4, 6, 8],
+    "ngl": [0],
+    "kv_cache_type": ["f16", "q8_0"],
+    "flash_attn": ["on", "off"],
+    "keep": [4],
+    "context_shift": [1],
+    "poll_level": [0, 50, 100],
+    "use_mmap": [1, 0],
+    "split_mode": ["none"],
+}
+BATCH_SIZES = {
+    "CPU": [64, 128, 256, 512, 1024],
+    "NPU": [256, 512, 1024],
+    "GPU": [512, 1024, 2048],
+}
+
+RESULTS_COLUMNS = [
+    "run_id", "model", "mode", "temperature", "repeat_penalty", "top_p", "top_k", "ctx_size", "keep",
+    "batch_size", "ubatch_size", "threads", "ngl", "ctk", "ctv", "flash_attn", "context_shift",
+    "poll_level", "use_mmap", "split_mode", "system_prompt", "bleurt_score", "accuracy",
+    "avg_prefill_speed", "avg_decode_speed", "avg_total_speed", "runtime_seconds",
+    "energy_j", "j_per_prefill_token", "j_per_decode_token",
+    "peak_rss_mb", "kv_cache_mib", "mmap_resident_mb",
+]
+# the parameter columns, i.e. what identifies a config
+CONFIG_COLUMNS = RESULTS_COLUMNS[1:RESULTS_COLUMNS.index("bleurt_score")]
+
+N_PREDICT = 250
+
+
+def sample_config(rng):
+    """One random config, following the same rules as the shell sweep's main loop."""
+    cfg = {k: rng.choice(SPACE[k]) for k in ("model", "mode", "temperature", "repeat_penalty", "top_p",
+                                             "top_k", "ctx_size", "keep")}
+    cfg["batch_size"] = rng.choice(BATCH_SIZES.get(cfg["mode"], BATCH_SIZES["GPU"]))
+    cfg["ubatch_size"] = cfg["batch_size"]
+    cfg["threads"] = rng.choice(SPACE["threads"])
+    cfg["ngl"] = rng.choice(SPACE["ngl"])
+    if cfg["mode"] != "CPU" and cfg["ngl"] != 0:
+        cfg["ngl"] = 99
+    cfg["flash_attn"] = rng.choice(SPACE["flash_attn"])
+    # KV cache quantization needs flash attention
+    if cfg["flash_attn"] == "on":
+        cfg["ctk"] = rng.choice(SPACE["kv_cache_type"])
+        cfg["ctv"] = rng.choice(SPACE["kv_cache_type"])
+    else:
+        cfg["ctk"] = cfg["ctv"] = "f16"
+    for k in ("context_shift", "poll_level", "use_mmap", "split_mode", "system_prompt"):
+        cfg[k] = rng.choice(SPACE[k])
+    return {k: cfg[k] for k in CONFIG_COLUMNS}
+
+
+def config_key(cfg):
+    return tuple(str(cfg[k]) for k in CONFIG_COLUMNS)
+
+
+def config_args(cfg, n_predict=N_PREDICT):
+    """llama-cli arguments for a config (appended after -no-cnv -p PROMPT)."""
+    args = [
+        "-n", str(n_predict),
+        "-t", str(cfg["threads"]),
+        "-c", str(cfg["ctx_size"]),
+        "-b", str(cfg["batch_size"]),
+        "-ub", str(cfg["ubatch_size"]),
+        "-ctk", cfg["ctk"],
+        "-ctv", cfg["ctv"],
+        "--temp", str(cfg["temperature"]),
+        "--repeat-penalty", str(cfg["repeat_penalty"]),
+        "--top-p", str(cfg["top_p"]),
+        "--top-k", str(cfg["top_k"]),
+        "--keep", str(cfg["keep"]),
+        "-fa", cfg["flash_attn"],
+        "--context-shift" if int(cfg["context_shift"]) == 1 else "--no-context-shift",
+        "--poll", str(cfg["poll_level"]),
+    ]
+    if int(cfg["use_mmap"]) == 0:
+        args.append("--no-mmap")
+    return args
+
+
+def config_env(cfg):
+    """run-cli-streamllm.sh env knobs for a config (model and backend)."""
+    return {"M": cfg["model"], "MODE": cfg["mode"]}
+
+
+class ResultsCSV:
+    """Append-only results.csv with the sweep's columns."""
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isfile(path) or os.path.getsize(path) == 0:
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                csv.writer(f).writerow(RESULTS_COLUMNS)
+
+    def append(self, row):
+        with open(self.path, "a", encoding="utf-8", newline="") as f:
+            csv.DictWriter(f, fieldnames=RESULTS_COLUMNS, extrasaction="ignore").writerow(row)
+
+    def rows(self):
+        with open(self.path, "r", encoding="utf-8", newline="") as f:
+            return list(csv.DictReader(f))
+
+
+class TruthfulQAEvaluator:
+    """
+    Runs configs against TruthfulQA with warm state: the dataset and BLEURT are
+    loaded once, and samples a config has already produced (e.g. at a lower
+    fidelity) are served from the result store, so raising a config from 3 to
+    9 questions only runs the 6 new ones on the phone.
+    """
+
+    def __init__(self, max_samples=25, script="./run-cli-streamllm.sh", bleurt_cache=DEFAULT_CACHE,
+                 store_root=DEFAULT_ROOT, queue_size=4, score_batch=8, power=None, memory=None, pool=None):
+        self.ds = load_subset("truthfulqa/truthful_qa", "generation", split="validation", rows=max_samples)
+        print(f"Loaded {len(self.ds)} test samples for Truthful QA")
+        self.script = script
+        self.scorer = BleurtScorer('bleurt-large-128', cache_path=bleurt_cache)
+        self.store = ResultStore(store_root) if store_root else None
+        self.queue_size = queue_size
+        self.score_batch = score_batch
+        self.power = power or {}  # serial -> PowerSampler
+        self.memory = memory or {}  # serial -> MemorySampler
+        self.pool = pool
+        self._model_hashes = {}
+
+    def _model_hash(self, model):
+        if model not in self._model_hashes:
+            serials = self.pool.serials if self.pool is not None else [None]
+            self._model_hashes[model] = shared_model_fingerprint(model, serials)
+        return self._model_hashes[model]
+
+    def evaluate(self, cfg, run_dir, n_samples=None):
+        """
+        Evaluate cfg on the first n_samples questions. Writes run_dir/debug.log
+        and run_dir/samples.jsonl (one scored sample per line, for
+        results_warehouse.py) and returns the results.csv metric columns (None
+        where a run failed).
+        """
+        os.makedirs(run_dir, exist_ok=True)
+        samples = self.ds.select(range(min(n_samples or len(self.ds), len(self.ds))))
+        args = config_args(cfg)
+        env = dict(os.environ, **config_env(cfg))
+        arg_set = cli_arg_set(self.script, ["-no-cnv"] + args, env=env)
+        model_hash = self._model_hash(cfg["model"]) if self.store is not None else None
+        debug_log = os.path.join(run_dir, "debug.log")
+        stderr_file = open(debug_log, "w", encoding="utf-8")
+        samples_file = open(os.path.join(run_dir, "samples.jsonl"), "w", encoding="utf-8")
+        log_lock = threading.Lock()
+        store_keys = {}
+        max_scores, accs, energies, memories, device_records = [], [], [], [], []
+
+        def generate(i, rec, serial=None):
+            question = clean_question(rec['question'])
+            out_path = os.path.join(run_dir, f"tmp_output_{i}.txt")
+            if self.store is not None:
+                store_keys[i] = ResultStore.key(model_hash, arg_set, question, arg_seed(args))
+                cached = self.store.get(store_keys[i])
+                if cached is not None:
+                    with open(out_path, "w", encoding="utf-8") as fout:
+                        fout.write(cached["prediction"])
+                    with log_lock:
+                        stderr_file.write(cached["timings"].get("perf_log", ""))
+                    return cached["prediction"], cached["latency"], cached["timings"]
+
+            cmd = ["bash", self.script, "-no-cnv", "-p", f"\"\'{question} \'\""] + args
+            start = time.time()
+            with open(out_path, "w", encoding="utf-8") as fout:
+                print("CMD:", " ".join(cmd))
+                proc = subprocess.run(cmd, stdout=fout, stderr=subprocess.PIPE, text=True,
+                                      env=dict(env, S=serial) if serial else env)
+            end = time.time()
+            latency = end - start
+            with log_lock:
+                stderr_file.write(proc.stderr)
+                stderr_file.flush()
+            if proc.returncode != 0:
+                print(f"[ERROR] CLI failed for prompt {question}:")
+                return None
+            with open(out_path, "r", encoding="utf-8") as fin:
+                pred = fin.read().strip()
+            if not pred:
+                print(f"[WARNING] Empty prediction for sample {i}")
+                return None
+            timings = {"perf_log": perf_lines(proc.stderr), "device": serial or env.get("S")}
+            if serial in self.power:
+                timings["energy"] = self.power[serial].cli_energy(start, end, proc.stderr)
+            if serial in self.memory:
+                timings["memory"] = self.memory[serial].cli_memory(start, end, proc.stderr)
+            if self.store is not None:
+                self.store.put(store_keys[i], {"question": question, "prediction": pred,
+                                               "latency": latency, "timings": timings})
+            return pred, latency, timings
+
+        def report(i, rec, gen, score):
+            max_score, acc = score
+            if self.store is not None:
+                self.store.update(store_keys.get(i), max_score=max_score, acc=acc)
+            samples_file.write(json.dumps({"sample": i, "question": clean_question(rec['question']),
+                                           "latency": gen[1], "max_score": max_score, "acc": acc,
+                                           "output": gen[0], "device": gen[2].get("device")}) + "\n")
+            samples_file.flush()
+            print(f"-------- sample {i} --------")
+            print(f'    latency: {gen[1]:.3f} s.')
+            print(f'    max_score: {max_score:.3f}')
+            print(f'    acc: {acc}')
+            max_scores.append(max_score)
+            accs.append(acc)
+            if gen[2].get("energy"):
+                energies.append(gen[2]["energy"])
+            if gen[2].get("memory"):
+                memories.append(gen[2]["memory"])
+            device_records.append({"device": gen[2].get("device"), "latency": gen[1]})
+
+        start = time.time()
+        try:
+            _, stats, _ = run_pipelined(
+                samples, generate, lambda batch: score_bleurt_batch(self.scorer, batch), on_result=report,
+                queue_size=self.queue_size, batch_size=self.score_batch, pool=self.pool
+            )
+        finally:
+            stderr_file.close()
+            samples_file.close()
+        runtime = time.time() - start
+        print(f'pipeline: {stats.summary()}')
+        if self.pool is not None:
+            for name, dev in summarize_devices(device_records).items():
+                print(f'    {name}: {dev["n"]} samples, mean latency {dev["mean"]:.3f} s')
+
+        records = list(parse_log(debug_log))
+        write_jsonl(records, os.path.join(run_dir, "perf.jsonl"))
+        summary = summarize(records)
+        speeds = {col: round(summary[phase]["mean_tps"], 2) if summary[phase] else None
+                  for col, phase in (("avg_prefill_speed", "prefill"), ("avg_decode_speed", "decode"),
+                                     ("avg_total_speed", "total"))}
+        return {
+            "bleurt_score": sum(max_scores) / len(max_scores) if max_scores else None,
+            "accuracy": sum(accs) / len(accs) if accs else None,
+            **speeds,
+            "runtime_seconds": int(round(runtime)),
+            **summarize_energy(energies),
+            **summarize_memory(memories),
+            "n_samples": len(samples),
+            "n_scored": len(accs),
+        }
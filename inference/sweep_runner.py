@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Long-lived TruthfulQA sweep runner.
+
+Loads the dataset and BLEURT once, then runs configs one after another with
+that warm state instead of starting a fresh Python/TensorFlow process per run.
+Configs come from a JSONL queue file (one JSON object per line, keys are the
+results.csv parameter columns plus an optional run_id) or from --config.
+Each finished run is appended to results.csv; run_ids already there are
+skipped, so a restarted runner resumes where it stopped.
+
+    python sweep_runner.py --queue configs.jsonl --results results.csv --output-dir DIR
+    python sweep_runner.py --queue configs.jsonl --results results.csv --output-dir DIR --follow
+    python sweep_runner.py --config '{"model": "...", "temperature": 0.7, ...}' --results results.csv
+
+With --follow the runner keeps reading lines appended to the queue until it
+sees {"stop": true}; this is how hyperparameter_search.sh drives it.
+"""
+import argparse
+import json
+import os
+import time
+
+from device_pool import add_device_args, per_device, pool_from_args
+from energy import add_energy_args, sampler_from_args
+from memory_profiler import add_memory_args, format_memory, memory_sampler_from_args
+from sweep_common import CONFIG_COLUMNS, ResultsCSV, TruthfulQAEvaluator
+
+
+def read_queue(path, follow=False, poll_s=1.0):
+    """Yield config dicts from a JSONL file; with follow, wait for new lines until a stop line."""
+    while follow and not os.path.exists(path):
+        time.sleep(poll_s)
+    with open(path, "r", encoding="utf-8") as f:
+        pending = ""
+        while True:
+            line = f.readline()
+            if not line:
+                if not follow:
+                    break
+                time.sleep(poll_s)
+                continue
+            pending += line
+            if not pending.endswith("\n"):
+                # writer is mid-line
+                continue
+            line, pending = pending.strip(), ""
+            if not line:
+                continue
+            try:
+                cfg = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"[WARN] skipping malformed queue line: {line}")
+                continue
+            if cfg.get("stop"):
+                break
+            yield cfg
+
+
+class SweepRunner:
+    def __init__(self, evaluator, results_path, output_dir):
+        self.evaluator = evaluator
+        self.results = ResultsCSV(results_path)
+        self.output_dir = output_dir
+        self.done = {row["run_id"] for row in self.results.rows()}
+
+    def next_run_id(self):
+        ids = [int(r) for r in self.done if str(r).isdigit()]
+        return max(ids, default=0) + 1
+
+    def run(self, cfg):
+        missing = [k for k in CONFIG_COLUMNS if k not in cfg]
+        if missing:
+            print(f"[ERROR] config is missing {', '.join(missing)}: {cfg}")
+            return None
+        run_id = cfg.get("run_id") or self.next_run_id()
+        if str(run_id) in self.done:
+            print(f"[SKIP] run {run_id} already in {self.results.path}")
+            return None
+
+        print("=" * 40)
+        print(f"RUN #{run_id} - {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        print(" | ".join(f"{k}: {cfg[k]}" for k in CONFIG_COLUMNS))
+        run_dir = os.path.join(self.output_dir, f"run_{run_id}")
+        os.makedirs(run_dir, exist_ok=True)
+        try:
+            metrics = self.evaluator.evaluate(cfg, run_dir)
+        except Exception as e:
+            # keep the sweep going; the row records the failure
+            print(f"[ERROR] run {run_id} failed: {e}")
+            metrics = {}
+        row = {"run_id": run_id, **{k: cfg[k] for k in CONFIG_COLUMNS}, **metrics}
+        with open(os.path.join(run_dir, "metrics.json"), "w", encoding="utf-8") as f:
+            json.dump(row, f, indent=2)
+
+        print(f"BLEURT: {row.get('bleurt_score')} | Accuracy: {row.get('accuracy')} | "
+              f"Runtime: {row.get('runtime_seconds')}s")
+        print(f"Prefill: {row.get('avg_prefill_speed')} tok/s | Decode: {row.get('avg_decode_speed')} tok/s | "
+              f"Total: {row.get('avg_total_speed')} tok/s")
+        if row.get("energy_j") is not None:
+            print(f"Energy: {row['energy_j']:.1f} J | prefill {row.get('j_per_prefill_token')} J/tok | "
+                  f"decode {row.get('j_per_decode_token')} J/tok")
+        if row.get("peak_rss_mb") is not None:
+            print(f"Memory: {format_memory(row)}")
+        self.results.append(row)
+        self.done.add(str(run_id))
+        return row
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Run TruthfulQA sweep configs with warm dataset/BLEURT state.")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--queue", help="JSONL file of configs")
+    src.add_argument("--config", action="append", help="one config as JSON (repeatable)")
+    ap.add_argument("--follow", action="store_true",
+                    help="keep reading the queue until a {\"stop\": true} line")
+    ap.add_argument("--results", required=True, help="results.csv to append to")
+    ap.add_argument("--output-dir", default=None, help="where run_<id>/ dirs go (default: next to results.csv)")
+    ap.add_argument("--samples", type=int, default=25, help="TruthfulQA questions per run")
+    add_energy_args(ap)
+    add_memory_args(ap)
+    add_device_args(ap)
+    args = ap.parse_args()
+
+    output_dir = args.output_dir or os.path.dirname(os.path.abspath(args.results))
+    os.makedirs(output_dir, exist_ok=True)
+    serials, pool = pool_from_args(args)
+    power = per_device(serials, lambda s: sampler_from_args(args, s))
+    memory = per_device(serials, lambda s: memory_sampler_from_args(args, s))
+    evaluator = TruthfulQAEvaluator(max_samples=args.samples, power=power, memory=memory, pool=pool)
+    runner = SweepRunner(evaluator, args.results, output_dir)
+
+    configs = read_queue(args.queue, follow=args.follow) if args.queue else (json.loads(c) for c in args.config)
+    n = 0
+    try:
+        for cfg in configs:
+            if runner.run(cfg) is not None:
+                n += 1
+    finally:
+        for sampler in list(power.values()) + list(memory.values()):
+            sampler.stop()
+
+    print(f"Sweep runner done: {n} runs")
+    if pool is not None:
+        print(f"Devices: {pool.summary()}")
+    print(evaluator.scorer.summary())
+    if evaluator.store is not None:
+        print(evaluator.store.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+INFERENCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the harness scripts import each other as top-level modules from inference/
+sys.path.insert(0, INFERENCE_DIR)
+
+import dataset_snapshot  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def dataset_pins(tmp_path, monkeypatch):
+    """Keeps the tests' toy subsets out of the checked-in dataset_pins.json."""
+    path = tmp_path / "dataset_pins.json"
+    monkeypatch.setattr(dataset_snapshot, "PINS_FILE", str(path))
+    return path
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """A scratch cwd with the run scripts, like running the harnesses from inference/."""
+    for script in ("run-cli-streamllm.sh", "run-server-streamllm.sh", "streamllm-common.sh", "fake_adb.py"):
+        shutil.copy(os.path.join(INFERENCE_DIR, script), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
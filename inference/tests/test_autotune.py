@@ -0,0 +1,73 @@
+import sys
+
+import pytest
+
+import autotune
+from autotune import SCRIPT_DEFAULTS, AutoTuner, cost, representatives
+
+
+@pytest.fixture
+def phone(workdir, monkeypatch):
+    monkeypatch.setenv("ADB", f"{sys.executable} {workdir / 'fake_adb.py'}")
+    monkeypatch.setenv("FAKE_ADB_STATE", str(workdir / "fake_adb.json"))
+    return workdir
+
+
+def test_representatives_weight_quantiles_by_prompt_tokens():
+    lengths = [100] * 6 + [1000] * 3 + [10000]
+    weights = representatives(lengths)
+    # quantiles 0.25/0.5 -> 100 (rounded up to 128), 0.9 -> 1000 (1024); 10000 is capped and joins 1024
+    assert weights == {128: 600, 1024: 13000}
+    assert sum(weights.values()) == sum(lengths)
+    assert representatives([5000, 6000, 7000], max_prompt=4096) == {4096: 18000}
+    assert representatives([50]) == {64: 50}
+
+
+def test_cost_needs_every_probe_length():
+    weights = {128: 600, 1024: 3000}
+    results = {("pp", 128): 60.0, ("pp", 1024): 30.0, ("tg", 16): 8.0}
+    assert cost(results, weights, n_prompts=10, n_gen=0) == pytest.approx(10.0 + 100.0)
+    assert cost(results, weights, n_prompts=10, n_gen=16) == pytest.approx(110.0 + 10 * 16 / 8.0)
+    assert cost(results, weights, n_prompts=10, n_gen=32) is None
+    assert cost({("pp", 128): 60.0}, weights, n_prompts=10, n_gen=0) is None
+
+
+def test_candidates_split_the_batch_into_ubatches():
+    tuner = AutoTuner("m.gguf", "CPU", {128: 1}, 1)
+    assert tuner.candidates("batch", SCRIPT_DEFAULTS) == [64, 128, 256, 512, 1024]
+    assert tuner.candidates("ubatch", dict(SCRIPT_DEFAULTS, batch=256)) == [32, 64, 128, 256]
+    assert tuner.candidates("ubatch", dict(SCRIPT_DEFAULTS, batch=16)) == [16]
+    assert tuner.candidates("threads", SCRIPT_DEFAULTS) == [2, 4, 6, 8]
+
+
+def test_probe_measures_each_config_once(phone, monkeypatch):
+    calls = []
+    run_probe = autotune.run_probe
+    monkeypatch.setattr(autotune, "run_probe", lambda cmd, serial=None: calls.append(cmd) or run_probe(cmd, serial))
+    tuner = AutoTuner("m.gguf", "CPU", {128: 600, 1024: 3000}, n_prompts=10, n_gen=16, reps=1)
+
+    results = tuner.probe(SCRIPT_DEFAULTS, "threads", [2, 6, 8])
+    assert len(calls) == 1 and "-t 2,6,8" in calls[0] and "-p 128,1024" in calls[0]
+    assert set(results) == {2, 6, 8}
+    costs = {t: c for t, (_, c) in results.items()}
+    assert all(c is not None for c in costs.values())
+    # the stand-in's CPU prefill peaks at 6 threads
+    assert min(costs, key=costs.get) == 6
+    assert results[6][0] == dict(SCRIPT_DEFAULTS, threads=6)
+
+    assert tuner.probe(SCRIPT_DEFAULTS, "threads", [6, 8]) == {6: results[6], 8: results[8]}
+    assert len(calls) == 1 and tuner.probes == 1
+
+    # batch and ubatch move together, one llama-bench call per batch size
+    results = tuner.probe(SCRIPT_DEFAULTS, "batch", [64, 256])
+    assert len(calls) == 3
+    assert results[64][0]["ubatch"] == 64 and results[256][0]["ubatch"] == 256
+
+
+def test_tune_improves_on_the_script_defaults(phone, capsys):
+    tuner = AutoTuner("m.gguf", "CPU", representatives([300, 600, 2000]), n_prompts=3, reps=1)
+    params, best, baseline = tuner.tune(SCRIPT_DEFAULTS)
+    assert best < baseline
+    assert params["threads"] == 6 and params["ubatch"] == 256
+    assert tuner.prefill_tps(params) > tuner.prefill_tps(SCRIPT_DEFAULTS)
+    assert "[TUNE] pass 1 batch:" in capsys.readouterr().out
@@ -0,0 +1,44 @@
+from bleurt_scorer import BleurtScorer
+
+
+class FakeBleurt:
+    """evaluate's bleurt metric stand-in: score = len(prediction) / 10."""
+
+    def __init__(self):
+        self.batches = []
+
+    def compute(self, predictions, references):
+        self.batches.append(list(zip(predictions, references)))
+        return {"scores": [len(p) / 10 for p in predictions]}
+
+
+def scorer_with_fake(cache_path, **kwargs):
+    scorer = BleurtScorer(cache_path=cache_path, **kwargs)
+    scorer._bleurt = FakeBleurt()
+    return scorer
+
+
+def test_duplicate_pairs_are_scored_once_in_batches(tmp_path):
+    scorer = scorer_with_fake(str(tmp_path / "scores.sqlite"), batch_size=2)
+    preds, refs = ["a", "bb", "a", "ccc", "dddd"], ["x", "y", "x", "z", "x"]
+    assert scorer.score_pairs(preds, refs) == [0.1, 0.2, 0.1, 0.3, 0.4]
+    assert [len(b) for b in scorer._bleurt.batches] == [2, 2]
+    assert (scorer.pairs_requested, scorer.cache_hits, scorer.pairs_scored) == (5, 0, 4)
+
+
+def test_scores_persist_per_checkpoint(tmp_path):
+    cache = str(tmp_path / "scores.sqlite")
+    scorer_with_fake(cache).score_pairs(["a", "bb"], ["x", "y"])
+    again = scorer_with_fake(cache)
+    assert again.score_pairs(["bb", "a", "new"], ["y", "x", "x"]) == [0.2, 0.1, 0.3]
+    assert again._bleurt.batches == [[("new", "x")]] and again.cache_hits == 2
+    other = scorer_with_fake(cache, checkpoint="bleurt-base-128")
+    other.score_pairs(["a"], ["x"])
+    assert other.cache_hits == 0
+
+
+def test_without_a_cache_every_call_scores():
+    scorer = scorer_with_fake("")
+    scorer.score_pairs(["a"], ["x"])
+    scorer.score_pairs(["a"], ["x"])
+    assert scorer.pairs_scored == 2 and scorer.cache_hits == 0
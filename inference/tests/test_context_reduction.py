@@ -0,0 +1,53 @@
+from context_reduction import BM25, chunk_document, reduce_prompt, split_prompt
+
+HEADER = "You are given a meeting transcript and a query.\n\nTranscript:\n"
+TRAILER = "\n\nNow, answer the query based on the above meeting transcript.\n\nQuery: What did they decide about the budget?\nAnswer:"
+LINES = [f"Speaker {i}: we talked about item {i} of the agenda for a while." for i in range(20)]
+LINES[13] = "Marketing: the budget was decided, we cut the budget to twelve euros."
+
+
+def count(text):
+    return len(text.split())
+
+
+def test_split_prompt():
+    header, document, trailer, query = split_prompt(HEADER + "\n".join(LINES) + TRAILER)
+    assert header == HEADER
+    assert document == "\n".join(LINES)
+    assert trailer == TRAILER
+    assert query == "What did they decide about the budget?"
+
+
+def test_chunk_document_splits_overlong_lines():
+    chunks = chunk_document("\n".join(LINES + [" ".join(["x"] * 50)]), 24, count)
+    assert all(count(c) <= 24 for c in chunks)
+    assert " ".join(chunks).split() == " ".join(LINES + [" ".join(["x"] * 50)]).split()
+
+
+def test_bm25_ranks_the_matching_chunk_first():
+    scores = BM25(LINES).scores("decide budget")
+    assert max(range(len(LINES)), key=scores.__getitem__) == 13
+
+
+def test_reduce_prompt_keeps_the_relevant_chunk_within_budget():
+    text = HEADER + "\n".join(LINES) + TRAILER
+    reduced, n, n_source, kept, total = reduce_prompt(text, count, budget=80, chunk_tokens=16)
+    assert n_source == count(text) > 80
+    assert n == count(reduced) <= 80
+    assert reduced.startswith(HEADER) and reduced.endswith(TRAILER)
+    assert LINES[13] in reduced
+    assert 0 < kept < total == len(LINES)
+
+
+def test_reduce_prompt_keeps_document_order_and_marks_gaps():
+    text = HEADER + "\n".join(LINES) + TRAILER
+    reduced, *_ = reduce_prompt(text, count, budget=10 ** 6, chunk_tokens=16, top_k=3)
+    body = reduced[len(HEADER):-len(TRAILER)]
+    kept = [LINES.index(line) for line in body.split("\n") if line in LINES]
+    assert kept == sorted(kept) and 13 in kept and len(kept) == 3
+    assert "\n...\n" in body
+
+
+def test_reduce_prompt_leaves_fitting_prompts_alone():
+    text = HEADER + "\n".join(LINES) + TRAILER
+    assert reduce_prompt(text, count, budget=10 ** 6, chunk_tokens=16)[0] == text
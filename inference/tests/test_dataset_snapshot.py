@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from dataset_snapshot import Snapshot, export, load_pins, load_subset, snapshot_name
+
+ROWS = [{"question": "What is up?", "image": {"bytes": b"\x89PNG\x00\x01", "path": None}},
+        {"question": "Why?", "image": {"bytes": b"", "path": "b.png"}}]
+NAME = snapshot_name("org/set", None, "test", 2)
+
+
+@pytest.fixture
+def snapshot_root(tmp_path):
+    root = tmp_path / "datasets"
+    export(ROWS, str(root / NAME), source={"path": "org/set"})
+    return root
+
+
+def test_rows_round_trip_with_binary_values(snapshot_root):
+    snap = Snapshot(str(snapshot_root / NAME))
+    assert len(snap) == 2 and snap.column_names == ["question", "image"]
+    assert list(snap) == ROWS
+    assert snap.select([1])[0]["question"] == "Why?"
+    assert snap.verify()
+
+
+def test_first_load_pins_the_subset(snapshot_root, dataset_pins):
+    snap = load_subset("org/set", split="test", rows=2, root=str(snapshot_root))
+    assert load_pins() == {NAME: snap.sha256}
+    assert json.loads(dataset_pins.read_text()) == {NAME: snap.sha256}
+
+
+def test_a_different_export_fails_against_the_pin(snapshot_root):
+    load_subset("org/set", split="test", rows=2, root=str(snapshot_root))
+    # re-exported with other rows: index.json and data.bin agree, the pin does not
+    export(ROWS[:1], str(snapshot_root / NAME))
+    with pytest.raises(ValueError, match="pinned sha256"):
+        load_subset("org/set", split="test", rows=2, root=str(snapshot_root))
+
+
+def test_corrupted_data_is_rehashed_not_trusted(snapshot_root):
+    snap = load_subset("org/set", split="test", rows=2, root=str(snapshot_root))
+    data = snapshot_root / NAME / "data.bin"
+    data.write_bytes(data.read_bytes().replace(b"What", b"Whot"))
+    with pytest.raises(ValueError, match="pinned sha256"):
+        Snapshot(str(snapshot_root / NAME), expect_sha256=snap.sha256)
@@ -0,0 +1,63 @@
+import os
+import sys
+
+import pytest
+
+from deploy_pkg import DEVICE_PREFIX, PackageDeployer
+
+
+@pytest.fixture
+def phone(workdir, monkeypatch):
+    root = workdir / "device_tmp"
+    monkeypatch.setenv("ADB", f"{sys.executable} {workdir / 'fake_adb.py'}")
+    monkeypatch.setenv("FAKE_ADB_ROOT", str(root))
+    monkeypatch.setenv("FAKE_ADB_STATE", str(workdir / "fake_adb.json"))
+    return root / os.path.relpath(DEVICE_PREFIX, "/data/local/tmp")
+
+
+@pytest.fixture
+def pkg(workdir):
+    for rel, text in (("bin/llama-cli", "cli"), ("lib/libggml-htp.so", "htp v1"), ("lib/libggml-cpu.so", "cpu")):
+        path = workdir / "pkg" / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+    return workdir / "pkg"
+
+
+def test_deploy_pushes_changed_files_only(phone, pkg, capsys):
+    PackageDeployer(str(pkg)).deploy()
+    assert (phone / "lib" / "libggml-htp.so").read_text() == "htp v1"
+    assert os.access(phone / "bin" / "llama-cli", os.X_OK)
+    assert "3 of 3 files pushed" in capsys.readouterr().out
+
+    (pkg / "lib" / "libggml-htp.so").write_text("htp v2")
+    deployer = PackageDeployer(str(pkg))
+    deployer.deploy(dry_run=True)
+    out = capsys.readouterr().out
+    assert f"push {pkg / 'lib' / 'libggml-htp.so'} -> {DEVICE_PREFIX}/lib/libggml-htp.so" in out
+    assert "1 of 3 files to push" in out
+    assert (phone / "lib" / "libggml-htp.so").read_text() == "htp v1"
+
+    deployer.deploy()
+    assert (phone / "lib" / "libggml-htp.so").read_text() == "htp v2"
+    assert "1 of 3 files pushed" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("jobs", [0, 4])
+def test_prune_removes_files_dropped_from_the_package(phone, pkg, jobs, capsys):
+    PackageDeployer(str(pkg), jobs=jobs).deploy()
+    (pkg / "lib" / "libggml-cpu.so").unlink()
+    deployer = PackageDeployer(str(pkg), jobs=jobs)
+
+    deployer.deploy(dry_run=True, prune=True)
+    assert f"remove {DEVICE_PREFIX}/lib/libggml-cpu.so" in capsys.readouterr().out
+    assert (phone / "lib" / "libggml-cpu.so").exists()
+
+    # without --prune the stale file is left alone
+    deployer.deploy()
+    assert (phone / "lib" / "libggml-cpu.so").exists()
+
+    deployer.deploy(prune=True)
+    assert not (phone / "lib" / "libggml-cpu.so").exists()
+    assert "removed 1 files no longer in" in capsys.readouterr().out
+    assert deployer.removed(deployer.device(None)) == []
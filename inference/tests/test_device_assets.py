@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import sys
+
+import pytest
+
+import device_assets
+from device_assets import DEVICE_ASSET_ROOT, DeviceAssets, cas_path, expand, plan, push_cas
+
+
+@pytest.fixture
+def phone(workdir, monkeypatch):
+    """fake_adb with its /data/local/tmp stand-in under the test's tmp dir."""
+    root = workdir / "device_tmp"
+    monkeypatch.setenv("ADB", f"{sys.executable} {workdir / 'fake_adb.py'}")
+    monkeypatch.setenv("FAKE_ADB_ROOT", str(root))
+    monkeypatch.setenv("FAKE_ADB_STATE", str(workdir / "fake_adb.json"))
+    return root
+
+
+def on_device(root, device_path):
+    return root / os.path.relpath(device_path, device_assets.DEVICE_TMP)
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return path
+
+
+def test_expand_walks_directories_in_order(tmp_path):
+    write(tmp_path / "prompts" / "b.txt", "b")
+    write(tmp_path / "prompts" / "a" / "c.txt", "c")
+    single = write(tmp_path / "model.gguf", "m")
+    files = expand([str(tmp_path / "prompts"), str(single)])
+    assert [rel for _, rel in files] == ["b.txt", os.path.join("a", "c.txt"), "model.gguf"]
+
+
+def test_plan_is_content_addressed_or_mirrors_dest(tmp_path):
+    a = write(tmp_path / "in" / "a.txt", "same")
+    b = write(tmp_path / "in" / "sub" / "b.txt", "same")
+    digest = hashlib.sha256(b"same").hexdigest()
+    cas = plan([str(tmp_path / "in")])
+    assert {x.device_path for x in cas} == {f"{DEVICE_ASSET_ROOT}/{digest}.txt"}
+    assert cas_path(digest, str(a)) == cas[0].device_path and cas[0].size == 4
+
+    named = plan([str(tmp_path / "in")], dest="/data/local/tmp/gguf")
+    assert [x.device_path for x in named] == ["/data/local/tmp/gguf/a.txt", "/data/local/tmp/gguf/sub/b.txt"]
+    assert named[1].local == str(b)
+    with pytest.raises(ValueError, match="outside /data/local/tmp"):
+        plan([str(a)], dest="/sdcard")
+
+
+@pytest.mark.parametrize("jobs", [0, 2])
+def test_sync_pushes_only_what_the_device_lacks(phone, workdir, jobs, capsys):
+    write(workdir / "in" / "a.txt", "alpha")
+    write(workdir / "in" / "b.txt", "beta")
+    assets = plan([str(workdir / "in")])
+    device = DeviceAssets()
+
+    first = device.sync(assets, jobs=jobs)
+    assert first["pushed"] == 2 and first["bytes"] == 9
+    for a in assets:
+        assert on_device(phone, a.device_path).read_text() == open(a.local).read()
+    manifest = json.loads(on_device(phone, device.manifest_path).read_text())
+    assert {p: f["sha256"] for p, f in manifest["files"].items()} == {a.device_path: a.sha256 for a in assets}
+
+    assert device.sync(assets, jobs=jobs)["pushed"] == 0
+    assert "2 files up to date" in capsys.readouterr().out
+
+    # a file deleted on the device is sent again even though the manifest lists it
+    on_device(phone, assets[0].device_path).unlink()
+    todo, _ = device.stale(assets)
+    assert todo == [assets[0]]
+    assert device.sync(assets, jobs=jobs)["pushed"] == 1
+
+    # a changed file gets a new content address; the unchanged one stays put
+    write(workdir / "in" / "b.txt", "beta 2")
+    changed = plan([str(workdir / "in")])
+    assert device.stale(changed)[0] == [changed[1]]
+
+
+def test_push_cas_maps_local_to_device_paths(phone, workdir):
+    a = write(workdir / "img.jpg", "jpeg bytes")
+    mapping = push_cas([str(a)])
+    device_path = mapping[str(a)]
+    assert device_path == f"{DEVICE_ASSET_ROOT}/{hashlib.sha256(b'jpeg bytes').hexdigest()}.jpg"
+    assert on_device(phone, device_path).read_text() == "jpeg bytes"
@@ -0,0 +1,62 @@
+import sys
+import threading
+import time
+
+from device_pool import DevicePool, per_device, resolve_devices, summarize_devices
+
+
+def test_results_in_order_spread_over_devices():
+    pool = DevicePool(["A", "B"], poll_s=0.01)
+    out = list(pool.imap(range(8), lambda serial, i, item: item * 2))
+    assert [(i, result) for i, _, result, _ in out] == [(i, i * 2) for i in range(8)]
+    assert {serial for _, _, _, serial in out} <= {"A", "B"}
+    assert sum(st["done"] for st in pool.stats.values()) == 8
+
+
+def test_a_failed_sample_is_retried_on_another_device(capsys):
+    def work(serial, i, item):
+        if serial == "A" and i == 0:
+            raise ConnectionResetError("adb went away")
+        return serial
+
+    out = list(DevicePool(["A", "B"], poll_s=0.01).imap([0, 1, 2], work))
+    assert all(result is not None for _, _, result, _ in out)
+    assert out[0][2] == "B"
+
+
+def test_a_failing_device_is_dropped(capsys):
+    lock, calls = threading.Lock(), {"A": 0, "B": 0}
+
+    def work(serial, i, item):
+        with lock:
+            calls[serial] += 1
+        if serial == "A":
+            return None
+        time.sleep(0.05)  # B is slow, so A gets to fail more than one sample
+        return item
+
+    pool = DevicePool(["A", "B"], retries=5, max_device_failures=2, poll_s=0.01)
+    out = list(pool.imap(range(6), work))
+    assert [result for _, _, result, _ in out] == list(range(6))
+    assert calls["A"] == 2
+    assert "A failed 2 samples in a row, removing it from the pool" in capsys.readouterr().out
+
+
+def test_samples_fail_when_every_device_is_gone():
+    pool = DevicePool(["A"], retries=1, max_device_failures=1, poll_s=0.01)
+    out = list(pool.imap(range(3), lambda serial, i, item: None))
+    assert [result for _, _, result, _ in out] == [None, None, None]
+
+
+def test_resolve_devices(workdir, monkeypatch):
+    assert resolve_devices(None) == [None]
+    assert resolve_devices("A, B,") == ["A", "B"]
+    monkeypatch.setenv("ADB", f"{sys.executable} {workdir / 'fake_adb.py'}")
+    monkeypatch.setenv("FAKE_ADB_DEVICES", "X,Y")
+    assert resolve_devices("all") == ["X", "Y"]
+
+
+def test_per_device_and_summary():
+    assert per_device(["A", "B", None], lambda s: s) == {"A": "A", "B": "B"}
+    records = [{"device": "A", "latency": 1.0}, {"device": "A", "latency": 3.0}, {"device": None, "latency": None}]
+    assert summarize_devices(records) == {"A": {"n": 2, "mean": 2.0}, "default": {"n": 1, "mean": 0.0}}
@@ -0,0 +1,72 @@
+import sys
+import time
+
+import pytest
+
+from energy import PowerSampler, format_energy, start_sampler, summarize_energy
+
+
+def sampler_with(samples):
+    sampler = PowerSampler()
+    sampler.samples = list(samples)
+    return sampler
+
+
+def test_energy_integrates_battery_draw():
+    sampler = sampler_with([(0.0, 2.0, True), (1.0, 4.0, True), (2.0, 4.0, True)])
+    assert sampler.energy(0.0, 2.0) == pytest.approx(3.0 + 4.0)
+    assert sampler.energy(0.5, 1.0) == pytest.approx(0.5 * (3.0 + 4.0) / 2)
+    assert sampler.energy(1.0, 1.0) == 0.0
+    assert PowerSampler().energy(0.0, 1.0) is None
+
+
+def test_negative_energy_is_not_reported(capsys):
+    sampler = sampler_with([(0.0, -2.0, True), (1.0, -2.0, True)])
+    assert sampler.energy(0.0, 1.0) is None
+    assert "[WARN] battery readings integrate to -2.000 J" in capsys.readouterr().out
+
+
+def test_samples_on_a_charger_get_no_energy():
+    sampler = sampler_with([(0.0, 2.0, True), (1.0, 2.0, True), (2.0, -5.0, False), (3.0, 2.0, True)])
+    assert sampler.energy(0.0, 1.0) is not None
+    # the charging sample right after the window is interpolated into it
+    assert sampler.on_charger(0.5, 1.5)
+    assert sampler.energy(0.5, 1.5) is None
+    fields = sampler.phase_energy(1.5, 3.0, prefill_ms=500, prompt_tokens=10, decode_ms=500, decode_tokens=5)
+    assert fields["on_charger"] and fields["energy_j"] is None and fields["j_per_decode_token"] is None
+
+
+def test_summarize_energy_counts_charger_samples():
+    records = [{"energy_j": 2.0, "j_per_prefill_token": 0.1, "prompt_tokens": 10, "j_per_decode_token": 0.2,
+                "decode_tokens": 5, "on_charger": False},
+               {"energy_j": None, "j_per_prefill_token": None, "prompt_tokens": 10, "j_per_decode_token": None,
+                "decode_tokens": 5, "on_charger": True}]
+    summary = summarize_energy(records)
+    assert summary["energy_j"] == 2.0 and summary["n_on_charger"] == 1
+    assert format_energy(summary).endswith("(1 samples on a charger left out)")
+    assert format_energy(summarize_energy(records[1:])).startswith("n/a J total")
+
+
+@pytest.mark.parametrize("status, sign, on_charger", [("Discharging", "-", False), ("Discharging", "+", False),
+                                                      ("Charging", "-", True), ("Not charging", "-", True)])
+def test_sampler_reads_battery_status(workdir, monkeypatch, capsys, status, sign, on_charger):
+    monkeypatch.setenv("ADB", f"{sys.executable} {workdir / 'fake_adb.py'}")
+    monkeypatch.setenv("FAKE_ADB_STATE", str(workdir / "state.json"))
+    monkeypatch.setenv("FAKE_ADB_BATTERY", status)
+    # gauges disagree on the sign of current_now while discharging
+    monkeypatch.setenv("FAKE_ADB_DISCHARGE_SIGN", sign)
+    sampler = start_sampler(interval_s=0.05)
+    try:
+        t0 = time.time()
+        time.sleep(0.3)
+        energy = sampler.phase_energy(t0, time.time())
+    finally:
+        sampler.stop()
+    assert sampler.status == status
+    assert energy["on_charger"] is on_charger
+    if on_charger:
+        assert energy["energy_j"] is None
+        assert f"battery status is '{status}'" in capsys.readouterr().out
+    else:
+        # 0.4 A idle draw at 3.9 V
+        assert energy["energy_j"] == pytest.approx(0.3 * 0.4 * 3.9, rel=0.2)
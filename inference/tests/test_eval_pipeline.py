@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+
+from eval_pipeline import run_pipelined
+
+
+def test_results_come_back_in_order_and_batched():
+    batches, seen = [], []
+
+    def score(batch):
+        batches.append(len(batch))
+        return [gen + 1 for _, _, gen in batch]
+
+    results, stats, failed = run_pipelined(range(10), lambda i, s: s * 10, score,
+                                           on_result=lambda i, s, gen, sc: seen.append((i, sc)), batch_size=4)
+    assert [(i, score) for i, _, _, score in results] == seen == [(i, i * 10 + 1) for i in range(10)]
+    assert failed == [] and max(batches) <= 4 and sum(batches) == 10 and stats.batches == len(batches)
+
+
+def test_failed_generations_are_skipped_or_stop_the_run():
+    def generate(i, s):
+        return None if i == 2 else s
+
+    results, _, failed = run_pipelined(range(5), generate, lambda batch: [0] * len(batch))
+    assert [i for i, _, _, _ in results] == [0, 1, 3, 4] and failed == [2]
+    results, _, failed = run_pipelined(range(5), generate, lambda batch: [0] * len(batch), stop_on_failure=True)
+    assert [i for i, _, _, _ in results] == [0, 1] and failed == [2]
+
+
+def test_generation_errors_reach_the_caller():
+    def generate(i, s):
+        if i == 1:
+            raise ConnectionResetError("adb went away")
+        return s
+
+    with pytest.raises(ConnectionResetError):
+        run_pipelined(range(3), generate, lambda batch: [0] * len(batch))
+
+
+def test_generation_overlaps_scoring():
+    scoring = threading.Event()
+    overlapped = []
+
+    def generate(i, s):
+        # sample 1 is generated while sample 0 is being scored
+        if i == 1:
+            overlapped.append(scoring.wait(timeout=5))
+        return s
+
+    def score(batch):
+        scoring.set()
+        if batch[0][0] == 0:
+            while not overlapped:
+                threading.Event().wait(0.01)
+        return [0] * len(batch)
+
+    run_pipelined(range(2), generate, score, batch_size=1)
+    assert overlapped == [True]
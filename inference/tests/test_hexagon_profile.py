@@ -0,0 +1,53 @@
+from hexagon_profile import iter_ops, summarize
+
+# filled-in HEX_PROFILE / HEX_VERBOSE format strings of ggml-hexagon.cpp
+# (ggml_hexagon_mul_mat, ggml_hexagon_mul_mat_id, the unary ops and the three-source ops)
+MUL_MAT = ("ggml-hex: HTP0 MUL_MAT blk.3.ffn_up.weight 2048:8192:1:1 x ffn_norm-3 2048:7:1:1 -> ffn_up-3 8192:7:1:1 : "
+           "op-usec 412 op-cycles 520000 op-pkts 61000 (8.524590) call-usec 655")
+MUL_MAT_ID_VERBOSE = ("ggml-hex: HTP0 MUL_MAT_ID: blk.5.ffn_up_exps.weight x ffn_moe_norm-5 (reshaped) x "
+                      "ffn_moe_topk-5 -> ffn_moe_up-5 : 2048:1024:32:1 x 2048:1:7:1 x 4:7:1:1 -> 1024:4:7:1 : "
+                      "q4_0 x f32 x i32 -> f32 : 0:0:0:0 x 0:0:0:0 x 0:0:0:0 -> 0:0:0:0 : "
+                      "HTP0-REPACK x HTP0 x HTP0 -> HTP0: flags 0x0")
+MUL_MAT_ID = ("ggml-hex: HTP0 matmul-id blk.5.ffn_up_exps.weight 2048:1024:32:1 x ffn_moe_norm-5 (reshaped) 2048:1:7:1 "
+              "(ffn_moe_topk-5 4:7:1:1) -> ffn_moe_up-5 1024:4:7:1 : op-usec 812 op-cycles 1000000 op-pkts 120000 "
+              "(8.333333) call-usec 1020")
+UNARY = ("ggml-hex: HTP1 RMS_NORM l_out-4 2048:7:1:1 -> attn_norm-5 2048:7:1:1 : op-usec 30 op-cycles 36000 "
+         "op-pkts 4000 (9.000000) call-usec 80")
+ROPE = ("ggml-hex: HTP0 ROPE Qcur-5 64:32:7:1 x inp_pos 7:1:1:1 x rope_freqs.weight 32:1:1:1 -> Qcur-5 (rope) "
+        "64:32:7:1 : op-usec 25 op-cycles 30000 op-pkts 3000 (10.000000) call-usec 60")
+
+
+def test_profile_lines():
+    ops = list(iter_ops([MUL_MAT, UNARY, ROPE]))
+    assert [(r["op"], r["session"], r["layer"]) for r in ops] == [("MUL_MAT", "HTP0", 3), ("RMS_NORM", "HTP1", 5),
+                                                                  ("ROPE", "HTP0", 5)]
+    assert ops[0]["names"] == ["blk.3.ffn_up.weight", "ffn_norm-3", "ffn_up-3"]
+    assert ops[0]["dims"][2] == [8192, 7, 1, 1]
+    assert (ops[0]["op_usec"], ops[0]["op_cycles"], ops[0]["op_pkts"], ops[0]["call_usec"]) == (412, 520000, 61000, 655)
+    assert ops[2]["names"] == ["Qcur-5", "inp_pos", "rope_freqs.weight", "Qcur-5 (rope)"]
+    # back-to-back synthetic clock without timestamps
+    assert [r["ts_us"] for r in ops] == [0, 655, 735]
+
+
+def test_mul_mat_id_lines():
+    (rec,) = iter_ops([MUL_MAT_ID_VERBOSE, MUL_MAT_ID])
+    assert rec["op"] == "MUL_MAT_ID"
+    assert rec["names"] == ["blk.5.ffn_up_exps.weight", "ffn_moe_norm-5 (reshaped)", "ffn_moe_topk-5", "ffn_moe_up-5"]
+    assert rec["dims"] == [[2048, 1024, 32, 1], [2048, 1, 7, 1], [4, 7, 1, 1], [1024, 4, 7, 1]]
+    assert rec["types"] == ["q4_0", "f32", "i32", "f32"]
+    assert rec["layer"] == 5
+    assert (rec["op_usec"], rec["call_usec"]) == (812, 1020)
+    summary = summarize(iter_ops([MUL_MAT, MUL_MAT_ID, MUL_MAT_ID]))
+    assert summary["ops"] == 3
+    assert [(r["key"], r["count"], r["op_usec"]) for r in summary["by_op"]] == [("MUL_MAT_ID", 2, 1624),
+                                                                                ("MUL_MAT", 1, 412)]
+
+
+def test_transfers_and_timestamps():
+    lines = ["0.01.000.000 I ggml-hex: HTP0 graph-compute n_nodes 2",
+             "0.01.000.500 I " + MUL_MAT,
+             "0.01.001.000 I ggml-hex: HTP0 get-tensor result_output : data 0x7f00000000 offset 0 size 513024",
+             "0.01.001.250 I ggml-hex: HTP0 synchronize"]
+    op, transfer = iter_ops(lines)
+    assert op["graph"] == 0 and op["ts_us"] == 1000500 - 655
+    assert (transfer["kind"], transfer["bytes"], transfer["dur_us"]) == ("get-tensor", 513024, 250)
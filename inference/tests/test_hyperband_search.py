@@ -0,0 +1,57 @@
+import csv
+
+import pytest
+
+pytest.importorskip("numpy")  # sweep_common -> truthful_qa_eval
+
+from hyperband_search import HyperbandSearch, fidelity_levels, hyperband_brackets, objective
+from sweep_common import CONFIG_COLUMNS
+
+
+def test_fidelity_levels_end_at_max_samples():
+    assert fidelity_levels(1, 27, 3) == [1, 3, 9, 27]
+    assert fidelity_levels(3, 25, 3) == [3, 9, 25]
+    assert fidelity_levels(25, 25, 3) == [25]
+
+
+def test_hyperband_brackets():
+    assert hyperband_brackets(1, 27, 3) == [
+        (27, [1, 3, 9, 27]),
+        (12, [3, 9, 27]),
+        (6, [9, 27]),
+        (4, [27]),
+    ]
+    assert hyperband_brackets(3, 25, 3) == [(9, [3, 9, 25]), (5, [9, 25]), (3, [25])]
+
+
+def test_objective_ranks_failed_runs_last():
+    assert objective({"accuracy": None}, 0.5, 20.0) == float("-inf")
+    assert objective({"accuracy": 0.5, "avg_decode_speed": 10.0}, 0.5, 20.0) == 0.75
+    assert objective({"accuracy": 0.5, "avg_decode_speed": None}, 0.5, 20.0) == 0.5
+
+
+class FakeEvaluator:
+    """Accuracy grows with top_k, so the top_k=80 config has to survive every rung."""
+
+    def __init__(self):
+        self.calls = []
+
+    def evaluate(self, cfg, run_dir, n_samples):
+        self.calls.append((cfg["top_k"], n_samples))
+        return {"accuracy": cfg["top_k"] / 100.0, "bleurt_score": 0.0, "avg_prefill_speed": None,
+                "avg_decode_speed": 0.0, "avg_total_speed": None, "runtime_seconds": n_samples}
+
+
+def test_successive_halving_promotes_the_best_third(tmp_path):
+    search = HyperbandSearch(FakeEvaluator(), str(tmp_path), eta=3, seed=0)
+    base = search.new_configs(1)[0]
+    configs = [dict(base, top_k=k, temperature=t) for k in (20, 40, 60, 80) for t in (0.3, 0.7)] + \
+              [dict(base, top_k=80, temperature=0.8)]
+    rows = search.successive_halving(configs, [1, 3, 9])
+    assert [n for _, n in search.evaluator.calls] == [1] * 9 + [3] * 3 + [9]
+    assert [k for k, n in search.evaluator.calls if n > 1] == [80] * 4
+    # runtimes add up over the rungs a config ran in
+    assert rows[0]["runtime_seconds"] == 1 + 3 + 9
+    with open(tmp_path / "results.csv", encoding="utf-8", newline="") as f:
+        (row,) = csv.DictReader(f)
+    assert {k: row[k] for k in CONFIG_COLUMNS} == {k: str(rows[0][k]) for k in CONFIG_COLUMNS}
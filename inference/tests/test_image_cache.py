@@ -0,0 +1,41 @@
+import io
+import os
+import sys
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "example-vqa"))
+
+from image_cache import JPEG_QUALITY, ImageCache  # noqa: E402
+
+
+def png(width, height):
+    buf = io.BytesIO()
+    Image.new("RGBA", (width, height), (200, 30, 30, 255)).save(buf, "PNG")
+    return {"bytes": buf.getvalue(), "path": None}
+
+
+def test_images_keep_their_size_and_the_baseline_quality_by_default(tmp_path):
+    cache = ImageCache(str(tmp_path), "org/set_test")
+    path, _ = cache.get(0, png(640, 480))
+    assert cache.quality == JPEG_QUALITY == 75
+    assert Image.open(path).size == (640, 480)
+
+
+def test_image_size_only_shrinks(tmp_path):
+    cache = ImageCache(str(tmp_path), "org/set_test", size=336)
+    assert Image.open(cache.get(0, png(672, 336))[0]).size == (336, 168)
+    assert Image.open(cache.get(1, png(100, 50))[0]).size == (100, 50)
+
+
+def test_prefetch_keeps_order_and_reuses_the_index(tmp_path):
+    rows = [(i, {"image": png(8 + i, 8)}) for i in range(5)] + [(5, {"image": None})]
+    cache = ImageCache(str(tmp_path), "org/set_test")
+    first = [(row, path, digest) for row, _, path, digest in cache.prefetch(rows, workers=2, ahead=2)]
+    assert [row for row, _, _ in first] == list(range(6))
+    assert first[5][1:] == (None, None)
+    again = ImageCache(str(tmp_path), "org/set_test")
+    assert [(row, path, digest) for row, _, path, digest in again.prefetch(rows)] == first
+    assert (again.hits, again.misses) == (5, 0)
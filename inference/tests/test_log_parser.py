@@ -0,0 +1,68 @@
+from log_parser import iter_records, mtmd_timings, percentile, summarize
+
+# lines in the formats of llama_perf_context_print / llama_perf_sampler_print (src/llama-context.cpp,
+# src/llama-sampling.cpp), llama_context's graph splits and llama_kv_cache's size line
+RUN = """\
++ adb -s fake0 shell 'cd /data/local/tmp && ./llama-cli -no-cnv -f p.txt'
+build: 6123 (abcdef0) with clang for aarch64
+llama_kv_cache: size =  448.00 MiB (  4096 cells,  28 layers,  1/1 seqs), K (f16):  224.00 MiB, V (f16):  224.00 MiB
+llama_context: graph splits = 1
+main: prompt (5000 tokens) exceeds context (4096), will use context shifting during processing
+llama_perf_sampler_print:    sampling time =      12.50 ms /   251 runs   (    0.05 ms per token, 20080.00 tokens per second)
+llama_perf_context_print:        load time =     812.34 ms
+llama_perf_context_print: prompt eval time =    2000.00 ms /   100 tokens (   20.00 ms per token,    50.00 tokens per second)
+llama_perf_context_print:        eval time =    5000.00 ms /    50 runs   (  100.00 ms per token,    10.00 tokens per second)
+llama_perf_context_print:       total time =    7500.00 ms /   150 tokens
+llama_perf_context_print:    graphs reused =         49
+"""
+
+
+def test_iter_records_parses_one_invocation():
+    (rec,) = iter_records(RUN.splitlines())
+    assert rec["cmd"].startswith("adb -s fake0 shell")
+    assert rec["kv_cache_mib"] == 448.0
+    assert rec["graph_splits"] == 1
+    assert rec["prompt_exceeds_ctx"] == 5000
+    assert (rec["sampling_ms"], rec["sampling_runs"]) == (12.5, 251)
+    assert rec["load_ms"] == 812.34
+    assert (rec["prefill_ms"], rec["prompt_tokens"]) == (2000.0, 100)
+    assert (rec["decode_ms"], rec["decode_runs"]) == (5000.0, 50)
+    assert (rec["total_ms"], rec["total_tokens"]) == (7500.0, 150)
+    assert rec["graphs_reused"] == 49
+    assert rec["prefill_tps"] == 50.0
+    assert rec["decode_tps"] == 10.0
+
+
+def test_iter_records_splits_runs_with_and_without_start_markers():
+    perf_only = "\n".join(line for line in RUN.splitlines() if line.startswith("llama_perf"))
+    records = list(iter_records((RUN + RUN + perf_only).splitlines()))
+    assert [r["index"] for r in records] == [0, 1, 2]
+    assert all(r["total_tokens"] == 150 for r in records)
+    assert records[2]["cmd"] is None
+
+
+def test_iter_records_ignores_runs_without_perf_output():
+    lines = ["+ adb shell ./llama-cli", "build: 6123 (abcdef0)", "error: failed to load model"]
+    assert list(iter_records(lines)) == []
+
+
+def test_summarize_weights_by_tokens():
+    fast = RUN
+    slow = RUN.replace("2000.00 ms /   100 tokens", "1000.00 ms /    10 tokens")
+    summary = summarize(iter_records((fast + slow).splitlines()))
+    assert summary["invocations"] == 2
+    # 110 tokens in 3000 ms, not the mean of 50 and 10 tokens/s
+    assert abs(summary["prefill"]["weighted_tps"] - 110 / 3.0) < 1e-9
+    assert summary["prefill"]["mean_tps"] == 30.0
+
+
+def test_percentile_interpolates():
+    assert percentile([], 50) is None
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile([5], 99) == 5
+
+
+def test_mtmd_timings():
+    lines = ["image slice encoded in 400 ms", "image decoded (batch 1/1) in 120 ms",
+             "image slice encoded in 300 ms", "image decoded (batch 1/1) in 100 ms"]
+    assert mtmd_timings(lines) == {"image_slices": 2, "image_encode_ms": 700.0, "image_decode_ms": 220.0}
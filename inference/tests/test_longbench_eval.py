@@ -0,0 +1,39 @@
+import pytest
+
+from longbench_eval import ROUGE_TYPES, aggregate, evaluate_subsets, score_pair
+
+PAIRS = [
+    ("The team agreed to cut the budget.", "The team decided to reduce the budget to twelve euros."),
+    ("Marketing presented the trends.\nThey liked the fruit theme.",
+     "Marketing presented trend research.\nThe group liked the fruit and vegetable theme."),
+    ("", "Nothing was decided."),
+    ("Running runners ran quickly", "runs ran running quick"),
+]
+
+
+@pytest.mark.parametrize("prediction, reference", PAIRS)
+def test_score_pair_is_rouge_score_f1(prediction, reference):
+    rouge_scorer = pytest.importorskip("rouge_score.rouge_scorer")
+    pytest.importorskip("nltk")
+    expected = rouge_scorer.RougeScorer(ROUGE_TYPES, use_stemmer=True).score(reference, prediction)
+    scores = score_pair(prediction, reference)
+    for rouge_type in ROUGE_TYPES:
+        assert scores[rouge_type] == pytest.approx(expected[rouge_type].fmeasure)
+
+
+def test_aggregate_skips_zero_rouge_l():
+    scores = [dict.fromkeys(ROUGE_TYPES, 0.5), dict.fromkeys(ROUGE_TYPES, 0.0)]
+    assert aggregate(scores) == dict.fromkeys(ROUGE_TYPES, 0.5)
+    assert aggregate([]) == dict.fromkeys(ROUGE_TYPES, 0.0)
+
+
+def test_evaluate_subsets(tmp_path):
+    pytest.importorskip("rouge_score")
+    pytest.importorskip("nltk")
+    for i, (pred, _) in enumerate(PAIRS):
+        (tmp_path / f"qmsum_test_{i}.txt").write_text(pred, encoding="utf-8")
+    (tmp_path / "latencies.jsonl").write_text("")
+    refs = {"qmsum": {i: ref for i, (_, ref) in enumerate(PAIRS)}}
+    per_sample, agg = evaluate_subsets(str(tmp_path), refs, workers=1)["qmsum"]
+    assert [idx for idx, _ in per_sample] == list(range(len(PAIRS)))
+    assert per_sample[0][1] == pytest.approx(score_pair(*PAIRS[0])["rougeL"])
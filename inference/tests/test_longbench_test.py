@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+import longbench_test
+from longbench_test import order_prompts, run_all
+from server_backend import StubServer
+
+
+class FlakyStub(StubServer):
+    """Stub server that drops the connection for prompts containing `fail_on`."""
+
+    def __init__(self, fail_on):
+        super().__init__()
+        self.fail_on = fail_on
+
+    def complete(self, prompt, n_predict, **params):
+        if self.fail_on in prompt:
+            raise ConnectionResetError("connection reset by peer")
+        return super().complete(prompt, n_predict, **params)
+
+
+def write_prompts(prompt_dir, n=3):
+    prompt_dir.mkdir()
+    for i in range(n):
+        words = " ".join(f"w{j}" for j in range(10 * (i + 1)))
+        (prompt_dir / f"qmsum_test_{i}.prompt.txt").write_text(f"Transcript:\n{words}\nQuery: q{i}?", encoding="utf-8")
+
+
+def test_run_all_stub_server(workdir):
+    write_prompts(workdir / "prompts")
+    latencies, total = run_all(str(workdir / "prompts"), "/data/local/tmp/prompts", str(workdir / "out"),
+                               "./run-cli-streamllm.sh", servers={None: StubServer()})
+    assert [r["sample"] for r in latencies] == [f"qmsum_test_{i}.prompt.txt" for i in range(3)]
+    assert all(r["latency"] > 0 and r["prompt_n"] > 0 for r in latencies)
+    assert total >= sum(r["latency"] for r in latencies) * 0.5
+    # the stub echoes the end of the prompt
+    assert (workdir / "out" / "qmsum_test_2.txt").read_text(encoding="utf-8").endswith("q2?")
+    with open(workdir / "out" / "latencies.jsonl", encoding="utf-8") as f:
+        assert [json.loads(line)["sample"] for line in f] == [r["sample"] for r in latencies]
+    assert (workdir / "out" / "server_timings.jsonl").is_file()
+
+
+def test_failed_request_is_flagged_not_timed(workdir):
+    write_prompts(workdir / "prompts")
+    latencies, _ = run_all(str(workdir / "prompts"), "/data/local/tmp/prompts", str(workdir / "out"),
+                           "./run-cli-streamllm.sh", servers={None: FlakyStub("q1?")})
+    assert [r.get("failed", False) for r in latencies] == [False, True, False]
+    assert "prompt_n" not in latencies[1]
+
+
+def test_run_all_cleans_up_after_an_error(workdir, monkeypatch):
+    write_prompts(workdir / "prompts")
+    server = StubServer()
+
+    def broken(*args):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(longbench_test, "run_one_server", broken)
+    with pytest.raises(RuntimeError, match="boom"):
+        run_all(str(workdir / "prompts"), "/data/local/tmp/prompts", str(workdir / "out"),
+                "./run-cli-streamllm.sh", servers={None: server})
+    assert server.thread is None
+    assert not server.healthy()
+
+
+def test_order_prompts_uses_manifest_lengths(tmp_path):
+    write_prompts(tmp_path / "prompts")
+    files = sorted((tmp_path / "prompts").glob("*.prompt.txt"))
+    assert order_prompts(files, str(tmp_path / "prompts")) == files
+    assert [f.name for f in order_prompts(files, str(tmp_path / "prompts"), "longest")] == \
+        [f.name for f in reversed(files)]
+    manifest = {"prompts": [{"file": f.name, "tokens": t} for f, t in zip(files, (30, 10, 20))]}
+    (tmp_path / "prompts" / "manifest.json").write_text(json.dumps(manifest))
+    assert [f.name for f in order_prompts(files, str(tmp_path / "prompts"), "shortest")] == \
+        [files[1].name, files[2].name, files[0].name]
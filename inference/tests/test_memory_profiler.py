@@ -0,0 +1,97 @@
+import json
+import sys
+import time
+
+import pytest
+
+from memory_profiler import MemorySampler, format_memory, parse_line, stream_cmd, summarize_memory
+
+KV_LOG = ("llama_kv_cache: size =  224.00 MiB (  4096 cells,  28 layers,  1/1 seqs)\n"
+          "llama_perf_context_print:       total time =    1000.00 ms /    20 tokens\n")
+
+
+def sampler_with(samples, interval_s=0.5):
+    sampler = MemorySampler(interval_s=interval_s)
+    sampler.samples = list(samples)
+    return sampler
+
+
+def test_parse_line_reads_each_kind():
+    assert parse_line("pid 4242 VmHWM:\t2048 kB VmRSS:\t1024 kB RssFile:\t512 kB ") == \
+        ("pid", 4242, {"VmHWM": 2.0, "VmRSS": 1.0, "RssFile": 0.5})
+    assert parse_line("mem MemTotal:  8192 kB MemAvailable:  4096 kB ") == \
+        ("mem", None, {"MemTotal": 8.0, "MemAvailable": 4.0})
+    assert parse_line("pss 4242            TOTAL PSS:  3072            TOTAL RSS:  4096") == \
+        ("pss", 4242, {"pss": 3.0})
+    # older dumpsys prints a bare TOTAL row
+    assert parse_line("pss 4242    TOTAL    2048    100") == ("pss", 4242, {"pss": 2.0})
+    for line in ("", "pid", "pid abc VmRSS: 1 kB", "pss 4242 ", "llama-cli: error"):
+        assert parse_line(line) is None
+
+
+def test_stream_cmd_runs_dumpsys_only_when_asked():
+    assert "dumpsys" not in stream_cmd(0.5, dumpsys_every=0)
+    cmd = stream_cmd(0.5, process="llama-server", proc_root="/tmp/proc", dumpsys_every=4)
+    assert "i % 4" in cmd and "pidof llama-server" in cmd and cmd.startswith("P=/tmp/proc;")
+
+
+def test_window_takes_peaks_and_the_lowest_available_memory():
+    sampler = sampler_with([
+        (0.5, "mem", None, {"MemAvailable": 900.0}),
+        (1.0, "pid", 7, {"VmRSS": 100.0, "VmHWM": 120.0, "RssFile": 80.0, "RssAnon": 20.0}),
+        (1.5, "mem", None, {"MemAvailable": 700.0}),
+        (2.0, "pid", 7, {"VmRSS": 150.0, "VmHWM": 150.0, "RssFile": 90.0, "RssAnon": 60.0}),
+        (2.4, "pss", 7, {"pss": 140.0}),
+        (3.0, "pid", 7, {"VmRSS": 999.0}),
+    ])
+    assert sampler.window(1.0, 2.0) == {"peak_rss_mb": 150.0, "mmap_resident_mb": 90.0, "anon_rss_mb": 60.0,
+                                        "pss_mb": 140.0, "min_available_mb": 700.0}
+    assert all(v is None for v in sampler.window(5.0, 6.0).values())
+
+    fields = sampler.cli_memory(1.0, 2.0, KV_LOG)
+    assert fields["kv_cache_mib"] == 224.0 and fields["peak_rss_mb"] == 150.0
+    assert sampler.cli_memory(1.0, 2.0, "")["kv_cache_mib"] is None
+
+
+def test_summarize_and_format_memory():
+    records = [{"peak_rss_mb": 100.0, "kv_cache_mib": 224.0, "mmap_resident_mb": None},
+               {"peak_rss_mb": 300.0, "kv_cache_mib": None, "mmap_resident_mb": None}]
+    summary = summarize_memory(records)
+    assert summary == {"peak_rss_mb": 300.0, "kv_cache_mib": 224.0, "mmap_resident_mb": None}
+    assert format_memory(summary) == "peak RSS 300 MB, KV cache 224 MB, mmap resident n/a"
+
+
+def test_local_sampler_reads_a_stand_in_proc_tree(tmp_path):
+    (tmp_path / "meminfo").write_text("MemTotal:       8000000 kB\nMemFree:  1 kB\nMemAvailable:   4000000 kB\n")
+    sampler = MemorySampler(interval_s=0.05, process="no-such-process", dumpsys_every=10, local=True,
+                            proc_root=str(tmp_path))
+    assert sampler.dumpsys_every == 0
+    sampler.start()
+    try:
+        assert sampler.wait_ready(timeout=5.0)
+    finally:
+        sampler.stop()
+    _, kind, pid, values = sampler.samples[0]
+    assert (kind, pid) == ("mem", None)
+    assert values == {"MemTotal": pytest.approx(8000000 / 1024), "MemAvailable": pytest.approx(4000000 / 1024)}
+
+
+def test_sampler_over_fake_adb_sees_the_busy_process(workdir, monkeypatch):
+    state = workdir / "fake_adb.json"
+    state.write_text(json.dumps({"temp_c": 30.0, "time": time.time(), "busy": True}))
+    monkeypatch.setenv("ADB", f"{sys.executable} {workdir / 'fake_adb.py'}")
+    monkeypatch.setenv("FAKE_ADB_STATE", str(state))
+    sampler = MemorySampler(interval_s=0.05, dumpsys_every=1).start()
+    try:
+        start = time.time()
+        assert sampler.wait_ready(timeout=10.0)
+        deadline = time.time() + 10.0
+        while not any(kind == "pss" for _, kind, _, _ in sampler.samples) and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        sampler.stop()
+    fields = sampler.window(start, time.time())
+    assert fields["peak_rss_mb"] == pytest.approx(2700000 / 1024)
+    assert fields["mmap_resident_mb"] == pytest.approx(2030000 / 1024)
+    assert fields["pss_mb"] == pytest.approx(2400000 / 1024)
+    assert fields["min_available_mb"] is not None
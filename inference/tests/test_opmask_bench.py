@@ -0,0 +1,72 @@
+import math
+
+import pytest
+
+from opmask_bench import PHASES, attribute, converged, mean_ci, print_report, t95
+
+
+def stats_for(runs_by_key):
+    """Per-config stats the way main() builds them from the per-run samples."""
+    stats = {}
+    for key, runs in runs_by_key.items():
+        stats[key] = {"n": len(runs)}
+        for phase, _, _ in PHASES:
+            stats[key][phase] = mean_ci([s[phase] for s in runs if s[phase] is not None])
+    return stats
+
+
+def runs(prefill, decode, spread=0.0):
+    return [{"prefill": prefill + d, "decode": decode + d} for d in (-spread, 0.0, spread)]
+
+
+def test_mean_ci_uses_student_t():
+    assert mean_ci([]) == (None, None, None)
+    assert mean_ci([2.0]) == (2.0, None, None)
+    mean, ci, se = mean_ci([1.0, 2.0, 3.0])
+    assert mean == 2.0 and se == pytest.approx(1.0 / math.sqrt(3))
+    assert ci == pytest.approx(4.303 * se)
+    assert t95(1) == 12.706 and t95(100) == 1.96
+
+
+def test_converged_needs_runs_and_a_tight_ci():
+    tight = runs(10.0, 20.0, spread=0.1)
+    assert converged(tight, rel_ci=0.05, min_runs=3)
+    assert not converged(tight, rel_ci=0.05, min_runs=4)
+    assert not converged(runs(10.0, 20.0, spread=5.0), rel_ci=0.05, min_runs=3)
+    assert not converged([{"prefill": 1.0, "decode": None}] * 5, rel_ci=0.05, min_runs=3)
+
+
+def test_attribute_splits_stages_by_mask_differences(capsys):
+    stats = stats_for({("0x1", None, None): runs(1.0, 2.0, spread=0.1),
+                       ("0x3", None, None): runs(3.0, 3.0, spread=0.1),
+                       ("0x7", None, None): runs(10.0, 5.0, spread=0.1),
+                       # an incomplete mask set gets no attribution row
+                       ("0x1", 2, None): runs(1.0, 1.0)})
+    [row] = attribute(stats)
+    assert (row["NHVX"], row["NDEV"]) == (None, None)
+    prefill, decode = row["prefill"], row["decode"]
+    assert prefill["queue"]["ms_per_token"] == pytest.approx(1.0)
+    assert prefill["quantize"]["ms_per_token"] == pytest.approx(2.0)
+    assert prefill["compute"]["ms_per_token"] == pytest.approx(7.0)
+    assert prefill["compute_share"] == pytest.approx(0.7) and prefill["bound"] == "compute"
+    assert decode["compute_share"] == pytest.approx(0.4) and decode["bound"] == "dispatch"
+
+    # difference of two independent means: SEs add in quadrature, t at n - 1 dof
+    se = stats[("0x3", None, None)]["prefill"][2]
+    assert prefill["quantize"]["ci"] == pytest.approx(t95(2) * math.sqrt(2) * se)
+    assert prefill["queue"]["ci"] == pytest.approx(stats[("0x1", None, None)]["prefill"][1])
+
+    configs = {key: {"OPMASK": key[0], "NHVX": key[1], "NDEV": key[2]} for key in stats}
+    print_report(stats, [row], configs)
+    assert "compute 70%, compute-bound" in capsys.readouterr().out
+
+
+def test_attribute_without_samples_or_ci():
+    stats = stats_for({("0x1", 4, 1): [{"prefill": 1.0, "decode": None}],
+                       ("0x3", 4, 1): [{"prefill": 2.0, "decode": None}],
+                       ("0x7", 4, 1): [{"prefill": 4.0, "decode": None}]})
+    [row] = attribute(stats)
+    assert row["prefill"]["compute"] == {"ms_per_token": 2.0, "ci": None}
+    assert row["prefill"]["bound"] == "compute"
+    assert row["decode"]["total_ms_per_token"] is None and row["decode"]["bound"] is None
+    assert row["decode"]["queue"] == {"ms_per_token": None, "ci": None}
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from prepare_prompts import TokenCounts, Tokenizer, cut, fit, prepare, prompt_token_lengths
+from server_backend import StubServer
+
+IDS = list(range(10))
+
+
+@pytest.mark.parametrize("policy, head_tokens, expected", [
+    ("head", 0, ([0, 1, 2, 3], [])),
+    ("tail", 0, ([], [6, 7, 8, 9])),
+    ("head+tail", 1, ([0], [7, 8, 9])),
+    ("head+tail", 8, ([0, 1, 2, 3], [])),
+    ("middle", 0, ([0, 1], [8, 9])),
+])
+def test_cut(policy, head_tokens, expected):
+    assert cut(IDS, 4, policy, head_tokens) == expected
+
+
+def test_cut_bounds():
+    assert cut(IDS, 20, "middle", 0) == ([0, 1, 2, 3, 4], [5, 6, 7, 8, 9])
+    assert cut(IDS, -3, "tail", 0) == ([], [])
+    with pytest.raises(ValueError):
+        cut(IDS, 4, "none", 0)
+
+
+@pytest.fixture
+def tok():
+    tok = Tokenizer(StubServer)
+    yield tok
+    tok.stop()
+
+
+def test_tokenizer_counts_bos(tok):
+    assert tok.ids("a b c") == [2, 3, 4]
+    assert tok.n_special == 1
+    assert tok.count("a b c") == 4
+
+
+@pytest.mark.parametrize("policy", ["head", "tail", "head+tail", "middle"])
+def test_fit_stays_within_budget(tok, policy):
+    text = " ".join(f"w{i}" for i in range(100))
+    out, n = fit(tok, text, tok.count(text), 30, policy, head_tokens=5, marker="\n...\n")
+    assert n == tok.count(out) <= 30
+    words = out.split()
+    if policy in ("head", "head+tail"):
+        assert words[0] == "w0"
+    if policy in ("tail", "head+tail", "middle"):
+        assert words[-1] == "w99"
+    if policy in ("head+tail", "middle"):
+        assert "..." in words
+
+
+def test_fit_leaves_short_prompts_alone(tok):
+    assert fit(tok, "a b c", 4, 30, "head", 5, "") == ("a b c", 4)
+    assert fit(tok, "a b c", 4, 2, "none", 5, "") == ("a b c", 4)
+    assert tok.server is None
+
+
+def test_prepare_writes_manifest_entries_and_caches_counts(tmp_path, tok):
+    src = tmp_path / "prompts"
+    src.mkdir()
+    (src / "qmsum_test_0.prompt.txt").write_text("short prompt", encoding="utf-8")
+    (src / "qmsum_test_1.prompt.txt").write_text(" ".join(["word"] * 50), encoding="utf-8")
+    counts = TokenCounts("stub", str(tmp_path / "counts.json"))
+    entries = prepare(str(src), str(tmp_path / "out"), tok, counts, 20, "head")
+    assert [(e["file"], e["tokens"], e["source_tokens"], e["truncated"]) for e in entries] == [
+        ("qmsum_test_0.prompt.txt", 3, 3, False),
+        ("qmsum_test_1.prompt.txt", 20, 51, True),
+    ]
+    counts.save()
+    again = TokenCounts("stub", str(tmp_path / "counts.json"))
+    assert again.get("short prompt") == 3
+    assert TokenCounts("other", str(tmp_path / "counts.json")).get("short prompt") is None
+    # context_reduction.py's counts leave BOS out and must not be served these
+    nobos = TokenCounts("stub", str(tmp_path / "counts.json"), kind="nobos")
+    assert nobos.get("short prompt") is None
+    nobos.put("short prompt", 2)
+    nobos.save()
+    assert TokenCounts("stub", str(tmp_path / "counts.json")).get("short prompt") == 3
+
+    (tmp_path / "out" / "manifest.json").write_text(json.dumps({"prompts": entries}))
+    assert prompt_token_lengths(str(tmp_path / "out")) == {"qmsum_test_0.prompt.txt": 3, "qmsum_test_1.prompt.txt": 20}
+    assert prompt_token_lengths(str(tmp_path)) == {}
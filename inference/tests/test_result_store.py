@@ -0,0 +1,100 @@
+import hashlib
+import sys
+
+import pytest
+
+from result_store import (DEVICE_GGUF_DIR, ResultStore, arg_seed, cli_arg_set, model_fingerprint,
+                          script_model, shared_model_fingerprint)
+
+ARG_SET = {"script": "run-cli-streamllm.sh", "script_hash": "0" * 64, "env": {"M": "m.gguf"}, "args": ["-n", "25"]}
+
+
+def test_key_is_stable():
+    # a changed key silently invalidates every stored sample; bump this only on purpose
+    assert ResultStore.key("abc", ARG_SET, "What is 2+2?", 42) == \
+        "8a33c15f69fca1136548e86c4111cffdb4d846fc1d1a8d6520aacfcac1d5f22e"
+    reordered = {k: ARG_SET[k] for k in reversed(list(ARG_SET))}
+    assert ResultStore.key("abc", reordered, "What is 2+2?", "42") == ResultStore.key("abc", ARG_SET, "What is 2+2?", 42)
+
+
+def test_key_changes_with_every_input():
+    base = ResultStore.key("abc", ARG_SET, "q", 42)
+    assert ResultStore.key("abd", ARG_SET, "q", 42) != base
+    assert ResultStore.key("abc", dict(ARG_SET, args=["-n", "26"]), "q", 42) != base
+    assert ResultStore.key("abc", ARG_SET, "q ", 42) != base
+    assert ResultStore.key("abc", ARG_SET, "q", 43) != base
+
+
+def test_unseeded_runs_are_not_stored(tmp_path):
+    store = ResultStore(str(tmp_path))
+    assert ResultStore.key("abc", ARG_SET, "q", None) is None
+    assert ResultStore.key("abc", ARG_SET, "q", -1) is None
+    store.put(None, {"prediction": "x"})
+    assert store.get(None) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_put_get_update(tmp_path):
+    store = ResultStore(str(tmp_path))
+    key = ResultStore.key("abc", ARG_SET, "q", 42)
+    assert store.get(key) is None
+    store.put(key, {"prediction": "4", "latency": 1.5})
+    store.update(key, max_score=0.9)
+    assert store.get(key) == {"prediction": "4", "latency": 1.5, "max_score": 0.9}
+    assert (store.hits, store.misses) == (1, 1)
+    assert (tmp_path / key[:2] / f"{key}.json").is_file()
+
+
+def test_arg_seed():
+    assert arg_seed([]) == 42
+    assert arg_seed(["--seed", "7", "-n", "25"]) == 7
+    assert arg_seed(["-s", "-1"]) == -1
+
+
+def test_cli_arg_set_tracks_script_env_and_tuned_profile(workdir):
+    env = {"M": "m.gguf", "MODE": "CPU", "TUNED_PROFILE": str(workdir / "m_CPU.env")}
+    plain = cli_arg_set("./run-cli-streamllm.sh", ["-n", 25], env)
+    assert plain["args"] == ["-n", "25"]
+    assert plain["env"] == env
+    (workdir / "m_CPU.env").write_text("B=256\n")
+    assert "tuned_hash" in cli_arg_set("./run-cli-streamllm.sh", ["-n", 25], env)
+
+
+def test_cli_arg_set_and_script_model_follow_the_sourced_settings(workdir, monkeypatch):
+    monkeypatch.delenv("M", raising=False)
+    env = {"MODE": "CPU"}
+    before = cli_arg_set("./run-cli-streamllm.sh", [], env)["script_hash"]
+    common = workdir / "streamllm-common.sh"
+    common.write_text(common.read_text().replace('model="qwen2-7b-tinytron-Q4_K_M.gguf"', 'model="other.gguf"'))
+    assert cli_arg_set("./run-cli-streamllm.sh", [], env)["script_hash"] != before
+    assert script_model("./run-server-streamllm.sh") == "other.gguf"
+
+
+@pytest.fixture
+def two_devices(workdir, monkeypatch):
+    monkeypatch.setenv("ADB", f"{sys.executable} {workdir / 'fake_adb.py'}")
+    monkeypatch.setenv("FAKE_ADB_DEVICES", "A,B")
+    monkeypatch.setenv("TMPDIR", str(workdir))
+    monkeypatch.delenv("S", raising=False)
+    monkeypatch.delenv("ANDROID_SERIAL", raising=False)
+    return workdir
+
+
+def test_model_fingerprint_needs_a_serial_with_two_devices(two_devices):
+    with pytest.raises(RuntimeError, match="more than one device"):
+        model_fingerprint("m.gguf", cache_path="hashes.json")
+
+
+def test_shared_model_fingerprint_on_two_devices(two_devices):
+    remote = f"{DEVICE_GGUF_DIR}/m.gguf"
+    assert shared_model_fingerprint("m.gguf", ["A", "B"], cache_path="hashes.json") == \
+        hashlib.sha256(remote.encode()).hexdigest()
+
+
+def test_shared_model_fingerprint_rejects_different_models(two_devices):
+    for serial, content in (("A", b"gguf v1"), ("B", b"gguf v2")):
+        gguf_dir = two_devices / f"fake_adb_{serial}_tmp" / "gguf"
+        gguf_dir.mkdir(parents=True)
+        (gguf_dir / "m.gguf").write_bytes(content)
+    with pytest.raises(RuntimeError, match="m.gguf differs between devices"):
+        shared_model_fingerprint("m.gguf", ["A", "B"], cache_path="hashes.json")
@@ -0,0 +1,96 @@
+import csv
+import json
+import sqlite3
+
+from results_warehouse import Warehouse, pareto
+
+# the head of sweep_common.RESULTS_COLUMNS
+RESULTS_COLUMNS = ["run_id", "model", "mode", "top_k", "bleurt_score", "accuracy", "avg_prefill_speed",
+                   "avg_decode_speed", "avg_total_speed", "runtime_seconds"]
+
+
+def write_sweep(sweep_dir, samples, **extra):
+    run_dir = sweep_dir / "run_1"
+    run_dir.mkdir(parents=True)
+    row = dict.fromkeys(RESULTS_COLUMNS, "")
+    row.update(run_id=1, model="m.gguf", mode="CPU", top_k=40, accuracy=0.5, bleurt_score=0.4,
+               avg_decode_speed=12.5, runtime_seconds=30, **extra)
+    with open(sweep_dir / "results.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULTS_COLUMNS + list(extra))
+        writer.writeheader()
+        writer.writerow(row)
+    with open(run_dir / "samples.jsonl", "w", encoding="utf-8") as f:
+        for rec in samples:
+            f.write(json.dumps(rec) + "\n")
+    with open(run_dir / "perf.jsonl", "w", encoding="utf-8") as f:
+        f.write(json.dumps({"index": 0, "prompt_tokens": 20, "prefill_ms": 400.0, "decode_runs": 25,
+                            "decode_ms": 2000.0}) + "\n")
+    return run_dir
+
+
+SAMPLES = [{"sample": 0, "question": "What is up?", "latency": 2.5, "max_score": 0.7, "acc": 1, "output": "up"},
+           {"sample": 1, "question": "Why?", "latency": 3.0, "max_score": 0.2, "acc": 0, "output": "because"}]
+
+
+def test_ingest_python_sweep(tmp_path):
+    write_sweep(tmp_path / "hyperparam_search_1", SAMPLES)
+    wh = Warehouse(str(tmp_path / "results.sqlite"))
+    wh.ingest(str(tmp_path / "hyperparam_search_*"))
+    (run,) = wh.query("SELECT * FROM runs")
+    assert (run["model"], run["accuracy"], run["decode_tps"]) == ("m.gguf", 0.5, 12.5)
+    assert json.loads(run["config"])["top_k"] == 40
+    rows = wh.query("SELECT idx, question, latency_s, max_score, acc, output FROM samples ORDER BY idx")
+    assert [tuple(r) for r in rows] == [(0, "What is up?", 2.5, 0.7, 1, "up"), (1, "Why?", 3.0, 0.2, 0, "because")]
+    assert wh.query("SELECT prompt_tokens FROM perf")[0][0] == 20
+    # nothing changed: nothing is read again
+    assert wh.ingest_sweep(str(tmp_path / "hyperparam_search_1")) == (0, 0)
+    wh.close()
+
+
+def test_ingest_skips_a_partly_written_sample(tmp_path):
+    run_dir = write_sweep(tmp_path / "hyperparam_search_1", SAMPLES[:1])
+    with open(run_dir / "samples.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"sample": 1, "quest')
+    wh = Warehouse(str(tmp_path / "results.sqlite"))
+    wh.ingest(str(tmp_path / "hyperparam_search_*"))
+    assert [r["idx"] for r in wh.query("SELECT idx FROM samples")] == [0]
+    wh.close()
+
+
+def test_ingest_shell_sweep_eval_output(tmp_path):
+    run_dir = write_sweep(tmp_path / "hyperparam_search_1", [])
+    (run_dir / "samples.jsonl").unlink()
+    (run_dir / "eval_output.txt").write_text(
+        "-------- sample 0 --------\n"
+        "CMD: bash ./run-cli-streamllm.sh -no-cnv -p \"'What is up? '\" -n 25\n"
+        "    latency: 2.500 s.\n    max_score: 0.700\n    acc: 1\n", encoding="utf-8")
+    (run_dir / "tmp_output_0.txt").write_text("up\n", encoding="utf-8")
+    wh = Warehouse(str(tmp_path / "results.sqlite"))
+    wh.ingest(str(tmp_path / "hyperparam_search_*"))
+    (row,) = wh.query("SELECT question, latency_s, max_score, acc, output FROM samples")
+    assert tuple(row) == ("What is up?", 2.5, 0.7, 1, "up")
+    wh.close()
+
+
+def test_memory_metrics_are_columns_also_in_an_old_database(tmp_path):
+    db_path = str(tmp_path / "results.sqlite")
+    db = sqlite3.connect(db_path)
+    db.execute("CREATE TABLE runs (id INTEGER PRIMARY KEY, sweep_id INTEGER, run_id INTEGER, model TEXT, "
+               "mode TEXT, bleurt_score REAL, accuracy REAL, rouge_l REAL, prefill_tps REAL, decode_tps REAL, "
+               "total_tps REAL, runtime_s REAL, energy_j REAL, j_per_prefill_token REAL, "
+               "j_per_decode_token REAL, config TEXT, UNIQUE (sweep_id, run_id))")
+    db.close()
+    write_sweep(tmp_path / "hyperparam_search_1", SAMPLES, peak_rss_mb=1830.5, kv_cache_mib=224,
+                mmap_resident_mb=1210.0)
+    wh = Warehouse(db_path)
+    wh.ingest(str(tmp_path / "hyperparam_search_*"))
+    (run,) = wh.query("SELECT peak_rss_mb, kv_cache_mib, mmap_resident_mb, config FROM runs")
+    assert tuple(run)[:3] == (1830.5, 224, 1210.0)
+    assert "peak_rss_mb" not in json.loads(run["config"])
+    wh.close()
+
+
+def test_pareto():
+    rows = [{"speed": 10, "score": 0.5}, {"speed": 20, "score": 0.4}, {"speed": 15, "score": 0.3},
+            {"speed": 5, "score": 0.6}]
+    assert pareto(rows) == [rows[3], rows[0], rows[1]]
@@ -0,0 +1,85 @@
+import urllib.error
+
+import pytest
+
+from server_backend import LlamaServer, LogTail, PrefixCache, StubServer, image_message, make_server
+
+
+@pytest.fixture
+def stub():
+    with make_server("stub") as server:
+        yield server
+
+
+def test_make_server_picks_the_backend():
+    assert isinstance(make_server("server"), LlamaServer)
+    stub = make_server("stub")
+    assert isinstance(stub, StubServer)
+    stub.stop()
+    with pytest.raises(ValueError, match="Unknown server backend 'cli'"):
+        make_server("cli")
+
+
+def test_complete_reports_server_timings(stub):
+    assert stub.healthy()
+    res = stub.complete("one two three four", n_predict=2)
+    assert res["content"] == "three four" and res["tokens_predicted"] == 2
+    assert res["timings"]["prompt_n"] == 4 and res["timings"]["predicted_n"] == 2
+    assert res["timings"]["prompt_ms"] == pytest.approx(1000.0 * 4 / stub.prefill_tps)
+    assert res["latency"] >= 0.0
+
+
+def test_cache_prompt_only_prefills_the_new_suffix(stub):
+    stub.complete("a b c", n_predict=0)
+    res = stub.complete("a b c d e", n_predict=1)
+    assert res["timings"]["cache_n"] == 3 and res["timings"]["prompt_n"] == 2
+    cold = stub.complete("a b c d e", n_predict=1, cache_prompt=False)
+    assert cold["timings"]["cache_n"] == 0 and cold["timings"]["prompt_n"] == 5
+
+
+def test_tokenize_round_trips(stub):
+    tokens = stub.tokenize("hello big world", add_special=True)
+    assert tokens[0] == 1 and len(tokens) == 4
+    assert stub.tokenize("world hello") == [tokens[3], tokens[1]]
+    assert stub.detokenize(tokens[1:]) == "hello big world"
+
+
+def test_stream_yields_one_chunk_per_token(stub):
+    chunks = list(stub.stream("p " * 10, n_predict=5))
+    assert len(chunks) == 6 and chunks[-1]["stop"] and not chunks[-1]["truncated"]
+    assert [c["tokens_predicted"] for c in chunks[:-1]] == [1, 2, 3, 4, 5]
+    assert all("t" in c for c in chunks)
+
+
+def test_chat_with_an_image_logs_its_encode(tmp_path):
+    log = tmp_path / "server.log"
+    log.touch()
+    with open(log, "a", encoding="utf-8") as f, StubServer(log_file=f) as stub:
+        tail = LogTail(str(log))
+        res = stub.chat([image_message("what is this", b"\xff\xd8jpeg")], n_predict=2)
+        lines = tail.read_request(timeout=1.0)
+        tail.close()
+    assert res["content"] == "is this" and res["tokens_predicted"] == 2
+    assert res["timings"]["prompt_n"] == StubServer.IMAGE_TOKENS + 3
+    assert any("image slice encoded in" in line for line in lines)
+    assert "total time =" in lines[-1]
+
+
+def test_prefix_cache_restores_the_prefilled_prefix(stub):
+    cache = PrefixCache(stub, "sys " * 20).prepare()
+    assert cache.prefix_n == 20
+    assert cache.prefill_ms == pytest.approx(1000.0 * 20 / stub.prefill_tps)
+
+    stub.complete("something unrelated evicts the slot", n_predict=0)
+    res = cache.complete("q1 q2 q3", n_predict=1)
+    assert res["timings"]["cache_n"] == 20 and res["timings"]["prompt_n"] == 3
+    assert res["timings"]["restore_ms"] == pytest.approx(StubServer.RESTORE_MS_PER_TOKEN * 20)
+
+    base = cache.complete("q1 q2 q3", n_predict=1, reuse=False)
+    assert base["timings"]["cache_n"] == 0 and base["timings"]["prompt_n"] == 23
+    assert "restore_ms" not in base["timings"]
+
+
+def test_prefix_cache_needs_prepare(stub):
+    with pytest.raises(urllib.error.HTTPError, match="400"):
+        PrefixCache(stub, "sys prompt").complete("q", n_predict=1)
@@ -0,0 +1,60 @@
+import io
+
+import pytest
+
+from server_backend import StubServer
+from streaming_bench import SHIFT_RE, analyze, predicted_shifts, shift_indices, stream_tokens
+
+
+def tokens(n, ms=10.0, stalls=(), stall_ms=50.0):
+    return [{"i": i, "ms": stall_ms if i in stalls else ms, "host_ms": 0.0} for i in range(n)]
+
+
+def test_predicted_shifts_replay_the_server_rule():
+    shifts = predicted_shifts(prompt_n=10, n_tokens=30, ctx_size=20, n_keep=4)
+    assert shifts == [(4, 15, 7)] * 3
+    assert shift_indices(shifts, prompt_n=10) == [9, 16, 23]
+    assert predicted_shifts(prompt_n=10, n_tokens=9, ctx_size=20, n_keep=4) == []
+    # n_keep is clamped like llama-server's, so a shift always frees cells
+    assert predicted_shifts(prompt_n=0, n_tokens=10, ctx_size=8, n_keep=100)[0] == (4, 3, 1)
+
+
+def test_predicted_shifts_match_the_stub_server_log():
+    log = io.StringIO()
+    stub = StubServer(log_file=log, ctx_size=64).start()
+    try:
+        records, final = stream_tokens(stub, "p " * 20, n_predict=200, n_keep=4)
+    finally:
+        stub.stop()
+    logged = [tuple(int(g) for g in m.groups()) for m in map(SHIFT_RE.search, log.getvalue().splitlines()) if m]
+    assert len(records) == 200 and final["prompt_n"] == 20
+    assert logged and logged == predicted_shifts(20, 200, 64, 4)
+
+
+def test_analyze_flags_periodic_stalls():
+    records = tokens(30, stalls=(9, 16, 23))
+    row = analyze(records, prompt_n=10, ctx_size=20, n_keep=4, logged=[], stall_factor=3.0)
+    assert row["shifts"] == 3 and row["shifts_logged"] == 0
+    assert row["steady_tps"] == pytest.approx(100.0)
+    assert row["shift_cost_ms"] == pytest.approx(40.0)
+    assert row["shift_overhead"] == pytest.approx(120.0 / 420.0)
+    assert row["overall_tps"] == pytest.approx(1000.0 * 30 / 420.0)
+    assert row["drift_ms_per_1k"] == pytest.approx(0.0)
+    assert row["verdict"] == "periodic stalls"
+    # records get their cache position, with the discarded cells taken off at each shift
+    assert [r["i"] for r in records if r["shift"]] == [9, 16, 23]
+    assert records[8]["n_past"] == 18 and records[9]["n_past"] == 12 and records[29]["pos"] == 39
+
+
+def test_analyze_prefers_logged_shifts_and_reports_flat_runs():
+    row = analyze(tokens(30), prompt_n=10, ctx_size=20, n_keep=4, logged=[(4, 15, 7)], stall_factor=3.0)
+    assert row["shifts"] == 1 and row["shifts_logged"] == 1
+    assert row["shift_cost_ms"] == pytest.approx(0.0) and row["verdict"] == "flat"
+
+
+def test_analyze_measures_latency_drift_with_cache_fill():
+    # 1 ms more per 100 cells in the cache, no shifts
+    records = [{"i": i, "ms": 10.0 + (10 + i) / 100.0, "host_ms": 0.0} for i in range(50)]
+    row = analyze(records, prompt_n=10, ctx_size=4096, n_keep=4, logged=[], stall_factor=3.0)
+    assert row["shifts"] == 0 and row["shift_cost_ms"] is None and row["verdict"] == "flat"
+    assert row["drift_ms_per_1k"] == pytest.approx(10.0)
@@ -0,0 +1,63 @@
+import json
+import os
+import random
+
+import pytest
+
+pytest.importorskip("numpy")  # sweep_common -> truthful_qa_eval
+
+import sweep_common
+from dataset_snapshot import DEFAULT_ROOT, export, snapshot_name
+from results_warehouse import Warehouse
+from sweep_common import CONFIG_COLUMNS, TruthfulQAEvaluator, config_args, sample_config
+
+FAKE_CLI = """#!/bin/bash
+# answers with the -p text and prints llama-cli's perf block
+while [ $# -gt 0 ]; do [ "$1" = "-p" ] && prompt="$2"; shift; done
+echo "$prompt"
+echo "llama_perf_context_print: prompt eval time =     100.00 ms /    10 tokens" >&2
+echo "llama_perf_context_print:        eval time =     500.00 ms /     5 runs" >&2
+echo "llama_perf_context_print:       total time =     600.00 ms /    15 tokens" >&2
+"""
+
+
+class FakeScorer:
+    def __init__(self, checkpoint, cache_path=None):
+        pass
+
+    def score_pairs(self, predictions, references):
+        return [float(ref in pred) for pred, ref in zip(predictions, references)]
+
+
+def test_sample_config_follows_the_shell_rules():
+    rng = random.Random(0)
+    for _ in range(50):
+        cfg = sample_config(rng)
+        assert list(cfg) == CONFIG_COLUMNS
+        assert cfg["ubatch_size"] == cfg["batch_size"]
+        if cfg["flash_attn"] == "off":
+            assert cfg["ctk"] == cfg["ctv"] == "f16"
+        assert ("--no-mmap" in config_args(cfg)) == (cfg["use_mmap"] == 0)
+
+
+def test_evaluate_writes_samples_for_the_warehouse(workdir, monkeypatch):
+    questions = [{"question": "Is the sky blue?", "correct_answers": ["sky"], "incorrect_answers": ["green"]},
+                 {"question": "Can pigs fly?", "correct_answers": ["no"], "incorrect_answers": ["pigs"]}]
+    export(questions, os.path.join(DEFAULT_ROOT, snapshot_name("truthfulqa/truthful_qa", "generation",
+                                                                "validation", 2)))
+    (workdir / "fake-cli.sh").write_text(FAKE_CLI)
+    monkeypatch.setattr(sweep_common, "BleurtScorer", FakeScorer)
+    evaluator = TruthfulQAEvaluator(max_samples=2, script="./fake-cli.sh", store_root="")
+    run_dir = workdir / "hyperparam_search_1" / "run_1"
+    metrics = evaluator.evaluate(sample_config(random.Random(0)), str(run_dir))
+    assert metrics["accuracy"] == 0.5 and metrics["avg_decode_speed"] == 10.0
+
+    with open(run_dir / "samples.jsonl", encoding="utf-8") as f:
+        samples = [json.loads(line) for line in f]
+    assert [(s["sample"], s["question"], s["acc"]) for s in samples] == [(0, "Is the sky blue?", 1),
+                                                                         (1, "Can pigs fly?", 0)]
+    wh = Warehouse("results.sqlite")
+    wh.ingest("hyperparam_search_*")
+    assert [tuple(r) for r in wh.query("SELECT idx, question, acc FROM samples ORDER BY idx")] == \
+        [(0, "Is the sky blue?", 1), (1, "Can pigs fly?", 0)]
+    wh.close()
@@ -0,0 +1,81 @@
+import sys
+
+import pytest
+
+from thermal import ThermalEnvelope, ThermalMonitor, ThermalScheduler, parse_probe, read_state, summarize_thermal
+
+PROBE = """temp=412
+current_now=-2500000
+voltage_now=3900000
+cpu0=1800000 1800000 1800000
+cpu7=1200000 2400000 3200000
+cpu8=
+"""
+
+
+def test_parse_probe():
+    r = parse_probe(PROBE)
+    assert (r["temp_c"], r["current_ma"], r["voltage_v"]) == (41.2, -2500.0, 3.9)
+    assert r["power_w"] == pytest.approx(2.5 * 3.9)
+    assert sorted(r["cpus"]) == ["cpu0", "cpu7"]
+    assert r["freq_cap"] == pytest.approx(0.75)
+    assert parse_probe("")["temp_c"] is None and parse_probe("")["freq_cap"] is None
+
+
+def reading(t, temp, cap=1.0):
+    return {"time": t, "temp_c": temp, "freq_cap": cap, "power_w": 2.0,
+            "cpus": {"cpu0": {"cur_khz": 1000000, "max_khz": 1, "hw_max_khz": 1}}}
+
+
+class ScriptedReader:
+    """Returns the given temperatures one reading at a time (the last one repeats)."""
+
+    def __init__(self, temps):
+        self.temps = list(temps)
+        self.t = 0.0
+
+    def __call__(self, serial):
+        self.t += 1.0
+        temp = self.temps.pop(0) if len(self.temps) > 1 else self.temps[0]
+        return reading(self.t, temp)
+
+
+def test_envelope_hysteresis_and_throttle_gate():
+    env = ThermalEnvelope(max_c=40.0)
+    assert env.resume_c == 38.0
+    assert env.too_hot(reading(0, 41.0), env.max_c) and not env.too_hot(reading(0, 39.0), env.max_c)
+    assert env.too_hot(reading(0, 39.0), env.resume_c)
+    assert not env.too_hot(None, env.max_c)
+    assert ThermalEnvelope(require_unthrottled=True).too_hot(reading(0, 30.0, cap=0.8), 40.0)
+
+
+def test_scheduler_cools_down_before_the_sample(capsys):
+    monitor = ThermalMonitor(reader=ScriptedReader([42.0, 39.0, 37.5, 37.0]))
+    scheduler = ThermalScheduler(monitor, ThermalEnvelope(max_c=40.0, poll_s=0.0))
+    with scheduler.track() as tags:
+        pass
+    # 42 -> wait through 39 (still above resume 38) -> start at 37.5
+    assert scheduler.last_reading["temp_c"] == 37.5
+    assert tags["temp_start_c"] == 37.5 and tags["throttled"] is False
+    assert "cooling down to 38.0" in capsys.readouterr().out
+
+
+def test_tags_summarize_the_window():
+    monitor = ThermalMonitor(reader=None)
+    monitor.readings = [reading(1.0, 35.0), reading(2.0, 37.0, cap=0.5), reading(9.0, 45.0)]
+    tags = ThermalScheduler(monitor).tags(0.5, 3.0, before=reading(0.0, 34.0))
+    assert (tags["temp_start_c"], tags["temp_end_c"], tags["temp_max_c"]) == (34.0, 37.0, 37.0)
+    assert tags["throttled"] and tags["freq_cap_min"] == 0.5 and tags["thermal_samples"] == 3
+    assert tags["cpu_freq_mean_mhz"] == 1000.0 and tags["power_mean_w"] == 2.0
+
+
+def test_summarize_thermal():
+    records = [{"latency": 1.0}, {"latency": 3.0, "throttled": True}, {"latency": None}]
+    assert summarize_thermal(records) == {"n": 2, "n_throttled": 1, "mean": 2.0, "mean_unthrottled": 1.0}
+
+
+def test_read_state_through_fake_adb(workdir, monkeypatch):
+    monkeypatch.setenv("ADB", f"{sys.executable} {workdir / 'fake_adb.py'}")
+    monkeypatch.setenv("FAKE_ADB_STATE", str(workdir / "state.json"))
+    r = read_state()
+    assert r["temp_c"] == pytest.approx(30.0, abs=1.0) and r["cpus"] and r["freq_cap"] == 1.0
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Thermal- and power-aware scheduling for on-device benchmark runs.
+
+ThermalMonitor samples battery temperature, current, voltage and per-core CPU
+frequencies over adb, in a background thread while a sample runs.
+ThermalScheduler gates each next sample on a thermal envelope (cool down to
+resume_c once the phone is above max_c) and tags every latency record with
+the thermal state it ran in, so throttled samples can be excluded or
+normalized afterwards.
+
+A CPU counts as throttled when its scaling_max_freq (which thermal mitigation
+lowers) is below cpuinfo_max_freq.
+
+Set ADB="python3 fake_adb.py" to exercise this without a phone.
+
+    python thermal.py --count 10 --interval 5       # print readings
+"""
+import argparse
+import threading
+import time
+from contextlib import contextmanager
+
+from adb_utils import adb_shell
+
+# One adb round trip per reading; key=value per line
+PROBE_CMD = (
+    "d=/sys/class/power_supply/battery; "
+    "for k in temp current_now voltage_now; do echo \"$k=$(cat $d/$k 2>/dev/null)\"; done; "
+    "for c in /sys/devices/system/cpu/cpu[0-9]*; do "
+    "echo \"$(basename $c)=$(cat $c/cpufreq/scaling_cur_freq $c/cpufreq/scaling_max_freq "
+    "$c/cpufreq/cpuinfo_max_freq 2>/dev/null | tr '\\n' ' ')\"; done"
+)
+
+
+def _int(text):
+    try:
+        return int(text.strip())
+    except (AttributeError, ValueError):
+        # no such line (None) or an empty / non-numeric node
+        return None
+
+
+def parse_probe(text):
+    """Turn PROBE_CMD output into a reading dict (None where a node is missing)."""
+    values = {}
+    for line in text.splitlines():
+        if "=" in line:
+            k, v = line.split("=", 1)
+            values[k.strip()] = v.strip()
+
+    temp = _int(values.get("temp"))
+    current_ua = _int(values.get("current_now"))
+    voltage_uv = _int(values.get("voltage_now"))
+    cpus = {}
+    for k, v in values.items():
+        if k.startswith("cpu") and k[3:].isdigit():
+            freqs = [_int(x) for x in v.split()]
+            if len(freqs) == 3 and None not in freqs:
+                cpus[k] = {"cur_khz": freqs[0], "max_khz": freqs[1], "hw_max_khz": freqs[2]}
+
+    reading = {
+        "time": time.time(),
+        # battery temp is reported in tenths of a degree
+        "temp_c": temp / 10.0 if temp is not None else None,
+        "current_ma": current_ua / 1000.0 if current_ua is not None else None,
+        "voltage_v": voltage_uv / 1e6 if voltage_uv is not None else None,
+        "cpus": cpus,
+    }
+    if reading["current_ma"] is not None and reading["voltage_v"] is not None:
+        reading["power_w"] = abs(reading["current_ma"]) / 1000.0 * reading["voltage_v"]
+    else:
+        reading["power_w"] = None
+    # lowest thermal cap across cores, 1.0 = unthrottled
+    caps = [c["max_khz"] / c["hw_max_khz"] for c in cpus.values() if c["hw_max_khz"]]
+    reading["freq_cap"] = min(caps) if caps else None
+    return reading
+
+
+def read_state(serial=None):
+    """One thermal/power reading from the device, or None if adb failed."""
+    try:
+        reading = parse_probe(adb_shell(PROBE_CMD, serial=serial, timeout=30))
+    except Exception as e:
+        print(f"[WARN] Failed to read thermal state via adb: {e}")
+        return None
+    if reading["temp_c"] is None:
+        # some devices hide the sysfs node; dumpsys always has it
+        try:
+            for line in adb_shell("dumpsys battery", serial=serial, timeout=30).splitlines():
+                if "temperature" in line.lower() and ":" in line:
+                    reading["temp_c"] = int(line.split(":")[1]) / 10.0
+        except Exception:
+            pass
+    return reading
+
+
+class ThermalMonitor:
+    """Samples read_state() every interval_s seconds in a background thread."""
+
+    def __init__(self, serial=None, interval_s=5.0, reader=read_state):
+        self.serial = serial
+        self.interval_s = interval_s
+        self.reader = reader
+        self.readings = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        reading = self.reader(self.serial)
+        if reading is not None:
+            with self._lock:
+                self.readings.append(reading)
+        return reading
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            self.sample()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="thermal-monitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def window(self, start, end):
+        with self._lock:
+            return sorted((r for r in self.readings if start <= r["time"] <= end), key=lambda r: r["time"])
+
+
+class ThermalEnvelope:
+    """
+    Start a sample only below max_c. Once above it, wait until the phone has
+    cooled to resume_c (hysteresis), giving up after max_wait_s. With
+    require_unthrottled, also wait until no CPU frequency cap is active.
+    """
+
+    def __init__(self, max_c=40.0, resume_c=None, max_wait_s=600.0, poll_s=10.0, require_unthrottled=False):
+        self.max_c = max_c
+        self.resume_c = max_c - 2.0 if resume_c is None else resume_c
+        self.max_wait_s = max_wait_s
+        self.poll_s = poll_s
+        self.require_unthrottled = require_unthrottled
+
+    def too_hot(self, reading, threshold):
+        if reading is None or reading["temp_c"] is None:
+            return False
+        if reading["temp_c"] > threshold:
+            return True
+        return self.require_unthrottled and reading["freq_cap"] is not None and reading["freq_cap"] < 1.0
+
+
+class ThermalScheduler:
+    def __init__(self, monitor, envelope=None):
+        self.monitor = monitor
+        self.envelope = envelope
+        self.cooldown_s = 0.0
+        self.last_reading = None
+
+    def wait_for_envelope(self):
+        """Block until the next sample may start. Returns seconds spent cooling down."""
+        reading = self.last_reading = self.monitor.sample()
+        env = self.envelope
+        if env is None or not env.too_hot(reading, env.max_c):
+            return 0.0
+        print(f"[THERMAL] {reading['temp_c']:.1f} °C above {env.max_c:.1f} °C, "
+              f"cooling down to {env.resume_c:.1f} °C...")
+        t0 = time.time()
+        while env.too_hot(reading, env.resume_c):
+            if time.time() - t0 > env.max_wait_s:
+                print(f"[WARN] still {reading['temp_c']:.1f} °C after {env.max_wait_s:.0f} s, continuing")
+                break
+            time.sleep(env.poll_s)
+            reading = self.last_reading = self.monitor.sample()
+        waited = time.time() - t0
+        self.cooldown_s += waited
+        temp = reading["temp_c"] if reading is not None else None
+        print(f"[THERMAL] resumed at {temp} °C after {waited:.0f} s")
+        return waited
+
+    def tags(self, start, end, cooldown_s=0.0, before=None):
+        """
+        Thermal state over [start, end] as flat fields for a latency record;
+        before is the reading taken right before the sample started.
+        """
+        window = ([before] if before is not None else []) + self.monitor.window(start, end)
+        temps = [r["temp_c"] for r in window if r["temp_c"] is not None]
+        caps = [r["freq_cap"] for r in window if r["freq_cap"] is not None]
+        powers = [r["power_w"] for r in window if r["power_w"] is not None]
+        freqs = [c["cur_khz"] for r in window for c in r["cpus"].values()]
+        return {
+            "temp_start_c": temps[0] if temps else None,
+            "temp_end_c": temps[-1] if temps else None,
+            "temp_max_c": max(temps) if temps else None,
+            "freq_cap_min": min(caps) if caps else None,
+            "cpu_freq_mean_mhz": sum(freqs) / len(freqs) / 1000.0 if freqs else None,
+            "power_mean_w": sum(powers) / len(powers) if powers else None,
+            "throttled": bool(caps) and min(caps) < 1.0,
+            "cooldown_s": cooldown_s,
+            "thermal_samples": len(window),
+        }
+
+    @contextmanager
+    def track(self):
+        """
+        Gate on the envelope, then record the thermal state while the body runs:
+
+            with scheduler.track() as thermal:
+                run_sample()
+            record.update(thermal)
+        """
+        cooldown = self.wait_for_envelope()
+        tags = {}
+        start = time.time()
+        try:
+            yield tags
+        finally:
+            self.monitor.sample()
+            tags.update(self.tags(start, time.time(), cooldown, self.last_reading))
+
+
+def add_thermal_args(ap):
+    """Thermal envelope options shared by the eval harnesses."""
+    ap.add_argument("--thermal-max-c", type=float, default=40.0,
+                    help="don't start a sample above this battery temperature (°C)")
+    ap.add_argument("--thermal-resume-c", type=float, default=None,
+                    help="once too hot, cool down to this temperature (default: max - 2)")
+    ap.add_argument("--thermal-max-wait", type=float, default=600.0, help="longest cooldown per sample (s)")
+    ap.add_argument("--thermal-interval", type=float, default=5.0, help="seconds between thermal readings")
+    ap.add_argument("--thermal-unthrottled", action="store_true",
+                    help="also wait until no CPU frequency cap is active")
+    ap.add_argument("--no-thermal", action="store_true", help="disable thermal monitoring and gating")
+
+
+def scheduler_from_args(args, serial=None):
+    """A started ThermalScheduler for the parsed add_thermal_args() options, or None."""
+    if args.no_thermal:
+        return None
+    envelope = ThermalEnvelope(args.thermal_max_c, args.thermal_resume_c, args.thermal_max_wait,
+                               poll_s=min(10.0, args.thermal_interval * 2),
+                               require_unthrottled=args.thermal_unthrottled)
+    monitor = ThermalMonitor(serial, interval_s=args.thermal_interval)
+    if monitor.sample() is None:
+        print("[WARN] no thermal readings from the device, running without thermal gating")
+        return None
+    return ThermalScheduler(monitor.start(), envelope)
+
+
+def summarize_thermal(records, key="latency"):
+    """Mean of key over all records vs. records that ran unthrottled."""
+    all_vals = [r[key] for r in records if r.get(key) is not None]
+    cool = [r[key] for r in records if r.get(key) is not None and not r.get("throttled")]
+    return {
+        "n": len(all_vals),
+        "n_throttled": len(all_vals) - len(cool),
+        "mean": sum(all_vals) / len(all_vals) if all_vals else None,
+        "mean_unthrottled": sum(cool) / len(cool) if cool else None,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Print the phone's thermal/power state.")
+    ap.add_argument("--count", type=int, default=1)
+    ap.add_argument("--interval", type=float, default=5.0)
+    ap.add_argument("--serial", default=None)
+    args = ap.parse_args()
+
+    for i in range(args.count):
+        if i:
+            time.sleep(args.interval)
+        r = read_state(args.serial)
+        if r is None:
+            continue
+        freqs = " ".join(f"{c['cur_khz'] // 1000}" for c in r["cpus"].values())
+        print(f"temp {r['temp_c']} °C | current {r['current_ma']} mA | voltage {r['voltage_v']} V | "
+              f"power {r['power_w'] and round(r['power_w'], 2)} W | freq cap {r['freq_cap'] and round(r['freq_cap'], 2)} | "
+              f"cpu MHz {freqs}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,84 +1,396 @@
 #!/usr/bin/env python3
 import os
-from datasets import load_dataset
-import evaluate
+import json
+import argparse
 import subprocess
+import threading
 import time
+from collections import defaultdict
+from contextlib import nullcontext
 import numpy as np
 
-def run_evaluate(extra_args=[]):
+from bleurt_scorer import BleurtScorer, DEFAULT_CACHE
+from eval_pipeline import run_pipelined
+from result_store import (ResultStore, DEFAULT_ROOT, arg_seed, cli_arg_set, perf_lines, script_model,
+                          shared_model_fingerprint)
+from server_backend import PrefixCache, make_server
+from thermal import add_thermal_args, scheduler_from_args, summarize_thermal
+from energy import add_energy_args, format_energy, sampler_from_args, summarize_energy
+from memory_profiler import add_memory_args, format_memory, memory_sampler_from_args, summarize_memory
+from device_pool import add_device_args, device_name, per_device, pool_from_args, summarize_devices
+from dataset_snapshot import load_subset
 
-    ds = load_dataset("truthfulqa/truthful_qa", "generation", split="validation")
-    
-    # Only evaluate the first x
-    # Can change range or comment out line
-    ds = ds.select(range(50))
-    n = len(ds) 
-    print(f"Loaded {n} test samples for Truthful QA")
+# the -sys text of run-cli-streamllm.sh (which llama-cli ignores with -no-cnv)
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant. Provide truthful, accurate, and concise answers."
+SLOT_SAVE_DIR = "slots"
 
-    # initiate BLEURT evaluator model
-    bleurt = evaluate.load('bleurt', 'bleurt-large-128') # load large model for accuracy
+def generate_cli(question, extra_args, stderr_file, serial=None, log_lock=None):
+    """
+    One llama-cli launch per sample via run-cli-streamllm.sh (on device
+    serial, if given). Returns (prediction, latency, timings) or None if the
+    CLI failed; timings holds the invocation's llama_perf lines.
+    """
+    cmd = ["bash", "./run-cli-streamllm.sh", "-no-cnv", "-p", f"\"\'{question} \'\"", "-n", str(25)] + extra_args
+    env = dict(os.environ, S=serial) if serial else None
+    tmp_output = f"tmp_output_{serial}.txt" if serial else "tmp_output.txt"
+    start = time.time()
+    with open(tmp_output, "w", encoding="utf-8") as fout:
 
-    #debug log
-    stderr_file = open('debug.log', 'w', encoding='utf-8')
-    max_score_arr = []
-    acc_score_arr = []
+        print("CMD:", " ".join(cmd))
+        # Note: we pass stderr=subprocess.PIPE so we can separately handle it
+        proc = subprocess.run(cmd, stdout=fout, stderr=subprocess.PIPE, text=True, env=env)
+    end = time.time()
+    with log_lock or nullcontext():
+        stderr_file.write(proc.stderr)
+        stderr_file.flush()
+
+    latency = end - start
+    if proc.returncode != 0:
+        # Print stderr to console
+        print(f"[ERROR] CLI failed for prompt {question}:")
+        print(proc.stderr)
+        return None
+
+    with open(tmp_output, "r", encoding='utf-8') as fin:
+        pred = fin.read().strip()
+    os.remove(tmp_output)
+    return pred, latency, {"perf_log": perf_lines(proc.stderr)}
+
+def generate_server(server, question, prefix=None, kv_reuse="on"):
+    """
+    Send one sample to the persistent llama-server.
+    The prompt matches what llama-cli receives after the adb shell quoting.
+    With a PrefixCache the system prompt goes in front of it: kv_reuse "on"
+    restores its saved KV state, "off" prefills it with every sample and
+    "compare" runs both, keeping the reuse run and recording the other's
+    timings under "no_reuse".
+    """
+    prompt = f"'{question} '"
+    if prefix is None:
+        res = server.complete(prompt, n_predict=25, seed=42)
+        return res["content"].strip(), res["latency"], res["timings"]
+    baseline = None
+    if kv_reuse != "on":
+        baseline = prefix.complete(prompt, n_predict=25, reuse=False, seed=42)
+        if kv_reuse == "off":
+            return baseline["content"].strip(), baseline["latency"], baseline["timings"]
+    res = prefix.complete(prompt, n_predict=25, seed=42)
+    if baseline is not None:
+        res["timings"]["no_reuse"] = {"latency": baseline["latency"], "prompt_n": baseline["timings"].get("prompt_n"),
+                                      "prompt_ms": baseline["timings"].get("prompt_ms")}
+    return res["content"].strip(), res["latency"], res["timings"]
+
+def clean_question(question):
+    question = question.replace("'", " ")
+    question = question.replace('"', ' ')
+    return question
 
-    for i, rec in enumerate(ds):
-        print(f"-------- sample {i} --------")
-        question = rec['question']
-        best_answer = rec['best_answer']
+def score_bleurt_batch(scorer, batch):
+    """
+    Score several samples in one pass of a BleurtScorer (cached, batched).
+    batch items are (index, rec, (pred, latency, timings)); returns a
+    (max_score, acc_score) tuple per sample, same as scoring them one by one.
+    """
+    predictions, references, spans = [], [], []
+    for _, rec, (pred, _, _) in batch:
         correct_answers = rec['correct_answers']
         incorrect_answers = rec['incorrect_answers']
+        spans.append((len(predictions), len(correct_answers), len(incorrect_answers)))
+        predictions += [pred] * (len(correct_answers) + len(incorrect_answers))
+        references += correct_answers + incorrect_answers
+    scores = scorer.score_pairs(predictions, references)
+
+    results = []
+    for start, n_true, n_false in spans:
+        score_true = scores[start:start + n_true]
+        score_false = scores[start + n_true:start + n_true + n_false]
+        results.append((max(score_true), int(max(score_true) > max(score_false))))
+    return results
+
+def start_servers(backend, extra_args, port, serials, log_file, system_prompt="", kv_reuse="on"):
+    """
+    Persistent servers, one per device on consecutive host ports, so model
+    load and warmup are paid once, not per sample. Returns ({serial: server},
+    {serial: PrefixCache}); the PrefixCaches only exist with a system prompt,
+    and with kv_reuse other than "off" its KV state is prefilled right away.
+    """
+    servers, prefixes = {}, {}
+    # slot save/restore is only enabled when the prefix state is reused
+    env = {"SLOT_SAVE": SLOT_SAVE_DIR} if system_prompt and kv_reuse != "off" else None
+    try:
+        for k, serial in enumerate(serials):
+            servers[serial] = make_server(backend, server_args=extra_args, port=port + k, serial=serial,
+                                          log_file=log_file, env=env)
+            servers[serial].start()
+            if system_prompt:
+                prefixes[serial] = PrefixCache(servers[serial], system_prompt + "\n")
+                if kv_reuse != "off":
+                    prefixes[serial].prepare()
+                    print(f"system prompt: {prefixes[serial].prefix_n} tokens prefilled once "
+                          f"in {prefixes[serial].prefill_ms or 0:.1f} ms on {device_name(serial)}")
+    except BaseException:
+        stop_devices(servers)
+        raise
+    return servers, prefixes
+
+def stop_devices(servers, thermal=None, power=None, memory=None):
+    """Stop the servers, thermal monitors and power/memory samplers of a run."""
+    for server in servers.values():
+        server.stop()
+    for scheduler in (thermal or {}).values():
+        scheduler.monitor.stop()
+    for sampler in list((power or {}).values()) + list((memory or {}).values()):
+        sampler.stop()
+
+def open_store(store_root, backend, extra_args, system_prompt, serials, kv_reuse="on"):
+    """
+    (ResultStore, question -> store key) for serving completed samples on
+    reruns, or (None, None) without store_root.
+    """
+    if not store_root:
+        return None, None
+    script = "./run-cli-streamllm.sh" if backend == "cli" else "./run-server-streamllm.sh"
+    model_hash = "stub" if backend == "stub" else shared_model_fingerprint(script_model(script), serials)
+    sys_args = ["-sys", system_prompt] if system_prompt else []
+    arg_set = cli_arg_set(script, ["-n", "25"] + extra_args + sys_args)
+    if system_prompt:
+        # the timings differ with and without reuse, and only "compare" records the no_reuse baseline
+        arg_set["kv_reuse"] = kv_reuse
+    seed = arg_seed(extra_args)
+    return ResultStore(store_root), lambda question: ResultStore.key(model_hash, arg_set, question, seed)
+
+def generate_sample(question, serial, extra_args, stderr_file, log_lock, server=None, prefix=None,
+                    kv_reuse="on", scheduler=None, sampler=None, mem=None):
+    """
+    Run one question on device serial, through server if given, else one
+    llama-cli launch, and tag its timings with the device, the thermal state
+    it ran in and its energy and memory. Returns (prediction, latency,
+    timings) or None if generation failed.
+    """
+    # wait for the thermal envelope, then tag the sample with the state it ran in
+    with (scheduler.track() if scheduler is not None else nullcontext({})) as thermal_tags:
+        t0 = time.time()
+        if server is None:
+            gen = generate_cli(question, extra_args, stderr_file, serial, log_lock)
+        else:
+            gen = generate_server(server, question, prefix, kv_reuse)
+        t1 = time.time()
+    if gen is None:
+        return None
+    timings = gen[2]
+    timings["device"] = serial or os.environ.get("S")
+    if thermal_tags:
+        timings["thermal"] = thermal_tags
+    if sampler is not None:
+        if server is None:
+            timings["energy"] = sampler.cli_energy(t0, t1, timings["perf_log"])
+        else:
+            timings["energy"] = sampler.server_energy(t0, t1, timings)
+    if mem is not None:
+        # a llama-server outlives the request, so its window peak covers earlier ones too
+        timings["memory"] = mem.cli_memory(t0, t1, timings["perf_log"]) if server is None else mem.window(t0, t1)
+    return gen
+
+def report_sample(i, gen, score, records, show_device=False):
+    """Print one scored sample and add it to records (kind -> list, see print_summary)."""
+    pred, latency, timings = gen
+    max_score, acc_score = score
+    print(f"-------- sample {i} --------")
+    if show_device:
+        print(f'    device: {device_name(timings.get("device"))}')
+    print(f'    latency: {latency:.3f} s.')
+    if timings and "prompt_ms" in timings:
+        print(f'    prefill: {timings["prompt_ms"]:.1f} ms / {timings["prompt_n"]} tokens, '
+              f'decode: {timings["predicted_ms"]:.1f} ms / {timings["predicted_n"]} tokens')
+    if timings and "no_reuse" in timings:
+        base = timings["no_reuse"]
+        print(f'    kv reuse: prefill {base["prompt_ms"]:.1f} -> {timings["prompt_ms"]:.1f} ms, '
+              f'latency {base["latency"]:.3f} -> {latency:.3f} s')
+        records["reuse"].append({"latency": latency, "prompt_ms": timings["prompt_ms"],
+                                 "base_latency": base["latency"], "base_prompt_ms": base["prompt_ms"]})
+    print(f'    max_score: {max_score:.3f}')
+    print(f'    acc: {acc_score}')
+
+    thermal_tags = (timings or {}).get("thermal")
+    if thermal_tags:
+        print(f'    temperature: {thermal_tags["temp_start_c"]} -> {thermal_tags["temp_end_c"]} °C'
+              f'{" (throttled)" if thermal_tags["throttled"] else ""}')
+        records["thermal"].append({"latency": latency, **thermal_tags})
 
-        question = question.replace("'", " ")
-        question = question.replace('"', ' ')
-
-        cmd = ["bash", "./run-cli-streamllm.sh", "-no-cnv", "-p", f"\"\'{question} \'\"", "-n", str(25)] + extra_args
-        start = time.time()
-        with open("tmp_output.txt", "w", encoding="utf-8") as fout:
-            
-            print("CMD:", " ".join(cmd))
-            # Note: we pass stderr=subprocess.PIPE so we can separately handle it
-            proc = subprocess.run(cmd, stdout=fout, stderr=stderr_file, text=True)
-        end = time.time()
-
-        latency = end - start
-        if proc.returncode != 0:
-            # Print stderr to console
-            print(f"[ERROR] CLI failed for prompt {question}:")
-            print(proc.stderr)
-            return -1, -1
-        
-        # start evaluate
-        with open("tmp_output.txt", "r", encoding='utf-8') as fin:
-            pred = fin.read().strip()
-            predictions = [pred] * len(correct_answers)
-            score_true = bleurt.compute(predictions=predictions, references=correct_answers)['scores']
-            predictions = [pred] * len(incorrect_answers)
-            score_false = bleurt.compute(predictions=predictions, references=incorrect_answers)['scores']
-
-            max_score = max(score_true)
-            acc_score = int(max(score_true) > max(score_false))
-
-            print(f'    latency: {latency:.3f} s.')
-            print(f'    max_score: {max_score:.3f}')
-            print(f'    acc: {acc_score}')
-
-            max_score_arr.append(max_score)
-            acc_score_arr.append(acc_score)
-        
-        os.remove("tmp_output.txt")
-    
+    energy = (timings or {}).get("energy")
+    if energy and energy["energy_j"] is not None:
+        print(f'    energy: {energy["energy_j"]:.2f} J, '
+              f'{energy["j_per_prefill_token"] or 0:.3f} J/prefill token, '
+              f'{energy["j_per_decode_token"] or 0:.3f} J/decode token')
+    elif energy and energy.get("on_charger"):
+        print('    energy: n/a (on a charger)')
+    if energy:
+        records["energy"].append(energy)
+
+    mem = (timings or {}).get("memory")
+    if mem and mem["peak_rss_mb"] is not None:
+        print(f'    memory: peak RSS {mem["peak_rss_mb"]:.0f} MB, '
+              f'mmap resident {mem["mmap_resident_mb"] or 0:.0f} MB')
+        records["memory"].append(mem)
+
+    records["max_score"].append(max_score)
+    records["acc"].append(acc_score)
+    records["device"].append({"device": timings.get("device"), "latency": latency, "acc": acc_score})
+
+def print_summary(records, n, stats, scorer, store=None, pool=None, thermal=None):
+    """The end-of-run report over report_sample()'s records of n samples."""
     print('=======================================')
     print('')
-    accuracy = sum(acc_score_arr) / n
-    print(f'avg max score: {np.mean(np.array(max_score_arr))}')
+    print(f'pipeline: {stats.summary()}')
+    print(scorer.summary())
+    if store is not None:
+        print(store.summary())
+    if pool is not None:
+        print(f'devices: {pool.summary()}')
+        for name, dev in summarize_devices(records["device"]).items():
+            print(f'    {name}: {dev["n"]} samples, mean latency {dev["mean"]:.3f} s')
+    if records["thermal"]:
+        th = summarize_thermal(records["thermal"])
+        cooldown = sum(scheduler.cooldown_s for scheduler in (thermal or {}).values())
+        print(f'thermal: {th["n_throttled"]} / {th["n"]} samples throttled, '
+              f'cooldown {cooldown:.0f} s, mean latency {th["mean"]:.3f} s '
+              f'({th["mean_unthrottled"] if th["mean_unthrottled"] is None else round(th["mean_unthrottled"], 3)} s unthrottled)')
+    if records["energy"]:
+        print(f'energy: {format_energy(summarize_energy(records["energy"]))}')
+    if records["memory"]:
+        print(f'memory: {format_memory(summarize_memory(records["memory"]))}')
+    reuse = records["reuse"]
+    if reuse:
+        def mean(key):
+            return np.mean([r[key] for r in reuse])
+        print(f'kv reuse: mean prefill {mean("base_prompt_ms"):.1f} -> {mean("prompt_ms"):.1f} ms, '
+              f'mean latency {mean("base_latency"):.3f} -> {mean("latency"):.3f} s '
+              f'({len(reuse)} samples, without -> with reuse)')
+    accuracy = sum(records["acc"]) / n
+    print(f'avg max score: {np.mean(np.array(records["max_score"]))}')
     print(f'avg accuracy: {accuracy:.3f}')
 
+def run_evaluate(extra_args=[], backend="cli", port=8080, queue_size=4, score_batch=8,
+                 bleurt_cache=DEFAULT_CACHE, store_root="", thermal=None, power=None,
+                 memory=None, serials=(None,), pool=None, system_prompt="", kv_reuse="on"):
+    """
+    thermal, power and memory map device serial -> ThermalScheduler /
+    PowerSampler / MemorySampler.
+    With a DevicePool, samples are spread over pool.serials; every record
+    carries the serial it ran on.
+    system_prompt (server backends) is prefixed to every sample; kv_reuse
+    picks how its KV state is reused (see generate_server).
+    """
+    thermal = thermal or {}
+    power = power or {}
+    memory = memory or {}
+    serials = list(pool.serials) if pool is not None else list(serials)
+    if backend == "cli" and system_prompt:
+        print("[WARN] --system-prompt needs --backend server or stub; llama-cli runs without it")
+        system_prompt = ""
+
+    # Only evaluate the first x
+    # Can change rows or set it to None; the subset is read from its offline snapshot
+    ds = load_subset("truthfulqa/truthful_qa", "generation", split="validation", rows=50)
+    n = len(ds)
+    print(f"Loaded {n} test samples for Truthful QA")
+
+    # initiate BLEURT evaluator model (loaded on first cache miss)
+    scorer = BleurtScorer('bleurt-large-128', cache_path=bleurt_cache) # load large model for accuracy
+    store, store_keys = None, {}
+    records = defaultdict(list)
+
+    #debug log
+    stderr_file = open('debug.log', 'w', encoding='utf-8')
+    log_lock = threading.Lock()
+    servers, prefixes, timings_file = {}, {}, None
+
+    def generate(i, rec, serial=serials[0]):
+        question = clean_question(rec['question'])
+        if store is not None:
+            store_keys[i] = store_key(question)
+            cached = store.get(store_keys[i])
+            if cached is not None:
+                # keep debug.log complete for parse_log.py
+                with log_lock:
+                    stderr_file.write(cached["timings"].get("perf_log", ""))
+                return cached["prediction"], cached["latency"], cached["timings"]
+        gen = generate_sample(question, serial, extra_args, stderr_file, log_lock, servers.get(serial),
+                              prefixes.get(serial), kv_reuse, thermal.get(serial), power.get(serial),
+                              memory.get(serial))
+        if gen is not None and store is not None:
+            pred, latency, timings = gen
+            store.put(store_keys[i], {"question": question, "prediction": pred,
+                                      "latency": latency, "timings": timings})
+        return gen
+
+    def report(i, rec, gen, score):
+        if store is not None:
+            store.update(store_keys[i], max_score=score[0], acc=score[1])
+        if timings_file is not None:
+            timings_file.write(json.dumps({"sample": i, "latency": gen[1], **gen[2]}) + "\n")
+            timings_file.flush()
+        report_sample(i, gen, score, records, show_device=len(serials) > 1)
+
+    try:
+        # completed samples are served from the result store on reruns
+        store, store_key = open_store(store_root, backend, extra_args, system_prompt, serials, kv_reuse)
+        if backend != "cli":
+            servers, prefixes = start_servers(backend, extra_args, port, serials, stderr_file,
+                                              system_prompt, kv_reuse)
+            timings_file = open('server_timings.jsonl', 'w', encoding='utf-8')
+        # generation on the phone overlaps with BLEURT scoring on the host
+        _, stats, failed = run_pipelined(
+            ds, generate, lambda batch: score_bleurt_batch(scorer, batch), on_result=report,
+            queue_size=queue_size, batch_size=score_batch, stop_on_failure=True, pool=pool
+        )
+    finally:
+        stop_devices(servers, thermal, power, memory)
+        if timings_file is not None:
+            timings_file.close()
+        stderr_file.close()
+
+    if failed:
+        return -1, -1
+    print_summary(records, n, stats, scorer, store, pool, thermal)
+
 
 def main():
-    run_evaluate()
+    ap = argparse.ArgumentParser(description="TruthfulQA eval on the phone.")
+    ap.add_argument("--backend", choices=["cli", "server", "stub"], default="cli",
+                    help="cli: one llama-cli per sample; server: persistent llama-server "
+                         "via adb forward; stub: local stand-in server (no phone)")
+    ap.add_argument("--port", type=int, default=8080, help="llama-server port (server backend)")
+    ap.add_argument("--queue-size", type=int, default=4,
+                    help="generated samples allowed to wait for scoring")
+    ap.add_argument("--score-batch", type=int, default=8,
+                    help="max samples per BLEURT call")
+    ap.add_argument("--bleurt-cache", default=DEFAULT_CACHE,
+                    help="SQLite cache of BLEURT pair scores ('' to disable)")
+    ap.add_argument("--result-store", nargs="?", const=DEFAULT_ROOT, default="",
+                    help="resume from / serve completed samples out of this per-sample result store "
+                         f"(without a value: {DEFAULT_ROOT}); cached samples report their old "
+                         "latency and timings, so leave it off when measuring speed")
+    ap.add_argument("--system-prompt", nargs="?", const=DEFAULT_SYSTEM_PROMPT, default="",
+                    help="prefix every sample with this system prompt (server backends; "
+                         "without a value: run-cli-streamllm.sh's -sys text)")
+    ap.add_argument("--kv-reuse", choices=["on", "off", "compare"], default="on",
+                    help="on: prefill the system prompt once and restore its saved KV state per sample; "
+                         "off: prefill it every time; compare: run both and report the difference")
+    add_thermal_args(ap)
+    add_energy_args(ap)
+    add_memory_args(ap)
+    add_device_args(ap)
+    args, extra_args = ap.parse_known_args()
+    serials, pool = pool_from_args(args)
+    run_evaluate(extra_args, backend=args.backend, port=args.port,
+                 queue_size=args.queue_size, score_batch=args.score_batch,
+                 bleurt_cache=args.bleurt_cache, store_root=args.result_store,
+                 thermal=per_device(serials, lambda s: scheduler_from_args(args, s)),
+                 power=per_device(serials, lambda s: sampler_from_args(args, s)),
+                 memory=per_device(serials, lambda s: memory_sampler_from_args(
+                     args, s, "llama-cli" if args.backend == "cli" else "llama-server")),
+                 serials=serials, pool=pool, system_prompt=args.system_prompt, kv_reuse=args.kv_reuse)
 
 if __name__ == "__main__":
     main()